@@ -38,7 +38,8 @@ EVAL_DIR = Path(__file__).parent
 BENCHMARK_FILE = EVAL_DIR / 'benchmark_cases.jsonl'
 BASELINE_DIR = EVAL_DIR / 'baseline'
 
-NORWEGIAN_CHARS = set('æøåÆØÅ')
+sys.path.insert(0, str(EVAL_DIR.parent / 'scripts'))
+from text_features import text_features
 
 # ============================================================
 # Synonym map for Norwegian medical terms
@@ -399,11 +400,7 @@ def compute_rouge_l(reference, hypothesis):
 
 def norwegian_char_rate(text):
     """Calculate the rate of Norwegian-specific characters in text."""
-    alpha_chars = sum(1 for c in text if c.isalpha())
-    if alpha_chars == 0:
-        return 0.0
-    norwegian_count = sum(1 for c in text if c in NORWEGIAN_CHARS)
-    return round(norwegian_count / alpha_chars, 4)
+    return round(text_features(text).norwegian_rate, 4)
 
 
 def evaluate_case(case, response, latency_ms):
@@ -1,5 +1,12 @@
-"""Live training monitor - run in a separate terminal: py monitor.py"""
-import time, os, glob, sys
+"""Live training monitor - run in a separate terminal: py monitor.py
+
+Follows the latest overnight log incrementally (only appended bytes are read
+and parsed), so the cost per refresh stays constant as the log grows.
+"""
+import csv, time, os, glob, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from log_stream import LogFollower, PhaseTracker
 
 LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
 PHASES = [
@@ -20,70 +27,47 @@ def find_latest_log():
     logs = glob.glob(os.path.join(LOG_DIR, "overnight-*.log"))
     return max(logs, key=os.path.getmtime) if logs else None
 
+def find_latest_metrics():
+    files = glob.glob(os.path.join(LOG_DIR, "metrics-*.csv"))
+    return max(files, key=os.path.getmtime) if files else None
+
+class MetricsTail:
+    """Latest row of a training metrics CSV (training/telemetry.py), read incrementally."""
+
+    def __init__(self, path):
+        self.path = path
+        self.follower = LogFollower(path)
+        self.header = None
+        self.last = None
+
+    def update(self):
+        for line in self.follower.read_new():
+            if not line:
+                continue
+            values = next(csv.reader([line]))
+            if self.header is None:
+                self.header = values
+            else:
+                self.last = dict(zip(self.header, values))
+        return self.last
+
+def format_metrics(row):
+    def num(key, spec):
+        try:
+            return format(float(row[key]), spec)
+        except (KeyError, ValueError):
+            return "-"
+    return (f"step {row.get('step', '-')}  {num('tokens_per_sec', '.0f')} tok/s  "
+            f"loss {num('loss', '.3f')}  GPU {num('gpu_peak_mb', '.0f')}MB")
+
 def parse_status(content):
-    completed = 0
-    current = "Starting..."
-    details = ""
-
-    checks = [
-        ("Environment checks", "Phase 0"),
-        ("Setting up ML", "Phase 1"),
-        ("Installing PyTorch", "Downloading PyTorch (2.4GB)..."),
-        ("Installing ML dependencies", "Installing ML packages..."),
-        ("Verifying CUDA", "Verifying GPU..."),
-        ("Cleaning training data", "Phase 2: Cleaning data..."),
-        ("Training chiro-fast", "Phase 3a: chiro-fast (3B)"),
-        ("COMPLETE in", ""),
-        ("Training chiro-medical", "Phase 3b: chiro-medical (4B)"),
-        ("Training chiro-norwegian", "Phase 3c: chiro-norwegian (7B)"),
-        ("Training chiro-no", "Phase 3d: chiro-no (7B)"),
-        ("Validation", "Phase 4: Validation"),
-        ("OVERNIGHT TRAINING COMPLETE", "ALL DONE!"),
-    ]
-
-    for keyword, label in checks:
-        if keyword in content:
-            current = label
-
-    # Count completed models
-    completed_models = content.count("COMPLETE in")
-    failed_models = content.count("FAILED after")
-
-    # Determine overall progress percentage
-    if "OVERNIGHT TRAINING COMPLETE" in content:
-        pct = 100
-    elif "Validation" in content:
-        pct = 90
-    elif completed_models + failed_models >= 4:
-        pct = 85
-    elif "Training chiro-no" in content:
-        pct = 65 + (completed_models * 5)
-    elif "Training chiro-norwegian" in content:
-        pct = 45 + (completed_models * 5)
-    elif "Training chiro-medical" in content:
-        pct = 30 + (completed_models * 5)
-    elif "Training chiro-fast" in content:
-        pct = 20 + (completed_models * 5)
-    elif "Cleaning training data" in content:
-        pct = 15
-    elif "Verifying CUDA" in content:
-        pct = 12
-    elif "Installing ML dependencies" in content:
-        pct = 8
-    elif "Installing PyTorch" in content:
-        pct = 5
-    elif "Setting up ML" in content:
-        pct = 3
-    elif "Environment" in content:
-        pct = 1
-    else:
-        pct = 0
-
-    # Get last meaningful log line
-    lines = [l.strip() for l in content.split("\n") if l.strip()]
-    last_line = lines[-1] if lines else ""
-
-    return pct, current, completed_models, failed_models, last_line
+    """One-shot status of a full log text (the monitor itself feeds lines incrementally)."""
+    tracker = PhaseTracker()
+    tracker.feed_lines(content.split("\n"))
+    return status_of(tracker)
+
+def status_of(tracker):
+    return tracker.pct, tracker.current, tracker.completed, tracker.failed, tracker.last_line
 
 def draw_bar(pct):
     filled = int(PROGRESS_CHARS * pct / 100)
@@ -96,21 +80,32 @@ def clear_screen():
 def main():
     print("Monitoring training pipeline... (Ctrl+C to stop)\n")
 
+    log_file = None
+    follower = tracker = None
+    metrics = None
+
     while True:
-        log_file = find_latest_log()
-        if not log_file:
+        latest = find_latest_log()
+        if not latest:
             print("No log file found yet... waiting")
             time.sleep(5)
             continue
+        if latest != log_file:
+            log_file = latest
+            follower, tracker = LogFollower(log_file), PhaseTracker()
 
         try:
-            with open(log_file, "r", encoding="utf-8", errors="replace") as f:
-                content = f.read()
+            tracker.feed_lines(follower.read_new())
         except Exception:
             time.sleep(5)
             continue
 
-        pct, current, done, failed, last_line = parse_status(content)
+        pct, current, done, failed, last_line = status_of(tracker)
+
+        latest_metrics = find_latest_metrics()
+        if latest_metrics and (metrics is None or metrics.path != latest_metrics):
+            metrics = MetricsTail(latest_metrics)
+        metrics_row = metrics.update() if metrics else None
 
         clear_screen()
         print("╔══════════════════════════════════════════════════════════╗")
@@ -130,11 +125,12 @@ def main():
             "chiro-no":        ("7B ", "░"),
         }
         for name in model_states:
-            if f"{name}: COMPLETE" in content or f"{name.split('-')[-1]}: COMPLETE" in content:
+            state = tracker.models.get(name)
+            if state == "complete":
                 icon = "✅"
-            elif f"{name}: FAILED" in content or f"{name.split('-')[-1]}: FAILED" in content:
+            elif state == "failed":
                 icon = "❌"
-            elif f"Training {name}" in content:
+            elif state == "training":
                 # Animate spinner
                 spinner = ["⠋","⠙","⠹","⠸","⠼","⠴","⠦","⠧","⠇","⠏"]
                 idx = int(time.time() * 2) % len(spinner)
@@ -147,6 +143,8 @@ def main():
         print("╠══════════════════════════════════════════════════════════╣")
         last_display = last_line[:54] if len(last_line) > 54 else last_line
         print(f"║  Last: {last_display:<51s}║")
+        if metrics_row:
+            print(f"║  Rate: {format_metrics(metrics_row)[:51]:<51s}║")
         print("╚══════════════════════════════════════════════════════════╝")
         print(f"\n  Log: {os.path.basename(log_file)}")
         print("  Press Ctrl+C to stop monitoring")
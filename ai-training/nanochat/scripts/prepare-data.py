@@ -25,10 +25,14 @@ Usage: python ai-training/nanochat/scripts/prepare-data.py
 import json
 import os
 import random
+import sys
 from pathlib import Path
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent.parent
+
+sys.path.insert(0, str(BASE_DIR / 'scripts'))
+from split_utils import append_order, hash_split_two_way  # noqa: E402
 ALPACA_FILE = BASE_DIR / 'training-data-alpaca.json'
 SFT_DIR = BASE_DIR / 'data' / 'sft'
 DPO_DIR = BASE_DIR / 'data' / 'dpo'
@@ -130,15 +134,13 @@ def load_dpo():
 
 
 def split_data(data, val_ratio=VALIDATION_SPLIT):
-    """Split data into train/validation sets."""
-    random.seed(RANDOM_SEED)
-    random.shuffle(data)
-    split_idx = int(len(data) * (1 - val_ratio))
-    return data[:split_idx], data[split_idx:]
+    """Split data into train/validation sets by content hash (stable as data grows)."""
+    return hash_split_two_way(data, val_ratio=val_ratio, salt=str(RANDOM_SEED))
 
 
 def write_jsonl(data, filepath):
-    """Write data as JSONL."""
+    """Write data as JSONL (rows already in the file keep their order; new ones are appended)."""
+    data = append_order(data, filepath)
     filepath.parent.mkdir(parents=True, exist_ok=True)
     with open(filepath, 'w', encoding='utf-8') as f:
         for item in data:
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Pluggable Text Embedders for Clinical RAG
+Local embedders that turn chunk text into L2-normalized float32 vectors.
+
+- HashingEmbedder: deterministic feature hashing of words, word bigrams and
+  character trigrams. No model and no network. It suits benchmarks and
+  tests that must give the same numbers on every machine.
+- OllamaEmbedder: a local Ollama embeddings endpoint (the same
+  nomic-embed-text fallback the backend uses in
+  services/training/embeddings.js). A list of texts goes out as one
+  POST /api/embed call. Older servers without /api/embed fall back to
+  one /api/embeddings call per text.
+- StubEmbedServer: an in-process HTTP stub of both endpoints backed by
+  HashingEmbedder, for exercising the batched HTTP path offline.
+
+All embedders expose `dim`, `key` (names the vector space, for caches)
+and `embed(texts) -> np.ndarray[len(texts), dim]`.
+Rows are unit length, so inner product equals cosine similarity, which is
+what pgvector's vector_cosine_ops ranks by.
+
+Usage:
+    from embedders import get_embedder
+
+    embedder = get_embedder("hash")            # or "hash:512", "ollama:nomic-embed-text"
+    vectors = embedder.embed(["Subjektiv: nakkesmerter ...", ...])
+
+    with StubEmbedServer() as stub:
+        embedder = OllamaEmbedder(url=stub.url)
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+OLLAMA_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
+DEFAULT_HASH_DIM = 256
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows in place (zero rows stay zero)."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.divide(vectors, norms, out=vectors, where=norms > 0)
+    return vectors
+
+
+class HashingEmbedder:
+    """
+    Signed feature-hashing embedder.
+
+    Each feature (word, word bigram, character trigram of each word) is hashed
+    with blake2b into a bucket and a sign. Feature hashes are memoized, since
+    clinical text repeats a small vocabulary.
+    """
+
+    name = 'hash'
+
+    def __init__(self, dim: int = DEFAULT_HASH_DIM, char_ngrams: int = 3):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.key = f'hash-{dim}d-c{char_ngrams}'
+        self._buckets = {}
+
+    def _bucket(self, feature: str):
+        hit = self._buckets.get(feature)
+        if hit is None:
+            h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+            hit = self._buckets[feature] = (h % self.dim, 1.0 if (h >> 63) else -1.0)
+        return hit
+
+    def features(self, text: str) -> List[str]:
+        words = _WORD_RE.findall(text.lower())
+        feats = list(words)
+        feats += [f'{a} {b}' for a, b in zip(words, words[1:])]
+        n = self.char_ngrams
+        for w in words:
+            if len(w) > n:
+                padded = f'<{w}>'
+                feats += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+        return feats
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vec = out[row]
+            for feat in self.features(text):
+                bucket, sign = self._bucket(feat)
+                vec[bucket] += sign
+        return normalize_rows(out)
+
+
+class OllamaEmbedder:
+    """Embeddings from a local Ollama server, one HTTP call per embed() batch."""
+
+    name = 'ollama'
+
+    def __init__(self, model: str = 'nomic-embed-text', url: str = OLLAMA_URL, timeout: float = 120):
+        import requests
+
+        self.model = model
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.batched = True      # cleared if the server has no /api/embed
+        self.calls = 0
+        self.dim = len(self._embed_batch(['dimension probe'])[0])
+        self.key = f'ollama-{model.replace(":", "-").replace("/", "-")}-{self.dim}d'
+
+    def _post(self, path: str, payload: Dict):
+        self.calls += 1
+        return self.session.post(f'{self.url}{path}', json=payload, timeout=self.timeout)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        if self.batched:
+            resp = self._post('/api/embed', {'model': self.model, 'input': texts})
+            if resp.status_code != 404:
+                resp.raise_for_status()
+                return resp.json()['embeddings']
+            self.batched = False
+        out = []
+        for text in texts:
+            resp = self._post('/api/embeddings', {'model': self.model, 'prompt': text})
+            resp.raise_for_status()
+            out.append(resp.json()['embedding'])
+        return out
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        out = np.array(self._embed_batch(list(texts)), dtype=np.float32).reshape(len(texts), self.dim)
+        return normalize_rows(out)
+
+
+class StubEmbedServer:
+    """In-process HTTP stub of Ollama's /api/embed and /api/embeddings, backed by HashingEmbedder."""
+
+    def __init__(self, dim: int = 768, port: int = 0, latency: float = 0.0):
+        self.embedder = HashingEmbedder(dim)
+        self.requests = 0
+        self.texts = 0
+        lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if self.path == '/api/embed':
+                    texts = payload.get('input', [])
+                    texts = [texts] if isinstance(texts, str) else texts
+                elif self.path == '/api/embeddings':
+                    texts = [payload.get('prompt', '')]
+                else:
+                    self.send_error(404)
+                    return
+                if latency:
+                    threading.Event().wait(latency)
+                with lock:
+                    stub.requests += 1
+                    stub.texts += len(texts)
+                    vectors = stub.embedder.embed(texts).tolist()
+                if self.path == '/api/embed':
+                    self._json({'model': payload.get('model'), 'embeddings': vectors})
+                else:
+                    self._json({'embedding': vectors[0]})
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def get_embedder(spec: str = 'hash', url: str = None):
+    """
+    Build an embedder from a spec string.
+
+    "hash" / "hash:<dim>"             HashingEmbedder
+    "ollama" / "ollama:<model>"       OllamaEmbedder at `url` (default $OLLAMA_BASE_URL)
+    """
+    kind, _, arg = spec.partition(':')
+    if kind == 'hash':
+        return HashingEmbedder(int(arg) if arg else DEFAULT_HASH_DIM)
+    if kind == 'ollama':
+        return OllamaEmbedder(arg or 'nomic-embed-text', url=url or OLLAMA_URL)
+    raise ValueError(f'Unknown embedder: {spec!r} (expected hash[:dim] or ollama[:model])')
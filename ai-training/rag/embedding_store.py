@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+Chunk Embedding Store and Batched Embedding Pipeline
+Embeds SOAPChunker output once per distinct chunk text, so a re-index only
+embeds chunks that are new or changed.
+
+- Chunks are keyed by sha256 of the normalized chunk text (Unicode NFC,
+  whitespace collapsed). Identical boilerplate sections from many visits
+  share one vector, and whitespace-only edits do not re-embed.
+- Vectors live in a memory-mapped float32 or float16 matrix
+  (vectors.bin). Its capacity doubles as it grows. A SQLite id map
+  (text hash → row) sits next to it. Rows are written and flushed before
+  their ids are committed, so an interrupted run loses at most the
+  uncommitted batch.
+- Missing texts are embedded in batches of --batch-size, one request per
+  batch to the local embed server (Ollama /api/embed, or the in-process
+  stub). Up to --workers batches are in flight, matching OLLAMA_NUM_PARALLEL.
+- Each embedder (model and dimension) gets its own subdirectory. Changing
+  the dtype or the store version resets that subdirectory.
+
+Each chunk dict (chunks_to_dict format) gets `text_hash` and
+`embedding_row`. The vector for the RAG tables is store.vectors(rows).
+
+Store location: rag/.cache/chunk-embeddings/<embedder key>/
+
+Usage:
+    python rag/embedding_store.py --notes notes.jsonl --output chunks.jsonl
+    python rag/embedding_store.py --chunks chunks.jsonl --embedder ollama:nomic-embed-text
+    python rag/embedding_store.py --synthetic 500 --stub-server --dtype float16
+    python rag/embedding_store.py --stats
+
+    from embedding_store import EmbeddingStore, embed_chunks
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from embedders import OllamaEmbedder, StubEmbedServer, get_embedder
+
+DEFAULT_STORE = Path(__file__).parent.resolve() / '.cache' / 'chunk-embeddings'
+STORE_VERSION = 1
+BATCH_SIZE = 64
+INITIAL_CAPACITY = 1024
+LOOKUP_BATCH = 500   # hashes per SELECT ... IN (...)
+# Parallel embedding requests the local server accepts (Ollama's own OLLAMA_NUM_PARALLEL)
+EMBED_WORKERS = int(os.environ.get('OLLAMA_NUM_PARALLEL', 1))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS ids (
+    text_hash TEXT PRIMARY KEY,
+    row INTEGER NOT NULL UNIQUE,
+    created TEXT
+);
+'''
+
+_WS_RE = re.compile(r'\s+')
+
+
+def normalize_text(text: str) -> str:
+    """NFC, whitespace runs collapsed to one space, stripped."""
+    return _WS_RE.sub(' ', unicodedata.normalize('NFC', text or '')).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """Memory-mapped embedding matrix with a text-hash → row id map."""
+
+    def __init__(self, path, key: str, dim: int, dtype: str = 'float32'):
+        self.dir = Path(path) / key
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.key = key
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.vectors_file = self.dir / 'vectors.bin'
+        self.db = sqlite3.connect(str(self.dir / 'ids.sqlite'))
+        self.db.executescript(SCHEMA)
+
+        params = json.dumps({'key': key, 'dim': dim, 'dtype': self.dtype.name}, sort_keys=True)
+        if self._meta('version') != str(STORE_VERSION) or self._meta('params') != params:
+            self.db.execute('DELETE FROM ids')
+            self.vectors_file.unlink(missing_ok=True)
+            self._set_meta('version', STORE_VERSION)
+            self._set_meta('params', params)
+            self.db.commit()
+
+        self.count = self.db.execute('SELECT COUNT(*) FROM ids').fetchone()[0]
+        self.matrix = None
+        self._open(max(INITIAL_CAPACITY, self.count))
+
+    def _meta(self, key, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+    def _open(self, capacity: int):
+        """(Re)map vectors.bin with room for `capacity` rows, growing the file if needed."""
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        row_bytes = self.dim * self.dtype.itemsize
+        size = self.vectors_file.stat().st_size if self.vectors_file.exists() else 0
+        capacity = max(capacity, size // row_bytes)
+        if size < capacity * row_bytes:
+            with open(self.vectors_file, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self.matrix = np.memmap(self.vectors_file, dtype=self.dtype, mode='r+', shape=(capacity, self.dim))
+
+    def close(self):
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, hashes: Iterable[str]) -> Dict[str, int]:
+        """{text_hash: row} for the hashes already in the store."""
+        hashes = list(hashes)
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_BATCH):
+            part = hashes[start:start + LOOKUP_BATCH]
+            found.update(self.db.execute(
+                f'SELECT text_hash, row FROM ids WHERE text_hash IN ({",".join("?" * len(part))})', part))
+        return found
+
+    def add(self, hashes: List[str], vectors: np.ndarray) -> List[int]:
+        """Append vectors for new hashes. Returns their rows."""
+        n = len(hashes)
+        if self.count + n > self.capacity:
+            capacity = self.capacity
+            while capacity < self.count + n:
+                capacity *= 2
+            self._open(capacity)
+        rows = list(range(self.count, self.count + n))
+        self.matrix[self.count:self.count + n] = vectors
+        self.matrix.flush()
+        created = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        self.db.executemany('INSERT INTO ids VALUES (?, ?, ?)', [(h, r, created) for h, r in zip(hashes, rows)])
+        self.db.commit()
+        self.count += n
+        return rows
+
+    def vectors(self, rows) -> np.ndarray:
+        """float32 copy of the given rows."""
+        return np.asarray(self.matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+
+    def summary(self) -> Dict:
+        return {
+            'key': self.key, 'vectors': self.count, 'dim': self.dim, 'dtype': self.dtype.name,
+            'capacity': self.capacity,
+            'file_mb': round(self.capacity * self.dim * self.dtype.itemsize / 2**20, 2),
+        }
+
+
+# ============================================================
+# Pipeline
+# ============================================================
+
+def chunk_text(chunk: Dict) -> str:
+    return chunk.get('chunk_text', chunk.get('text', ''))
+
+
+def embed_chunks(chunks: List[Dict], store: EmbeddingStore, embedder, batch_size: int = BATCH_SIZE,
+                 workers: int = EMBED_WORKERS, quiet: bool = False) -> Counter:
+    """
+    Set text_hash and embedding_row on each chunk, embedding only texts not in the store.
+
+    Returns counts: chunks, unique, cached, embedded, batches.
+    """
+    hashes = [text_hash(chunk_text(c)) for c in chunks]
+    rows = store.lookup(set(hashes))
+    todo = {}
+    for c, h in zip(chunks, hashes):
+        if h not in rows and h not in todo:
+            todo[h] = normalize_text(chunk_text(c))
+
+    stats = Counter(chunks=len(chunks), unique=len(set(hashes)), cached=len(set(hashes)) - len(todo))
+    items = list(todo.items())
+    batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+    # Requests overlap on the server; rows are written in batch order on this thread
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(lambda batch: embedder.embed([t for _, t in batch]), batches)
+        for batch, vectors in zip(batches, results):
+            batch_hashes = [h for h, _ in batch]
+            rows.update(zip(batch_hashes, store.add(batch_hashes, vectors)))
+            stats['batches'] += 1
+            stats['embedded'] += len(batch)
+            if not quiet and stats['batches'] % 20 == 0:
+                print(f'  ... embedded {stats["embedded"]}/{len(items)} texts')
+
+    for c, h in zip(chunks, hashes):
+        c['text_hash'] = h
+        c['embedding_row'] = rows[h]
+    return stats
+
+
+def chunk_notes(notes: List[Dict]) -> List[Dict]:
+    """chunks_to_dict output for JSONL notes ({"note"|"text", "patient_id"|"id", "visit_date", ...})."""
+    from chunker import SOAPChunker
+
+    chunker = SOAPChunker()
+    chunks = []
+    for i, note in enumerate(notes):
+        chunks += chunker.chunks_to_dict(chunker.chunk_note(
+            note.get('note') or note.get('text', ''),
+            patient_id=str(note.get('patient_id', note.get('id', f'NOTE-{i:05d}'))),
+            visit_date=note.get('visit_date', ''),
+            note_type=note.get('note_type', 'clinical_encounter'),
+            encounter_id=note.get('encounter_id'),
+        ))
+    return chunks
+
+
+def read_jsonl(path) -> List[Dict]:
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+    return rows
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Embed clinical chunks through a content-hash cache')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--notes', help='JSONL of notes to chunk with SOAPChunker')
+    source.add_argument('--chunks', help='JSONL of chunks (chunks_to_dict format)')
+    source.add_argument('--synthetic', type=int, metavar='N', help='N synthetic notes (retrieval_bench corpus)')
+    parser.add_argument('--embedder', default='ollama:nomic-embed-text', help='hash[:dim] or ollama[:model]')
+    parser.add_argument('--stub-server', action='store_true',
+                        help='Serve embeddings from an in-process Ollama stub (no model needed)')
+    parser.add_argument('--store', default=str(DEFAULT_STORE), help='Store directory')
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=EMBED_WORKERS,
+                        help='Batches in flight (default: OLLAMA_NUM_PARALLEL or 1)')
+    parser.add_argument('--output', help='Write chunks with text_hash/embedding_row as JSONL')
+    parser.add_argument('--stats', action='store_true', help='Show the stores and exit')
+    args = parser.parse_args()
+
+    if args.stats:
+        for meta in sorted(Path(args.store).glob('*/ids.sqlite')):
+            db = sqlite3.connect(str(meta))
+            n = db.execute('SELECT COUNT(*) FROM ids').fetchone()[0]
+            params = dict(db.execute('SELECT key, value FROM meta')).get('params', '{}')
+            db.close()
+            print(f'  {meta.parent.name:<40s} {n:>8d} vectors  {params}')
+        return 0
+
+    if args.notes:
+        chunks = chunk_notes(read_jsonl(args.notes))
+    elif args.chunks:
+        chunks = read_jsonl(args.chunks)
+    elif args.synthetic:
+        from retrieval_bench import synthetic_notes
+        chunks = chunk_notes(synthetic_notes(args.synthetic))
+    else:
+        parser.error('one of --notes, --chunks, --synthetic or --stats is required')
+
+    stub = StubEmbedServer().__enter__() if args.stub_server else None
+    try:
+        embedder = get_embedder(args.embedder, url=stub.url if stub else None)
+        with EmbeddingStore(args.store, embedder.key, embedder.dim, args.dtype) as store:
+            start = time.perf_counter()
+            stats = embed_chunks(chunks, store, embedder, args.batch_size, args.workers)
+            elapsed = time.perf_counter() - start
+            summary = store.summary()
+    finally:
+        if stub:
+            stub.__exit__(None, None, None)
+
+    print(f'  Chunks: {stats["chunks"]} ({stats["unique"]} distinct texts)')
+    print(f'  Cached: {stats["cached"]}, embedded: {stats["embedded"]} in {stats["batches"]} batches '
+          f'({elapsed:.1f}s)')
+    if isinstance(embedder, OllamaEmbedder):
+        print(f'  Embed server requests: {embedder.calls}')
+    print(f'  Store: {summary["vectors"]} vectors, {summary["dim"]}d {summary["dtype"]}, '
+          f'{summary["file_mb"]} MB mapped ({summary["key"]})')
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for c in chunks:
+                f.write(json.dumps(c, ensure_ascii=False) + '\n')
+        print(f'  Chunks written to: {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Offline Retrieval Benchmark for SOAP Chunking
+Measures how SOAPChunker chunk sizes affect retrieval recall, latency and
+index memory before chunks reach the pgvector RAG tables.
+
+For each chunking config the harness:
+1. chunks a corpus of clinical notes with SOAPChunker
+2. embeds the chunks with a pluggable embedder (see embedders.py)
+3. builds exact, IVF and HNSW indexes (see vector_index.py)
+4. runs queries made from note sentences with ~25% of the words dropped.
+   A query is answered when a chunk containing its source sentence is in
+   the top k. Templated sentences recur across visits, so any note's chunk
+   with the same sentence counts.
+
+Reported per config and index setting:
+- recall@k: share of queries answered (retrieval quality of the chunking)
+- ann@k: overlap of the approximate top-k with the exact top-k
+- QPS (search only, embeddings excluded), build time, index memory
+
+The default corpus is synthetic Norwegian SOAP notes with long sections.
+Real notes can be given as JSONL with a "note" or "text" field.
+
+Usage:
+    python rag/retrieval_bench.py
+    python rag/retrieval_bench.py --notes 500 --configs default small-128 --k 5
+    python rag/retrieval_bench.py --corpus notes.jsonl --embedder ollama:nomic-embed-text
+    python rag/retrieval_bench.py --nprobe 4 16 --ef-search 20 80 --output bench.json
+"""
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from chunker import SOAPChunker
+from embedders import get_embedder
+from vector_index import ExactIndex, HNSWIndex, IVFIndex
+
+SENTENCE_SPLIT = re.compile(r'(?<=[.!?:;\n])\s+')   # same split as SOAPChunker.chunk_section
+MIN_QUERY_WORDS = 6
+QUERY_DROP = 0.25
+
+
+def _scaled(config: Dict, target: float = 1.0, overlap: float = 1.0, **fixed) -> Dict:
+    return {
+        section: {
+            'target_tokens': fixed.get('target_tokens', int(c['target_tokens'] * target)),
+            'overlap_tokens': fixed.get('overlap_tokens', int(c['overlap_tokens'] * overlap)),
+        }
+        for section, c in config.items()
+    }
+
+
+# Chunking configs to compare; "default" is SOAPChunker.CHUNK_CONFIG as shipped
+CHUNK_CONFIGS = {
+    'default': SOAPChunker.CHUNK_CONFIG,
+    'uniform-500': _scaled(SOAPChunker.CHUNK_CONFIG, target_tokens=500, overlap_tokens=50),
+    'half': _scaled(SOAPChunker.CHUNK_CONFIG, target=0.5, overlap=0.5),
+    'small-128': _scaled(SOAPChunker.CHUNK_CONFIG, target_tokens=128, overlap_tokens=16),
+    'no-overlap': _scaled(SOAPChunker.CHUNK_CONFIG, overlap=0),
+}
+
+
+# ============================================================
+# Corpus
+# ============================================================
+
+REGIONS = ['nakken', 'korsryggen', 'brystryggen', 'høyre skulder', 'venstre skulder', 'bekkenet',
+           'høyre hofte', 'venstre kne', 'kjeveleddet', 'venstre ankel', 'høyre albue']
+ONSETS = ['etter løfting av tunge kasser', 'etter en bilulykke', 'uten kjent årsak', 'etter hagearbeid',
+          'etter lang kjøretur', 'etter fall på isen', 'etter maratontrening', 'etter flytting',
+          'etter mye hjemmekontor', 'etter fotballkamp']
+JOBS = ['sykepleier', 'snekker', 'lærer', 'kontorarbeider', 'bussjåfør', 'frisør', 'elektriker',
+        'barnehageansatt', 'lagerarbeider', 'tannlege', 'bonde', 'student']
+AGGRAVATING = ['sitting', 'foroverbøying', 'løfting', 'hoste og nys', 'skjermarbeid', 'trappegang',
+               'rotasjon', 'liggende på siden', 'gange i motbakke', 'bæring av barn']
+FINDINGS = ['nedsatt rotasjon mot høyre', 'nedsatt fleksjon', 'palpasjonsømhet paraspinalt',
+            'triggerpunkt i øvre trapezius', 'hypomobilitet i segmentet', 'muskulær hypertonus',
+            'positiv Spurling test', 'positiv Lasègue ved 50 grader', 'smerte ved ekstensjon',
+            'nedsatt kraft i dorsalfleksjon', 'normal sensibilitet', 'symmetriske reflekser']
+SEGMENTS = ['C2-C3', 'C5-C6', 'C6-C7', 'T4-T5', 'T7-T8', 'L3-L4', 'L4-L5', 'L5-S1', 'SI-leddet']
+DIAGNOSES = [('L83', 'nakkesyndrom'), ('L84', 'ryggsyndrom uten utstråling'),
+             ('L86', 'ryggsyndrom med utstråling'), ('L92', 'skuldersyndrom'), ('N89', 'migrene'),
+             ('L87', 'ganglion/bursitt'), ('L18', 'muskelsmerter'), ('L03', 'korsryggsmerter'),
+             ('N17', 'svimmelhet'), ('L96', 'akutt kneskade')]
+TREATMENTS = ['manipulasjon', 'mobilisering', 'bløtvevsbehandling', 'tørrnåling', 'trykkbølge',
+              'instrumentassistert bløtvevsbehandling', 'tøyning', 'kinesiotaping']
+EXERCISES = ['chin tuck', 'bekkenvipp', 'fuglehund', 'sideplanke', 'skulderblad-retraksjon',
+             'kattekamel', 'glute bridge', 'thorakal rotasjon', 'nervemobilisering']
+
+SECTION_TEMPLATES = {
+    'Subjektiv': [
+        'Pasienten er {age} år, jobber som {job} og har hatt smerter i {region} i {weeks} uker.',
+        'Smertene startet {onset} og beskrives som {quality} med intensitet {nrs}/10.',
+        'Verre ved {aggr}, bedre ved {relief} og varme.',
+        'Sover {sleep} og våkner {wake} ganger per natt på grunn av smertene.',
+        'Har tidligere hatt lignende plager for {years} år siden som gikk over etter {sessions} behandlinger.',
+        'Bruker {drug} ved behov, om lag {doses} ganger i uken.',
+        'Pasienten trener {activity} {freq} ganger i uken, men har måttet kutte ned.',
+        'Opplever utstråling mot {radiation} uten nummenhet eller kraftsvikt.',
+        'Hodepine {headache} dager i uken, lokalisert {headloc}.',
+        'Ingen røde flagg: ingen feber, vekttap, nattlige smerter eller blære- og tarmforstyrrelser.',
+    ],
+    'Objektiv': [
+        'Inspeksjon viser {posture} holdning med {shift}.',
+        'Aktiv bevegelighet i {region}: {finding}, {degrees} grader i ytterstilling.',
+        'Palpasjon avdekker {finding} ved {segment}.',
+        'Segmentell undersøkelse: {finding} i {segment}, smerte {nrs}/10 ved provokasjon.',
+        '{test} var {result} på {side} side.',
+        'Nevrologisk screening: {finding}, kraft {strength}/5 i testede myotomer.',
+        'Gangfunksjon {gait}, tåhev og hælgang {heel}.',
+        'Blodtrykk {sys}/{dia} mmHg, puls {pulse}.',
+        'Muskelkraft ved {muscle} målt til {kg} kg, mot {kg2} kg på motsatt side.',
+        'Ortopediske tester: {test} {result}, {test2} {result2}.',
+    ],
+    'Vurdering': [
+        'Funnene er forenlige med {dx_name} ({dx_code}) i {region}.',
+        'Klinisk bilde tyder på mekanisk dysfunksjon i {segment} med sekundær {secondary}.',
+        'Prognosen vurderes som {prognosis} gitt {weeks} ukers varighet og {factor}.',
+        'Differensialdiagnostisk er {ddx} vurdert og funnet mindre sannsynlig.',
+        'Ingen tegn til alvorlig patologi; videre utredning med {imaging} er ikke indisert nå.',
+    ],
+    'Plan': [
+        'Behandlet med {treatment} av {segment} og {treatment2} av omkringliggende muskulatur.',
+        'Hjemmeøvelser: {exercise} {reps} repetisjoner {sets} ganger daglig.',
+        'Ny time om {days} dager, deretter {interval} i {planweeks} uker.',
+        'Anbefalt {advice} og gradvis økning av {activity}.',
+        'Henvises til {referral} dersom ingen bedring etter {sessions} behandlinger.',
+        'Sykmelding {sick} vurderes ved neste kontroll.',
+    ],
+}
+
+SLOTS = {
+    'age': lambda r: r.randint(18, 85), 'job': JOBS, 'region': REGIONS, 'weeks': lambda r: r.randint(1, 52),
+    'onset': ONSETS, 'quality': ['stikkende', 'murrende', 'brennende', 'verkende', 'dyp og diffus'],
+    'nrs': lambda r: r.randint(2, 9), 'aggr': AGGRAVATING,
+    'relief': ['bevegelse', 'hvile', 'gåtur', 'tøyning', 'dusj'],
+    'sleep': ['dårlig', 'urolig', 'greit', 'med avbrudd'], 'wake': lambda r: r.randint(1, 5),
+    'years': lambda r: r.randint(1, 20), 'sessions': lambda r: r.randint(2, 10),
+    'drug': ['paracet', 'ibuprofen', 'diklofenak gel', 'naproksen'], 'doses': lambda r: r.randint(1, 14),
+    'activity': ['løping', 'styrketrening', 'svømming', 'langrenn', 'sykling', 'yoga', 'padel'],
+    'freq': lambda r: r.randint(1, 6),
+    'radiation': ['høyre arm', 'venstre arm', 'høyre legg', 'venstre lår', 'skulderbladet', 'lysken'],
+    'headache': lambda r: r.randint(0, 7), 'headloc': ['frontalt', 'i nakken', 'bak øyet', 'temporalt'],
+    'posture': ['fremskutt hode', 'økt kyfose', 'skjev bekken', 'avflatet lordose', 'normal'],
+    'shift': ['lateral shift mot venstre', 'hevet høyre skulder', 'ingen skjevhet', 'rotert bekken'],
+    'finding': FINDINGS, 'degrees': lambda r: r.randint(10, 90), 'segment': SEGMENTS,
+    'test': ['Spurling', 'Lasègue', 'Slump', 'Hawkins-Kennedy', 'Neer', 'FABER', 'Kemp', 'Dix-Hallpike'],
+    'test2': ['Adson', 'Patrick', 'Thomas', 'Empty can', 'Yergason', 'Trendelenburg'],
+    'result': ['positiv', 'negativ'], 'result2': ['positiv', 'negativ', 'usikker'],
+    'side': ['høyre', 'venstre'], 'strength': lambda r: r.randint(3, 5),
+    'gait': ['normal', 'antalgisk', 'forsiktig', 'bredsporet'], 'heel': ['uten anmerkning', 'smertefullt'],
+    'sys': lambda r: r.randint(105, 165), 'dia': lambda r: r.randint(60, 100), 'pulse': lambda r: r.randint(50, 100),
+    'muscle': ['grep', 'skulderabduksjon', 'knestrekk', 'hoftefleksjon'], 'kg': lambda r: r.randint(8, 60),
+    'kg2': lambda r: r.randint(8, 60), 'secondary': ['muskelspasme', 'nerverotsirritasjon', 'kompensasjon'],
+    'prognosis': ['god', 'moderat', 'usikker'],
+    'factor': ['høy aktivitetsgrad', 'stillesittende jobb', 'tidligere episoder', 'god motivasjon'],
+    'ddx': ['prolaps', 'fasettleddsyndrom', 'myofasielt smertesyndrom', 'radikulopati', 'artrose'],
+    'imaging': ['MR', 'røntgen', 'ultralyd', 'CT'], 'treatment': TREATMENTS, 'treatment2': TREATMENTS,
+    'exercise': EXERCISES, 'reps': lambda r: r.choice([8, 10, 12, 15]), 'sets': lambda r: r.randint(1, 3),
+    'days': lambda r: r.randint(3, 14), 'interval': ['ukentlig', 'annenhver uke', 'to ganger i uken'],
+    'planweeks': lambda r: r.randint(2, 8), 'advice': ['ergonomisk tilpasning', 'pauser fra skjerm', 'aktiv hvile'],
+    'referral': ['fastlege', 'fysioterapeut', 'ortoped', 'nevrolog'], 'sick': ['gradert 50%', 'ikke aktuelt'],
+}
+
+# Sentences per section: long sections so the target_tokens limits matter
+SECTION_LENGTHS = {'Subjektiv': (6, 40), 'Objektiv': (8, 50), 'Vurdering': (3, 20), 'Plan': (3, 20)}
+
+
+def _fill(template: str, rng: random.Random, extra: Dict) -> str:
+    def slot(match):
+        key = match.group(1)
+        if key in extra:
+            return str(extra[key])
+        source = SLOTS[key]
+        return str(source(rng) if callable(source) else rng.choice(source))
+    return re.sub(r'\{(\w+)\}', slot, template)
+
+
+def synthetic_notes(n: int, seed: int = 0) -> List[Dict]:
+    """n reproducible Norwegian SOAP notes with headed sections of varying length."""
+    rng = random.Random(seed)
+    notes = []
+    for i in range(n):
+        code, name = rng.choice(DIAGNOSES)
+        extra = {'dx_code': code, 'dx_name': name}
+        parts = ['KLINISK NOTAT']
+        for header, templates in SECTION_TEMPLATES.items():
+            lo, hi = SECTION_LENGTHS[header]
+            sentences = [_fill(rng.choice(templates), rng, extra) for _ in range(rng.randint(lo, hi))]
+            parts.append(f'{header}: ' + ' '.join(sentences))
+        notes.append({
+            'id': f'NOTE-{i:05d}',
+            'visit_date': f'2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'note': '\n\n'.join(parts),
+        })
+    return notes
+
+
+def load_notes(path: str) -> List[Dict]:
+    notes = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            text = row.get('note') or row.get('text') or ''
+            if text.strip():
+                notes.append({'id': str(row.get('id', f'NOTE-{i:05d}')),
+                               'visit_date': row.get('visit_date', ''), 'note': text})
+    return notes
+
+
+def make_queries(notes: List[Dict], n: int, seed: int = 0) -> List[Tuple[int, str, str]]:
+    """[(note index, source sentence, query text)]: a note sentence with QUERY_DROP of its words removed."""
+    rng = random.Random(seed + 1)
+    queries = []
+    candidates = list(range(len(notes)))
+    while candidates and len(queries) < n:
+        idx = rng.choice(candidates)
+        sentences = [s.strip() for s in SENTENCE_SPLIT.split(notes[idx]['note'])
+                     if len(s.split()) >= MIN_QUERY_WORDS]
+        if not sentences:
+            candidates.remove(idx)
+            continue
+        sentence = rng.choice(sentences)
+        words = sentence.split()
+        kept = [w for w in words if rng.random() >= QUERY_DROP] or words
+        queries.append((idx, sentence, ' '.join(kept)))
+    return queries
+
+
+# ============================================================
+# Benchmark
+# ============================================================
+
+def chunk_corpus(chunker: SOAPChunker, notes: List[Dict], config: Dict) -> List[str]:
+    """Chunk texts of all notes, using `config` as CHUNK_CONFIG."""
+    chunker.CHUNK_CONFIG = config
+    texts = []
+    for note in notes:
+        for chunk in chunker.chunk_note(note['note'], patient_id=note['id'], visit_date=note['visit_date']):
+            texts.append(chunk.text)
+    return texts
+
+
+def answered(ids: np.ndarray, texts: List[str], queries) -> float:
+    """Share of queries whose top-k holds a chunk containing the source sentence."""
+    hits = 0
+    for row, (_, sentence, _) in zip(ids, queries):
+        hits += any(i >= 0 and sentence in texts[i] for i in row)
+    return hits / max(len(queries), 1)
+
+
+def ann_recall(ids: np.ndarray, exact: np.ndarray) -> float:
+    k = exact.shape[1]
+    overlap = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(ids, exact))
+    return overlap / max(exact.size, 1) if k else 0.0
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    start = time.perf_counter()
+    ids = index.search(queries, k)
+    return ids, len(queries) / max(time.perf_counter() - start, 1e-9)
+
+
+def bench_config(name: str, config: Dict, chunker, notes, queries, query_vecs, embedder, args) -> Dict:
+    start = time.perf_counter()
+    texts = chunk_corpus(chunker, notes, config)
+    chunk_s = time.perf_counter() - start
+    start = time.perf_counter()
+    vectors = embedder.embed(texts)
+    embed_s = time.perf_counter() - start
+    tokens = [chunker.count_tokens(t) for t in texts]
+
+    result = {
+        'config': name,
+        'chunk_config': config,
+        'chunks': len(texts),
+        'avg_tokens': round(sum(tokens) / max(len(tokens), 1), 1),
+        'chunk_s': round(chunk_s, 2),
+        'embed_s': round(embed_s, 2),
+        'indexes': [],
+    }
+
+    def record(index, build_s, ids, qps, exact_ids):
+        result['indexes'].append({
+            'index': index.describe(),
+            'recall': round(answered(ids, texts, queries), 4),
+            'ann_recall': round(ann_recall(ids, exact_ids), 4),
+            'qps': round(qps, 1),
+            'build_s': round(build_s, 2),
+            'memory_mb': round(index.memory_bytes() / 2**20, 2),
+        })
+
+    start = time.perf_counter()
+    exact = ExactIndex().build(vectors)
+    build_s = time.perf_counter() - start
+    exact_ids, qps = timed_search(exact, query_vecs, args.k)
+    record(exact, build_s, exact_ids, qps, exact_ids)
+
+    if 'ivf' in args.indexes:
+        start = time.perf_counter()
+        ivf = IVFIndex(nlist=args.nlist, seed=args.seed).build(vectors)
+        build_s = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            ids, qps = timed_search(ivf, query_vecs, args.k)
+            record(ivf, build_s, ids, qps, exact_ids)
+
+    if 'hnsw' in args.indexes:
+        start = time.perf_counter()
+        hnsw = HNSWIndex(m=args.hnsw_m, ef_construction=args.ef_construction, seed=args.seed).build(vectors)
+        build_s = time.perf_counter() - start
+        for ef in args.ef_search:
+            hnsw.ef_search = ef
+            ids, qps = timed_search(hnsw, query_vecs, args.k)
+            record(hnsw, build_s, ids, qps, exact_ids)
+    return result
+
+
+def print_results(results: List[Dict], k: int):
+    print(f'\n  {"config":<13s} {"chunks":>7s} {"avg tok":>8s}  {"index":<28s} '
+          f'{"recall@" + str(k):>9s} {"ann@" + str(k):>7s} {"QPS":>9s} {"build s":>8s} {"MB":>7s}')
+    print(f'  {"─" * 100}')
+    for r in results:
+        for i, ix in enumerate(r['indexes']):
+            head = (f'{r["config"]:<13s} {r["chunks"]:>7d} {r["avg_tokens"]:>8.1f}' if i == 0
+                    else ' ' * 30)
+            print(f'  {head}  {ix["index"]:<28s} {ix["recall"]:>9.3f} {ix["ann_recall"]:>7.3f} '
+                  f'{ix["qps"]:>9.1f} {ix["build_s"]:>8.2f} {ix["memory_mb"]:>7.2f}')
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline retrieval benchmark for SOAPChunker configs')
+    parser.add_argument('--corpus', default=None, help='JSONL of notes ("note"/"text" field); default synthetic')
+    parser.add_argument('--notes', type=int, default=300, help='Synthetic notes to generate')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--configs', nargs='+', default=list(CHUNK_CONFIGS), choices=list(CHUNK_CONFIGS))
+    parser.add_argument('--embedder', default='hash', help='hash[:dim] or ollama[:model]')
+    parser.add_argument('--indexes', nargs='+', default=['ivf', 'hnsw'], choices=['ivf', 'hnsw'],
+                        help='Approximate indexes to build (exact always runs)')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF lists (default 4·sqrt(n))')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 16])
+    parser.add_argument('--hnsw-m', type=int, default=16)
+    parser.add_argument('--ef-construction', type=int, default=64)
+    parser.add_argument('--ef-search', type=int, nargs='+', default=[40, 100])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None, help='Write results as JSON')
+    args = parser.parse_args()
+
+    notes = load_notes(args.corpus) if args.corpus else synthetic_notes(args.notes, args.seed)
+    if not notes:
+        print('  No notes to benchmark.')
+        return 1
+    queries = make_queries(notes, args.queries, args.seed)
+    embedder = get_embedder(args.embedder)
+    query_vecs = embedder.embed([q for _, _, q in queries])
+    chunker = SOAPChunker()
+
+    print(f'  Retrieval benchmark — {len(notes)} notes, {len(queries)} queries, '
+          f'embedder {args.embedder} ({embedder.dim}d), k={args.k}')
+
+    results = []
+    for name in args.configs:
+        start = time.perf_counter()
+        results.append(bench_config(name, CHUNK_CONFIGS[name], chunker, notes, queries, query_vecs, embedder, args))
+        print(f'  {name}: {results[-1]["chunks"]} chunks ({time.perf_counter() - start:.1f}s)')
+
+    print_results(results, args.k)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'notes': len(notes), 'queries': len(queries), 'k': args.k,
+                'embedder': args.embedder, 'dim': embedder.dim, 'results': results,
+            }, f, indent=2, ensure_ascii=False)
+        print(f'\n  Results written to: {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
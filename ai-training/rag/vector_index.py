@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+NumPy Vector Indexes for Offline RAG Benchmarks
+Exact and approximate top-k search over L2-normalized embeddings.
+
+- ExactIndex: brute-force inner product. This is the ground truth for
+  recall, and matches a sequential scan in pgvector.
+- IVFIndex: spherical k-means coarse quantizer with inverted lists. The
+  probe count trades recall for speed (pgvector ivfflat: lists / probes).
+- HNSWIndex: hierarchical navigable small world graph (Malkov & Yashunin),
+  using the same m / ef_construction defaults as
+  database/migrations/030_pgvector_rag.sql. ef_search is the query-time
+  knob (pgvector: hnsw.ef_search).
+
+These are reference implementations for comparing chunking configs and
+index parameters offline. They are not a replacement for pgvector. The
+HNSW graph is built in Python, so building large corpora takes a while.
+
+All indexes expose build(vectors), search(queries, k) -> int64 ids
+(padded with -1) and memory_bytes().
+
+Usage:
+    from vector_index import ExactIndex, HNSWIndex
+
+    index = HNSWIndex(m=16, ef_construction=64).build(vectors)
+    ids = index.search(query_vectors, k=10)
+"""
+
+import heapq
+import math
+from typing import List, Optional
+
+import numpy as np
+
+SEARCH_BLOCK = 1024   # queries per matrix product (bounds the score matrix)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indexes of the k largest scores per row, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _pad(ids: np.ndarray, k: int) -> np.ndarray:
+    if ids.shape[-1] >= k:
+        return ids
+    return np.concatenate([ids, np.full(ids.shape[:-1] + (k - ids.shape[-1],), -1, dtype=np.int64)], axis=-1)
+
+
+class ExactIndex:
+    """Brute-force inner-product search."""
+
+    name = 'exact'
+
+    def build(self, vectors: np.ndarray) -> 'ExactIndex':
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        return self
+
+    def search(self, queries: np.ndarray, k: int) -> np.ndarray:
+        out = []
+        for start in range(0, len(queries), SEARCH_BLOCK):
+            scores = queries[start:start + SEARCH_BLOCK] @ self.vectors.T
+            out.append(_pad(top_k(scores, k), k))
+        return np.concatenate(out) if out else np.empty((0, k), dtype=np.int64)
+
+    def memory_bytes(self) -> int:
+        return self.vectors.nbytes
+
+    def describe(self) -> str:
+        return 'exact'
+
+
+class IVFIndex:
+    """
+    Inverted-file index with a spherical k-means quantizer.
+
+    Vectors are stored grouped by list, so probing a list reads one
+    contiguous slice.
+
+    The default of 4·sqrt(n) lists is this benchmark's own choice, so the
+    small offline corpora still get enough lists to make probing matter.
+    pgvector's guidance for ivfflat is rows / 1000 lists up to 1M rows and
+    sqrt(rows) beyond that; pass nlist to compare against it.
+    """
+
+    name = 'ivf'
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, iterations: int = 10, seed: int = 0):
+        self.nlist = nlist          # default: 4·sqrt(n), see class docstring
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.seed = seed
+
+    def _assign(self, vectors):
+        return np.concatenate([
+            np.argmax(vectors[s:s + SEARCH_BLOCK] @ self.centroids.T, axis=1)
+            for s in range(0, len(vectors), SEARCH_BLOCK)
+        ])
+
+    def build(self, vectors: np.ndarray) -> 'IVFIndex':
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        nlist = max(1, min(self.nlist or int(4 * math.sqrt(n)), n))
+        self.nlist = nlist
+        rng = np.random.default_rng(self.seed)
+        self.centroids = vectors[rng.choice(n, nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assign = self._assign(vectors)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, vectors)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = vectors[rng.choice(n, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            self.centroids = sums / np.maximum(norms, 1e-12)
+
+        assign = self._assign(vectors)
+        order = np.argsort(assign, kind='stable')
+        self.ids = order.astype(np.int64)
+        self.vectors = vectors[order]
+        self.offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        return self
+
+    def search(self, queries: np.ndarray, k: int) -> np.ndarray:
+        nprobe = min(self.nprobe, self.nlist)
+        out = np.full((len(queries), k), -1, dtype=np.int64)
+        for start in range(0, len(queries), SEARCH_BLOCK):
+            block = queries[start:start + SEARCH_BLOCK]
+            probes = top_k(block @ self.centroids.T, nprobe)
+            for row, (q, lists) in enumerate(zip(block, probes)):
+                rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+                if not len(rows):
+                    continue
+                best = top_k((self.vectors[rows] @ q)[None, :], k)[0]
+                out[start + row, :len(best)] = self.ids[rows[best]]
+        return out
+
+    def memory_bytes(self) -> int:
+        return self.vectors.nbytes + self.ids.nbytes + self.centroids.nbytes + self.offsets.nbytes
+
+    def describe(self) -> str:
+        return f'ivf lists={self.nlist} probes={self.nprobe}'
+
+
+class HNSWIndex:
+    """
+    Hierarchical navigable small world graph over inner-product similarity.
+
+    Layer 0 keeps up to 2·m neighbours per node, upper layers m. Neighbours
+    are chosen with the paper's diversity heuristic (Algorithm 4).
+    """
+
+    name = 'hnsw'
+
+    def __init__(self, m: int = 16, ef_construction: int = 64, ef_search: int = 40, seed: int = 0):
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search     # pgvector's hnsw.ef_search default
+        self.seed = seed
+
+    # ── Graph search ──
+
+    def _search_layer(self, q: np.ndarray, entry: List[int], ef: int, layer: int):
+        """Best-first search of one layer. Returns [(similarity, node)] (unordered, ≤ ef)."""
+        graph = self.graph[layer]
+        vectors = self.vectors
+        visited = set(entry)
+        sims = (vectors[entry] @ q).tolist()
+        candidates = [(-s, e) for s, e in zip(sims, entry)]
+        heapq.heapify(candidates)
+        results = [(s, e) for s, e in zip(sims, entry)]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            neg, node = heapq.heappop(candidates)
+            if -neg < results[0][0] and len(results) >= ef:
+                break
+            fresh = [n for n in graph.get(node, ()) if n not in visited]
+            if not fresh:
+                continue
+            visited.update(fresh)
+            for sim, n in zip((vectors[fresh] @ q).tolist(), fresh):
+                if len(results) < ef or sim > results[0][0]:
+                    heapq.heappush(candidates, (-sim, n))
+                    heapq.heappush(results, (sim, n))
+                    if len(results) > ef:
+                        heapq.heappop(results)
+        return results
+
+    def _select(self, found, m: int) -> List[int]:
+        """Diversity heuristic: keep a candidate only if it is closer to the base than to any kept neighbour."""
+        found = sorted(found, reverse=True)
+        nodes = [n for _, n in found]
+        if len(nodes) <= m:
+            return nodes
+        pair = self.vectors[nodes] @ self.vectors[nodes].T
+        kept = []
+        for i, (sim, _) in enumerate(found):
+            if all(sim > pair[i, j] for j in kept):
+                kept.append(i)
+                if len(kept) == m:
+                    break
+        return [nodes[i] for i in kept]
+
+    def _connect(self, node: int, neighbours: List[int], layer: int):
+        graph = self.graph[layer]
+        graph[node] = neighbours
+        limit = 2 * self.m if layer == 0 else self.m
+        for n in neighbours:
+            links = graph.setdefault(n, [])
+            links.append(node)
+            if len(links) > limit:
+                sims = (self.vectors[links] @ self.vectors[n]).tolist()
+                graph[n] = self._select(list(zip(sims, links)), limit)
+
+    # ── Build / query ──
+
+    def build(self, vectors: np.ndarray) -> 'HNSWIndex':
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(self.seed)
+        level_mult = 1 / math.log(self.m)
+        levels = np.floor(-np.log(1 - rng.random(len(vectors))) * level_mult).astype(int)
+        self.graph = [{} for _ in range(int(levels.max(initial=0)) + 1)]
+        self.entry, self.max_level = None, -1
+
+        for node, level in enumerate(levels.tolist()):
+            q = self.vectors[node]
+            if self.entry is None:
+                for layer in range(level + 1):
+                    self.graph[layer][node] = []
+                self.entry, self.max_level = node, level
+                continue
+            entry = [self.entry]
+            for layer in range(self.max_level, level, -1):
+                entry = [max(self._search_layer(q, entry, 1, layer))[1]]
+            for layer in range(min(level, self.max_level), -1, -1):
+                found = self._search_layer(q, entry, self.ef_construction, layer)
+                self._connect(node, self._select(found, self.m), layer)
+                entry = [n for _, n in found]
+            for layer in range(self.max_level + 1, level + 1):
+                self.graph[layer][node] = []
+            if level > self.max_level:
+                self.entry, self.max_level = node, level
+        return self
+
+    def search(self, queries: np.ndarray, k: int) -> np.ndarray:
+        out = np.full((len(queries), k), -1, dtype=np.int64)
+        if self.entry is None:
+            return out
+        ef = max(self.ef_search, k)
+        for row, q in enumerate(queries):
+            entry = [self.entry]
+            for layer in range(self.max_level, 0, -1):
+                entry = [max(self._search_layer(q, entry, 1, layer))[1]]
+            found = sorted(self._search_layer(q, entry, ef, 0), reverse=True)[:k]
+            out[row, :len(found)] = [n for _, n in found]
+        return out
+
+    def edges(self) -> int:
+        return sum(len(links) for layer in self.graph for links in layer.values())
+
+    def memory_bytes(self) -> int:
+        """Vectors plus int32 adjacency, i.e. the graph as a compiled index would store it."""
+        return self.vectors.nbytes + 4 * self.edges()
+
+    def describe(self) -> str:
+        return f'hnsw m={self.m} efc={self.ef_construction} ef={self.ef_search}'
@@ -2,8 +2,13 @@
 """
 ChiroClickCRM Overnight Training Launcher
 Run this with: py -3.11 run-overnight.py
+
+    py -3.11 run-overnight.py --parallel            # overlap deploy with next training
+    py -3.11 run-overnight.py --parallel --resume   # skip steps already done
 """
 
+import argparse
+import json
 import subprocess
 import sys
 import os
@@ -19,24 +24,30 @@ DATA_DIR = AI_DIR / "data" / "processed"
 MODELS_DIR = AI_DIR / "models"
 GGUF_DIR = MODELS_DIR / "gguf"
 LOGS_DIR = AI_DIR / "logs"
+PROGRESS_FILE = LOGS_DIR / "training-progress.json"
 
 LOGS_DIR.mkdir(exist_ok=True)
 MODELS_DIR.mkdir(exist_ok=True)
 
+sys.path.insert(0, str(SCRIPTS_DIR))
+from log_stream import LogWriter
+
 timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
 LOGFILE = LOGS_DIR / f"overnight-{timestamp}.log"
+LOG = LogWriter(LOGFILE)  # one open handle for the whole run + overnight-*.events.jsonl
 
 
 def log(msg):
-    line = f"[{datetime.now().strftime('%H:%M:%S')}] {msg}"
-    print(line, flush=True)
-    with open(LOGFILE, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
+    LOG.log(msg)
 
 
-def run(cmd, timeout=None):
-    """Run a command, logging output in real-time."""
-    log(f"Running: {' '.join(str(c) for c in cmd)}")
+def run(cmd, timeout=None, prefix=""):
+    """Run a command, logging output in real-time.
+
+    prefix tags each output line when steps run concurrently (--parallel).
+    """
+    log(f"{prefix}Running: {' '.join(str(c) for c in cmd)}")
+    LOG.event("command", cmd=[str(c) for c in cmd], tag=prefix.strip())
     proc = subprocess.Popen(
         cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
         text=True, encoding="utf-8", errors="replace"
@@ -44,19 +55,27 @@ def run(cmd, timeout=None):
     output_lines = []
     try:
         for line in proc.stdout:
-            line = line.rstrip()
-            print(line, flush=True)
+            line = prefix + line.rstrip()
+            LOG.line(line)
             output_lines.append(line)
-            with open(LOGFILE, "a", encoding="utf-8") as f:
-                f.write(line + "\n")
         proc.wait(timeout=timeout)
     except subprocess.TimeoutExpired:
         proc.kill()
         log("TIMEOUT - process killed")
+    LOG.event("exit", cmd=str(cmd[0]), returncode=proc.returncode, tag=prefix.strip())
     return proc.returncode, output_lines
 
 
 def main():
+    parser = argparse.ArgumentParser(description="ChiroClickCRM overnight training pipeline")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Run training/deploy as a resource-aware DAG (training/pipeline_dag.py)")
+    parser.add_argument("--resume", action="store_true",
+                        help="With --parallel: skip steps marked done in training-progress.json")
+    parser.add_argument("--slots", default="",
+                        help="Resource slots for --parallel, e.g. gpu=1,cpu_ram=2,disk_io=1,ollama=1")
+    args = parser.parse_args()
+
     overall_start = time.time()
 
     log("=" * 60)
@@ -149,21 +168,14 @@ def main():
     failed = []
     succeeded = []
 
-    for model_key, dataset_name, output_name in models:
-        log(f"\n{'=' * 60}")
-        log(f"[Phase 3] Training {output_name} ({model_key})")
-        log(f"{'=' * 60}")
-
-        model_start = time.time()
-
-        # Pick dataset
+    def dataset_dir(dataset_name):
         ds_dir = DATA_DIR / dataset_name
         if not (ds_dir / "train.jsonl").exists():
             ds_dir = DATA_DIR / "all-clean"
-        log(f"Dataset: {ds_dir}")
+        return ds_dir
 
-        # Train
-        rc, _ = run([
+    def train_cmd(model_key, ds_dir):
+        return [
             python_cmd, str(TRAINING_DIR / "train_unsloth.py"),
             "--model", model_key,
             "--data-dir", str(ds_dir),
@@ -171,23 +183,87 @@ def main():
             "--log-dir", str(LOGS_DIR),
             "--low-vram",
             "--quantize", "q4_k_m",
-        ], timeout=6 * 3600)  # 6h max per model
-
-        elapsed = (time.time() - model_start) / 60
-        if rc == 0:
-            log(f"{output_name}: COMPLETE in {elapsed:.0f} min")
-            trained += 1
-            succeeded.append(output_name)
-
-            # Deploy to Ollama
+        ]
+
+    if args.parallel:
+        sys.path.insert(0, str(TRAINING_DIR))
+        from pipeline_dag import DagScheduler, Step, parse_slots
+
+        def train_step(model_key, dataset_name, output_name):
+            log(f"[Phase 3] Training {output_name} ({model_key})")
+            start = time.time()
+            rc, _ = run(train_cmd(model_key, dataset_dir(dataset_name)),
+                        timeout=6 * 3600, prefix=f"[{output_name}] ")
+            elapsed = (time.time() - start) / 60
+            if rc == 0:
+                log(f"{output_name}: COMPLETE in {elapsed:.0f} min")
+            else:
+                log(f"{output_name}: FAILED after {elapsed:.0f} min - continuing")
+            return rc == 0
+
+        def deploy_step(output_name):
             lora_name = f"{output_name}-lora"
             modelfile = GGUF_DIR / f"Modelfile.{lora_name}"
-            if ollama_ok and modelfile.exists():
-                log(f"Deploying {lora_name} to Ollama...")
-                run(["ollama", "create", lora_name, "-f", str(modelfile)])
-        else:
-            log(f"{output_name}: FAILED after {elapsed:.0f} min - continuing")
-            failed.append(output_name)
+            if not (ollama_ok and modelfile.exists()):
+                log(f"{lora_name}: no Ollama/Modelfile - deploy skipped")
+                return True
+            log(f"Deploying {lora_name} to Ollama...")
+            rc, _ = run(["ollama", "create", lora_name, "-f", str(modelfile)],
+                        prefix=f"[{lora_name}] ")
+            return rc == 0
+
+        steps = []
+        for model_key, dataset_name, output_name in models:
+            steps.append(Step(f"train:{model_key}",
+                              lambda k=model_key, d=dataset_name, o=output_name: train_step(k, d, o),
+                              model=model_key))
+            steps.append(Step(f"deploy:{model_key}", lambda o=output_name: deploy_step(o),
+                              deps=[f"train:{model_key}"], model=model_key))
+
+        progress = {}
+        if args.resume and PROGRESS_FILE.exists():
+            with open(PROGRESS_FILE, "r") as f:
+                progress = json.load(f)
+        progress.setdefault("started_at", datetime.now().isoformat())
+        scheduler = DagScheduler(steps, slots=parse_slots(args.slots), progress=progress,
+                                 progress_path=PROGRESS_FILE, log=log)
+        status = scheduler.run()
+        for model_key, _, output_name in models:
+            if status[f"train:{model_key}"] == "done":
+                trained += 1
+                succeeded.append(output_name)
+            else:
+                failed.append(output_name)
+    else:
+        for model_key, dataset_name, output_name in models:
+            log(f"\n{'=' * 60}")
+            log(f"[Phase 3] Training {output_name} ({model_key})")
+            log(f"{'=' * 60}")
+
+            model_start = time.time()
+
+            # Pick dataset
+            ds_dir = dataset_dir(dataset_name)
+            log(f"Dataset: {ds_dir}")
+
+            # Train
+            rc, _ = run(train_cmd(model_key, ds_dir), timeout=6 * 3600)  # 6h max per model
+
+            elapsed = (time.time() - model_start) / 60
+            if rc == 0:
+                log(f"{output_name}: COMPLETE in {elapsed:.0f} min")
+                trained += 1
+                succeeded.append(output_name)
+
+                # Deploy to Ollama
+                lora_name = f"{output_name}-lora"
+                modelfile = GGUF_DIR / f"Modelfile.{lora_name}"
+                if ollama_ok and modelfile.exists():
+                    log(f"Deploying {lora_name} to Ollama...")
+                    run(["ollama", "create", lora_name, "-f", str(modelfile)])
+            else:
+                log(f"{output_name}: FAILED after {elapsed:.0f} min - continuing")
+                failed.append(output_name)
 
     # ── Phase 4: Validation ──
     log(f"\n[Phase 4] Validation")
@@ -8,11 +8,20 @@ local model fails relative to Claude.
 
 This enables targeted training data generation instead of blind dataset expansion.
 
+Cases are pipelined: Ollama generates at local concurrency while Claude
+reference answers and gradings run concurrently on the rate-limited
+AsyncClaude engine, so neither side waits on the other. Claude's reference
+answers are kept in a reference store (scripts/reference_store.py) and
+reused by later runs, so analyzing a new model version only queries Ollama
+and the grader.
+
 Usage:
     python scripts/analyze_gaps.py
     python scripts/analyze_gaps.py --model chiro-no-lora-v2
     python scripts/analyze_gaps.py --model chiro-no-lora-v2 --skip-claude
     python scripts/analyze_gaps.py --category red_flags --verbose
+    python scripts/analyze_gaps.py --ollama-concurrency 2 --concurrency 16
+    python scripts/analyze_gaps.py --refresh-references   # re-ask Claude for reference answers
 
 Requirements:
     pip install anthropic requests
@@ -24,6 +33,7 @@ Output:
 """
 
 import argparse
+import asyncio
 import json
 import os
 import re
@@ -49,6 +59,9 @@ EVAL_DIR = AI_TRAINING_DIR / 'evaluation'
 BENCHMARK_FILE = EVAL_DIR / 'benchmark_cases.jsonl'
 OUTPUT_FILE = EVAL_DIR / 'gap-analysis.json'
 OLLAMA_URL = os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434')
+# Parallel generations the local server accepts (Ollama's own OLLAMA_NUM_PARALLEL)
+OLLAMA_CONCURRENCY = int(os.environ.get('OLLAMA_NUM_PARALLEL', 1))
+CLAUDE_MODEL = 'claude-sonnet-4-6'   # reference answers (part of the reference store key)
 
 # ============================================================
 # Import evaluation functions from evaluate.py
@@ -67,10 +80,12 @@ from evaluate import (
 # ============================================================
 
 from claude_utils import (
-    get_client, check_pii, cached_message, extract_text,
-    structured_generate, build_batch_request, submit_batch,
+    get_client, get_async_client, check_pii, extract_text,
+    build_batch_request, submit_batch,
     extract_batch_tool_use, CLINICAL_GRADING_TOOL,
 )
+from claude_async import AsyncClaude, FakeAsyncAnthropic, RateLimiter, DEFAULT_CONCURRENCY, DEFAULT_RPM
+from reference_store import ReferenceStore, DEFAULT_STORE
 
 
 # ============================================================
@@ -104,22 +119,40 @@ def query_ollama(model, prompt, system_prompt=None, max_tokens=500, temperature=
         return None, 0, str(e)
 
 
-def query_claude(prompt, system_prompt=None, max_tokens=500, temperature=0.3):
-    """Send prompt to Claude via shared client, with prompt caching.
+async def query_ollama_async(limit, model, prompt, system_prompt=None, max_tokens=500):
+    """query_ollama() in a worker thread, at most `limit` generations at a time."""
+    async with limit:
+        return await asyncio.to_thread(query_ollama, model, prompt, system_prompt, max_tokens)
+
+
+async def query_claude(engine, prompt, system_prompt=None, max_tokens=500, temperature=0.3,
+                       store=None):
+    """Send prompt to Claude via the shared async engine, with prompt caching.
 
-    Returns (response_text, latency_ms, error).
+    With a ReferenceStore, a stored answer to the same prompt, system prompt,
+    model and settings is returned without an API call (with the latency it
+    had when it was made), and new answers are stored.
+
+    Returns (response_text, latency_ms, error). Latency includes any wait
+    for a rate-limit slot.
     """
-    client = get_client()
     sys_text = system_prompt or 'Du er en klinisk assistent for kiropraktorer i Norge.'
+    key = (prompt, sys_text, CLAUDE_MODEL, max_tokens, temperature)
+    if store:
+        stored = store.get(*key)
+        if stored:
+            return stored[0], stored[1], None
 
     start = time.time()
     try:
-        response = cached_message(
-            client, sys_text, prompt,
+        response = await engine.message(
+            sys_text, prompt, model=CLAUDE_MODEL,
             max_tokens=max_tokens, temperature=temperature,
         )
         latency_ms = round((time.time() - start) * 1000)
         text = extract_text(response)
+        if store and text:
+            store.put(*key, text, latency_ms)
         return text, latency_ms, None
     except Exception as e:
         latency_ms = round((time.time() - start) * 1000)
@@ -135,13 +168,12 @@ GRADING_SYSTEM_PROMPT = (
 )
 
 
-def grade_with_claude(prompt, ollama_output, claude_output):
+async def grade_with_claude(engine, prompt, ollama_output, claude_output):
     """Use Claude to grade the Ollama output using structured tool_use.
 
     Returns a structured grading dict with per-dimension scores 0-100,
     or None if grading fails. Uses CLINICAL_GRADING_TOOL for guaranteed schema.
     """
-    client = get_client()
 
     grading_prompt = (
         f"Klinisk prompt:\n{prompt}\n\n"
@@ -152,8 +184,8 @@ def grade_with_claude(prompt, ollama_output, claude_output):
     )
 
     try:
-        result = structured_generate(
-            client, GRADING_SYSTEM_PROMPT, grading_prompt,
+        result = await engine.structured(
+            GRADING_SYSTEM_PROMPT, grading_prompt,
             CLINICAL_GRADING_TOOL, max_tokens=1024,
         )
         return result
@@ -273,11 +305,72 @@ def load_benchmark(category_filter=None):
     return cases
 
 
-def run_gap_analysis(model, cases, skip_claude=False, verbose=False, batch_grade=False):
+async def analyze_case(engine, ollama_limit, model, case, case_id, skip_claude=False, batch_grade=False,
+                       store=None):
+    """Ollama answer, Claude reference answer and Claude grade for one case.
+
+    The Ollama generation and the Claude reference run side by side; the
+    grade needs both, so it starts as soon as the slower one returns.
+    """
+    prompt = case.get('prompt', '')
+    system_prompt = case.get('system_prompt', None)
+    max_tokens = case.get('max_tokens', 500)
+    cat = case.get('category', 'unknown')
+
+    ollama = query_ollama_async(ollama_limit, model, prompt, system_prompt, max_tokens)
+    c_response = c_latency = c_error = None
+    if skip_claude:
+        o_response, o_latency, o_error = await ollama
+    else:
+        (o_response, o_latency, o_error), (c_response, c_latency, c_error) = await asyncio.gather(
+            ollama, query_claude(engine, prompt, system_prompt, max_tokens, store=store),
+        )
+
+    # --- Ollama ---
+    if o_error:
+        o_result = {'id': case_id, 'category': cat, 'passed': False,
+                    'error': o_error, 'latency_ms': o_latency, 'checks': {}}
+    else:
+        o_result = evaluate_case(case, o_response, o_latency)
+
+    # --- Claude ---
+    c_result = None
+    if not skip_claude:
+        if c_error:
+            c_result = {'id': case_id, 'category': cat, 'passed': False,
+                        'error': c_error, 'latency_ms': c_latency, 'checks': {}}
+        else:
+            c_result = evaluate_case(case, c_response, c_latency)
+
+    # --- Claude Grading (deferred when batch grading) ---
+    grade = None
+    if o_response and c_response and not skip_claude and not batch_grade:
+        grade = await grade_with_claude(engine, prompt, o_response, c_response)
+
+    o_passed = o_result.get('passed', False)
+    return {
+        'o_response': o_response, 'o_result': o_result,
+        'c_response': c_response, 'c_result': c_result,
+        'grade': grade,
+        'gap_types': classify_gap(case, o_result, c_result) if not o_passed else [],
+    }
+
+
+async def run_gap_analysis(engine, model, cases, skip_claude=False, verbose=False, batch_grade=False,
+                           ollama_concurrency=OLLAMA_CONCURRENCY, store=None):
     """Run gap analysis comparing Ollama model vs Claude on all cases.
 
+    Pipelined: Ollama generations run ollama_concurrency at a time while
+    Claude reference answers and gradings run at the engine's API
+    concurrency, so the local GPU and the API work at the same time.
+    Progress lines print in completion order; results are merged by case id
+    in benchmark order, so the report is the same as a sequential run's.
+
     When batch_grade=True, collects all gradable cases and submits them
     to the Batch API for 50% cost savings on Claude grading calls.
+
+    With a ReferenceStore, Claude reference answers already stored are
+    reused, so only Ollama and the grader are queried for those cases.
     """
     results = []
     categories = defaultdict(lambda: {
@@ -286,7 +379,7 @@ def run_gap_analysis(model, cases, skip_claude=False, verbose=False, batch_grade
         'gap_cases': [], 'gap_types': defaultdict(int),
     })
 
-    # Collect cases for batch grading (populated during loop, graded after)
+    # Collect cases for batch grading (graded after the pipeline drains)
     pending_grades = []
     # Map case_id to entry index for batch grade assignment
     entry_index_map = {}
@@ -294,79 +387,70 @@ def run_gap_analysis(model, cases, skip_claude=False, verbose=False, batch_grade
     total = len(cases)
     print(f'\n  Gap Analysis: {model} vs Claude')
     print(f'  Cases: {total}')
+    print(f'  Concurrency: ollama={ollama_concurrency}'
+          + ('' if skip_claude else f'  claude={engine.concurrency}'))
     if batch_grade:
         print(f'  Mode: Batch grading (50% cost savings)')
     print(f'  {"─" * 60}')
 
+    # PII check on benchmark data, before anything is sent anywhere
+    case_ids = []
     for i, case in enumerate(cases, 1):
-        prompt = case.get('prompt', '')
-        system_prompt = case.get('system_prompt', None)
-        max_tokens = case.get('max_tokens', 500)
-        cat = case.get('category', 'unknown')
-        case_id = case.get('id', f'case_{i}')
-
-        # PII check on benchmark data
-        check_pii(prompt)
-        check_pii(system_prompt)
-
-        # --- Ollama ---
-        o_response, o_latency, o_error = query_ollama(
-            model, prompt, system_prompt, max_tokens
-        )
-        if o_error:
-            o_result = {'id': case_id, 'category': cat, 'passed': False,
-                        'error': o_error, 'latency_ms': o_latency, 'checks': {}}
-        else:
-            o_result = evaluate_case(case, o_response, o_latency)
-
-        # --- Claude ---
-        c_result = None
-        c_response = None
-        if not skip_claude:
-            c_response, c_latency, c_error = query_claude(
-                prompt, system_prompt, max_tokens
-            )
-            if c_error:
-                c_result = {'id': case_id, 'category': cat, 'passed': False,
-                            'error': c_error, 'latency_ms': c_latency, 'checks': {}}
-            else:
-                c_result = evaluate_case(case, c_response, c_latency)
-
-        # --- Claude Grading (sequential or deferred for batch) ---
-        grade = None
-        if o_response and c_response and not skip_claude:
-            if batch_grade:
-                # Defer grading — collect for batch submission
-                pending_grades.append({
-                    'id': case_id,
-                    'prompt': prompt,
-                    'ollama_output': o_response[:2000],
-                    'claude_output': c_response[:2000],
-                })
-                entry_index_map[case_id] = len(results)
-            else:
-                grade = grade_with_claude(prompt, o_response, c_response)
-
-        # --- Gap Classification ---
+        check_pii(case.get('prompt', ''))
+        check_pii(case.get('system_prompt', None))
+        case_ids.append(case.get('id', f'case_{i}'))
+
+    ollama_limit = asyncio.Semaphore(ollama_concurrency)
+    finished = 0
+
+    async def run_case(case, case_id):
+        nonlocal finished
+        outcome = await analyze_case(engine, ollama_limit, model, case, case_id,
+                                     skip_claude=skip_claude, batch_grade=batch_grade, store=store)
+        finished += 1
+        o_result, c_result = outcome['o_result'], outcome['c_result']
         o_passed = o_result.get('passed', False)
-        c_passed = c_result.get('passed', False) if c_result else None
-        o_partial = o_result.get('partial_score', 0)
         c_partial = c_result.get('partial_score', 0) if c_result else None
 
-        gap_types = classify_gap(case, o_result, c_result) if not o_passed else []
-
         # Status display
         o_status = '✓' if o_passed else '✗'
-        c_status = ('✓' if c_passed else '✗') if c_result else '—'
-        print(f'  [{i:3d}/{total}] {o_status}/{c_status}  {case_id:<35s} '
-              f'ollama={o_partial:5.1f}  claude={c_partial if c_partial is not None else "—":>5}')
+        c_status = ('✓' if c_result.get('passed', False) else '✗') if c_result else '—'
+        print(f'  [{finished:3d}/{total}] {o_status}/{c_status}  {case_id:<35s} '
+              f'ollama={o_result.get("partial_score", 0):5.1f}  '
+              f'claude={c_partial if c_partial is not None else "—":>5}')
 
         if verbose and not o_passed:
-            for gap in gap_types:
+            for gap in outcome['gap_types']:
                 print(f'           gap: {gap}')
             for check_name, check_data in o_result.get('checks', {}).items():
                 if not check_data.get('pass', True):
                     print(f'           FAIL: {check_name}')
+        return outcome
+
+    outcomes = await asyncio.gather(*(run_case(c, cid) for c, cid in zip(cases, case_ids)))
+
+    # --- Merge by case id, in benchmark order ---
+    for case, case_id, outcome in zip(cases, case_ids, outcomes):
+        cat = case.get('category', 'unknown')
+        o_response, o_result = outcome['o_response'], outcome['o_result']
+        c_response, c_result = outcome['c_response'], outcome['c_result']
+        grade = outcome['grade']
+        gap_types = outcome['gap_types']
+
+        o_passed = o_result.get('passed', False)
+        c_passed = c_result.get('passed', False) if c_result else None
+        o_partial = o_result.get('partial_score', 0)
+        c_partial = c_result.get('partial_score', 0) if c_result else None
+
+        if batch_grade and o_response and c_response:
+            # Deferred grading — collect for batch submission
+            pending_grades.append({
+                'id': case_id,
+                'prompt': case.get('prompt', ''),
+                'ollama_output': o_response[:2000],
+                'claude_output': c_response[:2000],
+            })
+            entry_index_map[case_id] = len(results)
 
         # Aggregate per category
         cat_data = categories[cat]
@@ -413,7 +497,7 @@ def run_gap_analysis(model, cases, skip_claude=False, verbose=False, batch_grade
     # --- Batch grading phase ---
     if batch_grade and pending_grades:
         print(f'\n  Running batch grading for {len(pending_grades)} cases...')
-        batch_grades = grade_batch_with_claude(pending_grades)
+        batch_grades = await asyncio.to_thread(grade_batch_with_claude, pending_grades)
         # Assign grades back to result entries
         for case_id, grade_data in batch_grades.items():
             idx = entry_index_map.get(case_id)
@@ -505,6 +589,20 @@ def main():
                         help='Use Batch API for Claude grading (50%% cost savings, async)')
     parser.add_argument('--output', default=str(OUTPUT_FILE),
                         help='Output JSON file path')
+    parser.add_argument('--ollama-concurrency', type=int, default=OLLAMA_CONCURRENCY,
+                        help=f'Parallel Ollama generations (default: OLLAMA_NUM_PARALLEL or 1)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Max Claude requests in flight (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_RPM,
+                        help='Starting Claude requests/minute; adapts to rate-limit headers')
+    parser.add_argument('--fake-api', action='store_true',
+                        help='Use the local fake Messages API for Claude (no key)')
+    parser.add_argument('--reference-store', default=str(DEFAULT_STORE),
+                        help='Claude reference-answer store (reused across runs)')
+    parser.add_argument('--no-reference-store', action='store_true',
+                        help='Always ask Claude for fresh reference answers (nothing stored)')
+    parser.add_argument('--refresh-references', action='store_true',
+                        help='Ask Claude again and overwrite the stored reference answers')
     args = parser.parse_args()
 
     if not BENCHMARK_FILE.exists():
@@ -518,9 +616,29 @@ def main():
 
     print(f'  Loaded {len(cases)} benchmark cases')
 
-    results, categories = run_gap_analysis(
-        args.model, cases, args.skip_claude, args.verbose, args.batch_grade
-    )
+    engine = None
+    store = None
+    if not args.skip_claude:
+        client = FakeAsyncAnthropic() if args.fake_api else get_async_client()
+        engine = AsyncClaude(client, RateLimiter(requests_per_minute=args.rpm),
+                             concurrency=args.concurrency)
+        if not args.no_reference_store and not args.fake_api:
+            store = ReferenceStore(args.reference_store, refresh=args.refresh_references)
+            info = store.sync_benchmark(BENCHMARK_FILE)
+            if info['changed'] and info['pruned']:
+                print(f'  Benchmark changed: pruned {info["pruned"]} stale reference answers')
+            print(f'  Reference store: {store.summary()["answers"]} answers '
+                  f'(benchmark version {info["version"]})')
+
+    start = time.time()
+    results, categories = asyncio.run(run_gap_analysis(
+        engine, args.model, cases, args.skip_claude, args.verbose, args.batch_grade,
+        ollama_concurrency=args.ollama_concurrency, store=store,
+    ))
+    print(f'\n  Analyzed {len(cases)} cases in {time.time() - start:.1f}s')
+    if store:
+        print(f'  Reference answers: {store.stats["hits"]} reused, {store.stats["stored"]} new')
+        store.close()
 
     report = build_report(args.model, results, categories, args.skip_claude)
 
@@ -7,6 +7,7 @@ Usage:
     python scripts/audit_training_data.py
     python scripts/audit_training_data.py --fix  # Auto-remove bad examples
     python scripts/audit_training_data.py --dataset norwegian-clinical
+    python scripts/audit_training_data.py --corpus-overlap  # + cross-dataset/benchmark overlap (overlap_index.py)
 """
 
 import argparse
@@ -17,8 +18,9 @@ import sys
 from collections import Counter, defaultdict
 from pathlib import Path
 
-# Norwegian characters (øæå) indicate Norwegian text
-NORWEGIAN_CHARS = set('æøåÆØÅ')
+from dataset_cache import load_rows
+from text_features import detect_language, text_features
+
 # Minimum response length (chars) to be useful for training
 MIN_RESPONSE_LENGTH = 20
 # Maximum example length in chars (~tokens ≈ chars / 4)
@@ -26,16 +28,6 @@ MAX_EXAMPLE_CHARS = 16000  # ~4096 tokens
 # Minimum example length
 MIN_EXAMPLE_CHARS = 30
 
-# Common contamination keywords (non-clinical)
-CONTAMINATION_KEYWORDS = [
-    'bubble.io', 'react.js', 'github.com', 'npm install', 'react component',
-    'api endpoint', 'deployment pipeline', 'javascript', 'typescript',
-    'docker compose', 'kubernetes', 'redux', 'tailwind css', 'prisma',
-    'webpack config', 'next.js', 'node_modules',
-    # Note: 'vite' excluded — it means "to know" in Norwegian (å vite)
-    # Note: 'frontend'/'backend' excluded — too common in general usage
-]
-
 DATASETS = {
     'all-clean': 'General clinical (all)',
     'norwegian-clinical': 'Norwegian clinical specialist',
@@ -61,26 +53,7 @@ def load_jsonl(path):
 
 def has_norwegian_chars(text):
     """Check if text contains Norwegian-specific characters."""
-    return bool(NORWEGIAN_CHARS & set(text))
-
-
-def detect_language(text):
-    """Simple language detection based on character patterns."""
-    norwegian_count = sum(1 for c in text if c in NORWEGIAN_CHARS)
-    total_alpha = sum(1 for c in text if c.isalpha())
-    if total_alpha == 0:
-        return 'unknown'
-    ratio = norwegian_count / total_alpha
-    if ratio > 0.005:  # ~0.5% Norwegian chars → likely Norwegian
-        return 'norwegian'
-    # Check for common Norwegian words
-    norwegian_words = ['og', 'er', 'det', 'som', 'på', 'med', 'den', 'til', 'av', 'for',
-                       'pasient', 'smerte', 'behandling', 'vurdering', 'tiltak']
-    words = text.lower().split()
-    matches = sum(1 for w in words if w in norwegian_words)
-    if matches >= 3:
-        return 'norwegian'
-    return 'english_or_other'
+    return text_features(text).norwegian_chars > 0
 
 
 def check_chatml_format(example):
@@ -153,11 +126,10 @@ def check_content_quality(example):
         issues.append(f'too_short ({total_chars} chars)')
 
     # Check for contamination
-    all_text = ' '.join(m.get('content', '') for m in messages).lower()
-    for keyword in CONTAMINATION_KEYWORDS:
-        if keyword in all_text:
-            issues.append(f'contamination ({keyword})')
-            break
+    all_text = ' '.join(m.get('content', '') for m in messages)
+    contamination = text_features(all_text).found('contamination')
+    if contamination:
+        issues.append(f'contamination ({contamination[0]})')
 
     # Check for repetition (same sentence repeated 3+ times)
     sentences = re.split(r'[.!?]\s+', response)
@@ -232,7 +204,8 @@ def audit_dataset(data_dir, dataset_name, verbose=False):
             report['splits'][split] = {'count': 0, 'error': 'file not found'}
             continue
 
-        examples = load_jsonl(path)
+        # Columnar cache when it lines up 1:1 with the JSONL, else parse
+        examples, _ = load_rows(path, strict=True)
         report['splits'][split] = {'count': len(examples)}
         total_examples += len(examples)
         all_examples.extend(examples)
@@ -416,6 +389,8 @@ def main():
     parser.add_argument('--verbose', action='store_true', help='Show detailed issues')
     parser.add_argument('--output', type=str, default=None,
                         help='Save report to JSON file')
+    parser.add_argument('--corpus-overlap', action='store_true',
+                        help='Also update the corpus overlap index and report cross-split/benchmark leakage')
     args = parser.parse_args()
 
     base_dir = Path(__file__).parent.parent / 'data' / 'processed'
@@ -465,6 +440,18 @@ def main():
     print(f'  Total issues: {total_issues}')
     print(f'  Overall issue rate: {round(total_issues / max(total_examples, 1) * 100, 1)}%')
 
+    # find_duplicates only sees one dataset; the overlap index spans all splits + the benchmark
+    overlap = None
+    if args.corpus_overlap:
+        from overlap_index import OverlapIndex, discover_files, print_report as print_overlap
+        index = OverlapIndex()
+        try:
+            index.update(discover_files(), quiet=True)
+            overlap = index.contamination_report()
+        finally:
+            index.close()
+        print_overlap(overlap)
+
     # Save report
     if args.output:
         output_path = args.output
@@ -479,6 +466,8 @@ def main():
             r = dict(report)
             r['issues'] = {k: v for k, v in report['issues'].items()}
             serializable[name] = r
+        if overlap is not None:
+            serializable['_corpus_overlap'] = overlap
         json.dump(serializable, f, indent=2, ensure_ascii=False)
 
     print(f'\n  Report saved to: {output_path}')
@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Async Claude Engine — ChiroClickCRM AI Training Pipeline
+
+Concurrent Messages API calls with an adaptive rate limiter, for the
+generation / distillation / grading scripts that used to call Claude one
+request at a time with fixed sleeps in between.
+
+- RateLimiter: token buckets for requests and input tokens per minute.
+  Buckets follow the anthropic-ratelimit-* response headers (limit,
+  remaining), and a 429 pauses every caller until retry-after and halves
+  the send rate, which then recovers additively on each success.
+- AsyncClaude: `await engine.create(**params)`, `structured(...)`,
+  `message(...)`; bounded concurrency, retries on 429/5xx/529.
+- FakeAsyncAnthropic: local stand-in for AsyncAnthropic with latency,
+  a server-side request limit (429 + headers) and deterministic content
+  derived from the request, for exercising the engine without an API key.
+  FakeAnthropic is the synchronous counterpart, with the Batches API.
+
+Results come back per call, so callers that gather tasks in a fixed order
+get the same output regardless of completion order.
+
+Usage:
+    from claude_async import AsyncClaude, RateLimiter
+    engine = AsyncClaude(get_async_client(), RateLimiter(requests_per_minute=50))
+    result = await engine.structured(system, prompt, TRAINING_EXAMPLE_TOOL)
+
+    python scripts/claude_async.py --simulate          # serial vs concurrent on the fake API
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from claude_utils import extract_text, extract_tool_input, message_params
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RPM = 50
+MAX_RETRIES = 6
+RETRY_STATUS = {429, 500, 502, 503, 504, 529}
+MIN_RATE_FRACTION = 0.1     # a throttled bucket never drops below 10% of its limit
+RECOVERY_FRACTION = 0.05    # +5% of the limit per successful call
+
+
+# ============================================================
+# Rate limiting
+# ============================================================
+
+class TokenBucket:
+    """Continuously refilled bucket of `limit` units per minute.
+
+    Holds up to `capacity` units (default: a full minute's worth, as the
+    API's buckets do).
+    """
+
+    def __init__(self, per_minute, clock=time.monotonic, capacity=None):
+        self.clock = clock
+        self.limit = float(per_minute)
+        self.rate = self.limit / 60
+        self.capacity = float(capacity or per_minute)
+        self.level = self.capacity
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount):
+        """Seconds until `amount` units are available (0 = available now)."""
+        self.refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+    def sync(self, limit=None, remaining=None):
+        """Adopt the server's view of this bucket (anthropic-ratelimit-* headers)."""
+        self.refill()
+        if limit and limit != self.limit:
+            scale = self.rate / (self.limit / 60)
+            self.capacity = self.capacity / self.limit * float(limit)
+            self.limit = float(limit)
+            self.rate = self.limit / 60 * scale
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+    def throttle(self):
+        self.refill()
+        self.level = 0.0
+        self.rate = max(self.limit / 60 * MIN_RATE_FRACTION, self.rate / 2)
+
+    def recover(self):
+        self.rate = min(self.limit / 60, self.rate + self.limit / 60 * RECOVERY_FRACTION)
+
+
+def _header(headers, name):
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _seconds_until(stamp):
+    try:
+        reset = datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+class RateLimiter:
+    """Request + input-token buckets shared by every task of one engine.
+
+    All bookkeeping happens between awaits on one event loop, so no locks.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_RPM, input_tokens_per_minute=None,
+                 clock=time.monotonic):
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(input_tokens_per_minute, clock) if input_tokens_per_minute else None
+        self.paused_until = 0.0
+
+    async def acquire(self, tokens=0):
+        while True:
+            wait = self.paused_until - self.clock()
+            if wait <= 0:
+                wait = self.requests.wait_for(1)
+                if self.tokens and tokens:
+                    wait = max(wait, self.tokens.wait_for(tokens))
+                if wait <= 0:
+                    self.requests.take(1)
+                    if self.tokens and tokens:
+                        self.tokens.take(tokens)
+                    return
+            await asyncio.sleep(wait)
+
+    def observe(self, headers):
+        """Successful response: follow the rate-limit headers and recover the send rate."""
+        headers = headers or {}
+        self.requests.sync(_header(headers, 'anthropic-ratelimit-requests-limit'),
+                           _header(headers, 'anthropic-ratelimit-requests-remaining'))
+        self.requests.recover()
+        if self.tokens:
+            self.tokens.sync(_header(headers, 'anthropic-ratelimit-input-tokens-limit'),
+                             _header(headers, 'anthropic-ratelimit-input-tokens-remaining'))
+            self.tokens.recover()
+
+    def rate_limited(self, headers, attempt):
+        """429: pause everyone until retry-after (or the bucket reset) and halve the rate."""
+        headers = headers or {}
+        delay = _header(headers, 'retry-after')
+        if delay is None:
+            delay = _seconds_until(headers.get('anthropic-ratelimit-requests-reset'))
+        if delay is None:
+            delay = min(60.0, 2.0 ** attempt)
+        self.paused_until = max(self.paused_until, self.clock() + delay)
+        self.requests.throttle()
+        if self.tokens:
+            self.tokens.throttle()
+        return delay
+
+
+def estimate_input_tokens(params):
+    """Rough input size (~4 chars per token) for the token bucket."""
+    size = len(json.dumps(params.get('system', ''), ensure_ascii=False))
+    size += len(json.dumps(params.get('messages', []), ensure_ascii=False))
+    size += len(json.dumps(params.get('tools', []), ensure_ascii=False))
+    return size // 4 + 1
+
+
+# ============================================================
+# Engine
+# ============================================================
+
+def _retryable(exc):
+    status = getattr(exc, 'status_code', None)
+    if status is not None:
+        return status in RETRY_STATUS
+    return type(exc).__name__ in ('APIConnectionError', 'APITimeoutError') or \
+        isinstance(exc, (asyncio.TimeoutError, ConnectionError))
+
+
+class AsyncClaude:
+    """Rate-limited, bounded-concurrency wrapper around an AsyncAnthropic client."""
+
+    def __init__(self, client, limiter=None, concurrency=DEFAULT_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.client = client
+        self.limiter = limiter or RateLimiter()
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._semaphore = None
+        self.stats = Counter()
+
+    @property
+    def semaphore(self):
+        # Created lazily so the engine can be built outside the event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def create(self, **params):
+        """messages.create() with rate limiting and retries. Returns the parsed message."""
+        tokens = estimate_input_tokens(params)
+        for attempt in range(self.max_retries + 1):
+            async with self.semaphore:
+                # Take rate budget only once a slot is free, so queued tasks don't hoard it
+                await self.limiter.acquire(tokens)
+                try:
+                    raw = await self.client.messages.with_raw_response.create(**params)
+                except Exception as e:
+                    if attempt >= self.max_retries or not _retryable(e):
+                        self.stats['errors'] += 1
+                        raise
+                    headers = getattr(getattr(e, 'response', None), 'headers', None)
+                    if getattr(e, 'status_code', None) == 429:
+                        self.stats['rate_limited'] += 1
+                        self.limiter.rate_limited(headers, attempt)
+                    else:
+                        self.stats['retries'] += 1
+                        delay = min(30.0, 2.0 ** attempt)
+                        self.limiter.paused_until = max(self.limiter.paused_until,
+                                                        self.limiter.clock() + delay)
+                    continue
+            self.stats['requests'] += 1
+            self.limiter.observe(raw.headers)
+            return raw.parse()
+
+    async def message(self, system_prompt, user_content, **kwargs):
+        """Async cached_message(): full response object."""
+        return await self.create(**message_params(system_prompt, user_content, **kwargs))
+
+    async def structured(self, system_prompt, user_content, tool_definition, **kwargs):
+        """Async structured_generate(): the forced tool call's input, or None."""
+        response = await self.create(**message_params(
+            system_prompt, user_content, tools=[tool_definition],
+            tool_choice={'type': 'tool', 'name': tool_definition['name']}, **kwargs,
+        ))
+        return extract_tool_input(response, tool_definition['name'])
+
+
+# ============================================================
+# Local fake Messages API
+# ============================================================
+
+class FakeAPIError(Exception):
+    """Shape of anthropic.APIStatusError: status_code + response.headers."""
+
+    def __init__(self, status_code, headers):
+        super().__init__(f'fake API error {status_code}')
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers)
+
+
+def request_seed(params):
+    """Stable seed of a request: same request, same fake response."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, ensure_ascii=False,
+                                     default=str).encode('utf-8')).hexdigest()
+
+
+def fake_tool_input(schema, seed):
+    """Schema-valid tool input, deterministic in the seed."""
+    rng = random.Random(seed)
+    out = {}
+    for name, prop in schema.get('properties', {}).items():
+        kind = prop.get('type')
+        if 'enum' in prop:
+            out[name] = rng.choice(prop['enum'])
+        elif kind == 'integer':
+            out[name] = rng.randint(prop.get('minimum', 0), prop.get('maximum', 100))
+        elif kind == 'number':
+            out[name] = round(rng.uniform(prop.get('minimum', 0), prop.get('maximum', 1)), 3)
+        elif kind == 'boolean':
+            out[name] = rng.random() < 0.7
+        elif kind == 'array':
+            items = prop.get('items', {}).get('enum')
+            out[name] = rng.sample(items, k=rng.randint(0, min(2, len(items)))) if items else ['smerte']
+        else:
+            out[name] = (f'{name} {seed[:8]}: fiktivt eksempel, pasient med lumbalgi (L03), '
+                         f'smerter i korsryggen og redusert bevegelighet.')
+    return out
+
+
+def fake_text(params, seed):
+    """Default text reply: a training example as JSON (the pipeline's common shape)."""
+    return json.dumps({
+        'instruction': f'Fiktiv instruksjon {seed[:8]} for testkjøring av pipeline.',
+        'input': '',
+        'output': f'Fiktivt svar {seed[:8]}: lumbalgi (L03), anbefaler øvelser og oppfølging.',
+        'quality_self_score': 3 + int(seed[8], 16) % 3,
+    }, ensure_ascii=False)
+
+
+def fake_message(params, seed=None, responder=None):
+    """The fake API's reply to a request: tool_use for a forced tool, else text (+ thinking)."""
+    seed = seed or request_seed(params)
+    content = []
+    if params.get('thinking'):
+        content.append(SimpleNamespace(type='thinking', thinking=f'Fiktiv resonnering {seed[:8]}.'))
+    choice = params.get('tool_choice') or {}
+    tools = {t['name']: t for t in params.get('tools', [])}
+    if choice.get('type') == 'tool' and choice.get('name') in tools:
+        content.append(SimpleNamespace(type='tool_use', name=choice['name'],
+                                       input=fake_tool_input(tools[choice['name']]['input_schema'], seed)))
+    else:
+        content.append(SimpleNamespace(type='text', text=(responder or fake_text)(params, seed)))
+    return SimpleNamespace(
+        content=content, stop_reason='end_turn', model=params.get('model'),
+        usage=SimpleNamespace(input_tokens=estimate_input_tokens(params), output_tokens=100),
+    )
+
+
+class _FakeRawResponse:
+    def __init__(self, headers, message):
+        self.headers = headers
+        self._message = message
+
+    def parse(self):
+        return self._message
+
+
+class FakeAsyncAnthropic:
+    """In-process AsyncAnthropic stand-in: latency, a request limit with 429s, fixed content.
+
+    `responder(params, seed)` can replace the default text reply.
+    """
+
+    def __init__(self, requests_per_minute=600, latency=0.05, jitter=0.5, responder=None,
+                 burst_seconds=1.0, clock=time.monotonic):
+        self.limit = requests_per_minute
+        # A short burst allowance makes over-eager clients hit 429s quickly
+        self.bucket = TokenBucket(requests_per_minute, clock,
+                                  capacity=max(1.0, requests_per_minute / 60 * burst_seconds))
+        self.latency = latency
+        self.jitter = jitter
+        self.responder = responder or fake_text
+        self.calls = Counter()
+        self.messages = SimpleNamespace(
+            with_raw_response=SimpleNamespace(create=self._create),
+            create=self._create_parsed,
+        )
+
+    def _headers(self):
+        reset = datetime.now(timezone.utc).timestamp() + (1 - self.bucket.level) / self.bucket.rate
+        return {
+            'anthropic-ratelimit-requests-limit': str(self.limit),
+            'anthropic-ratelimit-requests-remaining': str(max(0, int(self.bucket.level))),
+            'anthropic-ratelimit-requests-reset':
+                datetime.fromtimestamp(max(reset, 0), timezone.utc).isoformat(),
+        }
+
+    async def _create(self, **params):
+        seed = request_seed(params)
+        if self.bucket.wait_for(1) > 0:
+            self.calls['429'] += 1
+            headers = self._headers()
+            headers['retry-after'] = f'{self.bucket.wait_for(1):.3f}'
+            raise FakeAPIError(429, headers)
+        self.bucket.take(1)
+        self.calls['ok'] += 1
+        # Latency varies by request but is fixed per request (reproducible schedules)
+        await asyncio.sleep(self.latency * (1 + self.jitter * (int(seed[:4], 16) / 0xFFFF - 0.5)))
+
+        message = fake_message(params, seed, self.responder)
+        return _FakeRawResponse(self._headers(), message)
+
+    async def _create_parsed(self, **params):
+        return (await self._create(**params)).parse()
+
+
+class FakeAnthropic:
+    """Synchronous stand-in for anthropic.Anthropic incl. the Message Batches API.
+
+    Batches end immediately unless batch_seconds / batch_seconds_per_request
+    give them a processing time; `fail_every` marks every n-th request as
+    errored to exercise retry paths. Content matches FakeAsyncAnthropic.
+    """
+
+    def __init__(self, responder=None, fail_every=0, batch_seconds=0.0, batch_seconds_per_request=0.0,
+                 clock=time.monotonic):
+        self.responder = responder
+        self.fail_every = fail_every
+        self.batch_seconds = batch_seconds
+        self.batch_seconds_per_request = batch_seconds_per_request
+        self.clock = clock
+        self._ends_at = {}
+        self.calls = Counter()
+        self._batches = {}
+        self.messages = SimpleNamespace(
+            create=self._create,
+            batches=SimpleNamespace(create=self._batch_create, retrieve=self._batch_retrieve,
+                                    results=self._batch_results),
+        )
+
+    def _create(self, **params):
+        self.calls['ok'] += 1
+        return fake_message(params, responder=self.responder)
+
+    def _batch_create(self, requests):
+        batch_id = f'msgbatch_fake_{len(self._batches) + 1:04d}'
+        results = []
+        for n, req in enumerate(requests, 1):
+            if self.fail_every and n % self.fail_every == 0:
+                result = SimpleNamespace(type='errored', error={'type': 'overloaded_error'})
+            else:
+                result = SimpleNamespace(type='succeeded',
+                                         message=fake_message(req['params'], responder=self.responder))
+            results.append(SimpleNamespace(custom_id=req['custom_id'], result=result))
+        self._batches[batch_id] = results
+        self._ends_at[batch_id] = self.clock() + self.batch_seconds + self.batch_seconds_per_request * len(requests)
+        self.calls['batches'] += 1
+        self.calls['batch_requests'] += len(requests)
+        return SimpleNamespace(id=batch_id)
+
+    def _batch_retrieve(self, batch_id):
+        results = self._batches[batch_id]
+        if self.clock() < self._ends_at[batch_id]:
+            return SimpleNamespace(
+                id=batch_id, processing_status='in_progress',
+                request_counts=SimpleNamespace(processing=len(results), succeeded=0,
+                                               errored=0, expired=0, canceled=0),
+            )
+        errored = sum(1 for r in results if r.result.type == 'errored')
+        return SimpleNamespace(
+            id=batch_id, processing_status='ended',
+            request_counts=SimpleNamespace(processing=0, succeeded=len(results) - errored,
+                                           errored=errored, expired=0, canceled=0),
+        )
+
+    def _batch_results(self, batch_id):
+        return iter(self._batches[batch_id])
+
+
+# ============================================================
+# Simulation
+# ============================================================
+
+async def _simulate(n, concurrency, rpm, server_rpm, latency):
+    client = FakeAsyncAnthropic(requests_per_minute=server_rpm, latency=latency)
+    engine = AsyncClaude(client, RateLimiter(requests_per_minute=rpm), concurrency=concurrency)
+    start = time.perf_counter()
+    replies = await asyncio.gather(*(engine.message('system', f'prompt {i}', max_tokens=64)
+                                     for i in range(n)))
+    elapsed = time.perf_counter() - start
+    digest = hashlib.sha256(''.join(extract_text(r) for r in replies).encode()).hexdigest()[:12]
+    return elapsed, engine.stats, client.calls, digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise the async Claude engine on the fake API')
+    parser.add_argument('--simulate', action='store_true', help='Serial vs concurrent run on the fake API')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument('--rpm', type=int, default=6000, help='Client-side starting limit')
+    parser.add_argument('--server-rpm', type=int, default=3000, help='Fake server limit')
+    parser.add_argument('--latency', type=float, default=0.05, help='Fake API latency (s)')
+    args = parser.parse_args()
+
+    if not args.simulate:
+        parser.print_help()
+        return 0
+
+    print(f'  Fake API: {args.latency * 1000:.0f}ms latency, {args.server_rpm} req/min limit; '
+          f'client starts at {args.rpm} req/min')
+    for concurrency in (1, args.concurrency):
+        elapsed, stats, calls, digest = asyncio.run(
+            _simulate(args.requests, concurrency, args.rpm, args.server_rpm, args.latency))
+        print(f'  concurrency {concurrency:3d}: {args.requests} requests in {elapsed:6.2f}s '
+              f'({args.requests / elapsed:6.1f} req/s)  429s: {calls["429"]:3d}  '
+              f'output sha {digest}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,6 +14,8 @@ Usage:
         get_client, cached_message, structured_generate,
         submit_batch, check_pii, ensure_anthropic,
     )
+
+    Concurrent/async calls with rate limiting: see claude_async.py.
 """
 
 import json
@@ -68,6 +70,22 @@ def get_client():
     return _client
 
 
+def get_async_client():
+    """Create an AsyncAnthropic client for claude_async.AsyncClaude.
+
+    SDK-level retries are disabled: the engine's rate limiter has to see
+    429s and rate-limit headers to adapt.
+    """
+    anthropic = ensure_anthropic()
+
+    api_key = os.environ.get('ANTHROPIC_API_KEY')
+    if not api_key:
+        print('  ERROR: ANTHROPIC_API_KEY not set')
+        sys.exit(1)
+
+    return anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+
+
 def reset_client():
     """Reset the cached client (useful for testing)."""
     global _client
@@ -100,6 +118,39 @@ def has_pii(text):
 # Prompt caching wrapper
 # ============================================================
 
+def message_params(system_prompt, user_content, model='claude-sonnet-4-6',
+                   max_tokens=1024, temperature=0.3, cache_system=True,
+                   tools=None, tool_choice=None, **kwargs):
+    """Build messages.create() parameters (shared by sync, async and batch calls).
+
+    With cache_system the system prompt gets cache_control: {"type": "ephemeral"}.
+    """
+    if cache_system:
+        system = [
+            {
+                'type': 'text',
+                'text': system_prompt,
+                'cache_control': {'type': 'ephemeral'},
+            }
+        ]
+    else:
+        system = system_prompt
+
+    params = {
+        'model': model,
+        'max_tokens': max_tokens,
+        'system': system,
+        'messages': [{'role': 'user', 'content': user_content}],
+        'temperature': temperature,
+    }
+    if tools:
+        params['tools'] = tools
+    if tool_choice:
+        params['tool_choice'] = tool_choice
+    params.update(kwargs)
+    return params
+
+
 def cached_message(client, system_prompt, user_content, model='claude-sonnet-4-6',
                    max_tokens=1024, temperature=0.3, **kwargs):
     """Send a message with prompt caching on the system prompt.
@@ -110,26 +161,10 @@ def cached_message(client, system_prompt, user_content, model='claude-sonnet-4-6
 
     Returns the full response object (access .content, .usage, etc.).
     """
-    # Build system with cache control
-    system = [
-        {
-            'type': 'text',
-            'text': system_prompt,
-            'cache_control': {'type': 'ephemeral'},
-        }
-    ]
-
-    messages = [{'role': 'user', 'content': user_content}]
-
-    response = client.messages.create(
-        model=model,
-        max_tokens=max_tokens,
-        system=system,
-        messages=messages,
-        temperature=temperature,
-        **kwargs,
-    )
-    return response
+    return client.messages.create(**message_params(
+        system_prompt, user_content, model=model, max_tokens=max_tokens,
+        temperature=temperature, **kwargs,
+    ))
 
 
 def extract_text(response):
@@ -169,36 +204,21 @@ def structured_generate(client, system_prompt, user_content, tool_definition,
     Returns:
         Parsed JSON dict from the tool call, or None if extraction failed.
     """
-    # Build system prompt (with optional caching)
-    if cache_system:
-        system = [
-            {
-                'type': 'text',
-                'text': system_prompt,
-                'cache_control': {'type': 'ephemeral'},
-            }
-        ]
-    else:
-        system = system_prompt
-
-    messages = [{'role': 'user', 'content': user_content}]
-
-    response = client.messages.create(
-        model=model,
-        max_tokens=max_tokens,
-        system=system,
-        messages=messages,
-        temperature=temperature,
+    response = client.messages.create(**message_params(
+        system_prompt, user_content, model=model, max_tokens=max_tokens,
+        temperature=temperature, cache_system=cache_system,
         tools=[tool_definition],
         tool_choice={'type': 'tool', 'name': tool_definition['name']},
         **kwargs,
-    )
+    ))
+    return extract_tool_input(response, tool_definition['name'])
 
-    # Extract the tool use result
+
+def extract_tool_input(response, tool_name):
+    """Input of the named tool_use block in a response, or None."""
     for block in response.content:
-        if block.type == 'tool_use' and block.name == tool_definition['name']:
+        if block.type == 'tool_use' and block.name == tool_name:
             return block.input
-
     return None
 
 
@@ -208,29 +228,16 @@ def structured_generate(client, system_prompt, user_content, tool_definition,
 
 def build_batch_request(custom_id, system_prompt, user_content,
                         model='claude-sonnet-4-6', max_tokens=1024,
-                        temperature=0.3, tools=None, tool_choice=None):
+                        temperature=0.3, tools=None, tool_choice=None, **kwargs):
     """Build a single request for the Batch API.
 
+    Extra kwargs (e.g. thinking) go into the request params.
     Returns a dict ready to be included in a batch create call.
     """
-    params = {
-        'model': model,
-        'max_tokens': max_tokens,
-        'temperature': temperature,
-        'system': [
-            {
-                'type': 'text',
-                'text': system_prompt,
-                'cache_control': {'type': 'ephemeral'},
-            }
-        ],
-        'messages': [{'role': 'user', 'content': user_content}],
-    }
-
-    if tools:
-        params['tools'] = tools
-    if tool_choice:
-        params['tool_choice'] = tool_choice
+    params = message_params(
+        system_prompt, user_content, model=model, max_tokens=max_tokens,
+        temperature=temperature, tools=tools, tool_choice=tool_choice, **kwargs,
+    )
 
     return {
         'custom_id': custom_id,
@@ -238,28 +245,15 @@ def build_batch_request(custom_id, system_prompt, user_content,
     }
 
 
-def submit_batch(client, requests, poll_interval=30, max_wait=3600):
-    """Submit a batch of requests and poll until completion.
-
-    Args:
-        client: Anthropic client
-        requests: List of batch request dicts (from build_batch_request)
-        poll_interval: Seconds between status polls
-        max_wait: Maximum seconds to wait before giving up
-
-    Returns:
-        List of (custom_id, result_dict) tuples.
-        result_dict has 'type' ('succeeded'|'errored'|'expired') and 'message' for succeeded.
-    """
-    if not requests:
-        return []
-
-    # Create the batch
+def create_batch(client, requests):
+    """Create a batch job and return its id (poll with wait_for_batch)."""
     batch = client.messages.batches.create(requests=requests)
-    batch_id = batch.id
-    print(f'  Batch created: {batch_id} ({len(requests)} requests)')
+    print(f'  Batch created: {batch.id} ({len(requests)} requests)')
+    return batch.id
 
-    # Poll until complete
+
+def wait_for_batch(client, batch_id, poll_interval=30, max_wait=3600):
+    """Poll a batch until it ends. Returns True if it ended within max_wait."""
     start = time.time()
     while time.time() - start < max_wait:
         batch = client.messages.batches.retrieve(batch_id)
@@ -274,13 +268,21 @@ def submit_batch(client, requests, poll_interval=30, max_wait=3600):
 
         if status == 'ended':
             print()  # Newline after \r
-            break
+            return True
 
         time.sleep(poll_interval)
-    else:
-        print(f'\n  WARNING: Batch {batch_id} timed out after {max_wait}s')
 
-    # Collect results
+    print(f'\n  WARNING: Batch {batch_id} timed out after {max_wait}s')
+    return False
+
+
+def batch_ended(client, batch_id):
+    """Non-blocking status check: True once the batch has ended."""
+    return client.messages.batches.retrieve(batch_id).processing_status == 'ended'
+
+
+def collect_batch_results(client, batch_id):
+    """Results of a batch as (custom_id, result_dict) tuples (see submit_batch)."""
     results = []
     try:
         for result in client.messages.batches.results(batch_id):
@@ -308,6 +310,27 @@ def submit_batch(client, requests, poll_interval=30, max_wait=3600):
     return results
 
 
+def submit_batch(client, requests, poll_interval=30, max_wait=3600):
+    """Submit a batch of requests and poll until completion.
+
+    Args:
+        client: Anthropic client
+        requests: List of batch request dicts (from build_batch_request)
+        poll_interval: Seconds between status polls
+        max_wait: Maximum seconds to wait before giving up
+
+    Returns:
+        List of (custom_id, result_dict) tuples.
+        result_dict has 'type' ('succeeded'|'errored'|'expired') and 'message' for succeeded.
+    """
+    if not requests:
+        return []
+
+    batch_id = create_batch(client, requests)
+    wait_for_batch(client, batch_id, poll_interval, max_wait)
+    return collect_batch_results(client, batch_id)
+
+
 def extract_batch_text(result):
     """Extract text content from a batch result's message.
 
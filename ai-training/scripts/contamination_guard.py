@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Benchmark Contamination Guard — ChiroClickCRM AI Training Pipeline
+
+In-memory filter that keeps evaluation/benchmark_cases.jsonl prompts out of
+generated training data. Built once per process from the benchmark:
+
+- every benchmark prompt is shingled into word 5-grams (same normalization
+  as overlap_index.py) that go into one hash table,
+  n-gram → benchmark cases containing it
+- checking an example intersects its prompt n-grams with the table (a set
+  operation in C) and counts hits per case;
+  an example is contaminated when it contains at least NEAR_CONTAINMENT of
+  some benchmark prompt's n-grams, or the whole normalized prompt
+
+With ~120 benchmark prompts the table holds ~2k n-grams: a check costs
+~10µs for a typical prompt, less than probing a pure-Python Bloom filter
+k times per n-gram, and it also names the matched case.
+
+Generators write through write_jsonl() (or screen() before their own
+writes), which drops contaminated examples and reports what matched.
+
+Usage:
+    from contamination_guard import write_jsonl
+    write_jsonl(output_file, examples)
+
+    python scripts/contamination_guard.py data/mined/*.jsonl   # scan existing files
+    python scripts/contamination_guard.py --benchmark            # time the check
+"""
+
+import argparse
+import json
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+from overlap_index import BENCHMARK_FILE, NGRAM, normalize_words, prompt_text
+
+NEAR_CONTAINMENT = 0.5   # share of a benchmark prompt's n-grams found in the example
+
+
+def _grams(words, n=NGRAM):
+    """Word n-grams as tuples (zip over shifted slices runs in C)."""
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return set(zip(*(words[i:] for i in range(n))))
+
+
+class BenchmarkGuard:
+    """Hashed n-gram table of benchmark prompts; check() reports the closest case."""
+
+    def __init__(self, cases, threshold=NEAR_CONTAINMENT):
+        self.threshold = threshold
+        self.case_ids = []
+        self.case_sizes = []
+        self.exact = {}
+        self.table = {}
+        for case in cases:
+            words = normalize_words(case.get('prompt', ''))
+            if not words:
+                continue
+            idx = len(self.case_ids)
+            self.case_ids.append(case.get('id', f'case_{idx}'))
+            grams = _grams(words)
+            self.case_sizes.append(len(grams))
+            self.exact[' '.join(words)] = idx
+            for gram in grams:
+                self.table.setdefault(gram, []).append(idx)
+
+    @classmethod
+    def from_file(cls, path=BENCHMARK_FILE, threshold=NEAR_CONTAINMENT):
+        cases = []
+        path = Path(path)
+        if path.exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        cases.append(json.loads(line))
+        return cls(cases, threshold)
+
+    def __len__(self):
+        return len(self.case_ids)
+
+    def check(self, text):
+        """(benchmark id, containment) of the closest benchmark prompt if ≥ threshold, else None."""
+        words = normalize_words(text)
+        if not words:
+            return None
+        idx = self.exact.get(' '.join(words))
+        if idx is not None:
+            return self.case_ids[idx], 1.0
+        table = self.table
+        matched = [table[g] for g in _grams(words) & table.keys()]
+        if not matched:
+            return None
+        hits = {}
+        for cases in matched:
+            for c in cases:
+                hits[c] = hits.get(c, 0) + 1
+        best, count = max(((c, n / self.case_sizes[c]) for c, n in hits.items()), key=lambda x: x[1])
+        return (self.case_ids[best], round(count, 3)) if count >= self.threshold else None
+
+    def check_example(self, example):
+        return self.check(prompt_text(example))
+
+    def screen(self, examples):
+        """Split examples into (clean, [(example, benchmark id, containment), ...])."""
+        clean, rejected = [], []
+        for ex in examples:
+            match = self.check_example(ex)
+            if match:
+                rejected.append((ex, *match))
+            else:
+                clean.append(ex)
+        return clean, rejected
+
+
+@lru_cache(maxsize=1)
+def get_guard():
+    """The process-wide guard over evaluation/benchmark_cases.jsonl (built on first use)."""
+    return BenchmarkGuard.from_file()
+
+
+def report_rejected(rejected, total, label='', kept=False):
+    if not rejected:
+        return
+    where = f' in {label}' if label else ''
+    action = 'tagged' if kept else 'dropped'
+    print(f'  Benchmark guard: {action} {len(rejected)}/{total} examples{where} overlapping benchmark prompts')
+    for ex, case_id, containment in rejected[:5]:
+        print(f'    {case_id} ({containment:.0%}): {" ".join(prompt_text(ex).split())[:70]}')
+    if len(rejected) > 5:
+        print(f'    ... and {len(rejected) - 5} more')
+
+
+def write_jsonl(path, examples, allow_overlap=False, guard=None):
+    """Write examples as JSONL through the benchmark guard. Returns the count written.
+
+    Overlapping examples are dropped, or with allow_overlap kept and tagged
+    with metadata.benchmark_overlap (for runs evaluated on a held-out benchmark).
+    """
+    guard = guard or get_guard()
+    examples = list(examples)
+    clean, rejected = guard.screen(examples)
+    report_rejected(rejected, len(examples), Path(path).name, kept=allow_overlap)
+    if allow_overlap:
+        for ex, case_id, containment in rejected:
+            ex.setdefault('metadata', {})['benchmark_overlap'] = {'id': case_id, 'containment': containment}
+        clean = examples
+    with open(path, 'w', encoding='utf-8') as f:
+        for ex in clean:
+            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    return len(clean)
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Check JSONL files against benchmark prompts')
+    parser.add_argument('files', nargs='*', type=Path)
+    parser.add_argument('--threshold', type=float, default=NEAR_CONTAINMENT)
+    parser.add_argument('--benchmark', action='store_true', help='Time the per-example check')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    guard = BenchmarkGuard.from_file(threshold=args.threshold)
+    print(f'  Guard: {len(guard)} benchmark prompts, {len(guard.table)} n-grams '
+          f'({(time.perf_counter() - start) * 1000:.1f}ms)')
+
+    found = 0
+    for path in args.files:
+        examples = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        examples.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        start = time.perf_counter()
+        _, rejected = guard.screen(examples)
+        elapsed = time.perf_counter() - start
+        found += len(rejected)
+        print(f'  {path}: {len(rejected)}/{len(examples)} overlap '
+              f'({elapsed / max(len(examples), 1) * 1e6:.1f}µs/example)')
+        report_rejected(rejected, len(examples))
+
+    if args.benchmark:
+        texts = [f'Skriv en journal for pasient {i} med nakkesmerter etter bilulykke, '
+                 f'redusert rotasjon og hodepine som forverres utover dagen.' for i in range(20000)]
+        start = time.perf_counter()
+        for t in texts:
+            guard.check(t)
+        per = (time.perf_counter() - start) / len(texts) * 1e6
+        print(f'  check(): {per:.1f}µs per {len(texts[0].split())}-word prompt')
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,7 +24,6 @@ import hashlib
 import json
 import math
 import os
-import random
 import re
 import sys
 from collections import defaultdict
@@ -52,6 +51,8 @@ from claude_utils import (
     has_pii, get_client, build_batch_request, submit_batch,
     extract_batch_tool_use, QUALITY_JUDGE_TOOL,
 )
+from dataset_cache import write_dir_cache
+from split_utils import append_order, hash_split
 
 
 # ============================================================
@@ -185,6 +186,16 @@ def infer_category(messages):
     return 'general'
 
 
+def cache_category(record):
+    """Category for a saved record (used by the columnar cache manifest)."""
+    meta = record.get('metadata') or {}
+    if meta.get('category'):
+        return meta['category']
+    if 'messages' in record:
+        return infer_category(record['messages'])
+    return 'dpo'
+
+
 # ============================================================
 # Deduplication
 # ============================================================
@@ -517,29 +528,14 @@ def balance_categories(sft_examples, max_pct, min_pct, boost_categories):
 # Train/Val/Test Split
 # ============================================================
 
-def split_dataset(examples, val_ratio=0.1, test_ratio=0.1):
-    """Split examples into train/val/test sets, stratified by category."""
-    by_category = defaultdict(list)
-    for ex in examples:
-        by_category[ex['category']].append(ex)
-
-    train, val, test = [], [], []
+def split_dataset(examples, val_ratio=0.1, test_ratio=0.1, seed=42):
+    """Split examples into train/val/test sets, stratified by category.
 
-    for cat, cat_examples in by_category.items():
-        random.shuffle(cat_examples)
-        n = len(cat_examples)
-        n_test = max(1, int(n * test_ratio))
-        n_val = max(1, int(n * val_ratio))
-
-        test.extend(cat_examples[:n_test])
-        val.extend(cat_examples[n_test:n_test + n_val])
-        train.extend(cat_examples[n_test + n_val:])
-
-    random.shuffle(train)
-    random.shuffle(val)
-    random.shuffle(test)
-
-    return train, val, test
+    Assignment is by content hash (split_utils), so re-running after adding
+    data keeps every existing example in the split it was already in.
+    """
+    return hash_split(examples, val_ratio=val_ratio, test_ratio=test_ratio,
+                      category_fn=lambda ex: ex['category'], salt=str(seed))
 
 
 # ============================================================
@@ -608,7 +604,7 @@ def main():
     parser.add_argument('--min-quality', type=float, default=DEFAULT_MIN_QUALITY,
                         help='Min quality score threshold')
     parser.add_argument('--seed', type=int, default=42,
-                        help='Random seed for reproducibility')
+                        help='Salt for hash-based split assignment')
     parser.add_argument('--quality-gate', action='store_true',
                         help='Run Claude quality gate (Batch API, uses Haiku)')
     parser.add_argument('--diversity', action='store_true',
@@ -621,8 +617,6 @@ def main():
                         help='Output directory')
     args = parser.parse_args()
 
-    random.seed(args.seed)
-
     # ── Load all data sources ──
     print('  Loading data sources...')
 
@@ -733,7 +727,7 @@ def main():
     print(f'  After balancing: {len(all_sft)} SFT examples')
 
     # ── Split ──
-    train, val, test = split_dataset(all_sft)
+    train, val, test = split_dataset(all_sft, seed=args.seed)
 
     # ── Report ──
     report = build_composition_report(train, val, test, all_dpo, dedup_count, filtered_count, pii_count)
@@ -779,6 +773,7 @@ def main():
 
     def save_jsonl(examples, filename):
         path = output_dir / filename
+        examples = append_order(examples, path)   # rewrite = existing rows + appended new ones
         with open(path, 'w', encoding='utf-8') as f:
             for ex in examples:
                 # Save only the training-relevant fields
@@ -807,6 +802,10 @@ def main():
         dpo_path = save_jsonl(all_dpo, 'dpo.jsonl')
         print(f'  DPO:        {dpo_path} ({len(all_dpo)} pairs)')
 
+    # Columnar cache (memory-mapped by training/audit scripts)
+    write_dir_cache(output_dir, splits=('train', 'validation', 'test', 'dpo'),
+                    category_fn=cache_category)
+
     # Save composition report
     report_path = output_dir / 'composition-report.json'
     with open(report_path, 'w', encoding='utf-8') as f:
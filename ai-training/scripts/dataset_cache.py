@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+Columnar Dataset Cache — ChiroClickCRM AI Training Pipeline
+
+Stores processed JSONL splits as Arrow IPC files next to a small JSON manifest
+(content hash, row counts, per-category stats). Training, audit and scoring
+scripts load the Arrow file memory-mapped instead of re-parsing JSONL on every
+launch, and fall back to the JSONL whenever the cache is missing or stale.
+
+Layout (inside each dataset directory):
+    train.jsonl
+    .cache/train.arrow            Arrow IPC stream (same format `datasets` uses)
+    .cache/train.manifest.json    Source size/mtime/sha256, rows, categories
+
+Usage:
+    python scripts/dataset_cache.py ../data/processed-v8/combined-sft
+    python scripts/dataset_cache.py ../data/curated --check
+    python scripts/dataset_cache.py ../data/processed-v4 --recursive
+
+    from dataset_cache import write_dir_cache, load_rows, load_hf_dataset
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+CACHE_DIRNAME = '.cache'
+CACHE_VERSION = 1
+SPLITS = ('train', 'validation', 'test')
+
+
+# ============================================================
+# Dependency management
+# ============================================================
+
+def get_pyarrow():
+    """Import pyarrow if available. Returns the module or None.
+
+    The cache is an optimization: every caller must keep working on plain
+    JSONL when pyarrow is not installed.
+    """
+    try:
+        import pyarrow
+        import pyarrow.ipc  # noqa: F401
+        return pyarrow
+    except ImportError:
+        return None
+
+
+# ============================================================
+# Paths & manifest
+# ============================================================
+
+def cache_paths(jsonl_path):
+    """Return (arrow_path, manifest_path) for a JSONL split."""
+    jsonl_path = Path(jsonl_path)
+    cache_dir = jsonl_path.parent / CACHE_DIRNAME
+    stem = jsonl_path.stem
+    return cache_dir / f'{stem}.arrow', cache_dir / f'{stem}.manifest.json'
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Compute the sha256 of a file in streaming chunks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_manifest(jsonl_path):
+    """Load the manifest for a split, or None if absent/corrupt."""
+    _, manifest_path = cache_paths(jsonl_path)
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def is_fresh(jsonl_path, verify_hash=False):
+    """Check whether the cached Arrow file still matches its JSONL source.
+
+    Size + mtime is the fast path. When those differ (e.g. a git checkout
+    touched the file) the sha256 decides, and a matching hash refreshes the
+    recorded stat so the next check is fast again.
+
+    Returns the manifest dict if fresh, else None.
+    """
+    jsonl_path = Path(jsonl_path)
+    arrow_path, manifest_path = cache_paths(jsonl_path)
+    if not jsonl_path.exists() or not arrow_path.exists():
+        return None
+
+    manifest = read_manifest(jsonl_path)
+    if not manifest or manifest.get('version') != CACHE_VERSION:
+        return None
+
+    st = jsonl_path.stat()
+    stat_match = (manifest.get('source_size') == st.st_size and
+                  manifest.get('source_mtime_ns') == st.st_mtime_ns)
+    if stat_match and not verify_hash:
+        return manifest
+
+    if manifest.get('source_size') != st.st_size:
+        return None
+    if file_sha256(jsonl_path) != manifest.get('content_hash'):
+        return None
+
+    if not stat_match:
+        manifest['source_mtime_ns'] = st.st_mtime_ns
+        try:
+            _write_json_atomic(manifest_path, manifest)
+        except OSError:
+            pass
+    return manifest
+
+
+# ============================================================
+# Row normalization
+# ============================================================
+
+def default_category(record, fallback=None):
+    """Category for a record: metadata.category, then the caller's fallback."""
+    meta = record.get('metadata')
+    if isinstance(meta, dict) and meta.get('category'):
+        return str(meta['category'])
+    if record.get('category'):
+        return str(record['category'])
+    return fallback or 'uncategorized'
+
+
+def _source_of(record):
+    meta = record.get('metadata')
+    if isinstance(meta, dict) and meta.get('source'):
+        return str(meta['source'])
+    return str(record.get('source') or record.get('_source') or '')
+
+
+def to_cache_row(record, category):
+    """Project a JSONL record onto the fixed cache columns.
+
+    ChatML records keep role/content per message; DPO records keep
+    prompt/chosen/rejected verbatim (string or message-list form).
+    Everything else in the record is dropped — the JSONL stays the source
+    of truth.
+    """
+    if 'messages' in record:
+        messages = [
+            {'role': str(m.get('role', '')), 'content': str(m.get('content', ''))}
+            for m in record['messages'] if isinstance(m, dict)
+        ]
+        return {'messages': messages, 'category': category, 'source': _source_of(record)}
+
+    if all(k in record for k in ('prompt', 'chosen', 'rejected')):
+        return {
+            'prompt': record['prompt'],
+            'chosen': record['chosen'],
+            'rejected': record['rejected'],
+            'category': category,
+            'source': _source_of(record),
+        }
+
+    return None
+
+
+# ============================================================
+# Writing
+# ============================================================
+
+def write_cache(jsonl_path, category_fn=None, fallback_category=None):
+    """Build the Arrow cache + manifest for one JSONL split.
+
+    Hashes and parses the file in a single pass. Returns the manifest dict,
+    or None if pyarrow is unavailable or the rows cannot form one table
+    (e.g. DPO prompts mixing strings and message lists).
+    """
+    pa = get_pyarrow()
+    jsonl_path = Path(jsonl_path)
+    if pa is None or not jsonl_path.exists():
+        return None
+
+    start = time.time()
+    hasher = hashlib.sha256()
+    rows = []
+    parse_errors = 0
+    skipped = 0
+    categories = Counter()
+
+    st = jsonl_path.stat()
+    with open(jsonl_path, 'rb') as f:
+        for raw in f:
+            hasher.update(raw)
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                parse_errors += 1
+                continue
+            if category_fn is not None:
+                category = category_fn(record) or fallback_category or 'uncategorized'
+            else:
+                category = default_category(record, fallback_category)
+            row = to_cache_row(record, category)
+            if row is None:
+                skipped += 1
+                continue
+            rows.append(row)
+            categories[category] += 1
+
+    if not rows:
+        return None
+
+    try:
+        table = pa.Table.from_pylist(rows)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+        print(f'  Cache skipped for {jsonl_path.name}: {e}')
+        return None
+
+    arrow_path, manifest_path = cache_paths(jsonl_path)
+    arrow_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = arrow_path.with_suffix('.arrow.tmp')
+    with pa.OSFile(str(tmp), 'wb') as sink:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, arrow_path)
+
+    fmt = 'chatml' if 'messages' in table.column_names else 'dpo'
+    manifest = {
+        'version': CACHE_VERSION,
+        'source': jsonl_path.name,
+        'source_size': st.st_size,
+        'source_mtime_ns': st.st_mtime_ns,
+        'content_hash': hasher.hexdigest(),
+        'format': fmt,
+        'columns': table.column_names,
+        'rows': table.num_rows,
+        'parse_errors': parse_errors,
+        'skipped_rows': skipped,
+        'by_category': dict(sorted(categories.items())),
+        'arrow_bytes': arrow_path.stat().st_size,
+        'build_seconds': round(time.time() - start, 3),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    _write_json_atomic(manifest_path, manifest)
+    return manifest
+
+
+def write_dir_cache(data_dir, splits=SPLITS, category_fn=None, fallback_category=None,
+                    quiet=False):
+    """Build caches for every split JSONL present in a dataset directory.
+
+    Returns {split: manifest} for the splits that were cached.
+    """
+    data_dir = Path(data_dir)
+    if get_pyarrow() is None:
+        if not quiet:
+            print('  Columnar cache skipped (pyarrow not installed)')
+        return {}
+
+    written = {}
+    for split in splits:
+        path = data_dir / f'{split}.jsonl'
+        if not path.exists():
+            continue
+        manifest = write_cache(path, category_fn=category_fn,
+                               fallback_category=fallback_category)
+        if manifest:
+            written[split] = manifest
+            if not quiet:
+                print(f'  Cached {data_dir.name}/{split}: {manifest["rows"]} rows '
+                      f'({manifest["arrow_bytes"] / 1024:.0f} KB arrow)')
+    return written
+
+
+# ============================================================
+# Reading
+# ============================================================
+
+def load_table(jsonl_path, verify_hash=False):
+    """Return a memory-mapped pyarrow Table for a split if the cache is fresh.
+
+    Buffers reference the mapped file directly (zero-copy). Returns None when
+    the cache is missing, stale, or pyarrow is unavailable.
+    """
+    pa = get_pyarrow()
+    if pa is None or is_fresh(jsonl_path, verify_hash=verify_hash) is None:
+        return None
+    arrow_path, _ = cache_paths(jsonl_path)
+    try:
+        source = pa.memory_map(str(arrow_path), 'r')
+        return pa.ipc.open_stream(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+
+
+def load_hf_dataset(jsonl_path, verify_hash=False):
+    """Return a memory-mapped `datasets.Dataset` for a split, or None."""
+    if get_pyarrow() is None or is_fresh(jsonl_path, verify_hash=verify_hash) is None:
+        return None
+    try:
+        from datasets import Dataset
+    except ImportError:
+        return None
+    arrow_path, _ = cache_paths(jsonl_path)
+    try:
+        return Dataset.from_file(str(arrow_path))
+    except Exception:
+        return None
+
+
+def _read_jsonl(path):
+    rows = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return rows
+
+
+def load_rows(jsonl_path, verify_hash=False, strict=False):
+    """Load a split as a list of dicts, preferring the columnar cache.
+
+    Returns (rows, from_cache). Malformed JSONL lines are skipped in both
+    paths. With strict=True the cache is only used when it holds exactly one
+    row per non-empty JSONL line (no parse errors, no skipped records), so
+    row indices line up with the file for callers that report by index.
+    """
+    if strict:
+        manifest = read_manifest(jsonl_path)
+        if not manifest or manifest.get('parse_errors') or manifest.get('skipped_rows'):
+            return _read_jsonl(jsonl_path), False
+    table = load_table(jsonl_path, verify_hash=verify_hash)
+    if table is not None:
+        return table.to_pylist(), True
+    return _read_jsonl(jsonl_path), False
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _dataset_dirs(root, recursive):
+    root = Path(root)
+    if not recursive:
+        return [root]
+    dirs = {p.parent for p in root.rglob('*.jsonl') if CACHE_DIRNAME not in p.parts}
+    return sorted(d for d in dirs if any((d / f'{s}.jsonl').exists() for s in SPLITS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or check columnar dataset caches')
+    parser.add_argument('data_dir', help='Dataset directory containing train/validation/test.jsonl')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Cache every dataset directory below data_dir')
+    parser.add_argument('--check', action='store_true',
+                        help='Only report cache freshness, do not build')
+    parser.add_argument('--verify-hash', action='store_true',
+                        help='Verify sha256 instead of trusting size+mtime')
+    parser.add_argument('--category', default=None,
+                        help='Fallback category for rows without metadata.category')
+    args = parser.parse_args()
+
+    dirs = _dataset_dirs(args.data_dir, args.recursive)
+    if not dirs:
+        print(f'  No dataset splits found under {args.data_dir}')
+        return 1
+
+    if get_pyarrow() is None and not args.check:
+        print('  ERROR: pyarrow is required to build caches (pip install pyarrow)')
+        return 1
+
+    for d in dirs:
+        for split in SPLITS:
+            path = d / f'{split}.jsonl'
+            if not path.exists():
+                continue
+            manifest = is_fresh(path, verify_hash=args.verify_hash)
+            if args.check:
+                status = f'fresh ({manifest["rows"]} rows)' if manifest else 'STALE/MISSING'
+                print(f'  {d.name}/{split}: {status}')
+                continue
+            if manifest:
+                print(f'  {d.name}/{split}: up to date ({manifest["rows"]} rows)')
+                continue
+            manifest = write_cache(path, fallback_category=args.category or d.name)
+            if manifest:
+                cats = ', '.join(f'{c}={n}' for c, n in manifest['by_category'].items())
+                print(f'  {d.name}/{split}: cached {manifest["rows"]} rows '
+                      f'in {manifest["build_seconds"]}s [{cats}]')
+            else:
+                print(f'  {d.name}/{split}: not cacheable (see above)')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
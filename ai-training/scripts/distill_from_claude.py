@@ -13,16 +13,31 @@ Usage:
     python scripts/distill_from_claude.py --extra-scenarios scenarios.jsonl
     python scripts/distill_from_claude.py --category diagnosis_codes
     python scripts/distill_from_claude.py --dry-run
+    python scripts/distill_from_claude.py --concurrency 16 --fake-api   # offline run on the fake API
+    python scripts/distill_from_claude.py --output data/distilled/claude-distilled-2026-01-01.jsonl  # resume
+    python scripts/distill_from_claude.py --allow-benchmark-overlap  # also distill benchmark prompts (tagged)
 
 Requirements:
     pip install anthropic requests
     ANTHROPIC_API_KEY env var set
 
+Cases run concurrently on the rate-limited AsyncClaude engine. Each example
+is appended to the output the moment it validates, and finished case ids go
+to a .done.jsonl index beside it, so an interrupted run resumes where it
+stopped instead of starting over.
+
+Benchmark cases are only sent with --allow-benchmark-overlap; without it
+they are skipped before any API call (training on them inflates benchmark
+scores), and only the extra scenarios are distilled.
+
 Output:
     data/distilled/claude-distilled-{date}.jsonl
+    data/distilled/claude-distilled-{date}.done.jsonl   (resume index)
 """
 
 import argparse
+import asyncio
+import hashlib
 import json
 import os
 import re
@@ -46,20 +61,11 @@ from evaluate import evaluate_case, SYNONYMS
 # Import shared Claude utilities
 # ============================================================
 
-from claude_utils import (
-    get_client, check_pii, cached_message, extract_text, extract_thinking,
-)
-
-NORWEGIAN_CHARS = set('æøåÆØÅ')
+from claude_utils import get_async_client, check_pii, extract_text, extract_thinking
+from claude_async import AsyncClaude, FakeAsyncAnthropic, RateLimiter, DEFAULT_CONCURRENCY, DEFAULT_RPM
 
-
-def norwegian_char_rate(text):
-    """Calculate the rate of Norwegian-specific characters."""
-    alpha = sum(1 for c in text if c.isalpha())
-    if alpha == 0:
-        return 0.0
-    no_count = sum(1 for c in text if c in NORWEGIAN_CHARS)
-    return no_count / alpha
+from text_features import norwegian_char_rate
+from contamination_guard import get_guard, report_rejected
 
 
 # ============================================================
@@ -185,13 +191,15 @@ def get_reference_context(case):
 THINKING_CATEGORIES = {'diagnosis_codes', 'red_flags'}
 
 
-def distill_case(client, case, use_thinking=False):
+async def distill_case(engine, case, use_thinking=False):
     """Send a benchmark case to Claude and capture the response.
 
     Enhanced with:
     - Prompt caching on system prompts (90% input cost savings on repeated prompts)
     - Extended thinking for complex clinical cases (diagnosis_codes, red_flags)
     - Reference document context for medical grounding
+    - Runs on the shared AsyncClaude engine (bounded concurrency, rate limits,
+      retries); a PII hit comes back as an error like any API failure
 
     Uses the EXACT system prompt from the benchmark case (matching what the
     local model sees during evaluation) to ensure the distilled response
@@ -206,10 +214,6 @@ def distill_case(client, case, use_thinking=False):
     )
     max_tokens = case.get('max_tokens', 500)
 
-    # PII check
-    check_pii(prompt)
-    check_pii(system_prompt)
-
     # Add reference context for grounding
     ref_context = get_reference_context(case)
     user_content = prompt
@@ -217,6 +221,10 @@ def distill_case(client, case, use_thinking=False):
         user_content = prompt + ref_context
 
     try:
+        # PII check
+        check_pii(prompt)
+        check_pii(system_prompt)
+
         # Use extended thinking for complex clinical categories
         should_think = use_thinking and category in THINKING_CATEGORIES
         extra_kwargs = {}
@@ -229,8 +237,8 @@ def distill_case(client, case, use_thinking=False):
         else:
             temperature = 0.3
 
-        response = cached_message(
-            client, system_prompt, user_content,
+        response = await engine.message(
+            system_prompt, user_content,
             max_tokens=max_tokens, temperature=temperature,
             **extra_kwargs,
         )
@@ -364,129 +372,217 @@ def load_benchmark(category_filter=None):
     return cases
 
 
-def run_distillation(client, cases, verbose=False, use_thinking=False):
-    """Distill Claude's outputs for all benchmark cases.
+def extra_cases(category_filter=None):
+    """EXTRA_SCENARIOS as cases keyed by a stable id (category + prompt hash).
+
+    Minimal validation applies to these (see validate_extra), not the
+    benchmark criteria.
+    """
+    cases = []
+    for category, prompts in EXTRA_SCENARIOS.items():
+        if category_filter and category != category_filter:
+            continue
+        system_prompt = CATEGORY_SYSTEM_MAP.get(category, MODEL_SYSTEM_PROMPTS['default'])
+        for prompt in prompts:
+            digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:10]
+            cases.append({
+                'id': f'extra:{category}:{digest}',
+                'prompt': prompt,
+                'system_prompt': system_prompt,
+                'category': category,
+                'max_tokens': 500,
+                'expect_norwegian': True,
+                'extra': True,
+            })
+    return cases
+
+
+def validate_extra(case, response):
+    """Minimal validation for extra scenarios (no benchmark criteria to score against)."""
+    if not response or len(response) < 20:
+        return False, 'too_short'
+    if case['category'] == 'diagnosis_codes' and not re.search(r'[A-Z]\d{2}', response):
+        return False, 'missing_code_format'
+    return True, None
+
+
+def build_extra_example(case, response):
+    return {
+        'messages': [
+            {'role': 'system', 'content': case['system_prompt']},
+            {'role': 'user', 'content': case['prompt']},
+            {'role': 'assistant', 'content': response},
+        ],
+        'metadata': {
+            'category': case['category'],
+            'source': 'distilled_extra',
+            'quality_score': 5,
+        },
+    }
+
+
+class DistillLog:
+    """Append-only distillation output plus a resume index of finished cases.
+
+    Each validated example is appended and flushed to the output file as soon
+    as it passes, tagged with metadata.case_id. Each finished case (passed or
+    failed validation) gets a line in <output>.done.jsonl. API errors and
+    benchmark-guard drops are not recorded, so re-running with the same
+    output file (with or without --allow-benchmark-overlap) retries them and
+    skips everything else.
+    """
+
+    def __init__(self, output_file, allow_overlap=False):
+        self.output_file = Path(output_file)
+        self.index_file = self.output_file.with_name(self.output_file.stem + '.done.jsonl')
+        self.allow_overlap = allow_overlap
+        self.rejected = []
+        self.written = 0
+        self.done = {}
+        self.resumed = 0
+        self._out = None
+        self._index = None
+
+        for entry in self._read(self.index_file):
+            self.done[entry['id']] = entry.get('status', 'passed')
+        # An example written just before a crash may be missing from the index
+        for example in self._read(self.output_file):
+            self.resumed += 1
+            case_id = example.get('metadata', {}).get('case_id')
+            if case_id:
+                self.done[case_id] = 'passed'
+
+    @staticmethod
+    def _read(path):
+        """Records of a JSONL file, cutting off a line left half-written by a crash."""
+        if not path.exists():
+            return []
+        data = path.read_bytes()
+        if data and not data.endswith(b'\n'):
+            data = data[:data.rfind(b'\n') + 1]
+            with open(path, 'r+b') as f:
+                f.truncate(len(data))
+        records = []
+        for line in data.decode('utf-8').splitlines():
+            line = line.strip()
+            if line:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return records
+
+    def __enter__(self):
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self._out = open(self.output_file, 'a', encoding='utf-8')
+        self._index = open(self.index_file, 'a', encoding='utf-8')
+        return self
+
+    def __exit__(self, *exc):
+        self._out.close()
+        self._index.close()
+
+    def mark(self, case_id, status):
+        self._index.write(json.dumps({'id': case_id, 'status': status}, ensure_ascii=False) + '\n')
+        self._index.flush()
+        self.done[case_id] = status
+
+    def append(self, case_id, example):
+        """Write one example through the benchmark guard. Returns False if it was dropped."""
+        match = get_guard().check_example(example)
+        if match:
+            self.rejected.append((example, *match))
+            if not self.allow_overlap:
+                self.done[case_id] = 'benchmark_overlap'   # this run only, not the index
+                return False
+            example['metadata']['benchmark_overlap'] = {'id': match[0], 'containment': match[1]}
+        example['metadata']['case_id'] = case_id
+        self._out.write(json.dumps(example, ensure_ascii=False) + '\n')
+        self._out.flush()
+        self.written += 1
+        self.mark(case_id, 'passed')
+        return True
+
+
+async def run_distillation(engine, cases, log, verbose=False, use_thinking=False):
+    """Distill cases concurrently, streaming results into the log as they finish.
+
+    Concurrency and pacing come from the engine (bounded in-flight requests,
+    adaptive rate limiting), so there are no sleeps here. Progress lines are
+    numbered in completion order.
 
     Enhanced with:
     - Extended thinking for diagnosis_codes and red_flags categories
     - Thinking chains stored in metadata for analysis
     """
-    examples = []
     stats = {'total': 0, 'passed': 0, 'failed': 0, 'errors': 0, 'with_thinking': 0}
+    extra_stats = {'total': 0, 'passed': 0}
     category_stats = {}
 
     total = len(cases)
-    print(f'\n  Distilling {total} cases through Claude...')
+    finished = 0
+    print(f'\n  Distilling {total} cases through Claude (concurrency {engine.concurrency})...')
     if use_thinking:
         print(f'  Extended thinking: enabled for {", ".join(THINKING_CATEGORIES)}')
     print(f'  {"─" * 60}')
 
-    for i, case in enumerate(cases, 1):
-        stats['total'] += 1
-        case_id = case.get('id', f'case_{i}')
-        category = case.get('category', 'unknown')
-
-        if category not in category_stats:
-            category_stats[category] = {'total': 0, 'passed': 0}
-        category_stats[category]['total'] += 1
+    async def distill_one(case):
+        nonlocal finished
+        case_id = case['id']
+        is_extra = case.get('extra', False)
+        response, error, thinking = await distill_case(
+            engine, case, use_thinking=use_thinking and not is_extra
+        )
+        finished += 1
+        n = f'[{finished:3d}/{total}]'
 
-        # Distill (with optional extended thinking)
-        response, error, thinking = distill_case(client, case, use_thinking=use_thinking)
+        if is_extra:
+            extra_stats['total'] += 1
+        else:
+            stats['total'] += 1
+            category = case.get('category', 'unknown')
+            category_stats.setdefault(category, {'total': 0, 'passed': 0})['total'] += 1
 
         if error:
-            stats['errors'] += 1
-            print(f'  [{i:3d}/{total}] ✗ {case_id:<35s} ERROR: {error}')
-            continue
-
-        # Validate
-        passed, validation = validate_distilled(case, response)
+            stats['errors'] += not is_extra
+            print(f'  {n} ✗ {case_id:<35s} ERROR: {error}')
+            return
 
-        if passed:
-            stats['passed'] += 1
-            category_stats[category]['passed'] += 1
-            example = build_chatml_example(case, response, thinking=thinking)
-            examples.append(example)
-            think_marker = ' [T]' if thinking else ''
-            print(f'  [{i:3d}/{total}] ✓ {case_id:<35s} ({len(response)} chars){think_marker}')
-            if thinking:
-                stats['with_thinking'] += 1
+        if is_extra:
+            passed, validation = validate_extra(case, response)
         else:
-            stats['failed'] += 1
+            passed, validation = validate_distilled(case, response)
+
+        if not passed:
+            stats['failed'] += not is_extra
+            log.mark(case_id, 'failed')
             reason = validation if isinstance(validation, str) else 'eval_fail'
-            print(f'  [{i:3d}/{total}] ✗ {case_id:<35s} FAIL: {reason}')
+            print(f'  {n} ✗ {case_id:<35s} FAIL: {reason}')
             if verbose and isinstance(validation, dict):
                 for check, data in validation.get('checks', {}).items():
                     if not data.get('pass', True):
                         print(f'           {check}: {data}')
+            return
 
-        # Rate limiting
-        if i % 10 == 0:
-            time.sleep(0.5)
-
-    return examples, stats, category_stats
-
-
-def distill_extra_scenarios(client, category_filter=None):
-    """Distill additional synthetic clinical scenarios."""
-    examples = []
-    scenarios = EXTRA_SCENARIOS
-
-    if category_filter:
-        scenarios = {k: v for k, v in scenarios.items() if k == category_filter}
-
-    total = sum(len(v) for v in scenarios.values())
-    print(f'\n  Distilling {total} extra scenarios...')
-    count = 0
-
-    for category, prompts in scenarios.items():
-        system_prompt = CATEGORY_SYSTEM_MAP.get(category, MODEL_SYSTEM_PROMPTS['default'])
-
-        for prompt in prompts:
-            count += 1
-            try:
-                check_pii(prompt)
-            except ValueError:
-                continue
-
-            response, error = distill_case(client, {
-                'prompt': prompt,
-                'system_prompt': system_prompt,
-                'category': category,
-                'max_tokens': 500,
-                'expect_norwegian': True,
-            })
-
-            if error or not response:
-                print(f'  [{count}/{total}] ✗ {category}: {prompt[:50]}...')
-                continue
-
-            # Minimal validation for extra scenarios
-            if len(response) < 20:
-                continue
-
-            if category == 'diagnosis_codes' and not re.search(r'[A-Z]\d{2}', response):
-                continue
-
-            example = {
-                'messages': [
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': prompt},
-                    {'role': 'assistant', 'content': response},
-                ],
-                'metadata': {
-                    'category': category,
-                    'source': 'distilled_extra',
-                    'quality_score': 5,
-                },
-            }
-            examples.append(example)
-            print(f'  [{count}/{total}] ✓ {category}: {prompt[:50]}...')
-
-            if count % 5 == 0:
-                time.sleep(0.5)
+        if is_extra:
+            example = build_extra_example(case, response)
+        else:
+            example = build_chatml_example(case, response, thinking=thinking)
+        if not log.append(case_id, example):
+            print(f'  {n} ✗ {case_id:<35s} DROPPED: overlaps benchmark')
+            return
 
-    return examples
+        if is_extra:
+            extra_stats['passed'] += 1
+        else:
+            stats['passed'] += 1
+            category_stats[category]['passed'] += 1
+            stats['with_thinking'] += bool(thinking)
+        think_marker = ' [T]' if thinking else ''
+        print(f'  {n} ✓ {case_id:<35s} ({len(response)} chars){think_marker}')
 
+    await asyncio.gather(*(distill_one(case) for case in cases))
+    return stats, extra_stats, category_stats
 
 # ============================================================
 # Entry Point
@@ -506,6 +602,20 @@ def main():
                         help='Show detailed validation failures')
     parser.add_argument('--output-dir', default=str(OUTPUT_DIR),
                         help='Output directory')
+    parser.add_argument('--output', default=None,
+                        help='Output JSONL (default: <output-dir>/claude-distilled-<date>.jsonl); '
+                             're-running with the same file resumes it')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Discard an existing output file and resume index')
+    parser.add_argument('--allow-benchmark-overlap', action='store_true',
+                        help='Keep examples that overlap benchmark prompts, tagged instead of dropped '
+                             '(only for a held-out benchmark)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Max requests in flight (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_RPM,
+                        help='Starting requests/minute; adapts to rate-limit headers')
+    parser.add_argument('--fake-api', action='store_true',
+                        help='Use the local fake Messages API (no key, deterministic output)')
     args = parser.parse_args()
 
     if not BENCHMARK_FILE.exists():
@@ -514,51 +624,64 @@ def main():
 
     cases = load_benchmark(args.category)
     print(f'  Loaded {len(cases)} benchmark cases')
+    for i, case in enumerate(cases, 1):
+        case.setdefault('id', f'case_{i}')
+    if cases and not args.allow_benchmark_overlap:
+        # The guard would drop every one of them at write time; don't pay for the calls
+        print(f'  Skipping {len(cases)} benchmark cases: training on benchmark prompts inflates benchmark scores')
+        print(f'  (--allow-benchmark-overlap distills them, tagged metadata.benchmark_overlap, '
+              f'only for a held-out benchmark)')
+        cases = []
+
+    extras = [] if args.no_extras else extra_cases(args.category)
+    print(f'  Extra scenarios: {len(extras)}')
+    print(f'  Total to distill: {len(cases) + len(extras)}')
 
-    extra_count = 0
-    if not args.no_extras:
-        scenarios = EXTRA_SCENARIOS
-        if args.category:
-            scenarios = {k: v for k, v in scenarios.items() if k == args.category}
-        extra_count = sum(len(v) for v in scenarios.values())
-
-    print(f'  Extra scenarios: {extra_count}')
-    print(f'  Total to distill: {len(cases) + extra_count}')
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    output_file = Path(args.output) if args.output else \
+        Path(args.output_dir) / f'claude-distilled-{date_str}.jsonl'
+    if args.fresh and not args.dry_run:
+        output_file.unlink(missing_ok=True)
+        output_file.with_name(output_file.stem + '.done.jsonl').unlink(missing_ok=True)
+
+    log = DistillLog(output_file, allow_overlap=args.allow_benchmark_overlap)
+    pending = [c for c in cases + extras if c['id'] not in log.done]
+    if len(pending) < len(cases) + len(extras):
+        print(f'  Resuming {output_file.name}: {len(cases) + len(extras) - len(pending)} cases done '
+              f'({log.resumed} examples), {len(pending)} remaining')
 
     if args.dry_run:
         print('\n  DRY RUN — no distillation performed')
         return
 
-    client = get_client()
+    if not cases and not extras and not args.allow_benchmark_overlap:
+        print('\n  ERROR: nothing to distill without benchmark prompts (extras are off or empty).')
+        print('  Re-run with --allow-benchmark-overlap (examples are tagged metadata.benchmark_overlap)')
+        print('  only when the model is evaluated on a held-out benchmark.')
+        sys.exit(1)
+
+    if not pending:
+        print('  Nothing left to distill')
+        return
+
+    client = FakeAsyncAnthropic() if args.fake_api else get_async_client()
+    engine = AsyncClaude(client, RateLimiter(requests_per_minute=args.rpm),
+                         concurrency=args.concurrency)
 
     # Pre-load clinical reference data
     load_reference_data()
 
-    # Distill benchmark cases
+    # Distill benchmark cases and extra scenarios together
     use_thinking = not args.no_thinking
-    examples, stats, category_stats = run_distillation(
-        client, cases, args.verbose, use_thinking=use_thinking
-    )
-
-    # Distill extra scenarios
-    extra_examples = []
-    if not args.no_extras:
-        extra_examples = distill_extra_scenarios(client, args.category)
-        examples.extend(extra_examples)
-
-    if not examples:
-        print('  WARNING: No examples distilled')
-        return
-
-    # Save
-    output_dir = Path(args.output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    date_str = datetime.now().strftime('%Y-%m-%d')
-    output_file = output_dir / f'claude-distilled-{date_str}.jsonl'
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    start = time.time()
+    with log:
+        stats, extra_stats, category_stats = asyncio.run(
+            run_distillation(engine, pending, log, args.verbose, use_thinking=use_thinking)
+        )
+    print(f'\n  API: {engine.stats["requests"]} requests in {time.time() - start:.1f}s '
+          f'({engine.stats["rate_limited"]} rate-limited, {engine.stats["retries"]} retried)')
+    validated = log.written + (0 if args.allow_benchmark_overlap else len(log.rejected))
+    report_rejected(log.rejected, validated, output_file.name, kept=args.allow_benchmark_overlap)
 
     # Summary
     print(f'\n  {"=" * 60}')
@@ -568,16 +691,21 @@ def main():
           f'({stats["failed"]} failed, {stats["errors"]} errors)')
     if stats.get('with_thinking', 0) > 0:
         print(f'  Thinking:  {stats["with_thinking"]} examples with reasoning chains')
-    print(f'  Extra:     {len(extra_examples)} additional examples')
-    print(f'  Total:     {len(examples)} distilled examples')
+    print(f'  Extra:     {extra_stats["passed"]}/{extra_stats["total"]} additional examples')
+    print(f'  Total:     {log.resumed + log.written} distilled examples'
+          + (f' ({log.resumed} from earlier runs)' if log.resumed else ''))
 
-    print(f'\n  Per category:')
-    print(f'  {"Category":<25s} {"Passed":>8s} {"Total":>8s}')
-    print(f'  {"─" * 45}')
-    for cat, data in sorted(category_stats.items()):
-        print(f'  {cat:<25s} {data["passed"]:>8d} {data["total"]:>8d}')
+    if category_stats:
+        print(f'\n  Per category:')
+        print(f'  {"Category":<25s} {"Passed":>8s} {"Total":>8s}')
+        print(f'  {"─" * 45}')
+        for cat, data in sorted(category_stats.items()):
+            print(f'  {cat:<25s} {data["passed"]:>8d} {data["total"]:>8d}')
 
     print(f'\n  Output: {output_file}')
+    retry = sum(1 for c in pending if c['id'] not in log.done)
+    if retry:
+        print(f'  {retry} cases hit errors — re-run with --output {output_file} to retry them')
     print(f'\n  Next step:')
     print(f'    python scripts/curate_dataset.py')
 
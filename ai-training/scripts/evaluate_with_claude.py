@@ -9,11 +9,16 @@ Hybrid evaluation combining:
 Runs all benchmark cases through the local model, then submits outputs to
 Claude Batch API for per-dimension structured grading using the clinical_grading tool.
 
+With --stream, grading mini-batches (by count or elapsed time) go out while
+the local model is still generating. The keyword-only report is published as
+soon as generation ends and rewritten as each mini-batch's grades arrive.
+
 Usage:
     python scripts/evaluate_with_claude.py --model chiro-no-lora-v5
     python scripts/evaluate_with_claude.py --model chiro-no-lora-v5 --category red_flags
     python scripts/evaluate_with_claude.py --model chiro-no-lora-v5 --skip-batch
     python scripts/evaluate_with_claude.py --model chiro-no-lora-v5 --output eval-v5.json
+    python scripts/evaluate_with_claude.py --model chiro-no-lora-v5 --stream --batch-size 10
 
 Requirements:
     pip install anthropic requests
@@ -57,9 +62,10 @@ from evaluate import evaluate_case, compute_partial_score
 
 # Import shared Claude utilities
 from claude_utils import (
-    get_client, check_pii, build_batch_request, submit_batch,
-    extract_batch_tool_use, CLINICAL_GRADING_TOOL,
+    get_client, check_pii, build_batch_request, submit_batch, create_batch,
+    batch_ended, collect_batch_results, extract_batch_tool_use, CLINICAL_GRADING_TOOL,
 )
+from claude_async import FakeAnthropic
 
 
 # ============================================================
@@ -113,8 +119,12 @@ GRADING_SYSTEM = (
 # Main Evaluation Pipeline
 # ============================================================
 
-def run_evaluation(model, cases, verbose=False):
-    """Run all benchmark cases through Ollama and collect responses."""
+def run_evaluation(model, cases, verbose=False, grader=None):
+    """Run all benchmark cases through Ollama and collect responses.
+
+    With a StreamingGrader, each response is queued for Claude grading as
+    soon as it is generated.
+    """
     results = []
     total = len(cases)
 
@@ -163,57 +173,143 @@ def run_evaluation(model, cases, verbose=False):
             'keyword_result': keyword_result,
         })
 
+        if grader:
+            if response:
+                grader.add(case_id, case, response)
+            else:
+                grader.tick()
+
     return results
 
 
-def run_claude_grading(results):
+def grading_request(case_id, case, response):
+    """Batch API request asking Claude to grade one model response."""
+    user_content = (
+        f"Kategori: {case.get('category', 'unknown')}\n"
+        f"Klinisk prompt:\n{case.get('prompt', '')}\n\n"
+        f"--- AI-modellens svar ---\n{response[:2000]}\n\n"
+        "Grader dette svaret. Bruk clinical_grading-verktøyet."
+    )
+    return build_batch_request(
+        custom_id=case_id,
+        system_prompt=GRADING_SYSTEM,
+        user_content=user_content,
+        max_tokens=1024,
+        tools=[CLINICAL_GRADING_TOOL],
+        tool_choice={'type': 'tool', 'name': 'clinical_grading'},
+    )
+
+
+def parse_grades(batch_results):
+    """Map custom_id → clinical_grading input for the succeeded results."""
+    grades = {}
+    for custom_id, result in batch_results:
+        parsed = extract_batch_tool_use(result, 'clinical_grading')
+        if parsed:
+            grades[custom_id] = parsed
+    return grades
+
+
+def run_claude_grading(results, client=None, poll_interval=15):
     """Submit all model outputs to Claude Batch API for structured grading.
 
     Returns dict mapping case_id to structured grade.
     """
-    client = get_client()
-    batch_requests = []
+    client = client or get_client()
 
     # Only grade cases that have responses
     gradable = [(i, r) for i, r in enumerate(results) if r['response']]
 
     print(f'\n  Phase 2: Claude grading {len(gradable)} responses via Batch API...')
 
-    for i, r in gradable:
-        case = r['case']
-        case_id = case.get('id', f'case_{i}')
-        prompt = case.get('prompt', '')
-        response = r['response']
+    batch_requests = [
+        grading_request(r['case'].get('id', f'case_{i}'), r['case'], r['response'])
+        for i, r in gradable
+    ]
+    if not batch_requests:
+        return {}
 
-        user_content = (
-            f"Kategori: {case.get('category', 'unknown')}\n"
-            f"Klinisk prompt:\n{prompt}\n\n"
-            f"--- AI-modellens svar ---\n{response[:2000]}\n\n"
-            "Grader dette svaret. Bruk clinical_grading-verktøyet."
-        )
+    return parse_grades(submit_batch(client, batch_requests, poll_interval=poll_interval))
 
-        req = build_batch_request(
-            custom_id=case_id,
-            system_prompt=GRADING_SYSTEM,
-            user_content=user_content,
-            max_tokens=1024,
-            tools=[CLINICAL_GRADING_TOOL],
-            tool_choice={'type': 'tool', 'name': 'clinical_grading'},
-        )
-        batch_requests.append(req)
 
-    if not batch_requests:
-        return {}
+class StreamingGrader:
+    """Grades responses in Batch API mini-batches while local generation runs.
 
-    batch_results = submit_batch(client, batch_requests, poll_interval=15)
+    Requests queue until batch_size are pending or the oldest has waited
+    batch_window seconds, then go out as one batch. tick() is called between
+    local generations: it flushes a due mini-batch and, every poll_interval
+    seconds, merges the results of ended batches into .grades (calling
+    on_update). drain() submits the remainder and waits for everything.
+    """
 
-    grades = {}
-    for custom_id, result in batch_results:
-        parsed = extract_batch_tool_use(result, 'clinical_grading')
-        if parsed:
-            grades[custom_id] = parsed
+    def __init__(self, client, batch_size=20, batch_window=60, poll_interval=15, on_update=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.poll_interval = poll_interval
+        self.on_update = on_update
+        self.pending = []
+        self.pending_since = None
+        self.in_flight = {}   # batch_id -> request count
+        self.grades = {}
+        self.submitted = 0
+        self.last_poll = time.time()
+
+    def add(self, case_id, case, response):
+        if not self.pending:
+            self.pending_since = time.time()
+        self.pending.append(grading_request(case_id, case, response))
+        self.tick()
+
+    def tick(self):
+        now = time.time()
+        if self.pending and (len(self.pending) >= self.batch_size
+                             or now - self.pending_since >= self.batch_window):
+            self.flush()
+        if self.in_flight and now - self.last_poll >= self.poll_interval:
+            self.poll()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch_id = create_batch(self.client, self.pending)
+        self.in_flight[batch_id] = len(self.pending)
+        self.submitted += len(self.pending)
+        self.pending = []
+
+    def poll(self):
+        """Merge the results of every ended batch (non-blocking)."""
+        self.last_poll = time.time()
+        merged = False
+        for batch_id in list(self.in_flight):
+            if batch_ended(self.client, batch_id):
+                self.grades.update(parse_grades(collect_batch_results(self.client, batch_id)))
+                del self.in_flight[batch_id]
+                merged = True
+        if merged and self.on_update:
+            self.on_update()
+
+    @property
+    def done(self):
+        return not self.pending and not self.in_flight
+
+    def status(self):
+        return {
+            'mode': 'stream',
+            'submitted': self.submitted + len(self.pending),
+            'graded': len(self.grades),
+            'in_flight': sum(self.in_flight.values()) + len(self.pending),
+            'complete': self.done,
+        }
 
-    return grades
+    def drain(self, max_wait=3600):
+        """Submit what is left and wait for all batches. Returns True if all ended."""
+        self.flush()
+        start = time.time()
+        while self.in_flight and time.time() - start < max_wait:
+            time.sleep(max(0.0, self.poll_interval - (time.time() - self.last_poll)))
+            self.poll()
+        return not self.in_flight
 
 
 def build_report(model, results, claude_grades):
@@ -333,6 +429,15 @@ def build_report(model, results, claude_grades):
     return report
 
 
+def save_report(report, output_path):
+    """Write the report atomically (it is rewritten while streaming grades arrive)."""
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output_path.with_suffix(output_path.suffix + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, output_path)
+
+
 def print_report(report):
     """Print formatted evaluation report."""
     s = report['summary']
@@ -399,6 +504,17 @@ def main():
                         help='Show detailed failure info')
     parser.add_argument('--output', default=None,
                         help='Output JSON file path')
+    parser.add_argument('--stream', action='store_true',
+                        help='Grade in mini-batches during generation; publish the keyword '
+                             'report at once and fill in Claude grades as they arrive')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='Streaming: responses per grading mini-batch (default: 20)')
+    parser.add_argument('--batch-window', type=float, default=60,
+                        help='Streaming: max seconds a response waits for its mini-batch (default: 60)')
+    parser.add_argument('--poll-interval', type=float, default=15,
+                        help='Seconds between Batch status polls (default: 15)')
+    parser.add_argument('--fake-api', action='store_true',
+                        help='Use the local fake Batch API for grading (no key)')
     args = parser.parse_args()
 
     if not BENCHMARK_FILE.exists():
@@ -422,19 +538,6 @@ def main():
 
     print(f'  Loaded {len(cases)} benchmark cases')
 
-    # Phase 1: Run model outputs
-    results = run_evaluation(args.model, cases, verbose=args.verbose)
-
-    # Phase 2: Claude grading via Batch API
-    claude_grades = {}
-    if not args.skip_batch:
-        claude_grades = run_claude_grading(results)
-
-    # Build and print report
-    report = build_report(args.model, results, claude_grades)
-    print_report(report)
-
-    # Save report
     if args.output:
         output_path = Path(args.output)
     else:
@@ -442,11 +545,48 @@ def main():
         model_safe = args.model.replace('/', '_')
         output_path = EVAL_DIR / f'claude-eval-{model_safe}-{date_str}.json'
 
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(report, f, indent=2, ensure_ascii=False)
+    client = None
+    if not args.skip_batch:
+        client = FakeAnthropic() if args.fake_api else get_client()
 
-    print(f'\n  Report saved to: {output_path}')
+    start = time.time()
+    if args.stream and client:
+        # Generation and grading overlap: wall time ≈ max(local, remote)
+        results = []
+
+        def publish():
+            report = build_report(args.model, results, grader.grades)
+            report['grading'] = grader.status()
+            save_report(report, output_path)
+            return report
+
+        grader = StreamingGrader(client, batch_size=args.batch_size, batch_window=args.batch_window,
+                                 poll_interval=args.poll_interval)
+        results.extend(run_evaluation(args.model, cases, verbose=args.verbose, grader=grader))
+
+        # Keyword results are final now: publish them, then again as each mini-batch lands
+        grader.flush()
+        grader.on_update = publish
+        publish()
+        print(f'\n  Keyword report published to {output_path} ({time.time() - start:.1f}s); '
+              f'{grader.status()["in_flight"]} responses still being graded...')
+        if not grader.drain():
+            print(f'  WARNING: grading incomplete ({grader.status()["in_flight"]} responses)')
+        report = publish()
+    else:
+        # Phase 1: Run model outputs
+        results = run_evaluation(args.model, cases, verbose=args.verbose)
+
+        # Phase 2: Claude grading via Batch API
+        claude_grades = {}
+        if client:
+            claude_grades = run_claude_grading(results, client, poll_interval=args.poll_interval)
+
+        report = build_report(args.model, results, claude_grades)
+        save_report(report, output_path)
+
+    print_report(report)
+    print(f'\n  Report saved to: {output_path} ({time.time() - start:.1f}s)')
 
     # Print pass/fail verdict
     kw_rate = report['summary']['keyword_pass_rate']
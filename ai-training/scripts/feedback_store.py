@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+"""
+A/B Feedback Store — ChiroClickCRM AI Training Pipeline
+
+Local SQLite aggregate store for monitor_ab.py. Instead of pulling the whole
+feedback window on every run, the store fetches only feedback newer than its
+watermark (paginated, oldest first) and folds it into per-model/per-day
+rollups: counts, rating sums and a t-digest of decision latency. Any window
+is then a merge of at most days × models rows, in constant memory.
+
+Fetch contract (GET /ai-feedback/feedback/export):
+    params:   format=json, since=<ISO created_at>, page_size=N, cursor=<opaque>
+    response: {"items": [...], "next_cursor": "..."}  (or a bare list = one page)
+Items at or before the watermark are skipped, so a backend that ignores
+since/cursor and returns the full window still ingests correctly.
+
+Store location: data/.cache/ab-feedback.sqlite
+
+Usage:
+    python scripts/feedback_store.py sync                 # fetch new feedback
+    python scripts/feedback_store.py stats
+    python scripts/feedback_store.py stub --items 50000   # serve a local stub backend
+
+    from feedback_store import FeedbackStore, Rollup
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+AI_TRAINING_DIR = SCRIPT_DIR.parent
+DEFAULT_STORE = AI_TRAINING_DIR / 'data' / '.cache' / 'ab-feedback.sqlite'
+
+STORE_VERSION = 2               # 2: t-digest latency sketches
+PAGE_SIZE = 1000
+TDIGEST_COMPRESSION = 100       # ≤100 centroids per model-day; p99 rank error ~0.1%
+
+
+# ============================================================
+# Mergeable aggregates
+# ============================================================
+
+class TDigest:
+    """Merging t-digest (Dunning): mergeable latency quantiles in O(compression) space.
+
+    Points are buffered and merged into centroids whose size is bounded by
+    the k1 scale function, so centroids stay small near the tails (accurate
+    p99) and the digest never holds more than ~compression centroids no
+    matter how many values it has seen. Merging two digests re-compresses
+    the union of their centroids, so per-day digests combine into any window.
+    """
+
+    def __init__(self, compression=TDIGEST_COMPRESSION, centroids=None, vmin=math.inf, vmax=-math.inf):
+        self.compression = compression
+        self.centroids = centroids or []    # [(mean, weight)] sorted by mean
+        self.buffer = []
+        self.min = vmin
+        self.max = vmax
+
+    @property
+    def count(self):
+        return sum(w for _, w in self.centroids) + sum(w for _, w in self.buffer)
+
+    def add(self, value, weight=1):
+        self.buffer.append((value, weight))
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        self.buffer.extend(other.centroids)
+        self.buffer.extend(other.buffer)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if len(self.buffer) >= 5 * self.compression:
+            self._compress()
+        return self
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        points = sorted(self.centroids + self.buffer)
+        self.buffer = []
+        total = sum(w for _, w in points)
+        merged = []
+        before = 0
+        limit = self._k(0) + 1
+        mean, weight = points[0]
+        for m, w in points[1:]:
+            if self._k((before + weight + w) / total) <= limit:
+                weight += w
+                mean += (m - mean) * w / weight
+            else:
+                merged.append((mean, weight))
+                before += weight
+                limit = self._k(before / total) + 1
+                mean, weight = m, w
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q):
+        """Value at quantile q, interpolating between centroid centres (and min/max)."""
+        self._compress()
+        if not self.centroids:
+            return None
+        total = self.count
+        target = q * total
+        before = 0
+        prev_center, prev_mean = 0.0, self.min
+        for mean, weight in self.centroids:
+            center = before + weight / 2
+            if target < center:
+                if center == prev_center:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            prev_center, prev_mean = center, mean
+            before += weight
+        if total == prev_center:
+            return self.max
+        return prev_mean + (self.max - prev_mean) * (target - prev_center) / (total - prev_center)
+
+    def to_json(self):
+        self._compress()
+        return json.dumps({'c': self.compression, 'min': self.min, 'max': self.max,
+                           'm': [[round(m, 3), w] for m, w in self.centroids]}, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text):
+        if not text:
+            return cls()
+        data = json.loads(text)
+        if not data['m']:
+            return cls(data['c'])
+        return cls(data['c'], [tuple(c) for c in data['m']], data['min'], data['max'])
+
+
+class Rollup:
+    """Counts, rating sum and latency sketch for one model (over a day or a window)."""
+
+    FIELDS = ('total', 'accepted', 'rejected', 'modified',
+              'rating_count', 'rating_sum', 'latency_count', 'latency_sum')
+
+    def __init__(self):
+        for f in self.FIELDS:
+            setattr(self, f, 0)
+        self.latency = TDigest()
+
+    def add(self, item):
+        self.total += 1
+        if item.get('accepted'):
+            self.accepted += 1
+        elif item.get('correction_type') == 'rejected':
+            self.rejected += 1
+        else:
+            self.modified += 1
+
+        rating = item.get('rating', item.get('user_rating'))
+        if rating:
+            self.rating_count += 1
+            self.rating_sum += rating
+        latency = item.get('time_to_decision')
+        if latency:
+            self.latency_count += 1
+            self.latency_sum += latency
+            self.latency.add(latency)
+
+    def merge(self, other):
+        for f in self.FIELDS:
+            setattr(self, f, getattr(self, f) + getattr(other, f))
+        self.latency.merge(other.latency)
+        return self
+
+    @property
+    def acceptance_rate(self):
+        return self.accepted / max(self.total, 1)
+
+    @property
+    def avg_rating(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    def summary(self):
+        """JSON-ready stats for reports."""
+        out = {f: getattr(self, f) for f in ('total', 'accepted', 'rejected', 'modified')}
+        out['acceptance_rate'] = round(self.acceptance_rate * 100, 1)
+        out['avg_rating'] = round(self.avg_rating, 2) if self.avg_rating is not None else None
+        if self.latency_count:
+            out['latency_ms'] = {
+                'mean': round(self.latency_sum / self.latency_count),
+                **{f'p{int(q * 100)}': round(self.latency.quantile(q)) for q in (0.5, 0.9, 0.99)},
+            }
+        return out
+
+
+def rollup_items(items):
+    """{model: Rollup} for a list of raw feedback items."""
+    rollups = {}
+    for item in items:
+        model = item.get('model_name', item.get('model', 'unknown'))
+        rollups.setdefault(model, Rollup()).add(item)
+    return rollups
+
+
+# ============================================================
+# SQLite store
+# ============================================================
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS rollups (
+    model TEXT NOT NULL,
+    day TEXT NOT NULL,
+    total INTEGER, accepted INTEGER, rejected INTEGER, modified INTEGER,
+    rating_count INTEGER, rating_sum REAL, latency_count INTEGER, latency_sum REAL,
+    latency_sketch TEXT,
+    PRIMARY KEY (model, day)
+);
+'''
+
+
+def _created_at(item):
+    """Normalized UTC ISO timestamp of an item (so string order is time order), or None."""
+    raw = item.get('created_at') or item.get('timestamp')
+    if not raw:
+        return None
+    ts = datetime.fromisoformat(str(raw).replace('Z', '+00:00'))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def _item_id(item):
+    return str(item.get('id') or hashlib.sha1(json.dumps(item, sort_keys=True).encode()).hexdigest())
+
+
+class FeedbackStore:
+    """Per-model/per-day feedback rollups with an ingestion watermark."""
+
+    def __init__(self, path=DEFAULT_STORE, source=None):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(SCHEMA)
+        self.untimed = 0    # items skipped by ingest() for lack of a timestamp
+        params = json.dumps({'version': STORE_VERSION, 'compression': TDIGEST_COMPRESSION, 'source': source})
+        if source is not None and self._meta('params') != params:
+            # Different backend or aggregate format: rollups would not line up
+            self.db.executescript("DELETE FROM rollups; DELETE FROM meta;")
+            self._set_meta('params', params)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    @property
+    def watermark(self):
+        """(created_at, ids at that exact timestamp) of the newest ingested item."""
+        return self._meta('watermark'), set(json.loads(self._meta('watermark_ids', '[]')))
+
+    # ── Ingestion ──
+
+    def ingest(self, items):
+        """Fold new items into the rollups and advance the watermark (one transaction).
+
+        Items at or before the watermark are skipped, and so are items without
+        created_at/timestamp: they cannot be placed against the watermark and
+        would be re-ingested on every sync (counted in self.untimed).
+        Returns the number ingested.
+        """
+        mark, mark_ids = self.watermark
+        days = {}
+        new_mark, new_ids = mark, set(mark_ids)
+        n = 0
+        for item in items:
+            ts = _created_at(item)
+            if ts is None:
+                self.untimed += 1
+                continue
+            item_id = _item_id(item)
+            if mark and (ts < mark or (ts == mark and item_id in mark_ids)):
+                continue
+            model = item.get('model_name', item.get('model', 'unknown'))
+            days.setdefault((model, ts[:10]), Rollup()).add(item)
+            n += 1
+            if new_mark is None or ts > new_mark:
+                new_mark, new_ids = ts, {item_id}
+            elif ts == new_mark:
+                new_ids.add(item_id)
+
+        for (model, day), rollup in days.items():
+            row = self.db.execute(
+                f'SELECT {", ".join(Rollup.FIELDS)}, latency_sketch FROM rollups WHERE model=? AND day=?',
+                (model, day)).fetchone()
+            if row:
+                rollup.merge(self._rollup(row))
+            self.db.execute(
+                f'INSERT OR REPLACE INTO rollups VALUES (?, ?, {", ".join("?" * len(Rollup.FIELDS))}, ?)',
+                (model, day, *(getattr(rollup, f) for f in Rollup.FIELDS), rollup.latency.to_json()))
+        if n:
+            self._set_meta('watermark', new_mark)
+            self._set_meta('watermark_ids', json.dumps(sorted(new_ids)))
+        self.db.commit()
+        return n
+
+    @staticmethod
+    def _rollup(row):
+        rollup = Rollup()
+        for f, value in zip(Rollup.FIELDS, row):
+            setattr(rollup, f, value or 0)
+        rollup.latency = TDigest.from_json(row[len(Rollup.FIELDS)])
+        return rollup
+
+    # ── Reporting ──
+
+    def _rows(self, first, model_filter):
+        query = f'SELECT day, model, {", ".join(Rollup.FIELDS)}, latency_sketch FROM rollups WHERE day >= ?'
+        params = [first]
+        if model_filter:
+            query += ' AND model LIKE ?'
+            params.append(f'%{model_filter}%')
+        return self.db.execute(query + ' ORDER BY day', params)
+
+    def model_stats(self, days=7, model_filter=None, now=None):
+        """{model: Rollup} over the last `days` UTC days (today included)."""
+        now = now or datetime.now(timezone.utc)
+        first = (now - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        stats = {}
+        for row in self._rows(first, model_filter):
+            stats.setdefault(row[1], Rollup()).merge(self._rollup(row[2:]))
+        return stats
+
+    def daily_stats(self, since=None, model_filter=None):
+        """[(day, {model: Rollup}), ...] oldest first from `since` (YYYY-MM-DD; default all history).
+
+        Sequential tests need a fixed start, not a sliding window: every look
+        must extend the same data sequence.
+        """
+        daily = {}
+        for row in self._rows(since or '', model_filter):
+            daily.setdefault(row[0], {})[row[1]] = self._rollup(row[2:])
+        return sorted(daily.items())
+
+    def summary(self):
+        row = self.db.execute('SELECT COUNT(*), COUNT(DISTINCT model), MIN(day), MAX(day), SUM(total) '
+                              'FROM rollups').fetchone()
+        return {'rows': row[0], 'models': row[1], 'first_day': row[2], 'last_day': row[3],
+                'items': row[4] or 0, 'watermark': self.watermark[0]}
+
+
+# ============================================================
+# Paginated fetch
+# ============================================================
+
+def fetch_pages(api_base, cookies, since=None, days=7, page_size=PAGE_SIZE, timeout=30):
+    """Yield pages of feedback items newer than `since` (or the last `days`), oldest first."""
+    import requests
+
+    cursor = None
+    while True:
+        params = {'format': 'json', 'page_size': page_size, 'order': 'asc'}
+        if since:
+            params['since'] = since
+        else:
+            params['days'] = days
+        if cursor:
+            params['cursor'] = cursor
+        resp = requests.get(f'{api_base}/ai-feedback/feedback/export',
+                            cookies=cookies, params=params, timeout=timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, list):
+            # No pagination support: the whole window in one response
+            yield data
+            return
+        items = data.get('items', [])
+        yield items
+        cursor = data.get('next_cursor')
+        if not cursor or not items:
+            return
+
+
+def sync(store, api_base, cookies, days=7, page_size=PAGE_SIZE, quiet=False):
+    """Fetch everything after the store's watermark. Returns (items ingested, pages)."""
+    total, pages = 0, 0
+    untimed = store.untimed
+    for items in fetch_pages(api_base, cookies, since=store.watermark[0], days=days, page_size=page_size):
+        pages += 1
+        total += store.ingest(items)
+        if not quiet and pages % 10 == 0:
+            print(f'  ... {total} new feedback items ({pages} pages)')
+    if store.untimed > untimed:
+        print(f'  Warning: skipped {store.untimed - untimed} feedback items without created_at')
+    return total, pages
+
+
+# ============================================================
+# Local stub backend
+# ============================================================
+
+STUB_MODELS = {
+    # model: (acceptance probability, median time_to_decision ms)
+    'chiro-no': (0.62, 9000), 'chiro-no-lora': (0.70, 8000),
+    'chiro-norwegian': (0.58, 11000), 'chiro-norwegian-lora': (0.57, 11500),
+    'chiro-medical': (0.66, 14000), 'chiro-medical-lora': (0.55, 16000),
+    'chiro-fast': (0.71, 4000), 'chiro-fast-lora': (0.72, 3800),
+}
+
+
+def synthetic_feedback(n, days=30, seed=0, models=STUB_MODELS, end=None):
+    """n reproducible feedback items spread over the last `days`, oldest first."""
+    rng = random.Random(seed)
+    end = end or datetime.now(timezone.utc)
+    start = end - timedelta(days=days)
+    span = (end - start).total_seconds()
+    names = sorted(models)
+    items = []
+    for i in range(n):
+        model = names[rng.randrange(len(names))]
+        p_accept, median = models[model]
+        accepted = rng.random() < p_accept
+        items.append({
+            'id': f'fb-{seed}-{i:07d}',
+            'created_at': (start + timedelta(seconds=span * i / max(n, 1))).isoformat(),
+            'model_name': model,
+            'accepted': accepted,
+            'correction_type': 'accepted_as_is' if accepted else rng.choice(['minor_edit', 'major_edit', 'rejected']),
+            'rating': rng.choice([None, 3, 4, 5]) if accepted else rng.choice([None, 1, 2, 3]),
+            'time_to_decision': round(rng.lognormvariate(math.log(median), 0.6)),
+        })
+    return items
+
+
+class StubBackend:
+    """In-process HTTP stub of the login and paginated export endpoints."""
+
+    def __init__(self, items, port=0):
+        self.items = items
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _json(self, payload, headers=()):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.path.endswith('/auth/login'):
+                    self._json({'ok': True}, [('Set-Cookie', 'session=stub; Path=/')])
+                else:
+                    self.send_error(404)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if not url.path.endswith('/ai-feedback/feedback/export'):
+                    self.send_error(404)
+                    return
+                q = {k: v[0] for k, v in parse_qs(url.query).items()}
+                self._json(stub.page(q))
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/v1'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def page(self, q):
+        size = int(q.get('page_size', PAGE_SIZE))
+        offset = int(q.get('cursor', 0))
+        if offset == 0 and q.get('since'):
+            since = q['since']
+            offset = next((i for i, it in enumerate(self.items) if _created_at(it) >= since), len(self.items))
+        elif offset == 0 and q.get('days'):
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=int(q['days']))).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            offset = next((i for i, it in enumerate(self.items) if _created_at(it) >= cutoff), len(self.items))
+        page = self.items[offset:offset + size]
+        nxt = offset + size if offset + size < len(self.items) else None
+        return {'items': page, 'next_cursor': str(nxt) if nxt is not None else None}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='A/B feedback aggregate store')
+    parser.add_argument('command', choices=['sync', 'stats', 'stub'])
+    parser.add_argument('--store', default=str(DEFAULT_STORE), help='Store path')
+    parser.add_argument('--days', type=int, default=30, help='sync: first-run window / stats window')
+    parser.add_argument('--items', type=int, default=10000, help='stub: synthetic feedback items')
+    parser.add_argument('--port', type=int, default=8765, help='stub: port')
+    args = parser.parse_args()
+
+    if args.command == 'stub':
+        with StubBackend(synthetic_feedback(args.items, days=args.days), port=args.port) as stub:
+            print(f'  Stub backend: {stub.url} ({args.items} items) — BACKEND_URL={stub.url[:-7]}')
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return 0
+
+    from monitor_ab import API_BASE, login
+
+    store = FeedbackStore(args.store, source=API_BASE)
+    if args.command == 'sync':
+        cookies = login()
+        if not cookies:
+            print('  ERROR: Could not login to backend')
+            return 1
+        start = time.time()
+        n, pages = sync(store, API_BASE, cookies, days=args.days)
+        print(f'  Ingested {n} new feedback items ({pages} pages, {time.time() - start:.1f}s)')
+
+    s = store.summary()
+    print(f'  Store: {store.path}')
+    print(f'  {s["items"]} items in {s["rows"]} model-days ({s["models"]} models, '
+          f'{s["first_day"]} .. {s["last_day"]}), watermark {s["watermark"]}')
+    store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
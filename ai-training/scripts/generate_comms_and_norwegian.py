@@ -16,11 +16,12 @@ Problems addressed:
 Output: ChatML format compatible with train_unsloth.py
 """
 
-import json
 import random
 import sys
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 # ============================================================
 # System Prompts
 # ============================================================
@@ -1061,9 +1062,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_file = output_dir / 'comms-norwegian-v2-synthetic.jsonl'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in all_examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, all_examples)
 
     # Print summary
     print(f"{'=' * 60}")
@@ -11,9 +11,10 @@ Creates short, precise clinical text field examples:
 Output: ChatML format compatible with train_unsloth.py
 """
 
-import json
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SYSTEM_PROMPT = (
     'Du er en rask klinisk tekstassistent. '
     'Generer korte, presise kliniske tekstfelt for kiropraktisk dokumentasjon.'
@@ -189,9 +190,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_file = output_dir / 'concise-responses.jsonl'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, examples)
 
     print(f"Generated {len(examples)} concise response training examples")
     print(f"  Chief complaints: {len(CHIEF_COMPLAINTS)}")
@@ -18,11 +18,12 @@ Output: data/dpo/train.jsonl (540 pairs) + data/dpo/validation.jsonl (60 pairs)
 Format per line: {"prompt": "...", "chosen": "...", "rejected": "..."}
 """
 
-import json
 import random
 import sys
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SCRIPT_DIR = Path(__file__).parent.resolve()
 AI_TRAINING_DIR = SCRIPT_DIR.parent
 OUTPUT_DIR = AI_TRAINING_DIR / "data" / "dpo"
@@ -706,13 +707,8 @@ def main():
     train_path = OUTPUT_DIR / "train.jsonl"
     val_path = OUTPUT_DIR / "validation.jsonl"
 
-    with open(train_path, "w", encoding="utf-8") as f:
-        for pair in train:
-            f.write(json.dumps(pair, ensure_ascii=False) + "\n")
-
-    with open(val_path, "w", encoding="utf-8") as f:
-        for pair in val:
-            f.write(json.dumps(pair, ensure_ascii=False) + "\n")
+    write_jsonl(train_path, train)
+    write_jsonl(val_path, val)
 
     print(f"\n  Output: {train_path}")
     print(f"          {val_path}")
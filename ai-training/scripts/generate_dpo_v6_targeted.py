@@ -12,10 +12,11 @@ Categories:
 Output: data/dpo/v6_targeted.jsonl (200 pairs)
 """
 
-import json
 import random
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SCRIPT_DIR = Path(__file__).parent.resolve()
 AI_TRAINING_DIR = SCRIPT_DIR.parent
 OUTPUT_DIR = AI_TRAINING_DIR / "data" / "dpo"
@@ -713,9 +714,7 @@ def main():
     # Write output
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     out_path = OUTPUT_DIR / "v6_targeted.jsonl"
-    with open(out_path, "w", encoding="utf-8") as f:
-        for pair in all_pairs:
-            f.write(json.dumps(pair, ensure_ascii=False) + "\n")
+    write_jsonl(out_path, all_pairs)
 
     print(f"\n  Output: {out_path}")
     print(f"  Size:   {out_path.stat().st_size / 1024:.1f} KB")
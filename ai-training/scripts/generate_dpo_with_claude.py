@@ -11,6 +11,7 @@ Usage:
     python scripts/generate_dpo_with_claude.py --gap-report evaluation/gap-analysis.json
     python scripts/generate_dpo_with_claude.py --count 100
     python scripts/generate_dpo_with_claude.py --dry-run
+    python scripts/generate_dpo_with_claude.py --allow-benchmark-overlap  # required (exits 1 without): pairs use benchmark prompts
 
 Requirements:
     pip install anthropic
@@ -44,6 +45,8 @@ from claude_utils import (
     get_client, check_pii, cached_message, extract_text,
 )
 
+from contamination_guard import write_jsonl
+
 
 # ============================================================
 # DPO Pair Generation Prompts
@@ -324,6 +327,8 @@ def main():
                         help='Show plan without generating')
     parser.add_argument('--output-dir', default=str(OUTPUT_DIR),
                         help='Output directory')
+    parser.add_argument('--allow-benchmark-overlap', action='store_true',
+                        help='Keep pairs built on benchmark prompts (tagged; only for a held-out benchmark)')
     args = parser.parse_args()
 
     # Load benchmark cases
@@ -353,9 +358,18 @@ def main():
     print(f'    Total:           {total_gap + total_synthetic}')
 
     if args.dry_run:
+        if not args.allow_benchmark_overlap:
+            print('\n  Note: all pairs use benchmark prompts; a real run needs --allow-benchmark-overlap')
         print('\n  DRY RUN — no pairs generated')
         return
 
+    if not args.allow_benchmark_overlap:
+        # Every pair is built on a benchmark prompt; the guard would drop them all at write time
+        print('\n  ERROR: all pairs use benchmark prompts, so training on them inflates benchmark scores.')
+        print('  Re-run with --allow-benchmark-overlap (pairs are tagged metadata.benchmark_overlap)')
+        print('  only when the model is evaluated on a held-out benchmark.')
+        sys.exit(1)
+
     client = get_client()
     all_pairs = []
 
@@ -380,9 +394,7 @@ def main():
     date_str = datetime.now().strftime('%Y-%m-%d')
     output_file = output_dir / f'claude-generated-{date_str}.jsonl'
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for pair in all_pairs:
-            f.write(json.dumps(pair, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, all_pairs, allow_overlap=True)
 
     # Summary
     category_counts = {}
@@ -14,9 +14,10 @@ Output: ChatML format compatible with train_unsloth.py
 Target: ~100 examples
 """
 
-import json
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SYSTEM_PROMPT_CLINICAL = (
     'Du er en erfaren kiropraktor-assistent. '
     'Hjelp med klinisk dokumentasjon, SOAP-notater og pasientkommunikasjon. '
@@ -1036,9 +1037,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_file = output_dir / 'edge-cases-synthetic.jsonl'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, examples)
 
     # Count by category
     cats = {
@@ -17,11 +17,12 @@ Usage:
     python scripts/generate_icpc2_codes.py --count  # Just count, don't write
 """
 
-import json
 import os
 import sys
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 OUTPUT_FILE = Path(__file__).parent.parent / 'data' / 'mined' / 'icpc2-codes-synthetic.jsonl'
 
 SYSTEM_PROMPT_NO = (
@@ -736,9 +737,7 @@ def main():
         return
 
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(OUTPUT_FILE, examples)
 
     size_kb = os.path.getsize(OUTPUT_FILE) / 1024
     print(f"\nWritten to: {OUTPUT_FILE}")
@@ -24,6 +24,8 @@ import random
 import sys
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 OUTPUT_FILE = Path(__file__).parent.parent / 'data' / 'mined' / 'icpc2-v2-synthetic.jsonl'
 
 # =============================================================================
@@ -1459,9 +1461,7 @@ def main():
     # Ensure output directory exists
     OUTPUT_FILE.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(OUTPUT_FILE, examples)
 
     print(f"\nWritten to: {OUTPUT_FILE}")
     print(f"File size: {OUTPUT_FILE.stat().st_size / 1024:.1f} KB")
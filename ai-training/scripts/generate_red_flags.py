@@ -23,11 +23,12 @@ Output: ChatML format compatible with train_unsloth.py
 Target: 200+ examples (balanced positive/negative, NO+EN)
 """
 
-import json
 import random
 import sys
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SYSTEM_PROMPT_NO = (
     'Du er en medisinsk sikkerhetsrådgiver for kiropraktikk. '
     'Identifiser røde flagg, gi differensialdiagnostikk og klinisk resonnering. '
@@ -1480,9 +1481,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_file = output_dir / 'red-flags-synthetic.jsonl'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, examples)
 
     # Count categories
     positive_no = sum(1 for ex in examples
@@ -11,12 +11,13 @@ Output: ChatML JSONL format for train_unsloth.py
 Target: ~300 examples (100 per category), ALL Norwegian
 """
 
-import json
 import random
 import sys
 import argparse
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SYSTEM_PROMPT = (
     'Du er en medisinsk sikkerhetsrådgiver for kiropraktikk. '
     'Identifiser røde flagg, gi differensialdiagnostikk og klinisk resonnering. '
@@ -1414,9 +1415,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_file = output_dir / 'red-flags-v2-synthetic.jsonl'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in all_examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, all_examples)
 
     # Detailed counts
     safe_count = sum(
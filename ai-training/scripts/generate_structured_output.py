@@ -12,6 +12,8 @@ Output: ChatML format compatible with train_unsloth.py
 import json
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 SYSTEM_PROMPT_NO = (
     'Du er en klinisk AI-assistent for kiropraktorer i Norge. '
     'Svar alltid med gyldig JSON når du blir bedt om strukturert output.'
@@ -1198,9 +1200,7 @@ def main():
     output_dir.mkdir(parents=True, exist_ok=True)
 
     output_file = output_dir / 'structured-output.jsonl'
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(output_file, examples)
 
     # Validate
     errors = 0
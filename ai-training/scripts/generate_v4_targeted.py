@@ -11,11 +11,12 @@ Output: ChatML JSONL format for train_unsloth.py
 Usage: python generate_v4_targeted.py [--output ../data/raw/v4-targeted.jsonl]
 """
 
-import json
 import random
 import argparse
 from pathlib import Path
 
+from contamination_guard import write_jsonl
+
 # ============================================================
 # SYSTEM PROMPTS
 # ============================================================
@@ -543,9 +544,7 @@ def main():
     out_path = Path(args.output)
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(out_path, 'w', encoding='utf-8') as f:
-        for ex in examples:
-            f.write(json.dumps(ex, ensure_ascii=False) + '\n')
+    write_jsonl(out_path, examples)
 
     print(f'Generated {len(examples)} examples:')
     print(f'  - ICPC-2 diagnosis: {len(ICPC2_EXAMPLES)}')
@@ -10,6 +10,8 @@ Usage:
     python scripts/generate_with_claude.py --gap-report evaluation/gap-analysis.json
     python scripts/generate_with_claude.py --category icpc2_codes --count 50
     python scripts/generate_with_claude.py --dry-run
+    python scripts/generate_with_claude.py --fake-api --count 20   # offline run on the fake API
+    python scripts/generate_with_claude.py --batch                 # Batch API rounds, resumable
 
 Requirements:
     pip install anthropic
@@ -20,6 +22,8 @@ Output:
 """
 
 import argparse
+import asyncio
+import hashlib
 import json
 import os
 import re
@@ -38,9 +42,15 @@ OUTPUT_DIR = AI_TRAINING_DIR / 'data' / 'claude-generated'
 # ============================================================
 
 from claude_utils import (
-    get_client, check_pii, cached_message, extract_text, extract_thinking,
-    structured_generate, TRAINING_EXAMPLE_TOOL, CLINICAL_GRADING_TOOL,
+    get_client, get_async_client, check_pii, extract_text, extract_thinking,
+    build_batch_request, create_batch, wait_for_batch, collect_batch_results,
+    extract_batch_tool_use, TRAINING_EXAMPLE_TOOL, CLINICAL_GRADING_TOOL,
 )
+from claude_async import (
+    AsyncClaude, FakeAnthropic, FakeAsyncAnthropic, RateLimiter, DEFAULT_CONCURRENCY, DEFAULT_RPM,
+)
+
+from contamination_guard import get_guard, report_rejected
 
 
 # ============================================================
@@ -237,15 +247,39 @@ MAX_EVAL_RETRIES = 2  # Max regeneration attempts for weak category examples
 # Claude API — Enhanced with tool_use + eval-optimizer
 # ============================================================
 
-def generate_structured_example(client, category, system_prompt, user_prompt):
+QUALITY_GRADE_TOOL = {
+    'name': 'quality_grade',
+    'description': 'Grade a training example quality',
+    'input_schema': {
+        'type': 'object',
+        'properties': {
+            'score': {'type': 'integer', 'minimum': 1, 'maximum': 5},
+            'feedback': {'type': 'string'},
+        },
+        'required': ['score', 'feedback'],
+    },
+}
+
+GRADER_SYSTEM_PROMPT = "Du er en klinisk kvalitetsvurdering-ekspert for AI-treningsdata."
+
+# Request settings shared by the live (async) and Batch API paths
+STRUCTURED_PARAMS = {'max_tokens': 2048, 'temperature': 0.7}
+THINKING_PARAMS = {
+    'max_tokens': 4096, 'temperature': 1.0,  # thinking requires temperature=1.0
+    'thinking': {'type': 'enabled', 'budget_tokens': 1500},
+}
+GRADE_PARAMS = {'model': 'claude-haiku-4-5', 'max_tokens': 512}  # Cost-efficient for grading
+MAX_BATCH_ERRORS = 2  # errored/expired batch requests are resubmitted up to this many times
+
+
+async def generate_structured_example(engine, category, system_prompt, user_prompt):
     """Generate a single structured training example using tool_use.
 
     Returns a validated dict or None. Uses TRAINING_EXAMPLE_TOOL to guarantee
     JSON schema compliance — no regex parsing needed.
     """
-    result = structured_generate(
-        client, system_prompt, user_prompt,
-        TRAINING_EXAMPLE_TOOL, max_tokens=2048, temperature=0.7,
+    result = await engine.structured(
+        system_prompt, user_prompt, TRAINING_EXAMPLE_TOOL, **STRUCTURED_PARAMS,
     )
 
     if not result:
@@ -254,7 +288,7 @@ def generate_structured_example(client, category, system_prompt, user_prompt):
     return validate_example(result, category)
 
 
-def generate_with_thinking(client, category, system_prompt, user_prompt):
+async def generate_with_thinking(engine, category, system_prompt, user_prompt):
     """Generate a training example using extended thinking for complex categories.
 
     Extended thinking forces Claude to reason through clinical logic before
@@ -262,12 +296,11 @@ def generate_with_thinking(client, category, system_prompt, user_prompt):
 
     Used for: diagnosis_codes (ICPC-2 reasoning), red_flags (safety reasoning).
     """
-    response = cached_message(
-        client, system_prompt, user_prompt,
-        max_tokens=4096, temperature=1.0,  # thinking requires temperature=1.0
-        thinking={'type': 'enabled', 'budget_tokens': 1500},
-    )
+    response = await engine.message(system_prompt, user_prompt, **THINKING_PARAMS)
+    return example_from_thinking_response(response, category)
+
 
+def example_from_thinking_response(response, category):
     text = extract_text(response)
     thinking = extract_thinking(response)
 
@@ -279,12 +312,8 @@ def generate_with_thinking(client, category, system_prompt, user_prompt):
     return example
 
 
-def grade_example(client, example, category):
-    """Grade a generated example using Claude as evaluator.
-
-    Returns quality score 1-5, or None on failure.
-    """
-    grade_prompt = (
+def grade_prompt(example, category):
+    return (
         f"Vurder kvaliteten på dette treningseksempelet for kategori '{category}':\n\n"
         f"Instruksjon: {example['instruction']}\n"
         f"Input: {example.get('input', '')}\n"
@@ -293,24 +322,14 @@ def grade_example(client, example, category):
         "og relevans for kiropraktikk."
     )
 
-    result = structured_generate(
-        client,
-        "Du er en klinisk kvalitetsvurdering-ekspert for AI-treningsdata.",
-        grade_prompt,
-        {
-            'name': 'quality_grade',
-            'description': 'Grade a training example quality',
-            'input_schema': {
-                'type': 'object',
-                'properties': {
-                    'score': {'type': 'integer', 'minimum': 1, 'maximum': 5},
-                    'feedback': {'type': 'string'},
-                },
-                'required': ['score', 'feedback'],
-            },
-        },
-        model='claude-haiku-4-5',  # Cost-efficient for grading
-        max_tokens=512,
+
+async def grade_example(engine, example, category):
+    """Grade a generated example using Claude as evaluator.
+
+    Returns quality score 1-5, or None on failure.
+    """
+    result = await engine.structured(
+        GRADER_SYSTEM_PROMPT, grade_prompt(example, category), QUALITY_GRADE_TOOL, **GRADE_PARAMS,
     )
 
     if result:
@@ -318,7 +337,111 @@ def grade_example(client, example, category):
     return None, None
 
 
-def generate_batch(client, category, count, gap_cases=None):
+def gap_context(gap_cases):
+    """Prompt suffix describing the local model's failing cases."""
+    if not gap_cases:
+        return ''
+    failing_ids = [c['id'] for c in gap_cases[:10]]
+    gap_types = {}
+    for c in gap_cases:
+        for gt in c.get('gap_types', []):
+            gap_types[gt] = gap_types.get(gt, 0) + 1
+    return (
+        f"\n\nKONTEKST: Den lokale modellen feiler på disse sakene:\n"
+        f"  IDs: {', '.join(failing_ids)}\n"
+        f"  Feiltyper: {json.dumps(gap_types, ensure_ascii=False)}\n"
+        f"Generer eksempler som spesifikt adresserer disse svakhetene."
+    )
+
+
+def example_prompt(config, gap_suffix, i, count):
+    """Per-example prompt (varied to increase diversity)."""
+    user_prompt = config['template'].format(count=1) + gap_suffix
+    return user_prompt + f"\n\nGenerer eksempel {i + 1} av {count}. Varier fra tidligere eksempler."
+
+
+def category_modes(category):
+    """(use_thinking, use_eval_loop) for a category."""
+    return (category in ('diagnosis_codes', 'red_flags'),
+            category in ('diagnosis_codes', 'red_flags', 'letters'))
+
+
+# Evaluator-optimizer state of one example. A plain dict so Batch API
+# rounds can checkpoint it as JSON; the live and batch paths share the
+# transitions below and therefore make the same decisions.
+
+def new_slot(category, index, prompt):
+    return {'category': category, 'index': index, 'prompt': prompt, 'attempt': 0,
+            'state': 'generate', 'candidate': None, 'best': None, 'best_score': 0, 'errors': 0}
+
+
+def after_generate(slot, example):
+    """Generation result (None = unusable) → grade it, retry, or finish."""
+    _, use_eval_loop = category_modes(slot['category'])
+    if not example:
+        slot['attempt'] += 1
+        if slot['attempt'] > (MAX_EVAL_RETRIES if use_eval_loop else 0):
+            slot['state'] = 'done'
+    elif use_eval_loop and slot['attempt'] < MAX_EVAL_RETRIES:
+        slot['candidate'] = example
+        slot['state'] = 'grade'
+    else:
+        slot['best'] = example
+        slot['state'] = 'done'
+
+
+def after_grade(slot, score, feedback):
+    """Grade of the candidate → accept (score ≥ 4) or regenerate with feedback."""
+    example, slot['candidate'] = slot['candidate'], None
+    if score and score >= 4:
+        slot['best'], slot['best_score'] = example, score
+        slot['state'] = 'done'
+        return
+    if score and score > slot['best_score']:
+        slot['best'], slot['best_score'] = example, score
+    # Regenerate with feedback
+    if feedback:
+        slot['prompt'] += f"\n\nFORBEDRINGSFORSLAG: {feedback}"
+    slot['attempt'] += 1
+    slot['state'] = 'generate'
+
+
+def slot_result(slot):
+    best = slot['best']
+    if best and slot['best_score'] > 0:
+        best['quality_score'] = slot['best_score']
+    return best
+
+
+async def generate_one(engine, category, system_prompt, user_prompt, i):
+    """One example's generate → grade → regenerate chain (runs as its own task)."""
+    use_thinking, _ = category_modes(category)
+    slot = new_slot(category, i, user_prompt)
+
+    while slot['state'] != 'done':
+        if slot['state'] == 'generate':
+            try:
+                if use_thinking and slot['attempt'] == 0:
+                    example = await generate_with_thinking(engine, category, system_prompt, slot['prompt'])
+                else:
+                    example = await generate_structured_example(engine, category, system_prompt, slot['prompt'])
+            except Exception as e:
+                print(f'    ERROR generating {category} example {i + 1}: {e}')
+                break
+            after_generate(slot, example)
+        else:
+            # Evaluate quality (eval loop)
+            try:
+                score, feedback = await grade_example(engine, slot['candidate'], category)
+            except Exception as e:
+                print(f'    ERROR grading {category} example {i + 1}: {e}')
+                score, feedback = None, None
+            after_grade(slot, score, feedback)
+
+    return slot_result(slot)
+
+
+async def generate_batch(engine, category, count, gap_cases=None):
     """Generate a batch of training examples for a category.
 
     Enhanced with:
@@ -326,6 +449,8 @@ def generate_batch(client, category, count, gap_cases=None):
     - Evaluator-optimizer loop for weak categories (score < 4 → regenerate)
     - Extended thinking for diagnosis_codes and red_flags
     - Prompt caching on category system prompts
+    - Every example's chain runs as a concurrent task on the shared engine;
+      results keep example order, so output doesn't depend on timing
     """
     config = CATEGORY_PROMPTS.get(category)
     if not config:
@@ -333,26 +458,8 @@ def generate_batch(client, category, count, gap_cases=None):
         return []
 
     system_prompt = config['system']
-    base_template = config['template']
-
-    # Build gap context suffix
-    gap_suffix = ''
-    if gap_cases:
-        failing_ids = [c['id'] for c in gap_cases[:10]]
-        gap_types = {}
-        for c in gap_cases:
-            for gt in c.get('gap_types', []):
-                gap_types[gt] = gap_types.get(gt, 0) + 1
-        gap_suffix = (
-            f"\n\nKONTEKST: Den lokale modellen feiler på disse sakene:\n"
-            f"  IDs: {', '.join(failing_ids)}\n"
-            f"  Feiltyper: {json.dumps(gap_types, ensure_ascii=False)}\n"
-            f"Generer eksempler som spesifikt adresserer disse svakhetene."
-        )
-
-    # Determine if this is a weak category needing eval-optimizer
-    use_thinking = category in ('diagnosis_codes', 'red_flags')
-    use_eval_loop = category in ('diagnosis_codes', 'red_flags', 'letters')
+    gap_suffix = gap_context(gap_cases)
+    use_thinking, use_eval_loop = category_modes(category)
 
     print(f'  Generating {count} examples for {category}...')
     if use_thinking:
@@ -361,62 +468,202 @@ def generate_batch(client, category, count, gap_cases=None):
         print(f'    (with evaluator-optimizer loop, max {MAX_EVAL_RETRIES} retries)')
 
     start = time.time()
-    examples = []
+    done = 0
 
-    for i in range(count):
-        # Build per-example prompt (varied to increase diversity)
-        user_prompt = base_template.format(count=1) + gap_suffix
-        user_prompt += f"\n\nGenerer eksempel {i + 1} av {count}. Varier fra tidligere eksempler."
+    async def run(i):
+        nonlocal done
+        example = await generate_one(engine, category, system_prompt,
+                                     example_prompt(config, gap_suffix, i, count), i)
+        done += 1
+        # Progress indicator every 10 examples
+        if done % 10 == 0:
+            elapsed = round(time.time() - start, 1)
+            print(f'    {category}: {done}/{count} generated ({elapsed}s)')
+        return example
 
-        attempt = 0
-        best_example = None
-        best_score = 0
+    results = await asyncio.gather(*(run(i) for i in range(count)))
+    examples = [ex for ex in results if ex]
 
-        while attempt <= (MAX_EVAL_RETRIES if use_eval_loop else 0):
-            try:
-                if use_thinking and attempt == 0:
-                    example = generate_with_thinking(client, category, system_prompt, user_prompt)
-                else:
-                    example = generate_structured_example(client, category, system_prompt, user_prompt)
-            except Exception as e:
-                print(f'    ERROR generating example {i + 1}: {e}')
-                break
+    elapsed = round(time.time() - start, 1)
+    print(f'  Generated {len(examples)} {category} examples in {elapsed}s')
+    return examples
 
-            if not example:
-                attempt += 1
-                continue
 
-            # Evaluate quality if using eval loop
-            if use_eval_loop and attempt < MAX_EVAL_RETRIES:
-                score, feedback = grade_example(client, example, category)
-                if score and score >= 4:
-                    best_example = example
-                    best_score = score
-                    break
-                elif score and score > best_score:
-                    best_example = example
-                    best_score = score
-                # Regenerate with feedback
-                if feedback:
-                    user_prompt += f"\n\nFORBEDRINGSFORSLAG: {feedback}"
-                attempt += 1
-            else:
-                best_example = example
-                break
+async def generate_all(engine, generation_plan):
+    """Run every category concurrently; examples come back in plan order."""
+    batches = await asyncio.gather(*(
+        generate_batch(engine, cat, plan['count'], plan['gap_cases'])
+        for cat, plan in generation_plan.items()
+    ))
+    return [ex for batch in batches for ex in batch]
 
-        if best_example:
-            if best_score > 0:
-                best_example['quality_score'] = best_score
-            examples.append(best_example)
 
-        # Progress indicator every 10 examples
-        if (i + 1) % 10 == 0:
-            elapsed = round(time.time() - start, 1)
-            print(f'    {i + 1}/{count} generated ({elapsed}s)')
+# ============================================================
+# Batch API mode — one Batch job per phase, checkpointed per round
+# ============================================================
 
-    elapsed = round(time.time() - start, 1)
-    print(f'  Generated {len(examples)} examples in {elapsed}s')
-    return examples
+def batch_generate_request(custom_id, slot):
+    config = CATEGORY_PROMPTS[slot['category']]
+    use_thinking, _ = category_modes(slot['category'])
+    if use_thinking and slot['attempt'] == 0:
+        return build_batch_request(custom_id, config['system'], slot['prompt'], **THINKING_PARAMS)
+    return build_batch_request(
+        custom_id, config['system'], slot['prompt'],
+        tools=[TRAINING_EXAMPLE_TOOL],
+        tool_choice={'type': 'tool', 'name': TRAINING_EXAMPLE_TOOL['name']},
+        **STRUCTURED_PARAMS,
+    )
+
+
+def batch_grade_request(custom_id, slot):
+    return build_batch_request(
+        custom_id, GRADER_SYSTEM_PROMPT, grade_prompt(slot['candidate'], slot['category']),
+        tools=[QUALITY_GRADE_TOOL],
+        tool_choice={'type': 'tool', 'name': QUALITY_GRADE_TOOL['name']},
+        **GRADE_PARAMS,
+    )
+
+
+def apply_generate_result(slot, result):
+    use_thinking, _ = category_modes(slot['category'])
+    if use_thinking and slot['attempt'] == 0:
+        example = example_from_thinking_response(result['message'], slot['category'])
+    else:
+        parsed = extract_batch_tool_use(result, TRAINING_EXAMPLE_TOOL['name'])
+        example = validate_example(parsed, slot['category']) if parsed else None
+    after_generate(slot, example)
+
+
+def apply_grade_result(slot, result):
+    parsed = extract_batch_tool_use(result, QUALITY_GRADE_TOOL['name']) or {}
+    after_grade(slot, parsed.get('score'), parsed.get('feedback', ''))
+
+
+BATCH_PHASES = {
+    'generate': (batch_generate_request, apply_generate_result),
+    'grade': (batch_grade_request, apply_grade_result),
+}
+
+
+def save_batch_state(path, state):
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def batch_plan(generation_plan):
+    """What a batch checkpoint must match to be resumed: counts and gap case ids per category."""
+    return {cat: {'count': p['count'], 'gap_cases': [c.get('id') for c in p['gap_cases']]}
+            for cat, p in generation_plan.items() if cat in CATEGORY_PROMPTS}
+
+
+def batch_state_path(output_dir, generation_plan):
+    """Default checkpoint path, keyed by the plan so a run survives midnight."""
+    digest = hashlib.sha256(json.dumps(batch_plan(generation_plan), sort_keys=True).encode('utf-8'))
+    return Path(output_dir) / '.cache' / f'batch-state-{digest.hexdigest()[:12]}.json'
+
+
+def load_batch_state(path, generation_plan):
+    """Unfinished checkpointed run for this plan, or a fresh state with one slot per example."""
+    plan = batch_plan(generation_plan)
+    if path.exists():
+        with open(path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get('done'):
+            print(f'  Checkpoint {path} is from a finished run — starting a new one')
+        elif state.get('plan') == plan:
+            print(f'  Resuming batch run from {path} (round {state["round"]})')
+            return state
+        else:
+            print(f'  Checkpoint {path} is for a different plan — starting over')
+
+    slots = []
+    for cat, plan_entry in generation_plan.items():
+        config = CATEGORY_PROMPTS.get(cat)
+        if not config:
+            print(f'  WARNING: Unknown category "{cat}", skipping')
+            continue
+        gap_suffix = gap_context(plan_entry['gap_cases'])
+        for i in range(plan_entry['count']):
+            slots.append(new_slot(cat, i, example_prompt(config, gap_suffix, i, plan_entry['count'])))
+    return {'plan': plan, 'round': 1, 'in_flight': None, 'slots': slots}
+
+
+def run_batch_phase(client, state, path, phase, poll_interval, max_wait):
+    """Submit (or re-attach to) one phase's Batch job and apply its results.
+
+    Returns False if the job didn't finish within max_wait (state stays
+    checkpointed with the job id; re-run to resume).
+    """
+    build, apply = BATCH_PHASES[phase]
+    slots = state['slots']
+    in_flight = state['in_flight']
+
+    if not in_flight:
+        pending = [n for n, slot in enumerate(slots) if slot['state'] == phase]
+        if not pending:
+            return True
+        # custom_id encodes slot + attempt so a stale result can never be applied twice
+        requests = [build(f'{phase}-{n}-{slots[n]["attempt"]}', slots[n]) for n in pending]
+        print(f'\n  Round {state["round"]} — {phase}: {len(requests)} requests')
+        in_flight = state['in_flight'] = {'phase': phase, 'batch_id': create_batch(client, requests),
+                                          'ids': [r['custom_id'] for r in requests]}
+        save_batch_state(path, state)
+    else:
+        print(f'\n  Round {state["round"]} — re-attaching to {phase} batch {in_flight["batch_id"]}')
+
+    if not wait_for_batch(client, in_flight['batch_id'], poll_interval, max_wait):
+        return False
+
+    results = dict(collect_batch_results(client, in_flight['batch_id']))
+    for custom_id in in_flight['ids']:
+        slot = slots[int(custom_id.split('-')[1])]
+        result = results.get(custom_id, {'type': 'missing'})
+        if result['type'] == 'succeeded':
+            apply(slot, result)
+        else:
+            # errored/expired: resubmit next round without spending an attempt
+            slot['errors'] += 1
+            if slot['errors'] > MAX_BATCH_ERRORS:
+                slot['state'] = 'done'
+    state['in_flight'] = None
+    save_batch_state(path, state)
+    return True
+
+
+def run_batch_rounds(client, generation_plan, state_path, poll_interval=30, max_wait=24 * 3600):
+    """Evaluator-optimizer loop as Batch API rounds: generate all → grade all → regenerate failures.
+
+    Every phase is checkpointed to state_path, so an interrupted run resumes
+    where it stopped (including a job still processing on the API side).
+    Once every slot is done the checkpoint is marked done, so the next run
+    with the same plan submits new jobs instead of returning these results.
+    Returns the examples in plan order, or None if a job is still running.
+    """
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state = load_batch_state(state_path, generation_plan)
+    if state['in_flight']:
+        # Finish the phase that was in flight when the last run stopped
+        if not run_batch_phase(client, state, state_path, state['in_flight']['phase'],
+                               poll_interval, max_wait):
+            return None
+
+    while any(slot['state'] != 'done' for slot in state['slots']):
+        for phase in ('generate', 'grade'):
+            if not run_batch_phase(client, state, state_path, phase, poll_interval, max_wait):
+                return None
+        counts = {}
+        for slot in state['slots']:
+            counts[slot['state']] = counts.get(slot['state'], 0) + 1
+        print(f'  Round {state["round"]} done: {counts.get("done", 0)} finished, '
+              f'{counts.get("generate", 0)} to regenerate')
+        state['round'] += 1
+        save_batch_state(state_path, state)
+
+    state['done'] = True
+    save_batch_state(state_path, state)
+    return [ex for ex in map(slot_result, state['slots']) if ex]
 
 
 def parse_example_from_text(text, category):
@@ -546,6 +793,18 @@ def main():
                         help='Show what would be generated without calling Claude')
     parser.add_argument('--output-dir', default=str(OUTPUT_DIR),
                         help='Output directory for JSONL files')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Max requests in flight (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--rpm', type=int, default=DEFAULT_RPM,
+                        help='Starting requests/minute; adapts to rate-limit headers')
+    parser.add_argument('--fake-api', action='store_true',
+                        help='Use the local fake Messages API (no key, deterministic output)')
+    parser.add_argument('--batch', action='store_true',
+                        help='Run generate/grade rounds as Batch API jobs (checkpointed, resumable)')
+    parser.add_argument('--batch-state', default=None,
+                        help='Batch checkpoint file (default: <output-dir>/.cache/batch-state-<plan hash>.json)')
+    parser.add_argument('--poll-interval', type=int, default=30,
+                        help='Seconds between Batch status polls')
     args = parser.parse_args()
 
     # Load gap report if available
@@ -614,17 +873,31 @@ def main():
         print('\n  DRY RUN — no examples generated')
         return
 
-    # Generate
-    client = get_client()
-    all_examples = []
-
-    for cat, plan in generation_plan.items():
-        examples = generate_batch(client, cat, plan['count'], plan['gap_cases'])
-        all_examples.extend(examples)
-
-        # Rate limiting between batches
-        if len(generation_plan) > 1:
-            time.sleep(1)
+    date_str = datetime.now().strftime('%Y-%m-%d')
+    if args.batch:
+        # Batch API rounds (50% cost, no process held open per example)
+        client = FakeAnthropic() if args.fake_api else get_client()
+        state_path = Path(args.batch_state) if args.batch_state else \
+            batch_state_path(args.output_dir, generation_plan)
+        all_examples = run_batch_rounds(client, generation_plan, state_path,
+                                        poll_interval=args.poll_interval)
+        if all_examples is None:
+            print(f'\n  Batch still processing — re-run with --batch to resume ({state_path})')
+            return
+    else:
+        # Generate (all categories and examples concurrently, paced by the rate limiter)
+        client = FakeAsyncAnthropic() if args.fake_api else get_async_client()
+        engine = AsyncClaude(client, RateLimiter(requests_per_minute=args.rpm),
+                             concurrency=args.concurrency)
+        start = time.time()
+        all_examples = asyncio.run(generate_all(engine, generation_plan))
+        print(f'\n  API: {engine.stats["requests"]} requests in {time.time() - start:.1f}s '
+              f'({engine.stats["rate_limited"]} rate-limited, {engine.stats["retries"]} retried)')
+
+    # Keep benchmark prompts out of both the raw and the ChatML file
+    generated = len(all_examples)
+    all_examples, rejected = get_guard().screen(all_examples)
+    report_rejected(rejected, generated)
 
     if not all_examples:
         print('  WARNING: No examples generated')
@@ -633,7 +906,6 @@ def main():
     # Convert to ChatML and save
     output_dir = Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
-    date_str = datetime.now().strftime('%Y-%m-%d')
     output_file = output_dir / f'batch-{date_str}.jsonl'
 
     # Raw examples (instruction/output format)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Direct LoRA-Merged GGUF Writer — ChiroClickCRM AI Training Pipeline
+
+Streams merged tensors from lora_merge.StreamingLoraMerger straight into
+llama.cpp's convert_hf_to_gguf.py model classes, so no merged safetensors
+directory is written and read back. The converter only sees a skeleton
+directory (config + tokenizer files); its tensor source is replaced by the
+merge engine, which prefetches upcoming tensors on a small worker pool so
+blocks from different base shards are merged in parallel while the GGUF
+writer is busy.
+
+Checksums: base shards resolved from the Hugging Face cache are verified
+against their blob sha256 (in parallel across shards) before merging, and the
+finished GGUF's sha256 is recorded next to it in <name>.gguf.report.json,
+together with the bytes read/written and the intermediate I/O avoided.
+
+Usage:
+    python scripts/gguf_stream.py --base Qwen/Qwen2.5-7B-Instruct \\
+        --adapter models/chiro-no/checkpoint-1200 --adapter models/chiro-no-dpo \\
+        --outfile models/gguf/chiro-no-sft-dpo-v7.gguf --outtype q8_0
+
+    from gguf_stream import ConverterMismatchError, write_merged_gguf
+"""
+
+import argparse
+import hashlib
+import importlib.util
+import json
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    os.environ.setdefault('PYTHONIOENCODING', 'utf-8')
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+        sys.stderr.reconfigure(encoding='utf-8', errors='replace')
+    except Exception:
+        pass
+
+from lora_merge import StreamingLoraMerger, DTYPE_SIZES, resolve_base_dir
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+AI_TRAINING_DIR = SCRIPT_DIR.parent
+CONVERT_SCRIPT = AI_TRAINING_DIR / 'llama-cpp-convert' / 'convert_hf_to_gguf.py'
+
+# --outtype -> (gguf.LlamaFileType member, merge dtype)
+OUTTYPES = {
+    'f32': ('ALL_F32', 'float32'),
+    'f16': ('MOSTLY_F16', 'float16'),
+    'bf16': ('MOSTLY_BF16', 'bfloat16'),
+    'q8_0': ('MOSTLY_Q8_0', 'float16'),
+}
+
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+HASH_CHUNK = 16 * 1024 ** 2
+
+# What the converter's model classes raise when their internals no longer
+# match the overrides in streamed_model_class()
+_CONVERTER_API_ERRORS = (AttributeError, TypeError, NotImplementedError)
+
+
+class ConverterMismatchError(RuntimeError):
+    """convert_hf_to_gguf.py's internals differ from what StreamedModel overrides."""
+
+
+# ============================================================
+# Checksums
+# ============================================================
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verify_shard_checksums(base_dir, shard_names, workers=4):
+    """Hash base shards in parallel; compare against HF cache blob names.
+
+    Snapshot files in the Hugging Face cache are symlinks to blobs named by
+    their sha256, which gives a free expected value. Local directories are
+    hashed and recorded only. Raises ValueError on a mismatch.
+    """
+    def check(shard):
+        path = Path(base_dir) / shard
+        expected = None
+        if path.is_symlink():
+            blob = Path(os.readlink(path)).name
+            if _SHA256_RE.match(blob):
+                expected = blob
+        actual = sha256_file(path)
+        return shard, actual, expected, path.stat().st_size
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for shard, actual, expected, size in pool.map(check, shard_names):
+            if expected and actual != expected:
+                raise ValueError(f'Checksum mismatch for {shard}: {actual[:12]} != {expected[:12]}')
+            results[shard] = {'sha256': actual, 'verified': bool(expected), 'bytes': size}
+    return results
+
+
+# ============================================================
+# Tensor source for the converter
+# ============================================================
+
+class MergedTensorPrefetcher:
+    """Serves merged tensors in converter order, merging the next few ahead.
+
+    Memory is bounded by `window` merged tensors.
+    """
+
+    def __init__(self, merger, order, workers=4, window=None):
+        self.merger = merger
+        self.order = list(order)
+        self.position = {name: i for i, name in enumerate(self.order)}
+        self.window = window or workers * 2
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.futures = {}
+        self.next_submit = 0
+
+    def _submit_until(self, index):
+        while self.next_submit < min(len(self.order), index):
+            name = self.order[self.next_submit]
+            self.futures[name] = self.pool.submit(self.merger.merged_tensor, name)
+            self.next_submit += 1
+
+    def tensor(self, name):
+        index = self.position.get(name, 0)
+        self._submit_until(index + self.window)
+        future = self.futures.pop(name, None)
+        # Drop prefetched tensors the converter skipped (e.g. rotary buffers)
+        for stale in [n for n in self.futures if self.position[n] < index - self.window]:
+            self.futures.pop(stale).cancel()
+        if future is None:
+            return self.merger.merged_tensor(name)
+        return future.result()
+
+    def close(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+def load_converter(convert_script=CONVERT_SCRIPT):
+    """Import llama.cpp's convert_hf_to_gguf.py (it puts its own gguf-py on sys.path)."""
+    if not Path(convert_script).exists():
+        raise FileNotFoundError(f'convert_hf_to_gguf.py not found at {convert_script}')
+    spec = importlib.util.spec_from_file_location('convert_hf_to_gguf', str(convert_script))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['convert_hf_to_gguf'] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def streamed_model_class(converter, architecture, merger, prefetcher):
+    """Subclass the converter's model class so its tensors come from the merger.
+
+    Covers both converter generations: `index_tensors()` (name -> loader,
+    called from __init__) and the older `get_tensors()` generator. In lazy
+    mode tensors are handed over as deferred LazyTorchTensors, so the GGUF
+    writer pulls each merged tensor only when it writes it.
+
+    This relies on convert_hf_to_gguf internals that llama.cpp does not treat
+    as an API: `ModelBase` (or `Model`) with from_model_architecture(), the
+    (dir, ftype, outfile, eager=) constructor, LazyTorchTensor and the two
+    tensor hooks above. write_merged_gguf() turns a break in any of them into
+    ConverterMismatchError, so callers can fall back to merged safetensors +
+    the convert script.
+    """
+    import torch
+
+    base_cls = getattr(converter, 'ModelBase', None) or getattr(converter, 'Model')
+    model_cls = base_cls.from_model_architecture(architecture)
+    lazy_cls = getattr(converter, 'LazyTorchTensor', None)
+    names = [name for _, entries in merger.plan() for name, _, _ in entries]
+
+    def load(model, name):
+        if getattr(model, 'lazy', False) and lazy_cls is not None and hasattr(lazy_cls, 'meta_with_dtype_and_shape'):
+            code = merger.output_code(name)
+            dtype = {'F32': torch.float32, 'F16': torch.float16, 'BF16': torch.bfloat16}.get(code)
+            if dtype is not None:
+                meta = lazy_cls.meta_with_dtype_and_shape(dtype, tuple(merger.headers[name]['shape']))
+                return lazy_cls(meta=meta, args=(name,), func=prefetcher.tensor)
+        return prefetcher.tensor(name)
+
+    class StreamedModel(model_cls):
+        def index_tensors(self, *args, **kwargs):
+            return {name: (lambda n=name: load(self, n)) for name in names}
+
+        def get_tensors(self):
+            for name in names:
+                yield name, load(self, name)
+
+    return StreamedModel
+
+
+# ============================================================
+# Pipeline stage
+# ============================================================
+
+def write_merged_gguf(base, adapter_dirs, gguf_path, outtype='f16', workers=4,
+                      verify_checksums=True, convert_script=CONVERT_SCRIPT, quiet=False):
+    """Merge adapters into base and write a GGUF directly. Returns the report dict.
+
+    Raises FileNotFoundError / ValueError / ImportError when the stage cannot
+    run (missing converter, unsupported adapter, checksum mismatch), and
+    ConverterMismatchError when the converter no longer fits StreamedModel;
+    callers fall back to the merged-directory + convert_hf_to_gguf.py path.
+    """
+    if outtype not in OUTTYPES:
+        raise ValueError(f'Unsupported outtype: {outtype}')
+    ftype_name, merge_dtype = OUTTYPES[outtype]
+    gguf_path = Path(gguf_path)
+    t0 = time.time()
+
+    base_dir = resolve_base_dir(base)
+    merger = StreamingLoraMerger(base_dir, adapter_dirs, dtype=merge_dtype)
+    shard_names = [shard for shard, _ in merger.shards]
+
+    checksums = {}
+    verify_seconds = 0.0
+    if verify_checksums:
+        t_verify = time.time()
+        checksums = verify_shard_checksums(base_dir, shard_names, workers=workers)
+        verify_seconds = time.time() - t_verify
+        if not quiet:
+            verified = sum(1 for c in checksums.values() if c['verified'])
+            print(f'  Checksums: {verified}/{len(checksums)} base shards verified ({verify_seconds:.0f}s)')
+
+    converter = load_converter(convert_script)
+    with open(base_dir / 'config.json', 'r', encoding='utf-8') as f:
+        architecture = json.load(f)['architectures'][0]
+
+    gguf_path.parent.mkdir(parents=True, exist_ok=True)
+    skeleton = Path(tempfile.mkdtemp(prefix='gguf-skeleton-', dir=gguf_path.parent))
+    order = [name for _, entries in merger.plan() for name, _, _ in entries]
+    prefetcher = MergedTensorPrefetcher(merger, order, workers=workers)
+    try:
+        merger.copy_sidecar_files(skeleton)
+        try:
+            model_cls = streamed_model_class(converter, architecture, merger, prefetcher)
+            ftype = getattr(converter.gguf.LlamaFileType, ftype_name)
+        except _CONVERTER_API_ERRORS as e:
+            raise ConverterMismatchError(f'{type(e).__name__}: {e}') from e
+        if not quiet:
+            print(f'  Writing {gguf_path.name} ({outtype}) from {len(order)} streamed tensors, '
+                  f'{workers} merge workers...')
+        t_write = time.time()
+        try:
+            model = model_cls(skeleton, ftype, gguf_path, eager=False)
+            model.write()
+        except BaseException as e:
+            gguf_path.unlink(missing_ok=True)  # never leave a partial GGUF for deploy to pick up
+            if isinstance(e, _CONVERTER_API_ERRORS):
+                raise ConverterMismatchError(f'{type(e).__name__}: {e}') from e
+            raise
+        write_seconds = time.time() - t_write
+    finally:
+        prefetcher.close()
+        shutil.rmtree(skeleton, ignore_errors=True)
+
+    gguf_bytes = gguf_path.stat().st_size
+    gguf_sha = sha256_file(gguf_path) if verify_checksums else None
+
+    # What the merged-directory path would have written and read back
+    merged_bytes = sum(DTYPE_SIZES[code] * math.prod(shape)
+                       for _, entries in merger.plan() for _, code, shape in entries)
+    throughput = gguf_bytes / write_seconds if write_seconds > 0 else 0
+    report = {
+        'gguf': str(gguf_path),
+        'outtype': outtype,
+        'adapters': [str(a) for a in adapter_dirs],
+        'base': str(base),
+        'base_shards': checksums,
+        'gguf_sha256': gguf_sha,
+        'gguf_bytes': gguf_bytes,
+        'bytes_read': merger.stats['bytes_read'] + sum(c['bytes'] for c in checksums.values()),
+        'bytes_written': gguf_bytes,
+        'intermediate_bytes_avoided': 2 * merged_bytes,
+        'estimated_seconds_saved': round(2 * merged_bytes / throughput, 1) if throughput else None,
+        'merge_stats': merger.stats,
+        'checksum_seconds': round(verify_seconds, 1),
+        'write_seconds': round(write_seconds, 1),
+        'total_seconds': round(time.time() - t0, 1),
+    }
+    with open(gguf_path.with_name(gguf_path.name + '.report.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    if not quiet:
+        print(f'  GGUF created: {gguf_path} ({gguf_bytes / 1024**3:.1f} GB) in {report["total_seconds"]:.0f}s')
+        print(f'  Skipped intermediate I/O: {report["intermediate_bytes_avoided"] / 1024**3:.1f} GB '
+              f'(~{report["estimated_seconds_saved"] or 0:.0f}s at this run\'s write throughput)')
+    return report
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a LoRA-merged GGUF without an intermediate model dir')
+    parser.add_argument('--base', required=True, help='Base model hub id or local directory')
+    parser.add_argument('--adapter', action='append', required=True,
+                        help='LoRA adapter directory (repeat to stack, applied in order)')
+    parser.add_argument('--outfile', required=True, help='Output .gguf path')
+    parser.add_argument('--outtype', default='f16', choices=sorted(OUTTYPES))
+    parser.add_argument('--workers', type=int, default=4, help='Merge/checksum worker threads')
+    parser.add_argument('--no-checksums', action='store_true', help='Skip shard and output checksums')
+    parser.add_argument('--convert-script', default=str(CONVERT_SCRIPT),
+                        help='Path to llama.cpp convert_hf_to_gguf.py')
+    args = parser.parse_args()
+
+    try:
+        write_merged_gguf(args.base, args.adapter, args.outfile, outtype=args.outtype,
+                          workers=args.workers, verify_checksums=not args.no_checksums,
+                          convert_script=args.convert_script)
+    except (FileNotFoundError, ValueError, ImportError, ConverterMismatchError) as e:
+        print(f'  ERROR: {e}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Pipeline Log Stream — ChiroClickCRM AI Training Pipeline
+
+Constant-cost logging and monitoring for long training runs:
+
+- LogWriter:    one long-lived, line-buffered handle for the text log plus a
+                JSON-lines event stream next to it (<log>.events.jsonl).
+- LogFollower:  tracks the byte offset of a growing log and returns only the
+                complete lines appended since the last poll.
+- PhaseTracker: incremental state machine over log lines (phase, progress %,
+                per-model state), so nothing is re-parsed from the start.
+
+Usage:
+    from log_stream import LogWriter, LogFollower, PhaseTracker
+
+    python scripts/log_stream.py logs/overnight-20260101-220000.log   # print state changes as JSON
+"""
+
+import atexit
+import json
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+MODELS = ('chiro-fast', 'chiro-medical', 'chiro-norwegian', 'chiro-no')
+
+
+# ============================================================
+# Writer
+# ============================================================
+
+def events_path_for(log_path):
+    log_path = Path(log_path)
+    return log_path.with_name(log_path.stem + '.events.jsonl')
+
+
+class LogWriter:
+    """Appends to a text log and a JSON-lines event stream through open handles.
+
+    Thread-safe (steps may run concurrently); line-buffered so followers see
+    every complete line immediately without reopening the file per line.
+    """
+
+    def __init__(self, log_path, echo=True):
+        self.path = Path(log_path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.echo = echo
+        self._lock = threading.Lock()
+        self._log = open(self.path, 'a', encoding='utf-8', buffering=1)
+        self._events = open(events_path_for(self.path), 'a', encoding='utf-8', buffering=1)
+        atexit.register(self.close)
+
+    def line(self, text, echo=None):
+        """Write one raw line (e.g. subprocess output)."""
+        with self._lock:
+            if echo if echo is not None else self.echo:
+                print(text, flush=True)
+            if not self._log.closed:
+                self._log.write(text + '\n')
+
+    def log(self, msg):
+        """Timestamped message, mirrored into the event stream."""
+        now = datetime.now()
+        self.line(f"[{now.strftime('%H:%M:%S')}] {msg}")
+        self.event('log', msg=msg, _ts=now)
+
+    def event(self, kind, _ts=None, **fields):
+        record = {'ts': (_ts or datetime.now()).isoformat(timespec='seconds'), 'event': kind}
+        record.update(fields)
+        with self._lock:
+            if not self._events.closed:
+                self._events.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        with self._lock:
+            for handle in (self._log, self._events):
+                if not handle.closed:
+                    handle.close()
+
+
+# ============================================================
+# Follower
+# ============================================================
+
+class LogFollower:
+    """Reads only the bytes appended to a file since the last call."""
+
+    def __init__(self, path, from_start=True):
+        self.path = Path(path)
+        self.offset = 0
+        self._partial = b''
+        if not from_start and self.path.exists():
+            self.offset = self.path.stat().st_size
+
+    def read_new(self):
+        """Return the complete lines appended since the last call."""
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            return []
+        if size < self.offset:  # truncated or replaced: start over
+            self.offset, self._partial = 0, b''
+        if size == self.offset:
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+        self.offset += len(data)
+        data = self._partial + data
+        lines = data.split(b'\n')
+        self._partial = lines.pop()  # incomplete last line (empty if data ended with \n)
+        return [line.decode('utf-8', errors='replace').rstrip('\r') for line in lines]
+
+
+# ============================================================
+# Incremental state machine
+# ============================================================
+
+# (keyword, label, progress %) in pipeline order; the furthest phase seen wins
+PHASE_MARKERS = [
+    ('Environment checks', 'Phase 0', 1),
+    ('Setting up ML', 'Phase 1', 3),
+    ('Installing PyTorch', 'Downloading PyTorch (2.4GB)...', 5),
+    ('Installing ML dependencies', 'Installing ML packages...', 8),
+    ('Verifying CUDA', 'Verifying GPU...', 12),
+    ('Cleaning training data', 'Phase 2: Cleaning data...', 15),
+    ('Training chiro-fast', 'Phase 3a: chiro-fast (3B)', 20),
+    ('Training chiro-medical', 'Phase 3b: chiro-medical (4B)', 30),
+    ('Training chiro-norwegian', 'Phase 3c: chiro-norwegian (7B)', 45),
+    ('Training chiro-no ', 'Phase 3d: chiro-no (7B)', 65),
+    ('[Phase 4] Validation', 'Phase 4: Validation', 90),
+    ('OVERNIGHT TRAINING COMPLETE', 'ALL DONE!', 100),
+]
+
+_TRAINING_RE = re.compile(r'Training (chiro-[a-z]+)\b')
+_RESULT_RE = re.compile(r'\b(chiro-[a-z]+|fast|medical|norwegian|default): (COMPLETE in|FAILED after)')
+_SHORT_NAMES = {'fast': 'chiro-fast', 'medical': 'chiro-medical',
+                'norwegian': 'chiro-norwegian', 'default': 'chiro-no'}
+
+
+class PhaseTracker:
+    """Feed log lines as they arrive; query the pipeline state at any time."""
+
+    def __init__(self):
+        self.phase_index = -1
+        self.current = 'Starting...'
+        self.completed = 0
+        self.failed = 0
+        self.last_line = ''
+        self.models = {name: 'pending' for name in MODELS}
+        self.lines = 0
+
+    def feed(self, line):
+        """Update state from one line. Returns a list of change events."""
+        self.lines += 1
+        text = line.strip()
+        if not text:
+            return []
+        self.last_line = text
+        changes = []
+
+        for i, (keyword, label, _) in enumerate(PHASE_MARKERS):
+            if i > self.phase_index and keyword in text + ' ':
+                self.phase_index, self.current = i, label
+                changes.append({'event': 'phase', 'label': label, 'pct': self.pct})
+
+        m = _TRAINING_RE.search(text)
+        if m and self.models.get(m.group(1)) == 'pending':
+            self.models[m.group(1)] = 'training'
+            changes.append({'event': 'model', 'model': m.group(1), 'state': 'training'})
+
+        m = _RESULT_RE.search(text)
+        if m:
+            name = _SHORT_NAMES.get(m.group(1), m.group(1))
+            state = 'complete' if m.group(2).startswith('COMPLETE') else 'failed'
+            if state == 'complete':
+                self.completed += 1
+            else:
+                self.failed += 1
+            if name in self.models:
+                self.models[name] = state
+            changes.append({'event': 'model', 'model': name, 'state': state})
+        return changes
+
+    def feed_lines(self, lines):
+        changes = []
+        for line in lines:
+            changes.extend(self.feed(line))
+        return changes
+
+    @property
+    def pct(self):
+        if self.phase_index < 0:
+            return 0
+        base = PHASE_MARKERS[self.phase_index][2]
+        if base >= 90:
+            return base
+        if self.completed + self.failed >= len(MODELS):
+            return 85
+        if base >= 20:  # training phases: credit finished models
+            return base + self.completed * 5
+        return base
+
+    def snapshot(self):
+        return {'pct': self.pct, 'current': self.current, 'completed': self.completed,
+                'failed': self.failed, 'models': dict(self.models), 'last_line': self.last_line}
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('Usage: python scripts/log_stream.py <overnight-log>')
+        return 1
+    follower = LogFollower(sys.argv[1])
+    tracker = PhaseTracker()
+    try:
+        while True:
+            for change in tracker.feed_lines(follower.read_new()):
+                print(json.dumps(change, ensure_ascii=False), flush=True)
+            if tracker.pct >= 100:
+                return 0
+            time.sleep(2)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
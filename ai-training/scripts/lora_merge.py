@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+"""
+Streaming LoRA Merge — ChiroClickCRM AI Training Pipeline
+
+Merges one or more LoRA adapters into a base model without materializing the
+model. Base safetensors shards are memory-mapped, every tensor is merged in
+row blocks (W + B@A * alpha/r, summed over all stacked adapters) and written
+straight into the output shard, whose header is computed up front from the
+base shapes. Peak memory is one row block plus the adapters' A/B matrices,
+instead of the ~15 GB fp16 model `merge_and_unload()` needs for a 7B model.
+
+Supported adapter features: Linear and Embedding LoRA, fan_in_fan_out,
+rsLoRA scaling, rank_pattern / alpha_pattern, modules_to_save (full tensor
+replacement). DoRA and LoRA biases are rejected — use the PEFT merge.
+
+Usage:
+    python scripts/lora_merge.py --base Qwen/Qwen2.5-7B-Instruct \\
+        --adapter models/chiro-no/checkpoint-1200 --adapter models/chiro-no-dpo \\
+        --output models/chiro-no-sft-dpo-v7-merged
+    python scripts/lora_merge.py --base <tiny-model> --adapter <lora> \\
+        --output /tmp/merged --dtype float32 --verify
+
+    from lora_merge import StreamingLoraMerger
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Fix Windows console encoding
+if sys.platform == 'win32':
+    os.environ.setdefault('PYTHONIOENCODING', 'utf-8')
+    try:
+        sys.stdout.reconfigure(encoding='utf-8', errors='replace')
+        sys.stderr.reconfigure(encoding='utf-8', errors='replace')
+    except Exception:
+        pass
+
+PEFT_PREFIX = 'base_model.model.'
+DEFAULT_BLOCK_BYTES = 64 * 1024 ** 2
+
+# Non-weight files copied from the base snapshot into the merged directory
+SIDECAR_FILES = (
+    'config.json', 'generation_config.json', 'tokenizer.json', 'tokenizer_config.json',
+    'special_tokens_map.json', 'added_tokens.json', 'vocab.json', 'merges.txt',
+    'tokenizer.model',
+)
+
+_LORA_KEY_RE = re.compile(
+    r'^(?P<module>.+)\.(?P<part>lora_A|lora_B|lora_embedding_A|lora_embedding_B)'
+    r'(?:\.(?P<adapter>[^.]+))?(?:\.weight)?$'
+)
+
+FLOAT_DTYPES = ('F64', 'F32', 'F16', 'BF16')
+DTYPE_CODES = {'float32': 'F32', 'float16': 'F16', 'bfloat16': 'BF16'}
+DTYPE_SIZES = {'F64': 8, 'F32': 4, 'F16': 2, 'BF16': 2, 'I64': 8, 'I32': 4,
+               'I16': 2, 'I8': 1, 'U8': 1, 'BOOL': 1}
+
+
+# ============================================================
+# Safetensors headers (read without loading any tensor data)
+# ============================================================
+
+def read_safetensors_header(path):
+    """Return the JSON header of a safetensors file (without __metadata__)."""
+    with open(path, 'rb') as f:
+        (header_len,) = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len))
+    header.pop('__metadata__', None)
+    return header
+
+
+def list_base_shards(base_dir):
+    """Return [(shard_filename, [tensor_name, ...])] in the base's shard order."""
+    base_dir = Path(base_dir)
+    index_path = base_dir / 'model.safetensors.index.json'
+    if index_path.exists():
+        with open(index_path, 'r', encoding='utf-8') as f:
+            weight_map = json.load(f)['weight_map']
+        shards = {}
+        for name, shard in weight_map.items():
+            shards.setdefault(shard, []).append(name)
+        return [(shard, names) for shard, names in sorted(shards.items())]
+    single = base_dir / 'model.safetensors'
+    if single.exists():
+        return [(single.name, list(read_safetensors_header(single)))]
+    raise FileNotFoundError(f'No safetensors weights in {base_dir} (.bin checkpoints are not supported)')
+
+
+def resolve_base_dir(name_or_path):
+    """Local directory holding the base model's safetensors and tokenizer.
+
+    Hub ids resolve through the Hugging Face cache (already populated by
+    training), downloading only safetensors, JSON and tokenizer files.
+    """
+    path = Path(name_or_path)
+    if path.is_dir():
+        base_dir = path
+    else:
+        from huggingface_hub import snapshot_download
+        base_dir = Path(snapshot_download(
+            name_or_path,
+            allow_patterns=['*.safetensors', '*.json', '*.txt', '*.model'],
+        ))
+
+    config_path = base_dir / 'config.json'
+    if config_path.exists():
+        with open(config_path, 'r', encoding='utf-8') as f:
+            if 'quantization_config' in json.load(f):
+                raise ValueError(f'{name_or_path} is a quantized checkpoint; merge into the fp16/bf16 base instead')
+    return base_dir
+
+
+# ============================================================
+# Adapters
+# ============================================================
+
+def _pattern_value(patterns, module, default):
+    """Resolve a PEFT rank_pattern/alpha_pattern entry for a module name."""
+    for key, value in (patterns or {}).items():
+        if module == key or module.endswith('.' + key) or re.fullmatch(rf'(.*\.)?{key}', module):
+            return value
+    return default
+
+
+class LoraAdapter:
+    """A saved PEFT LoRA adapter, indexed by the base tensor it modifies."""
+
+    def __init__(self, adapter_dir):
+        from safetensors import safe_open
+
+        self.path = Path(adapter_dir)
+        config_path = self.path / 'adapter_config.json'
+        weights_path = self.path / 'adapter_model.safetensors'
+        if not config_path.exists() or not weights_path.exists():
+            raise FileNotFoundError(f'adapter_config.json / adapter_model.safetensors missing in {self.path}')
+        with open(config_path, 'r', encoding='utf-8') as f:
+            self.config = json.load(f)
+        if self.config.get('use_dora'):
+            raise ValueError(f'{self.path}: DoRA adapters are not supported by the streaming merge')
+
+        self._file = safe_open(str(weights_path), framework='pt', device='cpu')
+        self.lora = {}          # base tensor name -> {'A': key, 'B': key, 'embedding': bool, 'module': name}
+        self.replacements = {}  # base tensor name -> adapter key (modules_to_save)
+
+        for key in self._file.keys():
+            name = key[len(PEFT_PREFIX):] if key.startswith(PEFT_PREFIX) else key
+            m = None if name.endswith('.bias') else _LORA_KEY_RE.match(name)
+            if m:
+                module = m.group('module')
+                entry = self.lora.setdefault(f'{module}.weight', {'module': module})
+                entry['A' if m.group('part').endswith('A') else 'B'] = key
+                entry['embedding'] = 'embedding' in m.group('part')
+            elif 'lora_' in name or 'magnitude' in name:
+                raise ValueError(f'{self.path}: unsupported adapter tensor {key}')
+            else:
+                self.replacements[name.replace('.modules_to_save', '')] = key
+
+        for target, entry in self.lora.items():
+            if 'A' not in entry or 'B' not in entry:
+                raise ValueError(f'{self.path}: incomplete LoRA pair for {target}')
+
+    def scaling(self, module, rank):
+        r = _pattern_value(self.config.get('rank_pattern'), module, self.config.get('r', rank))
+        alpha = _pattern_value(self.config.get('alpha_pattern'), module, self.config.get('lora_alpha', r))
+        if self.config.get('use_rslora'):
+            return alpha / math.sqrt(r)
+        return alpha / r
+
+    def factors(self, target):
+        """Return (A, B, scale, transposed) in float32 for a base tensor name."""
+        import torch
+
+        entry = self.lora[target]
+        a = self._file.get_tensor(entry['A']).to(torch.float32)
+        b = self._file.get_tensor(entry['B']).to(torch.float32)
+        if entry['embedding']:
+            # PEFT Embedding: A is (r, num_embeddings), B is (dim, r); delta = (B@A).T
+            transposed = True
+        else:
+            transposed = bool(self.config.get('fan_in_fan_out'))
+        return a, b, self.scaling(entry['module'], a.shape[0]), transposed
+
+    def replacement(self, target):
+        return self._file.get_tensor(self.replacements[target])
+
+
+# ============================================================
+# Streaming safetensors writer
+# ============================================================
+
+class SafetensorsStreamWriter:
+    """Writes a safetensors file whose layout is known before any data exists.
+
+    The header (names, dtypes, shapes, offsets) is written first; tensor bytes
+    are then appended in header order, in as many chunks as the caller likes.
+    """
+
+    def __init__(self, path, entries, metadata=None):
+        self.path = Path(path)
+        self.entries = entries  # [(name, dtype_code, shape)]
+        header = {'__metadata__': metadata or {'format': 'pt'}}
+        offset = 0
+        self.sizes = {}
+        for name, code, shape in entries:
+            size = DTYPE_SIZES[code] * math.prod(shape)
+            header[name] = {'dtype': code, 'shape': list(shape), 'data_offsets': [offset, offset + size]}
+            self.sizes[name] = size
+            offset += size
+        self.data_bytes = offset
+        raw = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        raw += b' ' * (-len(raw) % 8)
+        self._header = struct.pack('<Q', len(raw)) + raw
+        self._file = None
+        self._expected = iter(entries)
+        self._current = None
+        self._remaining = 0
+        self.bytes_written = 0
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path.with_suffix(self.path.suffix + '.tmp'), 'wb')
+        self._file.write(self._header)
+        self.bytes_written = len(self._header)
+        return self
+
+    def begin(self, name):
+        if self._remaining:
+            raise RuntimeError(f'{self._current}: {self._remaining} bytes still expected')
+        expected = next(self._expected)[0]
+        if name != expected:
+            raise RuntimeError(f'Tensor written out of order: {name} (expected {expected})')
+        self._current = name
+        self._remaining = self.sizes[name]
+
+    def write(self, data):
+        view = memoryview(data).cast('B')
+        if len(view) > self._remaining:
+            raise RuntimeError(f'{self._current}: more data than its header declares')
+        self._file.write(view)
+        self._remaining -= len(view)
+        self.bytes_written += len(view)
+
+    def __exit__(self, exc_type, exc, tb):
+        tmp = Path(self._file.name)
+        self._file.close()
+        if exc_type is None:
+            if self._remaining or next(self._expected, None) is not None:
+                tmp.unlink()
+                raise RuntimeError(f'{self.path.name}: incomplete tensor data')
+            os.replace(tmp, self.path)
+        elif tmp.exists():
+            tmp.unlink()
+        return False
+
+
+def tensor_bytes(tensor):
+    """Raw little-endian bytes of a CPU tensor (works for bfloat16 too)."""
+    import torch
+    return tensor.contiguous().reshape(-1).view(torch.uint8).numpy()
+
+
+# ============================================================
+# Merge engine
+# ============================================================
+
+class StreamingLoraMerger:
+    """Merges stacked LoRA adapters into a base model one tensor block at a time.
+
+    Adapters are applied in the given order (e.g. SFT, then DPO); deltas are
+    accumulated in float32 and rounded to the output dtype once. A
+    modules_to_save tensor replaces the running weight, so adapters stacked
+    after it still add their deltas on top.
+    """
+
+    def __init__(self, base_dir, adapter_dirs, dtype='float16', block_bytes=DEFAULT_BLOCK_BYTES):
+        import torch
+        from safetensors import safe_open
+
+        if dtype not in DTYPE_CODES:
+            raise ValueError(f'Unsupported output dtype: {dtype}')
+        self.base_dir = Path(base_dir)
+        self.adapters = [a if isinstance(a, LoraAdapter) else LoraAdapter(a) for a in adapter_dirs]
+        self.dtype = dtype
+        self.torch_dtype = getattr(torch, dtype)
+        self.block_bytes = block_bytes
+        self.shards = list_base_shards(self.base_dir)
+        self._open = {}
+        self._safe_open = safe_open
+
+        self.headers = {}
+        for shard, _ in self.shards:
+            header = read_safetensors_header(self.base_dir / shard)
+            for name, info in header.items():
+                self.headers[name] = dict(info, shard=shard)
+
+        missing = sorted(
+            target for adapter in self.adapters
+            for target in list(adapter.lora) + list(adapter.replacements)
+            if target not in self.headers
+        )
+        if missing:
+            raise ValueError(f'Adapter targets not found in base model: {missing[:5]}'
+                             + (f' (+{len(missing) - 5} more)' if len(missing) > 5 else ''))
+
+        self.stats = {'tensors': 0, 'lora_merged': 0, 'replaced': 0,
+                      'bytes_read': 0, 'bytes_written': 0, 'peak_block_bytes': 0}
+        self._stats_lock = threading.Lock()  # tensors may be merged from worker threads
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _peak(self, nbytes):
+        with self._stats_lock:
+            self.stats['peak_block_bytes'] = max(self.stats['peak_block_bytes'], nbytes)
+
+    # ── Planning ──
+
+    def output_code(self, name):
+        code = self.headers[name]['dtype']
+        return DTYPE_CODES[self.dtype] if code in FLOAT_DTYPES else code
+
+    def plan(self):
+        """[(shard_filename, [(name, dtype_code, shape), ...])] of the merged model."""
+        return [
+            (shard, [(name, self.output_code(name), tuple(self.headers[name]['shape'])) for name in names])
+            for shard, names in self.shards
+        ]
+
+    def _base(self, shard):
+        if shard not in self._open:
+            self._open[shard] = self._safe_open(str(self.base_dir / shard), framework='pt', device='cpu')
+        return self._open[shard]
+
+    # ── Merging ──
+
+    def iter_blocks(self, name):
+        """Yield the merged tensor `name` as consecutive row blocks (output dtype)."""
+        import torch
+
+        info = self.headers[name]
+        shape = info['shape']
+        base = self._base(info['shard'])
+        is_float = info['dtype'] in FLOAT_DTYPES
+        src_size = DTYPE_SIZES[info['dtype']] * math.prod(shape)
+        self._count('tensors')
+        self._count('bytes_read', src_size)
+
+        deltas = []
+        replacement = None
+        for adapter in self.adapters:
+            if name in adapter.replacements:
+                replacement = adapter.replacement(name).to(torch.float32)
+                deltas = []  # earlier adapters are overwritten by the saved module
+                self._count('replaced')
+            if name in adapter.lora:
+                deltas.append(adapter.factors(name))
+                self._count('lora_merged')
+
+        if not is_float or len(shape) < 2:
+            tensor = replacement if replacement is not None else base.get_tensor(name)
+            if deltas:
+                raise ValueError(f'LoRA delta on non-matrix tensor {name}')
+            if is_float:
+                tensor = tensor.to(self.torch_dtype)
+            self._peak(tensor.numel() * 4)
+            yield tensor
+            return
+
+        rows = shape[0]
+        row_elems = math.prod(shape[1:])
+        rows_per_block = max(1, self.block_bytes // (row_elems * 4))
+        source = base.get_slice(name)
+        for start in range(0, rows, rows_per_block):
+            stop = min(rows, start + rows_per_block)
+            if replacement is not None:
+                block = replacement[start:stop].clone()
+            else:
+                block = source[start:stop].to(torch.float32)
+            for a, b, scale, transposed in deltas:
+                if transposed:
+                    delta = (b @ a[:, start:stop]).T
+                else:
+                    delta = b[start:stop] @ a
+                block += delta.reshape(block.shape) * scale
+            self._peak(block.numel() * 4)
+            yield block.to(self.torch_dtype)
+
+    def merged_tensor(self, name):
+        """The whole merged tensor (memory: one tensor). Used by the GGUF writer."""
+        import torch
+        blocks = list(self.iter_blocks(name))
+        return blocks[0] if len(blocks) == 1 else torch.cat(blocks, dim=0)
+
+    def write(self, output_dir, quiet=False):
+        """Write merged shards, index, config and tokenizer files to output_dir."""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        t0 = time.time()
+        plan = self.plan()
+        weight_map = {}
+        total_size = 0
+
+        for i, (shard, entries) in enumerate(plan, 1):
+            with SafetensorsStreamWriter(output_dir / shard, entries) as writer:
+                for name, _, _ in entries:
+                    writer.begin(name)
+                    for block in self.iter_blocks(name):
+                        writer.write(tensor_bytes(block))
+                    weight_map[name] = shard
+            total_size += writer.data_bytes
+            self.stats['bytes_written'] += writer.bytes_written
+            if not quiet:
+                print(f'    [{i}/{len(plan)}] {shard}: {len(entries)} tensors, '
+                      f'{writer.bytes_written / 1024**3:.2f} GB ({time.time() - t0:.0f}s)')
+
+        if len(plan) > 1 or (self.base_dir / 'model.safetensors.index.json').exists():
+            with open(output_dir / 'model.safetensors.index.json', 'w', encoding='utf-8') as f:
+                json.dump({'metadata': {'total_size': total_size}, 'weight_map': weight_map}, f, indent=2)
+
+        self.copy_sidecar_files(output_dir)
+        self.stats['seconds'] = round(time.time() - t0, 1)
+        return self.stats
+
+    def copy_sidecar_files(self, output_dir):
+        for filename in SIDECAR_FILES:
+            src = self.base_dir / filename
+            if src.exists():
+                shutil.copyfile(src, Path(output_dir) / filename)
+
+        # Same config cleanup the PEFT merge path does
+        config_path = Path(output_dir) / 'config.json'
+        if config_path.exists():
+            with open(config_path, 'r', encoding='utf-8') as f:
+                cfg = json.load(f)
+            cfg.pop('quantization_config', None)
+            cfg['dtype'] = self.dtype
+            if 'torch_dtype' in cfg:
+                cfg['torch_dtype'] = self.dtype
+            cfg['use_cache'] = True
+            with open(config_path, 'w', encoding='utf-8') as f:
+                json.dump(cfg, f, indent=2)
+
+
+def merge_adapters(base, adapter_dirs, output_dir, dtype='float16',
+                   block_bytes=DEFAULT_BLOCK_BYTES, quiet=False):
+    """Resolve the base model, stream-merge adapters into output_dir, return stats."""
+    base_dir = resolve_base_dir(base)
+    merger = StreamingLoraMerger(base_dir, adapter_dirs, dtype=dtype, block_bytes=block_bytes)
+    if not quiet:
+        n_lora = sum(len(a.lora) for a in merger.adapters)
+        print(f'  Streaming merge: {len(merger.headers)} base tensors in {len(merger.shards)} shard(s), '
+              f'{n_lora} LoRA targets from {len(merger.adapters)} adapter(s)')
+    stats = merger.write(output_dir, quiet=quiet)
+    if not quiet:
+        print(f'  Peak working block: {stats["peak_block_bytes"] / 1024**2:.0f} MB; '
+              f'wrote {stats["bytes_written"] / 1024**3:.2f} GB in {stats["seconds"]:.0f}s')
+    return stats
+
+
+# ============================================================
+# Verification against PEFT (tiny models only)
+# ============================================================
+
+def verify_against_peft(base, adapter_dirs, merged_dir):
+    """Merge with PEFT in float32 and compare every tensor. Returns max abs diff.
+
+    Loads the full model, so only use this on small models.
+    """
+    import torch
+    from safetensors import safe_open
+    from transformers import AutoModelForCausalLM
+    from peft import PeftModel
+
+    model = AutoModelForCausalLM.from_pretrained(str(resolve_base_dir(base)), torch_dtype=torch.float32)
+    for adapter_dir in adapter_dirs:
+        model = PeftModel.from_pretrained(model, str(adapter_dir)).merge_and_unload()
+    reference = model.state_dict()
+
+    max_diff = 0.0
+    compared = 0
+    for shard, _ in list_base_shards(merged_dir):
+        with safe_open(str(Path(merged_dir) / shard), framework='pt', device='cpu') as f:
+            for name in f.keys():
+                if name not in reference:
+                    continue
+                diff = (f.get_tensor(name).to(torch.float32) - reference[name].to(torch.float32)).abs().max()
+                max_diff = max(max_diff, float(diff))
+                compared += 1
+    return max_diff, compared
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream-merge LoRA adapters into a base model')
+    parser.add_argument('--base', required=True, help='Base model hub id or local directory')
+    parser.add_argument('--adapter', action='append', required=True,
+                        help='LoRA adapter directory (repeat to stack, applied in order)')
+    parser.add_argument('--output', required=True, help='Merged model output directory')
+    parser.add_argument('--dtype', default='float16', choices=sorted(DTYPE_CODES),
+                        help='Output dtype for floating tensors (default: float16)')
+    parser.add_argument('--block-mb', type=int, default=DEFAULT_BLOCK_BYTES // 1024 ** 2,
+                        help='Working row-block size in MB (default: 64)')
+    parser.add_argument('--verify', action='store_true',
+                        help='Compare against a full PEFT merge (tiny models only)')
+    args = parser.parse_args()
+
+    try:
+        merge_adapters(args.base, args.adapter, args.output, dtype=args.dtype,
+                       block_bytes=args.block_mb * 1024 ** 2)
+    except (FileNotFoundError, ValueError) as e:
+        print(f'  ERROR: {e}')
+        return 1
+
+    if args.verify:
+        max_diff, compared = verify_against_peft(args.base, args.adapter, args.output)
+        tolerance = 1e-4 if args.dtype == 'float32' else 1e-2
+        status = 'OK' if max_diff <= tolerance else 'MISMATCH'
+        print(f'  Verify vs PEFT: {compared} tensors, max abs diff {max_diff:.2e} ({status})')
+        return 0 if status == 'OK' else 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,8 +3,16 @@
 Merge LoRA adapter with base model in float16 and deploy to Ollama.
 
 The training script saves 4-bit quantized models, but merging quantized models
-produces broken safetensors (flat 1D tensors). This script loads the base model
-in float16, applies the LoRA adapter, merges, saves, and deploys to Ollama.
+produces broken safetensors (flat 1D tensors). This script merges the LoRA
+adapter into the float16 base model, saves, and deploys to Ollama.
+
+By default the merge streams tensor by tensor from the memory-mapped base
+shards (lora_merge.py), so a 7B merge needs well under 1 GB of RAM.
+--peft-merge uses the previous full-model PEFT merge_and_unload() path.
+
+When deploying, merged tensors go straight into the GGUF writer
+(gguf_stream.py) without a merged safetensors directory; if that stage
+cannot run, the merged-directory + convert_hf_to_gguf.py path is used.
 
 Usage:
     python merge_and_deploy.py --model fast
@@ -12,6 +20,8 @@ Usage:
     python merge_and_deploy.py --model norwegian
     python merge_and_deploy.py --model default
     python merge_and_deploy.py --all
+    python merge_and_deploy.py --model fast --peft-merge
+    python merge_and_deploy.py --model fast --no-direct-gguf
 """
 
 import argparse
@@ -42,17 +52,77 @@ PROGRESS_FILE = LOGS_DIR / 'training-progress.json'
 # Import model configs from training script
 sys.path.insert(0, str(AI_TRAINING_DIR / 'training'))
 from train_unsloth import MODELS
+from lora_merge import merge_adapters
+from gguf_stream import ConverterMismatchError, write_merged_gguf
+
+
+def base_candidates(config, base_model_name):
+    """Base model names to try, in order.
+
+    Adapters trained on a 4-bit checkpoint record that checkpoint as their
+    base, so the fp16 model name from MODELS is tried next.
+    """
+    candidates = []
+    for name in (base_model_name, config['name'], config['fallback']):
+        if name and name not in candidates:
+            candidates.append(name)
+    return candidates
+
+
+def adapter_base_name(lora_dir, config):
+    with open(lora_dir / 'adapter_config.json', 'r') as f:
+        return json.load(f).get('base_model_name_or_path', config['name'])
+
+
+def stream_merge(config, base_model_name, lora_dir, merged_dir):
+    """Streaming merge into merged_dir; tries the candidate base names in order."""
+    for name in base_candidates(config, base_model_name):
+        print(f"  [1/2] Streaming merge from {name}...")
+        try:
+            merge_adapters(name, [lora_dir], merged_dir)
+            print("  [2/2] Creating Modelfile...")
+            return True
+        except (FileNotFoundError, ValueError, OSError) as e:
+            print(f"  Streaming merge with {name} failed: {e}")
+    return False
+
+
+def write_merged_modelfile(config, merged_dir):
+    """Write the safetensors-import Modelfile into merged_dir."""
+    num_ctx = config.get('low_vram_seq_length', 2048)
+    system_prompt = config['system_prompt']
+    modelfile_content = f'''FROM .
+
+TEMPLATE """{{{{- if .System }}}}<|im_start|>system
+{{{{ .System }}}}<|im_end|>
+{{{{ end }}}}{{{{- range .Messages }}}}<|im_start|>{{{{ .Role }}}}
+{{{{ .Content }}}}<|im_end|>
+{{{{ end }}}}<|im_start|>assistant
+"""
 
+PARAMETER temperature 0.3
+PARAMETER top_p 0.85
+PARAMETER top_k 40
+PARAMETER num_ctx {num_ctx}
+PARAMETER repeat_penalty 1.1
+PARAMETER stop <|im_end|>
+PARAMETER stop <|im_start|>
 
-def merge_lora_model(model_key, low_memory=False):
+SYSTEM """{system_prompt}"""
+'''
+    modelfile_path = merged_dir / 'Modelfile'
+    with open(modelfile_path, 'w', encoding='utf-8') as f:
+        f.write(modelfile_content)
+
+
+def merge_lora_model(model_key, low_memory=False, streaming=True):
     """
     Load base model in float16, apply LoRA adapter, merge, and save.
     Returns merged_dir path on success, None on failure.
-    """
-    import torch
-    from transformers import AutoModelForCausalLM, AutoTokenizer
-    from peft import PeftModel
 
+    With streaming=True (default) the merge runs tensor by tensor without
+    loading the model; low_memory only affects the PEFT path.
+    """
     config = MODELS[model_key]
     output_name = config['output_name']
     lora_dir = MODELS_DIR / f'{output_name}-lora'
@@ -81,6 +151,17 @@ def merge_lora_model(model_key, low_memory=False):
 
     merge_start = time.time()
 
+    if streaming:
+        if not stream_merge(config, base_model_name, lora_dir, merged_dir):
+            return None
+        write_merged_modelfile(config, merged_dir)
+        print(f"\n  Merge complete in {(time.time() - merge_start) / 60:.1f} minutes")
+        return merged_dir
+
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from peft import PeftModel
+
     # Step 1: Load base model in float16 (NOT 4-bit!)
     print("  [1/5] Loading base model in float16...")
     try:
@@ -160,30 +241,7 @@ def merge_lora_model(model_key, low_memory=False):
 
     # Step 5: Create Modelfile (with ChatML template for Qwen models)
     print("  [5/5] Creating Modelfile...")
-    num_ctx = config.get('low_vram_seq_length', 2048)
-    system_prompt = config['system_prompt']
-    modelfile_content = f'''FROM .
-
-TEMPLATE """{{{{- if .System }}}}<|im_start|>system
-{{{{ .System }}}}<|im_end|>
-{{{{ end }}}}{{{{- range .Messages }}}}<|im_start|>{{{{ .Role }}}}
-{{{{ .Content }}}}<|im_end|>
-{{{{ end }}}}<|im_start|>assistant
-"""
-
-PARAMETER temperature 0.3
-PARAMETER top_p 0.85
-PARAMETER top_k 40
-PARAMETER num_ctx {num_ctx}
-PARAMETER repeat_penalty 1.1
-PARAMETER stop <|im_end|>
-PARAMETER stop <|im_start|>
-
-SYSTEM """{system_prompt}"""
-'''
-    modelfile_path = merged_dir / 'Modelfile'
-    with open(modelfile_path, 'w', encoding='utf-8') as f:
-        f.write(modelfile_content)
+    write_merged_modelfile(config, merged_dir)
 
     elapsed = time.time() - merge_start
     print(f"\n  Merge complete in {elapsed / 60:.1f} minutes")
@@ -201,6 +259,29 @@ SYSTEM """{system_prompt}"""
     return merged_dir
 
 
+def direct_gguf(model_key, workers=4):
+    """Merge the LoRA adapter straight into an f16 GGUF. Returns gguf_path or None."""
+    config = MODELS[model_key]
+    output_name = config['output_name']
+    lora_dir = MODELS_DIR / f'{output_name}-lora'
+    gguf_path = MODELS_DIR / 'gguf' / f'{output_name}.gguf'
+
+    print(f"\n{'='*60}")
+    print(f"  Direct merge -> GGUF: {output_name}")
+    print(f"  LoRA adapter: {lora_dir}")
+    print(f"  Output: {gguf_path}")
+    print(f"{'='*60}\n")
+
+    for name in base_candidates(config, adapter_base_name(lora_dir, config)):
+        print(f"  Base model: {name}")
+        try:
+            write_merged_gguf(name, [lora_dir], gguf_path, outtype='f16', workers=workers)
+            return gguf_path
+        except (FileNotFoundError, ValueError, ImportError, ConverterMismatchError) as e:
+            print(f"  Direct GGUF with {name} failed: {type(e).__name__}: {e}")
+    return None
+
+
 def convert_to_gguf(model_key, merged_dir):
     """Convert merged safetensors to GGUF format. Returns gguf_path on success."""
     config = MODELS[model_key]
@@ -370,6 +451,12 @@ def main():
                         help='Merge and deploy all models with LoRA adapters')
     parser.add_argument('--low-memory', action='store_true',
                         help='Use CPU-only loading for large models (7B)')
+    parser.add_argument('--peft-merge', action='store_true',
+                        help='Load the full fp16 model and merge with PEFT instead of streaming')
+    parser.add_argument('--no-direct-gguf', action='store_true',
+                        help='Write a merged model dir and convert it, instead of streaming into GGUF')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Merge/checksum worker threads for the direct GGUF stage')
     parser.add_argument('--skip-deploy', action='store_true',
                         help='Only merge, do not deploy to Ollama')
     parser.add_argument('--skip-test', action='store_true',
@@ -415,8 +502,24 @@ def main():
         is_large = '7B' in config['name'] or model_key in ('norwegian', 'default')
         use_low_mem = args.low_memory or is_large
 
+        # Direct merge -> GGUF (no merged model directory)
+        use_direct = not (args.skip_deploy or args.peft_merge or args.no_direct_gguf)
+        if use_direct and direct_gguf(model_key, workers=args.workers) is not None:
+            merged_dir = MODELS_DIR / f'{output_name}-merged'
+            if deploy_to_ollama(model_key, merged_dir):
+                results[model_key] = 'DEPLOYED'
+                update_progress(model_key, deployed=True)
+                if not args.skip_test:
+                    test_model(model_key)
+            else:
+                results[model_key] = 'DEPLOY_FAILED'
+            continue
+        if use_direct:
+            print("  Falling back to merged directory + GGUF conversion")
+
         # Merge
-        merged_dir = merge_lora_model(model_key, low_memory=use_low_mem)
+        merged_dir = merge_lora_model(model_key, low_memory=use_low_mem,
+                                      streaming=not args.peft_merge)
         if merged_dir is None:
             results[model_key] = 'MERGE_FAILED'
             continue
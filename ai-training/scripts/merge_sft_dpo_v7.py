@@ -8,17 +8,25 @@ v7 changes vs v6:
 - LoRA rank: r=64, alpha=128 (vs r=16, alpha=16 in v6)
 
 Two-step merge pipeline:
-1. Load Qwen2.5-7B-Instruct in fp16 (CPU)
-2. Apply SFT LoRA (latest checkpoint) -> merge_and_unload()
-3. Apply DPO LoRA (chiro-no-dpo) -> merge_and_unload()
-4. Save merged safetensors in fp16
-5. Convert to GGUF Q8_0
-6. Create Modelfile and deploy to Ollama
+1. Stream Qwen2.5-7B-Instruct shards tensor by tensor (lora_merge.py)
+2. Apply SFT LoRA (latest checkpoint) + DPO LoRA (chiro-no-dpo) in one pass
+3. Write merged safetensors in fp16
+4. Convert to GGUF Q8_0
+5. Create Modelfile and deploy to Ollama
+
+--peft-merge uses the previous path (full fp16 model on CPU, two
+merge_and_unload() calls), which needs ~15+ GB of RAM.
+
+By default steps 1-4 run as one stage (gguf_stream.py): merged tensors are
+streamed straight into the GGUF writer, with no merged directory on disk.
+--no-direct-gguf (or --peft-merge) keeps the separate merge + convert steps.
 
 Usage:
     python scripts/merge_sft_dpo_v7.py
     python scripts/merge_sft_dpo_v7.py --version v7
     python scripts/merge_sft_dpo_v7.py --skip-deploy
+    python scripts/merge_sft_dpo_v7.py --peft-merge
+    python scripts/merge_sft_dpo_v7.py --no-direct-gguf
 """
 
 import argparse
@@ -49,6 +57,9 @@ DPO_DIR = MODELS_DIR / 'chiro-no-dpo'
 CONVERT_SCRIPT = AI_TRAINING_DIR / 'llama-cpp-convert' / 'convert_hf_to_gguf.py'
 PYTHON_EXE = AI_TRAINING_DIR / 'ml-env' / 'Scripts' / 'python.exe'
 
+from lora_merge import merge_adapters
+from gguf_stream import ConverterMismatchError, write_merged_gguf
+
 SYSTEM_PROMPT = """Du er en spesialisert klinisk assistent for kiropraktorer i Norge. Du har omfattende kunnskap om kiropraktisk praksis, muskel- og skjelettsystemet, nevrologisk undersokelse, og norsk helsevesen.
 
 DINE KJERNEOPPGAVER:
@@ -146,12 +157,8 @@ def find_latest_sft_checkpoint():
     return None
 
 
-def step1_merge(merged_dir, version):
+def step1_merge(merged_dir, version, streaming=True):
     """Load base model in fp16, apply SFT + DPO LoRAs, merge and save."""
-    import torch
-    from transformers import AutoModelForCausalLM, AutoTokenizer
-    from peft import PeftModel
-
     # Auto-detect SFT checkpoint
     sft_dir = find_latest_sft_checkpoint()
     if sft_dir is None:
@@ -174,6 +181,20 @@ def step1_merge(merged_dir, version):
             return False
         print(f"  Found {label} adapter: {path}")
 
+    if streaming:
+        print(f"\n  [1/1] Streaming SFT + DPO merge (single pass)...")
+        try:
+            merge_adapters(BASE_MODEL, [sft_dir, DPO_DIR], merged_dir)
+        except (FileNotFoundError, ValueError, OSError) as e:
+            print(f"  ERROR: Streaming merge failed: {e}")
+            return False
+        print(f"\n  Merge complete in {(time.time()-t0)/60:.1f} minutes")
+        return True
+
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from peft import PeftModel
+
     # Load base model in fp16 on CPU (avoids OOM on 12GB GPU)
     print(f"\n  [1/6] Loading base model in fp16 (CPU)...")
     model = AutoModelForCausalLM.from_pretrained(
@@ -228,6 +249,29 @@ def step1_merge(merged_dir, version):
     return True
 
 
+def step12_direct_gguf(gguf_path, version, workers=4):
+    """Merge SFT + DPO LoRAs straight into a Q8_0 GGUF (no merged directory)."""
+    sft_dir = find_latest_sft_checkpoint()
+    if sft_dir is None:
+        return False
+
+    print(f"\n{'='*60}")
+    print(f"  STEP 1+2: Streaming LoRA Merge -> GGUF Q8_0 ({version})")
+    print(f"  Base: {BASE_MODEL}")
+    print(f"  SFT:  {sft_dir}")
+    print(f"  DPO:  {DPO_DIR}")
+    print(f"  Out:  {gguf_path}")
+    print(f"{'='*60}\n")
+
+    try:
+        write_merged_gguf(BASE_MODEL, [sft_dir, DPO_DIR], gguf_path,
+                          outtype='q8_0', workers=workers, convert_script=CONVERT_SCRIPT)
+    except (FileNotFoundError, ValueError, ImportError, ConverterMismatchError) as e:
+        print(f"  Direct GGUF stage failed: {type(e).__name__}: {e}")
+        return False
+    return True
+
+
 def step2_convert_gguf(merged_dir, gguf_path):
     """Convert merged safetensors to GGUF Q8_0."""
     print(f"\n{'='*60}")
@@ -354,6 +398,12 @@ def main():
     parser.add_argument('--version', default='v7', help='Version tag (default: v7)')
     parser.add_argument('--skip-deploy', action='store_true', help='Only merge and convert, no Ollama deploy')
     parser.add_argument('--skip-merge', action='store_true', help='Skip merge (use existing merged dir)')
+    parser.add_argument('--peft-merge', action='store_true',
+                        help='Load the full fp16 model and merge with PEFT instead of streaming')
+    parser.add_argument('--no-direct-gguf', action='store_true',
+                        help='Write the merged dir and convert it, instead of streaming into GGUF')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Merge/checksum worker threads for the direct GGUF stage')
     args = parser.parse_args()
 
     version = args.version
@@ -367,23 +417,31 @@ def main():
 
     overall_start = time.time()
 
-    # Step 1: Merge
-    if not args.skip_merge:
-        ok = step1_merge(merged_dir, version)
+    # Steps 1+2 in one pass: streamed merge straight into GGUF
+    direct_ok = False
+    if not (args.skip_merge or args.peft_merge or args.no_direct_gguf):
+        direct_ok = step12_direct_gguf(gguf_path, version, workers=args.workers)
+        if not direct_ok:
+            print("  Falling back to merged directory + GGUF conversion")
+
+    if not direct_ok:
+        # Step 1: Merge
+        if not args.skip_merge:
+            ok = step1_merge(merged_dir, version, streaming=not args.peft_merge)
+            if not ok:
+                print("\nMerge failed. Aborting.")
+                return 1
+        else:
+            if not merged_dir.exists():
+                print(f"Merged dir not found: {merged_dir}")
+                return 1
+            print(f"Skipping merge, using existing: {merged_dir}")
+
+        # Step 2: Convert to GGUF Q8_0
+        ok = step2_convert_gguf(merged_dir, gguf_path)
         if not ok:
-            print("\nMerge failed. Aborting.")
+            print("\nGGUF conversion failed. Aborting.")
             return 1
-    else:
-        if not merged_dir.exists():
-            print(f"Merged dir not found: {merged_dir}")
-            return 1
-        print(f"Skipping merge, using existing: {merged_dir}")
-
-    # Step 2: Convert to GGUF Q8_0
-    ok = step2_convert_gguf(merged_dir, gguf_path)
-    if not ok:
-        print("\nGGUF conversion failed. Aborting.")
-        return 1
 
     # Step 3: Deploy to Ollama
     if not args.skip_deploy:
@@ -21,10 +21,12 @@ Usage:
 
 import json
 import os
-import random
 import sys
 from pathlib import Path
 
+from dataset_cache import write_dir_cache
+from split_utils import append_order, hash_split_two_way
+
 # Fix Windows console encoding
 if sys.platform == 'win32':
     os.environ.setdefault('PYTHONIOENCODING', 'utf-8')
@@ -34,8 +36,6 @@ if sys.platform == 'win32':
     except Exception:
         pass
 
-random.seed(42)
-
 SCRIPT_DIR = Path(__file__).parent.resolve()
 AI_DIR = SCRIPT_DIR.parent
 
@@ -160,11 +160,8 @@ def merge_sft():
 
     print(f"  Valid new examples: {len(valid_new)}")
 
-    # Split new data 90/10
-    random.shuffle(valid_new)
-    split_idx = int(len(valid_new) * 0.9)
-    new_train = valid_new[:split_idx]
-    new_val = valid_new[split_idx:]
+    # Split new data 90/10 by content hash (stable as sources grow)
+    new_train, new_val = hash_split_two_way(valid_new, val_ratio=0.1)
 
     print(f"  New split: {len(new_train)} train, {len(new_val)} val")
 
@@ -172,14 +169,16 @@ def merge_sft():
     all_train = v7_train + new_train
     all_val = v7_val + new_val
 
-    # Shuffle training data
-    random.shuffle(all_train)
+    # Rows already in the previous output keep their place; new rows are appended
+    all_train = append_order(all_train, OUT_SFT_DIR / "train.jsonl")
+    all_val = append_order(all_val, OUT_SFT_DIR / "validation.jsonl")
 
     print(f"  Combined: {len(all_train)} train, {len(all_val)} val")
 
     # Write output
     write_jsonl(all_train, OUT_SFT_DIR / "train.jsonl")
     write_jsonl(all_val, OUT_SFT_DIR / "validation.jsonl")
+    write_dir_cache(OUT_SFT_DIR)
 
     return len(all_train), len(all_val)
 
@@ -218,23 +217,22 @@ def merge_dpo():
 
     print(f"  Valid new DPO: {len(valid_new)}")
 
-    # Split new data 90/10
-    random.shuffle(valid_new)
-    split_idx = int(len(valid_new) * 0.9)
-    new_train = valid_new[:split_idx]
-    new_val = valid_new[split_idx:]
+    # Split new data 90/10 by content hash (stable as sources grow)
+    new_train, new_val = hash_split_two_way(valid_new, val_ratio=0.1)
 
     # Combine with v7 base
     all_train = v7_train + new_train
     all_val = v7_val + new_val
 
-    random.shuffle(all_train)
+    all_train = append_order(all_train, OUT_DPO_DIR / "train.jsonl")
+    all_val = append_order(all_val, OUT_DPO_DIR / "validation.jsonl")
 
     print(f"  Combined: {len(all_train)} train, {len(all_val)} val")
 
     # Write output
     write_jsonl(all_train, OUT_DPO_DIR / "train.jsonl")
     write_jsonl(all_val, OUT_DPO_DIR / "validation.jsonl")
+    write_dir_cache(OUT_DPO_DIR)
 
     return len(all_train), len(all_val)
 
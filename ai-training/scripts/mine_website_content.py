@@ -9,73 +9,219 @@ Extracts:
 - Summary/key points from premium-summary-card
 - Condition descriptions from condition-card divs
 
+Each page is parsed once (PageParser) and every extractor reads that result.
+A captured element runs to its matching close tag, so boxes with nested
+<div>s are taken whole; the old per-extractor regexes stopped at the first
+inner </div> (dropping or truncating such red-flag and summary boxes), and
+picked condition cards by what followed the closing tag.
+Pages are mined in a process pool, and pages whose content hash is unchanged
+since the last run are reused from data/mined/mine-cache.json.
+
 Outputs ChatML format compatible with train_unsloth.py
+
+Usage:
+    python mine_website_content.py /path/to/website
+    python mine_website_content.py /path/to/website --workers 8 --full
+    python mine_website_content.py /path/to/website --benchmark
 """
 
+import argparse
+import hashlib
+import html
 import json
 import os
 import re
 import sys
-from html.parser import HTMLParser
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 
 # ============================================================
-# HTML Text Extraction
+# Single-Pass Page Parser
 # ============================================================
 
-class HTMLTextExtractor(HTMLParser):
-    """Extract text content from HTML, stripping tags."""
+# (tag, class) -> extractor bucket; class matches any token of the class attribute
+CAPTURE_CLASSES = {
+    ('div', 'red-flag-alert'): 'red_flags',
+    ('div', 'premium-summary-card'): 'summaries',
+    ('div', 'intro-text'): 'intros',
+    ('div', 'condition-card'): 'cards',
+    ('section', 'hub-section'): 'sections',
+}
+# Buckets whose first heading of this tag becomes the item title
+TITLE_TAGS = {'sections': 'h2', 'cards': 'h3'}
+SKIP_TAGS = {'script', 'style', 'noscript'}
+BLOCK_END_TAGS = {'p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'}
 
-    def __init__(self):
-        super().__init__()
-        self._text = []
-        self._skip = False
-        self._skip_tags = {'script', 'style', 'noscript'}
-
-    def handle_starttag(self, tag, attrs):
-        if tag in self._skip_tags:
-            self._skip = True
-
-    def handle_endtag(self, tag):
-        if tag in self._skip_tags:
-            self._skip = False
-        if tag in ('p', 'li', 'h1', 'h2', 'h3', 'h4', 'br', 'div'):
-            self._text.append('\n')
-
-    def handle_data(self, data):
-        if not self._skip:
-            self._text.append(data)
-
-    def get_text(self):
-        return ''.join(self._text).strip()
-
-
-def html_to_text(html_str):
-    """Convert HTML string to plain text."""
-    extractor = HTMLTextExtractor()
-    extractor.feed(html_str)
-    text = extractor.get_text()
-    # Normalize whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
+
+def normalize_text(text):
+    """Collapse blank lines and runs of spaces/tabs."""
+    text = re.sub(r'\n{3,}', '\n\n', text.strip())
     text = re.sub(r'[ \t]+', ' ', text)
     return text.strip()
 
 
+class _Capture:
+    """Text of one open element (and its first title heading) being collected."""
+
+    __slots__ = ('kind', 'tag', 'depth', 'parts', 'title_tag', 'title_parts', 'title', 'in_title')
+
+    def __init__(self, kind, tag, title_tag=None):
+        self.kind = kind
+        self.tag = tag
+        self.depth = 1
+        self.parts = []
+        self.title_tag = title_tag
+        self.title_parts = []
+        self.title = None
+        self.in_title = False
+
+    @property
+    def text(self):
+        return normalize_text(''.join(self.parts))
+
+
+# Tags, comments and declarations; text between matches is page data
+_TOKEN_RE = re.compile(
+    r'<!--.*?-->|<![^>]*>|<\?[^>]*>'
+    r'|<(/?)([a-zA-Z][a-zA-Z0-9]*)((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.DOTALL)
+# Outside every capture only tags that can open one (or hide text) matter,
+# so the scan skips ordinary markup in C instead of visiting each tag
+_OUTSIDE_RE = re.compile(
+    r'<!--.*?-->'
+    r'|<()(html|script|style|noscript|div|section|h1)\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>',
+    re.DOTALL | re.IGNORECASE)
+_ATTR_RE = re.compile(r'([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+_CLOSE_RE = {tag: re.compile(rf'</{tag}\s*>', re.IGNORECASE) for tag in SKIP_TAGS}
+# Only these tags have attributes we read (lang, class, type)
+_ATTR_TAGS = {tag for tag, _ in CAPTURE_CLASSES} | {'html', 'script'}
+
+
+def _attrs(attr_text):
+    return {m.group(1).lower(): html.unescape(next(g for g in m.groups()[1:] if g is not None))
+            for m in _ATTR_RE.finditer(attr_text)}
+
+
+class PageParser:
+    """Walks a page once and collects everything the extractors need.
+
+    A single regex scan over the tags; text between tags is only sliced and
+    unescaped while some capture is open. Each captured element
+    (red-flag box, summary card, intro, condition card, hub section, h1) gets
+    its own text buffer; nested captures all receive the text, and an element
+    closes when its own tag depth returns to zero.
+    """
+
+    def __init__(self):
+        self.lang = None
+        self.jsonld = []
+        self.found = {kind: [] for kind in CAPTURE_CLASSES.values()}
+        self.h1 = None
+        self._open = []
+
+    def feed(self, page):
+        pos = 0
+        end = len(page)
+        while pos < end:
+            m = (_TOKEN_RE if self._open else _OUTSIDE_RE).search(page, pos)
+            if m is None:
+                self._data(page[pos:])
+                break
+            if self._open and m.start() > pos:
+                self._data(page[pos:m.start()])
+            pos = m.end()
+            tag = m.group(2)
+            if tag is None:  # comment / doctype / processing instruction
+                continue
+            tag = tag.lower()
+            if m.group(1):
+                self._end(tag)
+                continue
+            attr_text = m.group(3)
+            self._start(tag, attr_text)
+            if tag in SKIP_TAGS:
+                # Raw text up to the closing tag; only JSON-LD scripts are kept
+                close_match = _CLOSE_RE[tag].search(page, pos)
+                close = close_match.start() if close_match else end
+                if tag == 'script' and 'application/ld+json' in attr_text:
+                    self.jsonld.append(page[pos:close])
+                pos = close
+            elif attr_text.rstrip().endswith('/'):
+                self._end(tag)
+        return self
+
+    def _start(self, tag, attr_text):
+        attrs = _attrs(attr_text) if tag in _ATTR_TAGS else {}
+        if tag == 'html' and self.lang is None:
+            self.lang = attrs.get('lang')
+
+        for cap in self._open:
+            if cap.tag == tag:
+                cap.depth += 1
+            if tag == cap.title_tag and cap.title is None and not cap.in_title:
+                cap.in_title = True
+
+        for cls in (attrs.get('class') or '').split():
+            kind = CAPTURE_CLASSES.get((tag, cls))
+            if kind:
+                self._open.append(_Capture(kind, tag, TITLE_TAGS.get(kind)))
+                break
+        if tag == 'h1' and self.h1 is None and not any(c.kind == 'h1' for c in self._open):
+            self._open.append(_Capture('h1', 'h1'))
+
+    def _end(self, tag):
+        if not self._open:
+            return
+        still_open = []
+        for cap in self._open:
+            if cap.in_title and tag == cap.title_tag:
+                cap.in_title = False
+                cap.title = normalize_text(''.join(cap.title_parts))
+            if cap.tag == tag:
+                cap.depth -= 1
+                if cap.depth == 0:
+                    self._close(cap)
+                    continue
+            if tag in BLOCK_END_TAGS:
+                cap.parts.append('\n')
+                if cap.in_title:
+                    cap.title_parts.append('\n')
+            still_open.append(cap)
+        self._open = still_open
+
+    def _data(self, data):
+        if not self._open:
+            return
+        data = html.unescape(data)
+        for cap in self._open:
+            cap.parts.append(data)
+            if cap.in_title:
+                cap.title_parts.append(data)
+
+    def _close(self, cap):
+        if cap.kind == 'h1':
+            self.h1 = cap.text
+        else:
+            self.found[cap.kind].append(cap)
+
+
+def parse_page(html_content):
+    """Parse a page once; returns the PageParser with all captures filled in."""
+    return PageParser().feed(html_content)
+
+
 # ============================================================
-# Content Extractors
+# Content Extractors (all read one parsed page)
 # ============================================================
 
-def extract_faq_from_jsonld(html_content):
+def extract_faq_from_jsonld(page):
     """Extract FAQ Q&A pairs from JSON-LD FAQPage schema."""
     faqs = []
-    # Find all JSON-LD blocks
-    pattern = r'<script\s+type="application/ld\+json">\s*(.*?)\s*</script>'
-    matches = re.findall(pattern, html_content, re.DOTALL)
-
-    for match in matches:
+    for block in page.jsonld:
         try:
-            data = json.loads(match)
+            data = json.loads(block.strip())
             if data.get('@type') == 'FAQPage' and 'mainEntity' in data:
                 for item in data['mainEntity']:
                     if item.get('@type') == 'Question':
@@ -83,119 +229,62 @@ def extract_faq_from_jsonld(html_content):
                         a = item.get('acceptedAnswer', {}).get('text', '').strip()
                         if q and a:
                             faqs.append({'question': q, 'answer': a})
-        except (json.JSONDecodeError, KeyError, TypeError):
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
             continue
 
     return faqs
 
 
-def extract_red_flags(html_content):
-    """Extract red flag alert content."""
-    flags = []
-    pattern = r'<div\s+class="red-flag-alert">(.*?)</div>'
-    matches = re.findall(pattern, html_content, re.DOTALL)
-
-    for match in matches:
-        text = html_to_text(match)
-        if text and len(text) > 20:
-            flags.append(text)
+def extract_red_flags(page):
+    """Extract red flag alert content (the whole box, nested divs included)."""
+    return [t for t in (c.text for c in page.found['red_flags']) if len(t) > 20]
 
-    return flags
 
-
-def extract_sections(html_content):
-    """Extract numbered clinical sections from hub-section divs."""
+def extract_sections(page):
+    """Extract clinical sections (with an h2 title) from hub-section elements."""
     sections = []
-    # Match sections with id like s1, s2, etc. or named sections
-    pattern = r'<section\s+(?:class="hub-section"\s+)?id="([^"]*)"[^>]*class="hub-section"[^>]*>(.*?)</section>'
-    # More flexible pattern
-    pattern = r'<section[^>]*class="hub-section"[^>]*>(.*?)</section>'
-    matches = re.findall(pattern, html_content, re.DOTALL)
-
-    for match in matches:
-        # Extract section header
-        header_match = re.search(r'<h2>(.*?)</h2>', match, re.DOTALL)
-        if header_match:
-            title = html_to_text(header_match.group(1))
-            content = html_to_text(match)
-            # Remove the section number prefix
-            content = re.sub(r'^\d+\s*\n', '', content)
-            if content and len(content) > 50:
-                sections.append({
-                    'title': title,
-                    'content': content
-                })
-
+    for cap in page.found['sections']:
+        if cap.title is None:
+            continue
+        # Remove the section number prefix
+        content = re.sub(r'^\d+\s*\n', '', cap.text)
+        if len(content) > 50:
+            sections.append({'title': cap.title, 'content': content})
     return sections
 
 
-def extract_summary(html_content):
-    """Extract key points from premium-summary-card."""
-    pattern = r'<div\s+class="premium-summary-card">(.*?)</div>'
-    matches = re.findall(pattern, html_content, re.DOTALL)
-
-    summaries = []
-    for match in matches:
-        text = html_to_text(match)
-        if text and len(text) > 20:
-            summaries.append(text)
-
-    return summaries
+def extract_summary(page):
+    """Extract key points from premium-summary-card (the whole card, nested divs included)."""
+    return [t for t in (c.text for c in page.found['summaries']) if len(t) > 20]
 
 
-def extract_condition_cards(html_content):
-    """Extract condition descriptions from condition-card divs."""
+def extract_condition_cards(page):
+    """Extract condition descriptions (with an h3 title) from every condition-card div."""
     cards = []
-    pattern = r'<div\s+class="condition-card">(.*?)</div>\s*</div>|<div\s+class="condition-card">(.*?)</div>'
-    # Simpler approach: get all condition-card content
-    pattern = r'<div\s+class="condition-card">(.*?)</div>\s*(?=<div|</section)'
-    matches = re.findall(pattern, html_content, re.DOTALL)
-
-    for match in matches:
-        h3_match = re.search(r'<h3>(.*?)</h3>', match, re.DOTALL)
-        if h3_match:
-            title = html_to_text(h3_match.group(1))
-            content = html_to_text(match)
-            if content and len(content) > 30:
-                cards.append({
-                    'title': title,
-                    'content': content
-                })
-
+    for cap in page.found['cards']:
+        content = cap.text
+        if cap.title is not None and len(content) > 30:
+            cards.append({'title': cap.title, 'content': content})
     return cards
 
 
-def extract_page_title(html_content):
-    """Extract the main page title from h1."""
-    match = re.search(r'<h1>(.*?)</h1>', html_content, re.DOTALL)
-    if match:
-        return html_to_text(match.group(1))
-    return None
+def extract_page_title(page):
+    """The main page title from the first h1."""
+    return page.h1 or None
 
 
-def extract_intro(html_content):
+def extract_intro(page):
     """Extract intro text."""
-    pattern = r'<div\s+class="intro-text">(.*?)</div>'
-    matches = re.findall(pattern, html_content, re.DOTALL)
-
-    intros = []
-    for match in matches:
-        text = html_to_text(match)
-        if text and len(text) > 30:
-            intros.append(text)
-
-    return intros
+    return [t for t in (c.text for c in page.found['intros']) if len(t) > 30]
 
 
-def detect_language(html_content):
+def detect_language(page):
     """Detect if page is Norwegian or English."""
-    lang_match = re.search(r'<html\s+lang="([^"]+)"', html_content)
-    if lang_match:
-        lang = lang_match.group(1).lower()
-        if lang in ('nb', 'no', 'nn'):
-            return 'no'
-        elif lang == 'en':
-            return 'en'
+    lang = (page.lang or '').lower()
+    if lang in ('nb', 'no', 'nn'):
+        return 'no'
+    elif lang == 'en':
+        return 'en'
     return 'no'  # default
 
 
@@ -477,48 +566,129 @@ def generate_soap_from_condition(page_title, intro, sections, lang='no'):
 # Main Processing
 # ============================================================
 
-def process_file(filepath):
-    """Process a single HTML file and return training examples."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except (UnicodeDecodeError, FileNotFoundError):
-        return []
+# Bump when extraction/generation changes so cached pages are re-mined
+# (3: whole-element captures, see the module docstring)
+MINER_VERSION = 3
+CACHE_NAME = 'mine-cache.json'
+
 
-    lang = detect_language(content)
-    page_title = extract_page_title(content)
+def process_content(content):
+    """Parse one page once and return its training examples."""
+    page = parse_page(content)
+    lang = detect_language(page)
+    page_title = extract_page_title(page)
     if not page_title:
         return []
 
     examples = []
 
     # Extract and generate from FAQs
-    faqs = extract_faq_from_jsonld(content)
+    faqs = extract_faq_from_jsonld(page)
     examples.extend(generate_faq_examples(faqs, page_title, lang))
 
     # Extract and generate from red flags
-    red_flags = extract_red_flags(content)
+    red_flags = extract_red_flags(page)
     examples.extend(generate_red_flag_examples(red_flags, page_title, lang))
 
     # Extract and generate from sections
-    sections = extract_sections(content)
+    sections = extract_sections(page)
     examples.extend(generate_section_examples(sections, page_title, lang))
 
     # Extract and generate from summaries
-    summaries = extract_summary(content)
+    summaries = extract_summary(page)
     examples.extend(generate_summary_examples(summaries, page_title, lang))
 
     # Extract and generate from condition cards
-    cards = extract_condition_cards(content)
+    cards = extract_condition_cards(page)
     examples.extend(generate_condition_card_examples(cards, page_title, lang))
 
     # Generate SOAP-style examples (Norwegian only)
-    intros = extract_intro(content)
+    intros = extract_intro(page)
     examples.extend(generate_soap_from_condition(page_title, intros, sections, lang))
 
     return examples
 
 
+def process_file(filepath):
+    """Process a single HTML file and return training examples."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+    except (UnicodeDecodeError, FileNotFoundError):
+        return []
+    return process_content(content)
+
+
+def mine_file(filepath, known_hash=None):
+    """Hash a page and mine it unless the hash matches known_hash.
+
+    Returns (sha256, examples); examples is None when the page is unchanged.
+    Top-level so it can run in a process pool.
+    """
+    try:
+        raw = Path(filepath).read_bytes()
+    except FileNotFoundError:
+        return None, []
+    digest = hashlib.sha256(raw).hexdigest()
+    if digest == known_hash:
+        return digest, None
+    try:
+        content = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return digest, []
+    return digest, process_content(content)
+
+
+def load_cache(path):
+    """Per-page {sha256, examples} from the previous run (empty if stale/missing)."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    if cache.get('version') != MINER_VERSION:
+        return {}
+    return cache.get('pages', {})
+
+
+def save_cache(path, pages):
+    tmp = Path(path).with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': MINER_VERSION, 'pages': pages}, f, ensure_ascii=False)
+    tmp.replace(path)
+
+
+def mine_pages(html_files, website_dir, cache=None, workers=1):
+    """Mine all pages, reusing cached examples for unchanged ones.
+
+    Returns (examples in file order, new cache dict, number of re-mined pages).
+    """
+    cache = cache or {}
+    keys = [Path(f).relative_to(website_dir).as_posix() for f in html_files]
+    known = [cache.get(k, {}).get('sha256') for k in keys]
+
+    if workers > 1 and len(html_files) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(html_files) // (workers * 4))
+            results = list(pool.map(mine_file, html_files, known, chunksize=chunksize))
+    else:
+        results = [mine_file(f, k) for f, k in zip(html_files, known)]
+
+    all_examples = []
+    new_cache = {}
+    mined = 0
+    for key, (digest, examples) in zip(keys, results):
+        if digest is None:
+            continue
+        if examples is None:
+            examples = cache[key]['examples']
+        else:
+            mined += 1
+        new_cache[key] = {'sha256': digest, 'examples': examples}
+        all_examples.extend(examples)
+    return all_examples, new_cache, mined
+
+
 def find_html_files(website_dir):
     """Find all condition HTML files in the website."""
     files = []
@@ -551,12 +721,43 @@ def find_html_files(website_dir):
     return files
 
 
+def run_benchmark(html_files, website_dir, workers):
+    """Time cold serial, cold parallel and warm (all cached) mining of the site."""
+    print(f"\nBenchmark: {len(html_files)} pages, {workers} workers")
+    timings = {}
+
+    start = time.perf_counter()
+    serial, cache, _ = mine_pages(html_files, website_dir, workers=1)
+    timings['serial'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parallel, _, _ = mine_pages(html_files, website_dir, workers=workers)
+    timings['parallel'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    warm, _, mined = mine_pages(html_files, website_dir, cache=cache, workers=workers)
+    timings['incremental'] = time.perf_counter() - start
+
+    for name, seconds in timings.items():
+        rate = len(html_files) / seconds if seconds else 0
+        speedup = timings['serial'] / seconds if seconds else 0
+        print(f"  {name:<12s} {seconds:7.2f}s  {rate:8.1f} pages/s  {speedup:5.1f}x")
+    print(f"  Re-mined on warm run: {mined} pages")
+    print(f"  Outputs identical: {serial == parallel == warm}")
+    return 0 if serial == parallel == warm else 1
+
+
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python mine_website_content.py <website_directory>")
-        print("Example: python mine_website_content.py /path/to/website")
-        sys.exit(1)
-    website_dir = sys.argv[1]
+    parser = argparse.ArgumentParser(description='Mine clinical content from TheBackROM website')
+    parser.add_argument('website_dir', help='Path to the website directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Worker processes (default: CPU count, 1 = serial)')
+    parser.add_argument('--full', action='store_true',
+                        help='Re-mine every page (ignore the content-hash cache)')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Time serial vs. parallel vs. incremental mining and exit')
+    args = parser.parse_args()
+    website_dir = args.website_dir
 
     if not Path(website_dir).exists():
         print(f"ERROR: Website directory not found: {website_dir}")
@@ -571,36 +772,42 @@ def main():
     print(f"Output directory: {output_dir}")
 
     # Find all HTML files
-    html_files = find_html_files(website_dir)
+    html_files = sorted(find_html_files(website_dir))
     print(f"Found {len(html_files)} HTML files")
 
-    all_examples = []
+    if args.benchmark:
+        return run_benchmark(html_files, website_dir, args.workers)
+
+    cache_path = output_dir / CACHE_NAME
+    cache = {} if args.full else load_cache(cache_path)
+    start = time.perf_counter()
+    all_examples, cache, mined = mine_pages(html_files, website_dir, cache=cache, workers=args.workers)
+    save_cache(cache_path, cache)
+    print(f"Mined {mined} changed pages, reused {len(cache) - mined} unchanged "
+          f"({time.perf_counter() - start:.1f}s)")
+
     no_examples = []
     en_examples = []
     medical_examples = []
     quick_examples = []
 
-    for filepath in sorted(html_files):
-        examples = process_file(filepath)
-        all_examples.extend(examples)
-
-        for ex in examples:
-            msgs = ex['messages']
-            system_msg = msgs[0]['content'] if msgs[0]['role'] == 'system' else ''
-
-            # Categorize by model target
-            if 'sikkerhetsrådgiver' in system_msg or 'safety advisor' in system_msg:
-                medical_examples.append(ex)
-            elif 'rask klinisk' in system_msg:
-                quick_examples.append(ex)
-
-            # Language split
-            if any(kw in system_msg for kw in ['norsk', 'Norge', 'kiropraktikk', 'dokumentasjonsspesialist', 'kiropraktorer']):
-                no_examples.append(ex)
-            elif 'You are' in system_msg:
-                en_examples.append(ex)
-            else:
-                no_examples.append(ex)
+    for ex in all_examples:
+        msgs = ex['messages']
+        system_msg = msgs[0]['content'] if msgs[0]['role'] == 'system' else ''
+
+        # Categorize by model target
+        if 'sikkerhetsrådgiver' in system_msg or 'safety advisor' in system_msg:
+            medical_examples.append(ex)
+        elif 'rask klinisk' in system_msg:
+            quick_examples.append(ex)
+
+        # Language split
+        if any(kw in system_msg for kw in ['norsk', 'Norge', 'kiropraktikk', 'dokumentasjonsspesialist', 'kiropraktorer']):
+            no_examples.append(ex)
+        elif 'You are' in system_msg:
+            en_examples.append(ex)
+        else:
+            no_examples.append(ex)
 
     print(f"\nTotal examples extracted: {len(all_examples)}")
     print(f"  Norwegian: {len(no_examples)}")
@@ -638,4 +845,4 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
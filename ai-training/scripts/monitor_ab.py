@@ -6,11 +6,32 @@ Queries the ai_feedback table to compare acceptance rates between
 base models and LoRA variants. Outputs a report with statistical
 significance testing.
 
+Feedback is synced incrementally into a local aggregate store
+(scripts/feedback_store.py): each run fetches only items newer than the
+last watermark, page by page, and reports from per-model/per-day rollups,
+so a 30-day window costs the same as a 1-day one. The first sync fetches
+--days of history; later runs only fetch what is new.
+
 Usage:
     python scripts/monitor_ab.py
     python scripts/monitor_ab.py --days 30
     python scripts/monitor_ab.py --model chiro-norwegian
     python scripts/monitor_ab.py --format csv
+    python scripts/monitor_ab.py --offline              # report from the store, no fetch
+    python scripts/monitor_ab.py --stub-backend 50000   # against a local stub backend
+    python scripts/monitor_ab.py --watch 300 --stop-on-decision --since 2026-10-01
+
+Stopping decisions use an always-valid sequential test (mSPRT) over the
+cumulative acceptance counts after each day, so the monitor can be left
+running (--watch) and a losing LoRA variant stopped as soon as the evidence
+is conclusive, without the inflated false-positive rate of re-running a
+fixed-horizon z-test. The looks are cumulative from the experiment start
+(--since, default: everything in the store), not over the --days report
+window: a sliding window tests a different sequence at every look and
+loses the always-valid guarantee. The first sync only fetches --days of
+history, so make --days reach back to the start on a fresh store.
+Decision-time percentiles come from mergeable t-digests kept per model and
+day in the store.
 """
 
 import argparse
@@ -18,6 +39,7 @@ import json
 import math
 import os
 import sys
+import time
 from datetime import datetime, timedelta
 
 try:
@@ -27,10 +49,19 @@ except ImportError:
     subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'requests', '-q'])
     import requests
 
+from feedback_store import (
+    DEFAULT_STORE, FeedbackStore, StubBackend, rollup_items, synthetic_feedback, sync,
+)
+
 # Backend API configuration
 BACKEND_URL = os.environ.get('BACKEND_URL', 'http://localhost:3000')
 API_BASE = f'{BACKEND_URL}/api/v1'
 
+# Sequential (mSPRT) test settings
+MSPRT_TAU = 0.05          # mixing sd of the acceptance-rate difference (effects of ~5 points)
+SEQUENTIAL_ALPHA = 0.05
+MIN_SAMPLES = 30
+
 # Model pairs: base → LoRA variant
 MODEL_PAIRS = {
     'chiro-no': 'chiro-no-lora',
@@ -40,12 +71,12 @@ MODEL_PAIRS = {
 }
 
 
-def login(email=None, password=None):
+def login(email=None, password=None, api_base=None):
     """Login and return session cookie. Uses AB_EMAIL/AB_PASSWORD env vars or defaults."""
     email = email or os.environ.get('AB_EMAIL', 'admin@chiroclickcrm.no')
     password = password or os.environ.get('AB_PASSWORD', 'admin123')
     try:
-        resp = requests.post(f'{API_BASE}/auth/login', json={
+        resp = requests.post(f'{api_base or API_BASE}/auth/login', json={
             'email': email,
             'password': password,
         }, timeout=10)
@@ -73,11 +104,11 @@ def fetch_feedback(cookies, days=7, model_filter=None):
         return None
 
 
-def fetch_feedback_export(cookies, days=7):
-    """Export raw feedback data for detailed analysis."""
+def fetch_feedback_export(cookies, days=7, api_base=None):
+    """Export raw feedback data for detailed analysis (the whole window in one response)."""
     try:
         params = {'format': 'json', 'days': days}
-        resp = requests.get(f'{API_BASE}/ai-feedback/feedback/export',
+        resp = requests.get(f'{api_base or API_BASE}/ai-feedback/feedback/export',
                           cookies=cookies, params=params, timeout=30)
         if resp.status_code == 200:
             return resp.json()
@@ -133,48 +164,82 @@ def norm_cdf(x):
     return 0.5 * (1.0 + sign * y)
 
 
-def analyze_ab_results(feedback_data):
-    """Analyze A/B test results from feedback data."""
-    if not feedback_data:
-        return {}
+def msprt_log_lr(n1, x1, n2, x2, tau=MSPRT_TAU):
+    """log Λ of the normal-mixture SPRT for H0: equal acceptance rates.
 
-    # Group by model
-    model_stats = {}
+    The rate difference d = p2 - p1 is approximately N(θ, v) with the pooled
+    variance v; mixing θ over N(0, tau²) gives (Johari et al., "Always Valid
+    Inference"):
+        Λ = sqrt(v / (v + tau²)) · exp(tau² d² / (2 v (v + tau²)))
+    """
+    if n1 == 0 or n2 == 0:
+        return 0.0
+    p_pool = (x1 + x2) / (n1 + n2)
+    v = p_pool * (1 - p_pool) * (1 / n1 + 1 / n2)
+    if v == 0:
+        return 0.0
+    d = x2 / n2 - x1 / n1
+    t2 = tau * tau
+    return 0.5 * math.log(v / (v + t2)) + t2 * d * d / (2 * v * (v + t2))
+
+
+def sequential_test(looks, tau=MSPRT_TAU, alpha=SEQUENTIAL_ALPHA, min_samples=MIN_SAMPLES):
+    """Always-valid test over cumulative looks [(label, n_base, x_base, n_lora, x_lora), ...].
+
+    The always-valid p-value is the running minimum of 1/Λ, so the data can
+    be checked after every sync and the test stopped at the first look where
+    p < alpha without inflating the false-positive rate (unlike re-running a
+    fixed-horizon z-test). Looks before both arms have min_samples are skipped.
+    """
+    result = {'p_value': 1.0, 'decision': None, 'decided_at': None, 'looks': 0, 'n': 0}
+    for label, n1, x1, n2, x2 in looks:
+        result['n'] = n1 + n2
+        if min(n1, n2) < min_samples:
+            continue
+        result['looks'] += 1
+        p = math.exp(-min(msprt_log_lr(n1, x1, n2, x2, tau), 700.0))
+        result['p_value'] = min(result['p_value'], p)
+        if result['decision'] is None and result['p_value'] < alpha:
+            result['decision'] = 'lora_better' if x2 / n2 > x1 / n1 else 'lora_worse'
+            result['decided_at'] = label
+    result['p_value'] = round(result['p_value'], 6)
+    return result
+
+
+def pair_looks(daily, base, lora):
+    """Cumulative (day, n_base, accepted_base, n_lora, accepted_lora) after each day."""
+    n1 = x1 = n2 = x2 = 0
+    looks = []
+    for day, stats in daily:
+        b, l = stats.get(base), stats.get(lora)
+        if not b and not l:
+            continue
+        if b:
+            n1, x1 = n1 + b.total, x1 + b.accepted
+        if l:
+            n2, x2 = n2 + l.total, x2 + l.accepted
+        looks.append((day, n1, x1, n2, x2))
+    return looks
 
-    items = feedback_data if isinstance(feedback_data, list) else feedback_data.get('items', [])
 
-    for item in items:
-        model = item.get('model_name', item.get('model', 'unknown'))
-        if model not in model_stats:
-            model_stats[model] = {
-                'total': 0,
-                'accepted': 0,
-                'rejected': 0,
-                'modified': 0,
-                'ratings': [],
-                'latencies': [],
-            }
-
-        stats = model_stats[model]
-        stats['total'] += 1
-
-        if item.get('accepted'):
-            stats['accepted'] += 1
-        elif item.get('correction_type') == 'rejected':
-            stats['rejected'] += 1
-        else:
-            stats['modified'] += 1
+def sequential_tests(daily):
+    """{(base, lora): sequential_test result} for every MODEL_PAIRS pair with data."""
+    return {(base, lora): sequential_test(pair_looks(daily, base, lora))
+            for base, lora in MODEL_PAIRS.items()}
+
 
-        if item.get('rating'):
-            stats['ratings'].append(item['rating'])
-        if item.get('time_to_decision'):
-            stats['latencies'].append(item['time_to_decision'])
+def analyze_ab_results(feedback_data):
+    """Analyze A/B test results from raw feedback data: {model: Rollup}."""
+    if not feedback_data:
+        return {}
 
-    return model_stats
+    items = feedback_data if isinstance(feedback_data, list) else feedback_data.get('items', [])
+    return rollup_items(items)
 
 
-def print_report(model_stats, days):
+def print_report(model_stats, days, sequential=None):
     """Print formatted A/B test report."""
+    sequential = sequential or {}
     print(f'\n{"=" * 70}')
     print(f'  A/B TEST MONITORING REPORT — Last {days} days')
     print(f'  Generated: {datetime.now().strftime("%Y-%m-%d %H:%M")}')
@@ -190,12 +255,21 @@ def print_report(model_stats, days):
     print(f'  {"─" * 65}')
 
     for model, stats in sorted(model_stats.items()):
-        total = stats['total']
-        accept_rate = round(stats['accepted'] / max(total, 1) * 100, 1)
-        avg_rating = round(sum(stats['ratings']) / max(len(stats['ratings']), 1), 1) if stats['ratings'] else '-'
+        total = stats.total
+        accept_rate = round(stats.acceptance_rate * 100, 1)
+        avg_rating = f'{stats.avg_rating:.1f}' if stats.avg_rating is not None else '-'
+
+        print(f'  {model:<25s} {total:>6d} {stats.accepted:>7d} {stats.modified:>7d} '
+              f'{stats.rejected:>7d} {accept_rate:>5.1f}% {avg_rating:>5s}')
 
-        print(f'  {model:<25s} {total:>6d} {stats["accepted"]:>7d} {stats["modified"]:>7d} '
-              f'{stats["rejected"]:>7d} {accept_rate:>5.1f}% {avg_rating:>5s}')
+    # Decision latency (from the mergeable sketches)
+    if any(s.latency_count for s in model_stats.values()):
+        print(f'\n  {"Decision time (s)":<25s} {"p50":>7s} {"p90":>7s} {"p99":>7s}')
+        print(f'  {"─" * 50}')
+        for model, stats in sorted(model_stats.items()):
+            if stats.latency_count:
+                p50, p90, p99 = (stats.latency.quantile(q) / 1000 for q in (0.5, 0.9, 0.99))
+                print(f'  {model:<25s} {p50:>7.1f} {p90:>7.1f} {p99:>7.1f}')
 
     # Pairwise comparisons
     print(f'\n  PAIRWISE COMPARISONS (Base vs LoRA):')
@@ -208,13 +282,13 @@ def print_report(model_stats, days):
         if not base_stats or not lora_stats:
             continue
 
-        base_rate = base_stats['accepted'] / max(base_stats['total'], 1)
-        lora_rate = lora_stats['accepted'] / max(lora_stats['total'], 1)
+        base_rate = base_stats.acceptance_rate
+        lora_rate = lora_stats.acceptance_rate
         diff = round((lora_rate - base_rate) * 100, 1)
 
         z, p_value = compute_z_test(
-            base_stats['total'], base_rate,
-            lora_stats['total'], lora_rate
+            base_stats.total, base_rate,
+            lora_stats.total, lora_rate
         )
 
         significant = p_value is not None and p_value < 0.05
@@ -222,15 +296,23 @@ def print_report(model_stats, days):
 
         winner = 'LoRA' if diff > 0 else ('Base' if diff < 0 else 'Tie')
         print(f'\n  {base} vs {lora}:')
-        print(f'    Base:  {base_stats["total"]} samples, {round(base_rate*100,1)}% acceptance')
-        print(f'    LoRA:  {lora_stats["total"]} samples, {round(lora_rate*100,1)}% acceptance')
+        print(f'    Base:  {base_stats.total} samples, {round(base_rate*100,1)}% acceptance')
+        print(f'    LoRA:  {lora_stats.total} samples, {round(lora_rate*100,1)}% acceptance')
         print(f'    Diff:  {diff:+.1f}% ({winner}){sig_marker}')
 
         if z is not None:
-            print(f'    Z={z}, p={p_value} {"(significant)" if significant else "(not significant)"}')
+            print(f'    Z={z}, p={p_value} {"(significant)" if significant else "(not significant)"}'
+                  f' [fixed-horizon]')
+
+        seq = sequential.get((base, lora))
+        if seq and seq['looks']:
+            verdict = {'lora_better': 'LoRA conclusively better', 'lora_worse': 'LoRA conclusively worse',
+                       None: 'not conclusive yet'}[seq['decision']]
+            when = f' (since {seq["decided_at"]})' if seq['decided_at'] else ''
+            print(f'    mSPRT: always-valid p={seq["p_value"]:.4f} over {seq["looks"]} looks — {verdict}{when}')
 
         # Sample size warning
-        min_samples = min(base_stats['total'], lora_stats['total'])
+        min_samples = min(base_stats.total, lora_stats.total)
         if min_samples < 30:
             print(f'    ⚠ Low sample size ({min_samples}) — need ≥30 for reliable comparison')
 
@@ -245,18 +327,25 @@ def print_report(model_stats, days):
         if not base_stats or not lora_stats:
             continue
 
-        base_rate = base_stats['accepted'] / max(base_stats['total'], 1)
-        lora_rate = lora_stats['accepted'] / max(lora_stats['total'], 1)
-        min_samples = min(base_stats['total'], lora_stats['total'])
+        base_rate = base_stats.acceptance_rate
+        lora_rate = lora_stats.acceptance_rate
+        min_samples = min(base_stats.total, lora_stats.total)
+        seq = sequential.get((base, lora)) or sequential_test(
+            [('now', base_stats.total, base_stats.accepted, lora_stats.total, lora_stats.accepted)])
 
-        if min_samples < 30:
+        # Decisions come from the always-valid sequential test, so acting on
+        # the first conclusive run does not inflate the error rate
+        if min_samples < MIN_SAMPLES:
             print(f'  {lora}: INSUFFICIENT DATA — collect more feedback')
-        elif lora_rate < base_rate - 0.05:  # >5% worse
-            print(f'  {lora}: ⚠ ROLLBACK RECOMMENDED — {round((base_rate-lora_rate)*100,1)}% worse than base')
-        elif lora_rate > base_rate + 0.05:  # >5% better
-            print(f'  {lora}: ✓ PROMOTE — {round((lora_rate-base_rate)*100,1)}% better than base')
+        elif seq['decision'] == 'lora_worse':
+            print(f'  {lora}: ⚠ STOP — {round((base_rate-lora_rate)*100,1)}% worse than base '
+                  f'(always-valid p={seq["p_value"]:.4f}); set its A/B split to 0')
+        elif seq['decision'] == 'lora_better':
+            print(f'  {lora}: ✓ PROMOTE — {round((lora_rate-base_rate)*100,1)}% better than base '
+                  f'(always-valid p={seq["p_value"]:.4f})')
         else:
-            print(f'  {lora}: ◐ CONTINUE TESTING — no significant difference yet')
+            print(f'  {lora}: ◐ CONTINUE TESTING — no conclusive difference yet '
+                  f'(always-valid p={seq["p_value"]:.4f})')
 
 
 def export_csv(model_stats, days, output_path):
@@ -268,16 +357,61 @@ def export_csv(model_stats, days, output_path):
                         'acceptance_rate', 'avg_rating', 'period_days'])
 
         for model, stats in sorted(model_stats.items()):
-            total = stats['total']
-            accept_rate = round(stats['accepted'] / max(total, 1) * 100, 1)
-            avg_rating = round(sum(stats['ratings']) / max(len(stats['ratings']), 1), 1) if stats['ratings'] else 0
+            accept_rate = round(stats.acceptance_rate * 100, 1)
+            avg_rating = round(stats.avg_rating, 1) if stats.avg_rating is not None else 0
 
-            writer.writerow([model, total, stats['accepted'], stats['modified'],
-                           stats['rejected'], accept_rate, avg_rating, days])
+            writer.writerow([model, stats.total, stats.accepted, stats.modified,
+                           stats.rejected, accept_rate, avg_rating, days])
 
     print(f'\n  CSV exported to: {output_path}')
 
 
+# ============================================================
+# Continuous monitoring
+# ============================================================
+
+def sync_store(store, api_base, cookies, days):
+    if not cookies:
+        return
+    start = time.time()
+    try:
+        n, pages = sync(store, api_base, cookies, days=days, quiet=True)
+        print(f'  Synced {n} new feedback items ({pages} pages, {time.time() - start:.1f}s)')
+    except Exception as e:
+        print(f'  Warning: Could not fetch feedback: {e} — reporting from the local store')
+
+
+def stopped_variants(sequential):
+    return [lora for (base, lora), seq in (sequential or {}).items() if seq['decision'] == 'lora_worse']
+
+
+def watch(store, api_base, cookies, args):
+    """Sync and re-run the sequential tests every args.watch seconds.
+
+    Memory stays constant: each round only fetches new items into the store
+    and reads back per-day rollups.
+    """
+    print(f'  Watching every {args.watch}s (Ctrl+C to stop)')
+    try:
+        while True:
+            print(f'\n  [{datetime.now().strftime("%H:%M:%S")}]')
+            sync_store(store, api_base, cookies, args.days)
+            sequential = sequential_tests(store.daily_stats(args.since))
+            for (base, lora), seq in sequential.items():
+                if not seq['looks']:
+                    continue
+                status = {'lora_better': 'PROMOTE', 'lora_worse': 'STOP', None: 'continue'}[seq['decision']]
+                print(f'  {lora:<25s} vs {base:<18s} n={seq["n"]:>7d}  '
+                      f'always-valid p={seq["p_value"]:.4f}  {status}')
+            stopped = stopped_variants(sequential)
+            if stopped and args.stop_on_decision:
+                print(f'  Conclusively worse: {", ".join(stopped)} — set their A/B split (AB_SPLIT_*) to 0')
+                return 2
+            time.sleep(args.watch)
+    except KeyboardInterrupt:
+        return 0
+
+
 def main():
     parser = argparse.ArgumentParser(description='Monitor A/B test results for AI models')
     parser.add_argument('--days', type=int, default=7, help='Number of days to analyze (default: 7)')
@@ -287,24 +421,75 @@ def main():
     parser.add_argument('--output', type=str, default=None, help='Output file path')
     parser.add_argument('--no-login', action='store_true',
                        help='Skip login (use with already-exported data)')
+    parser.add_argument('--store', default=str(DEFAULT_STORE),
+                       help='Local feedback aggregate store')
+    parser.add_argument('--offline', action='store_true',
+                       help='Report from the store without fetching new feedback')
+    parser.add_argument('--no-store', action='store_true',
+                       help='Fetch and aggregate the whole window on every run (old behaviour)')
+    parser.add_argument('--stub-backend', type=int, default=0, metavar='N',
+                       help='Run against a local stub backend with N synthetic feedback items')
+    parser.add_argument('--since', type=str, default=None, metavar='YYYY-MM-DD',
+                       help='Experiment start for the sequential test (default: all feedback in the store). '
+                            'Independent of --days, which only sets the report window')
+    parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                       help='Keep syncing every SECONDS and print the sequential test status')
+    parser.add_argument('--stop-on-decision', action='store_true',
+                       help='Exit with status 2 as soon as a LoRA variant is conclusively worse')
     args = parser.parse_args()
+    if args.watch and args.no_store:
+        parser.error('--watch needs the local store')
+    if args.since:
+        try:
+            datetime.strptime(args.since, '%Y-%m-%d')
+        except ValueError:
+            parser.error('--since must be YYYY-MM-DD')
 
     print(f'  A/B Test Monitor — ChiroClickCRM')
     print(f'  Analyzing last {args.days} days...')
 
+    api_base = API_BASE
+    stub = None
+    if args.stub_backend:
+        stub = StubBackend(synthetic_feedback(args.stub_backend, days=max(args.days, 30))).__enter__()
+        api_base = stub.url
+        if args.store == str(DEFAULT_STORE):
+            args.store = str(DEFAULT_STORE.with_name('ab-feedback-stub.sqlite'))
+        print(f'  Stub backend: {api_base} ({args.stub_backend} items)')
+
     # Try to login and fetch data
     cookies = None
-    if not args.no_login:
-        cookies = login()
+    if not args.no_login and not args.offline:
+        cookies = login(api_base=api_base)
         if not cookies:
             print(f'  Warning: Could not login to backend. Using mock data analysis.')
 
     # Fetch feedback data
-    feedback_data = None
-    if cookies:
-        feedback_data = fetch_feedback_export(cookies, args.days)
+    model_stats = None
+    sequential = None
+    try:
+        if args.no_store:
+            feedback_data = fetch_feedback_export(cookies, args.days, api_base) if cookies else None
+            model_stats = analyze_ab_results(feedback_data)
+        else:
+            store = FeedbackStore(args.store, source=api_base)
+            if args.watch:
+                try:
+                    return watch(store, api_base, cookies, args)
+                finally:
+                    store.close()
+            sync_store(store, api_base, cookies, args.days)
+            start = time.perf_counter()
+            model_stats = store.model_stats(args.days, args.model)
+            sequential = sequential_tests(store.daily_stats(args.since))
+            print(f'  Aggregated {sum(s.total for s in model_stats.values())} items from the store '
+                  f'({(time.perf_counter() - start) * 1000:.1f}ms)')
+            store.close()
+    finally:
+        if stub:
+            stub.__exit__(None, None, None)
 
-    if not feedback_data:
+    if not model_stats:
         print(f'\n  No feedback data available from backend.')
         print(f'  This script requires the backend to be running with feedback data.')
         print(f'  To populate feedback, use the application and rate AI suggestions.')
@@ -312,11 +497,8 @@ def main():
         print(f'  curl -b cookies.txt {API_BASE}/ai-feedback/performance')
         return
 
-    # Analyze
-    model_stats = analyze_ab_results(feedback_data)
-
     if args.format == 'text':
-        print_report(model_stats, args.days)
+        print_report(model_stats, args.days, sequential)
     elif args.format == 'csv':
         output_path = args.output or f'ab-results-{args.days}d.csv'
         export_csv(model_stats, args.days, output_path)
@@ -326,10 +508,15 @@ def main():
             json.dump({
                 'period_days': args.days,
                 'generated': datetime.now().isoformat(),
-                'models': model_stats,
-            }, f, indent=2, ensure_ascii=False, default=str)
+                'models': {m: s.summary() for m, s in sorted(model_stats.items())},
+                'sequential': {f'{base} vs {lora}': seq for (base, lora), seq in (sequential or {}).items()},
+            }, f, indent=2, ensure_ascii=False)
         print(f'\n  JSON exported to: {output_path}')
 
+    if args.stop_on_decision and stopped_variants(sequential):
+        return 2
+    return 0
+
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Corpus Overlap Index — ChiroClickCRM AI Training Pipeline
+
+Persistent exact + near-duplicate index over every processed split and the
+evaluation benchmark, for catching leakage that per-dataset audits miss:
+train ↔ validation/test across datasets, and SFT data ↔ benchmark prompts.
+
+- Each example is reduced to its prompt text (user turns / benchmark prompt),
+  normalized, and shingled into word n-grams.
+- A MinHash signature per example is split into LSH bands; bands and exact
+  fingerprints are indexed in SQLite, so "which examples overlap this one"
+  is a handful of indexed lookups instead of a corpus scan.
+- Files are tracked by size/mtime/sha256: `update` only re-indexes files
+  that are new or changed and drops files that disappeared.
+
+Index location: data/.cache/overlap-index.sqlite
+
+Usage:
+    python scripts/overlap_index.py update                      # index data/processed*/ + benchmark
+    python scripts/overlap_index.py update --roots ../data/curated
+    python scripts/overlap_index.py report --output ../logs/contamination-report.json
+    python scripts/overlap_index.py query "Skriv subjektiv del av SOAP-notat for ..."
+
+    from overlap_index import OverlapIndex
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import struct
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+AI_TRAINING_DIR = SCRIPT_DIR.parent
+DATA_DIR = AI_TRAINING_DIR / 'data'
+BENCHMARK_FILE = AI_TRAINING_DIR / 'evaluation' / 'benchmark_cases.jsonl'
+DEFAULT_INDEX = DATA_DIR / '.cache' / 'overlap-index.sqlite'
+
+INDEX_VERSION = 1
+NGRAM = 5
+NUM_PERM = 64
+BANDS = 16                      # 16 bands x 4 rows: ~50% Jaccard detection threshold
+ROWS = NUM_PERM // BANDS
+NEAR_THRESHOLD = 0.6            # estimated Jaccard reported as a near-duplicate
+EVAL_SPLITS = ('validation', 'test', 'benchmark')
+
+_PRIME = (1 << 31) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _perm_params():
+    """Fixed (a, b) pairs derived from sha256 so signatures are stable across runs."""
+    params = []
+    for i in range(NUM_PERM):
+        h = hashlib.sha256(f'minhash:{i}'.encode()).digest()
+        a = int.from_bytes(h[:4], 'big') % (_PRIME - 1) + 1
+        b = int.from_bytes(h[4:8], 'big') % _PRIME
+        params.append((a, b))
+    return params
+
+
+PERMS = _perm_params()
+
+
+# ============================================================
+# Text → shingles → signature
+# ============================================================
+
+_WORD_RE = re.compile(r'\w+')
+_CHATML_USER_RE = re.compile(r'<\|im_start\|>user\s*(.*?)(?:<\|im_end\|>|$)', re.S)
+
+
+def normalize_words(text):
+    """Lowercased word tokens (punctuation and spacing ignored)."""
+    return _WORD_RE.findall(text.lower())
+
+
+def shingle_hashes(text, n=NGRAM):
+    """Set of 32-bit hashes of the word n-grams of a text (whole text if shorter)."""
+    words = normalize_words(text)
+    if not words:
+        return set()
+    if len(words) < n:
+        grams = [' '.join(words)]
+    else:
+        grams = [' '.join(words[i:i + n]) for i in range(len(words) - n + 1)]
+    return {int.from_bytes(hashlib.blake2b(g.encode('utf-8'), digest_size=4).digest(), 'big')
+            for g in grams}
+
+
+def text_fingerprint(text):
+    """Exact-match key: sha256 of the normalized word sequence."""
+    return hashlib.sha256(' '.join(normalize_words(text)).encode('utf-8')).hexdigest()[:32]
+
+
+def minhash(shingles):
+    """MinHash signature (NUM_PERM ints) of a shingle-hash set."""
+    if not shingles:
+        return [_MAX_HASH] * NUM_PERM
+    try:
+        import numpy as np
+    except ImportError:
+        return [min((a * h + b) % _PRIME for h in shingles) for a, b in PERMS]
+    hs = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    a = np.array([p[0] for p in PERMS], dtype=np.uint64)[:, None]
+    b = np.array([p[1] for p in PERMS], dtype=np.uint64)[:, None]
+    return ((a * hs + b) % np.uint64(_PRIME)).min(axis=1).tolist()
+
+
+def band_keys(signature):
+    """One signed 64-bit key per LSH band (SQLite INTEGER range)."""
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f'>{ROWS}I', *signature[band * ROWS:(band + 1) * ROWS])
+        digest = hashlib.blake2b(chunk, digest_size=8, person=struct.pack('>Q', band)).digest()
+        keys.append(int.from_bytes(digest, 'big', signed=True))
+    return keys
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity from two signatures."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def _pack(signature):
+    return struct.pack(f'>{NUM_PERM}I', *signature)
+
+
+def _unpack(blob):
+    return list(struct.unpack(f'>{NUM_PERM}I', blob))
+
+
+# ============================================================
+# Which text of an example is indexed
+# ============================================================
+
+def _user_content(content):
+    """A user turn's text; ChatML-wrapped prompts contribute only their user segments."""
+    turns = _CHATML_USER_RE.findall(content)
+    return '\n'.join(turns) if turns else content
+
+
+def prompt_text(record):
+    """The prompt side of an example: user turns, DPO prompt, instruction, or benchmark prompt."""
+    prompt = record.get('messages', record.get('prompt'))
+    if isinstance(prompt, list):
+        return '\n'.join(_user_content(m.get('content', '')) for m in prompt
+                         if isinstance(m, dict) and m.get('role') == 'user')
+    if isinstance(prompt, str):
+        return _user_content(prompt)
+    if 'instruction' in record:
+        return f"{record.get('instruction', '')}\n{record.get('input', '')}".strip()
+    return ''
+
+
+def discover_files(roots=None):
+    """Processed split files under the roots (default: data/processed*/) plus the benchmark."""
+    if roots is None:
+        roots = sorted(p for p in DATA_DIR.glob('processed*') if p.is_dir())
+    files = []
+    for root in roots:
+        root = Path(root)
+        if root.is_file():
+            files.append(root)
+            continue
+        for path in sorted(root.rglob('*.jsonl')):
+            if '.cache' not in path.parts and path.stem in ('train', 'validation', 'test'):
+                files.append(path)
+    if BENCHMARK_FILE.exists():
+        files.append(BENCHMARK_FILE)
+    return files
+
+
+def file_label(path):
+    """(dataset, split) for a file, e.g. ('processed-v4/all-clean', 'train')."""
+    path = Path(path).resolve()
+    if path == BENCHMARK_FILE.resolve():
+        return 'evaluation', 'benchmark'
+    try:
+        dataset = path.parent.relative_to(DATA_DIR.resolve()).as_posix()
+    except ValueError:
+        dataset = path.parent.name
+    return dataset, path.stem
+
+
+# ============================================================
+# Persistent index
+# ============================================================
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha256 TEXT,
+    dataset TEXT, split TEXT, docs INTEGER);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY, path TEXT, row INTEGER, dataset TEXT, split TEXT,
+    fingerprint TEXT, preview TEXT, signature BLOB);
+CREATE TABLE IF NOT EXISTS bands (band INTEGER, key INTEGER, doc_id INTEGER);
+CREATE INDEX IF NOT EXISTS docs_path ON docs(path);
+CREATE INDEX IF NOT EXISTS docs_fp ON docs(fingerprint);
+CREATE INDEX IF NOT EXISTS bands_key ON bands(band, key);
+CREATE INDEX IF NOT EXISTS bands_doc ON bands(doc_id);
+"""
+
+
+def _sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class OverlapIndex:
+    """SQLite-backed MinHash-LSH + exact-fingerprint index of corpus prompts."""
+
+    def __init__(self, path=DEFAULT_INDEX):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(SCHEMA)
+        params = json.dumps({'version': INDEX_VERSION, 'ngram': NGRAM, 'perm': NUM_PERM, 'bands': BANDS})
+        row = self.db.execute("SELECT value FROM meta WHERE key='params'").fetchone()
+        if row is None or row[0] != params:
+            # Different shingling/signature parameters: start from scratch
+            self.db.executescript('DELETE FROM files; DELETE FROM docs; DELETE FROM bands;')
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('params', ?)", (params,))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    # ── Updating ──
+
+    def update(self, files, quiet=False):
+        """Index new/changed files and drop indexed files that no longer exist. Returns counts."""
+        files = [Path(f).resolve() for f in files]
+        known = {row[0]: row[1:] for row in self.db.execute('SELECT path, size, mtime, sha256 FROM files')}
+        stats = Counter()
+
+        for path in known:
+            if not os.path.exists(path):
+                self._drop(path)
+                stats['removed'] += 1
+
+        for path in files:
+            st = path.stat()
+            prev = known.get(str(path))
+            if prev and prev[0] == st.st_size and prev[1] == st.st_mtime:
+                stats['unchanged'] += 1
+                continue
+            digest = _sha256(path)
+            if prev and prev[2] == digest:
+                self.db.execute('UPDATE files SET mtime=? WHERE path=?', (st.st_mtime, str(path)))
+                stats['unchanged'] += 1
+                continue
+            self._drop(str(path))
+            n = self._add_file(path, st, digest)
+            stats['indexed'] += 1
+            stats['docs'] += n
+            if not quiet:
+                print(f"  Indexed {n:6d} examples  {'/'.join(file_label(path))}")
+        self.db.commit()
+        return dict(stats)
+
+    def _drop(self, path):
+        self.db.execute('DELETE FROM bands WHERE doc_id IN (SELECT id FROM docs WHERE path=?)', (path,))
+        self.db.execute('DELETE FROM docs WHERE path=?', (path,))
+        self.db.execute('DELETE FROM files WHERE path=?', (path,))
+
+    def _add_file(self, path, st, digest):
+        dataset, split = file_label(path)
+        n = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for row, line in enumerate(f):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                text = prompt_text(record)
+                if not text.strip():
+                    continue
+                signature = minhash(shingle_hashes(text))
+                cur = self.db.execute(
+                    'INSERT INTO docs (path, row, dataset, split, fingerprint, preview, signature) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (str(path), row, dataset, split, text_fingerprint(text),
+                     ' '.join(text.split())[:120], _pack(signature)))
+                self.db.executemany('INSERT INTO bands VALUES (?, ?, ?)',
+                                    [(b, k, cur.lastrowid) for b, k in enumerate(band_keys(signature))])
+                n += 1
+        self.db.execute('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (str(path), st.st_size, st.st_mtime, digest, dataset, split, n))
+        return n
+
+    # ── Queries ──
+
+    def query(self, text, threshold=NEAR_THRESHOLD, exclude_id=None, limit=50):
+        """Examples overlapping a text: exact fingerprint matches + LSH candidates ≥ threshold.
+
+        Returns dicts sorted by similarity (1.0 = exact normalized match).
+        """
+        return self._query(text_fingerprint(text), minhash(shingle_hashes(text)),
+                           threshold, exclude_id, limit)
+
+    def _query(self, fingerprint, signature, threshold, exclude_id=None, limit=50):
+        hits = {}
+        for doc in self.db.execute('SELECT id, dataset, split, row, preview FROM docs WHERE fingerprint=?',
+                                   (fingerprint,)):
+            if doc[0] != exclude_id:
+                hits[doc[0]] = self._hit(doc, 1.0, exact=True)
+
+        candidates = set()
+        for band, key in enumerate(band_keys(signature)):
+            candidates.update(r[0] for r in self.db.execute(
+                'SELECT doc_id FROM bands WHERE band=? AND key=?', (band, key)))
+        candidates -= set(hits)
+        candidates.discard(exclude_id)
+        for doc_id in candidates:
+            doc = self.db.execute('SELECT id, dataset, split, row, preview, signature FROM docs WHERE id=?',
+                                  (doc_id,)).fetchone()
+            sim = similarity(signature, _unpack(doc[5]))
+            if sim >= threshold:
+                hits[doc_id] = self._hit(doc, sim, exact=False)
+        return sorted(hits.values(), key=lambda h: -h['similarity'])[:limit]
+
+    @staticmethod
+    def _hit(doc, sim, exact):
+        return {'id': doc[0], 'dataset': doc[1], 'split': doc[2], 'row': doc[3],
+                'preview': doc[4], 'similarity': round(sim, 3), 'exact': exact}
+
+    def overlaps_of(self, doc_id, threshold=NEAR_THRESHOLD, limit=50):
+        """Overlaps of an indexed example (by doc id)."""
+        fp, blob = self.db.execute('SELECT fingerprint, signature FROM docs WHERE id=?', (doc_id,)).fetchone()
+        return self._query(fp, _unpack(blob), threshold, exclude_id=doc_id, limit=limit)
+
+    def stats(self):
+        files = self.db.execute('SELECT COUNT(*), COALESCE(SUM(docs), 0) FROM files').fetchone()
+        return {'files': files[0], 'docs': files[1]}
+
+    # ── Report ──
+
+    def contamination_report(self, threshold=NEAR_THRESHOLD, examples_per_pair=5):
+        """Every validation/test/benchmark example that overlaps a different split.
+
+        Leakage pairs are grouped as "<dataset>/<split> -> <dataset>/<split>"
+        with the number of source examples whose closest match there is exact
+        or near, plus a few sample matches.
+        """
+        start = time.perf_counter()
+        pairs = defaultdict(lambda: {'exact': 0, 'near': 0, 'samples': []})
+        contaminated = Counter()
+        totals = Counter()
+        eval_docs = self.db.execute(
+            f"SELECT id, dataset, split, row, preview FROM docs WHERE split IN ({','.join('?' * len(EVAL_SPLITS))})",
+            EVAL_SPLITS).fetchall()
+        for doc_id, dataset, split, row, preview in eval_docs:
+            source = f'{dataset}/{split}'
+            totals[source] += 1
+            best = {}  # closest match per target split (hits are sorted by similarity)
+            for hit in self.overlaps_of(doc_id, threshold=threshold, limit=1000):
+                if hit['split'] == split and hit['dataset'] == dataset:
+                    continue  # duplicates inside one split are the per-dataset audit's job
+                if split != 'benchmark' and hit['split'] != 'train':
+                    continue  # val/test leakage means a match in some train split
+                best.setdefault(f"{hit['dataset']}/{hit['split']}", hit)
+            for target, hit in best.items():
+                entry = pairs[f'{source} -> {target}']
+                entry['exact' if hit['exact'] else 'near'] += 1
+                if len(entry['samples']) < examples_per_pair:
+                    entry['samples'].append({'row': row, 'match_row': hit['row'],
+                                             'similarity': hit['similarity'], 'prompt': preview})
+            if best:
+                contaminated[source] += 1
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'threshold': threshold,
+            'index': self.stats(),
+            'seconds': round(time.perf_counter() - start, 2),
+            'contaminated': {src: {'examples': totals[src], 'contaminated': contaminated[src],
+                                   'rate': round(contaminated[src] / totals[src], 4)}
+                             for src in sorted(totals)},
+            'pairs': {k: pairs[k] for k in sorted(pairs, key=lambda k: -(pairs[k]['exact'] + pairs[k]['near']))},
+        }
+
+
+def print_report(report):
+    print(f"\n{'=' * 60}")
+    print(f"  CONTAMINATION REPORT ({report['index']['docs']} examples, "
+          f"{report['index']['files']} files, threshold {report['threshold']})")
+    print(f"{'=' * 60}")
+    for src, c in report['contaminated'].items():
+        flag = '  !!' if c['contaminated'] else ''
+        print(f"  {src:<45s} {c['contaminated']:5d}/{c['examples']:<5d} "
+              f"({c['rate'] * 100:5.1f}%){flag}")
+    if report['pairs']:
+        print('\n  Overlapping pairs (exact / near):')
+        for name, entry in list(report['pairs'].items())[:20]:
+            print(f"    {name}: {entry['exact']} / {entry['near']}")
+            for sample in entry['samples'][:2]:
+                print(f"      → row {sample['row']} ~ row {sample['match_row']} "
+                      f"({sample['similarity']}): {sample['prompt'][:70]}")
+    else:
+        print('\n  OK - No cross-split or benchmark overlap found!')
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Corpus-wide overlap index and contamination report')
+    parser.add_argument('--index', type=Path, default=DEFAULT_INDEX, help='SQLite index path')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    upd = sub.add_parser('update', help='Index new/changed files (incremental)')
+    upd.add_argument('--roots', nargs='*', type=Path,
+                     help='Dataset dirs/files to index (default: data/processed*/)')
+
+    rep = sub.add_parser('report', help='Update, then write the contamination report')
+    rep.add_argument('--roots', nargs='*', type=Path)
+    rep.add_argument('--threshold', type=float, default=NEAR_THRESHOLD)
+    rep.add_argument('--output', type=Path, help='Save report JSON')
+
+    qry = sub.add_parser('query', help='Which indexed examples overlap this text?')
+    qry.add_argument('text')
+    qry.add_argument('--threshold', type=float, default=NEAR_THRESHOLD)
+
+    args = parser.parse_args()
+    index = OverlapIndex(args.index)
+    try:
+        if args.command in ('update', 'report'):
+            start = time.perf_counter()
+            stats = index.update(discover_files(args.roots))
+            print(f"  Index: {index.stats()['docs']} examples in {index.stats()['files']} files "
+                  f"({stats.get('indexed', 0)} re-indexed, {stats.get('unchanged', 0)} unchanged, "
+                  f"{stats.get('removed', 0)} removed; {time.perf_counter() - start:.1f}s)")
+        if args.command == 'report':
+            report = index.contamination_report(threshold=args.threshold)
+            print_report(report)
+            if args.output:
+                os.makedirs(args.output.parent, exist_ok=True)
+                with open(args.output, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, indent=2, ensure_ascii=False)
+                print(f'\n  Report saved to: {args.output}')
+        elif args.command == 'query':
+            for hit in index.query(args.text, threshold=args.threshold):
+                kind = 'exact' if hit['exact'] else f"~{hit['similarity']}"
+                print(f"  {kind:>6s}  {hit['dataset']}/{hit['split']}:{hit['row']}  {hit['preview'][:80]}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
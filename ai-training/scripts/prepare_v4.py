@@ -23,10 +23,12 @@ import os
 import re
 import hashlib
 import argparse
-import random
 from pathlib import Path
 from collections import defaultdict
 
+from dataset_cache import write_dir_cache
+from split_utils import append_order, primary_category, split_by_ratio, stable_order
+
 # ============================================================
 # Configuration
 # ============================================================
@@ -379,7 +381,6 @@ def apply_task_type_caps(examples, caps, seed=42):
 
     Returns: recombined list, cap_stats dict
     """
-    rng = random.Random(seed)
     non_website = []
     website_by_type = defaultdict(list)
 
@@ -402,8 +403,8 @@ def apply_task_type_caps(examples, caps, seed=42):
         cap = caps.get(task_type)
         before = len(exs)
         if cap is not None and len(exs) > cap:
-            rng.shuffle(exs)
-            exs = exs[:cap]
+            # Keep the lowest-hash examples: stable as new data arrives
+            exs = stable_order(exs, salt=str(seed))[:cap]
         capped_website.extend(exs)
         after = len(exs)
         cap_label = str(cap) if cap is not None else "uncapped"
@@ -439,24 +440,9 @@ def categorize_example(example):
 # Train/Val/Test Split
 # ============================================================
 
-def split_dataset(examples, train_ratio=0.80, val_ratio=0.10, seed=42):
-    """Split examples into train/validation/test sets."""
-    rng = random.Random(seed)
-    shuffled = list(examples)
-    rng.shuffle(shuffled)
-
-    n = len(shuffled)
-    n_train = max(1, int(n * train_ratio))
-    n_val = max(1, int(n * val_ratio))
-
-    train = shuffled[:n_train]
-    val = shuffled[n_train:n_train + n_val]
-    test = shuffled[n_train + n_val:]
-
-    if not test and len(val) > 1:
-        test = [val.pop()]
-
-    return train, val, test
+def split_category(example):
+    """Stratification key for the train/validation/test split."""
+    return primary_category(categorize_example(example))
 
 
 def save_jsonl(items, filepath):
@@ -477,7 +463,7 @@ def main():
     parser = argparse.ArgumentParser(description="Prepare v4 curated training data")
     parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR,
                         help="Output directory for processed data")
-    parser.add_argument("--seed", type=int, default=42, help="Random seed for splits")
+    parser.add_argument("--seed", type=int, default=42, help="Salt for hash-based split assignment")
     args = parser.parse_args()
 
     output_dir = args.output_dir.resolve()
@@ -584,13 +570,14 @@ def main():
                 seen.add(h)
                 unique.append(ex)
 
-        train, val, test = split_dataset(unique, seed=args.seed)
+        train, val, test = split_by_ratio(unique, seed=args.seed, category_fn=split_category)
 
         ds_dir = output_dir / name
-        save_jsonl(train, ds_dir / "train.jsonl")
-        save_jsonl(val, ds_dir / "validation.jsonl")
+        save_jsonl(append_order(train, ds_dir / "train.jsonl"), ds_dir / "train.jsonl")
+        save_jsonl(append_order(val, ds_dir / "validation.jsonl"), ds_dir / "validation.jsonl")
         if test:
-            save_jsonl(test, ds_dir / "test.jsonl")
+            save_jsonl(append_order(test, ds_dir / "test.jsonl"), ds_dir / "test.jsonl")
+        write_dir_cache(ds_dir, fallback_category=name, quiet=True)
 
         summary[name] = {
             "total": len(unique),
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Claude Reference-Answer Store — ChiroClickCRM AI Training Pipeline
+
+Persistent store of Claude's reference answers to benchmark prompts, so gap
+analyses of new local model versions only query the local model and the
+grader instead of asking Claude the same benchmark questions again.
+
+- Answers are keyed by sha256(prompt), sha256(system prompt), Claude model,
+  max_tokens and temperature: any change to what Claude would be sent
+  misses the store.
+- The store remembers the sha256 of benchmark_cases.jsonl. When the file
+  changes, the benchmark version is bumped and answers to prompts that are
+  no longer in the benchmark are pruned; answers to unchanged prompts stay.
+- Only successful answers are stored; errors are retried on the next run.
+
+Store location: evaluation/.cache/claude-references.sqlite
+
+Usage:
+    python scripts/reference_store.py stats
+    python scripts/reference_store.py sync            # prune after editing the benchmark
+    python scripts/reference_store.py clear --model claude-sonnet-4-6
+
+    from reference_store import ReferenceStore
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).parent.resolve()
+AI_TRAINING_DIR = SCRIPT_DIR.parent
+BENCHMARK_FILE = AI_TRAINING_DIR / 'evaluation' / 'benchmark_cases.jsonl'
+DEFAULT_STORE = AI_TRAINING_DIR / 'evaluation' / '.cache' / 'claude-references.sqlite'
+
+STORE_VERSION = 1
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS answers (
+    prompt_hash TEXT NOT NULL,
+    system_hash TEXT NOT NULL,
+    model TEXT NOT NULL,
+    max_tokens INTEGER NOT NULL,
+    temperature REAL NOT NULL,
+    response TEXT NOT NULL,
+    latency_ms INTEGER,
+    benchmark_version INTEGER,
+    created TEXT,
+    PRIMARY KEY (prompt_hash, system_hash, model, max_tokens, temperature)
+);
+'''
+
+
+def text_hash(text):
+    return hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ReferenceStore:
+    """SQLite store of Claude reference answers, versioned against the benchmark file."""
+
+    def __init__(self, path=DEFAULT_STORE, refresh=False):
+        self.path = Path(path)
+        self.refresh = refresh   # get() always misses; put() overwrites
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript(SCHEMA)
+        self.stats = Counter()
+        if self._meta('version') != str(STORE_VERSION):
+            self.db.execute('DELETE FROM answers')
+            self._set_meta('version', STORE_VERSION)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key, default=None):
+        row = self.db.execute('SELECT value FROM meta WHERE key=?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+    @property
+    def benchmark_version(self):
+        return int(self._meta('benchmark_version', 0))
+
+    # ── Benchmark versioning ──
+
+    def sync_benchmark(self, path=BENCHMARK_FILE):
+        """Bump the benchmark version and prune stale answers if the benchmark file changed.
+
+        Returns {'changed': bool, 'version': int, 'pruned': int}.
+        """
+        path = Path(path)
+        digest = file_hash(path)
+        if self._meta('benchmark_sha256') == digest:
+            return {'changed': False, 'version': self.benchmark_version, 'pruned': 0}
+
+        prompts = set()
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    prompts.add(text_hash(json.loads(line).get('prompt', '')))
+
+        stored = {row[0] for row in self.db.execute('SELECT DISTINCT prompt_hash FROM answers')}
+        stale = stored - prompts
+        cur = self.db.executemany('DELETE FROM answers WHERE prompt_hash=?', [(h,) for h in stale])
+        pruned = cur.rowcount if stale else 0
+        version = self.benchmark_version + 1
+        self._set_meta('benchmark_sha256', digest)
+        self._set_meta('benchmark_version', version)
+        self.db.commit()
+        return {'changed': True, 'version': version, 'pruned': pruned}
+
+    # ── Answers ──
+
+    def _key(self, prompt, system_prompt, model, max_tokens, temperature):
+        return (text_hash(prompt), text_hash(system_prompt), model, int(max_tokens), float(temperature))
+
+    def get(self, prompt, system_prompt, model, max_tokens, temperature):
+        """(response, latency_ms) of a stored answer, or None."""
+        if self.refresh:
+            self.stats['misses'] += 1
+            return None
+        row = self.db.execute(
+            'SELECT response, latency_ms FROM answers WHERE prompt_hash=? AND system_hash=? '
+            'AND model=? AND max_tokens=? AND temperature=?',
+            self._key(prompt, system_prompt, model, max_tokens, temperature),
+        ).fetchone()
+        self.stats['hits' if row else 'misses'] += 1
+        return (row[0], row[1]) if row else None
+
+    def put(self, prompt, system_prompt, model, max_tokens, temperature, response, latency_ms=None):
+        self.db.execute(
+            'INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            self._key(prompt, system_prompt, model, max_tokens, temperature)
+            + (response, latency_ms, self.benchmark_version, time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())),
+        )
+        self.db.commit()
+        self.stats['stored'] += 1
+
+    def clear(self, model=None):
+        """Delete all answers (or one model's). Returns the number removed."""
+        if model:
+            cur = self.db.execute('DELETE FROM answers WHERE model=?', (model,))
+        else:
+            cur = self.db.execute('DELETE FROM answers')
+        self.db.commit()
+        return cur.rowcount
+
+    def summary(self):
+        by_model = dict(self.db.execute('SELECT model, COUNT(*) FROM answers GROUP BY model'))
+        by_version = dict(self.db.execute(
+            'SELECT benchmark_version, COUNT(*) FROM answers GROUP BY benchmark_version'))
+        return {
+            'answers': sum(by_model.values()),
+            'benchmark_version': self.benchmark_version,
+            'by_model': by_model,
+            'by_benchmark_version': by_version,
+        }
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Claude reference-answer store')
+    parser.add_argument('command', choices=['stats', 'sync', 'clear'])
+    parser.add_argument('--store', default=str(DEFAULT_STORE), help='Store path')
+    parser.add_argument('--benchmark', default=str(BENCHMARK_FILE), help='Benchmark JSONL')
+    parser.add_argument('--model', default=None, help='clear: only this model')
+    args = parser.parse_args()
+
+    store = ReferenceStore(args.store)
+    if args.command == 'sync':
+        info = store.sync_benchmark(args.benchmark)
+        if info['changed']:
+            print(f'  Benchmark changed: now version {info["version"]}, pruned {info["pruned"]} stale answers')
+        else:
+            print(f'  Benchmark unchanged (version {info["version"]})')
+    elif args.command == 'clear':
+        print(f'  Removed {store.clear(args.model)} answers')
+
+    s = store.summary()
+    print(f'  Store: {store.path}')
+    print(f'  Answers: {s["answers"]} (benchmark version {s["benchmark_version"]})')
+    for model, n in sorted(s['by_model'].items()):
+        print(f'    {model:<30s} {n:>6d}')
+    store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,73 +14,34 @@ Usage:
     python scripts/score_training_data.py --input ../data/processed/general-clinical/train.jsonl
     python scripts/score_training_data.py --use-api --api-key sk-ant-xxx --sample 200
     python scripts/score_training_data.py --triage  # Output keep/rewrite/remove lists
+    python scripts/score_training_data.py --triage --keep-threshold 4.25  # re-triage from cached scores
+    python scripts/score_training_data.py --workers 8 --chunk-size 2000
+
+Heuristic scores are cached per example in a columnar sidecar next to the
+input (.cache/<split>.scores.arrow, or .scores.json without pyarrow) keyed by
+a content fingerprint, so triage, histograms and threshold changes only score
+examples that are new or changed.
 """
 
 import argparse
+import hashlib
 import json
 import os
 import re
 import sys
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from dataset_cache import CACHE_DIRNAME, get_pyarrow, load_rows
+from text_features import text_features
+
 SCRIPT_DIR = Path(__file__).parent.resolve()
 AI_TRAINING_DIR = SCRIPT_DIR.parent
 DEFAULT_INPUT = AI_TRAINING_DIR / "data" / "processed" / "general-clinical" / "train.jsonl"
 OUTPUT_DIR = AI_TRAINING_DIR / "data" / "scored"
 
-# ============================================================
-# Norwegian Language Quality Heuristics
-# ============================================================
-
-NORWEGIAN_CHARS = set('æøåÆØÅ')
-
-# Colloquial terms that should be formal in medical context
-COLLOQUIAL_TERMS = {
-    'nakkevondt': 'cervikalgi',
-    'vondt i ryggen': 'dorsalgi/lumbalgi',
-    'vondt i skulderen': 'omalgi',
-    'nerve i klem': 'nerverotaffeksjon',
-    'slitasje': 'degenerativ forandring',
-    'stiv nakke': 'cervikal bevegelsesrestriksjon',
-    'sideveis bøying': 'lateralfleksjon',
-    'forover bøying': 'fleksjon',
-    'bakover bøying': 'ekstensjon',
-    'hevelse': 'ødem',
-    'nummen': 'hypoestesi/parestesi',
-    'vondt å gå': 'gangvansker/funksjonsnedsettelse',
-}
-
-# Formal medical terms (presence = good quality)
-FORMAL_TERMS = [
-    'cervikalgi', 'lumbalgi', 'dorsalgi', 'omalgi', 'cefalgi',
-    'radikulopati', 'myelopati', 'stenose', 'spondylose',
-    'lateralfleksjon', 'antefleksjon', 'retrofleksjon',
-    'hypoestesi', 'parestesi', 'pareser',
-    'palpasjonsømhet', 'hypertonisitet', 'segmental dysfunksjon',
-    'differensialdiagnostikk', 'klinisk resonnering',
-    'artikulær', 'periartrikulær', 'myofascial',
-    'propriosepsjon', 'nevrologisk status',
-]
-
-# English contamination markers
-ENGLISH_CONTAMINATION = [
-    'the patient', 'chief complaint', 'range of motion',
-    'subjective:', 'objective:', 'assessment:', 'plan:',
-    'however,', 'therefore,', 'additionally,',
-    'treatment plan', 'follow up', 'referred to',
-    'bilateral', 'unilateral',  # acceptable in medical context
-]
-
-# Non-clinical contamination
-NON_CLINICAL = [
-    'bubble.io', 'react', 'github', 'npm', 'component',
-    'api endpoint', 'webpack', 'javascript', 'docker',
-    'kubernetes', 'tailwind', 'prisma', 'deployment',
-    'frontend', 'backend', 'css', 'html',
-]
-
-
 def score_format(example):
     """Score format quality (1-5). Does it follow ChatML structure?"""
     messages = example.get('messages', [])
@@ -131,29 +92,27 @@ def score_norwegian(example):
     if not assistant_msgs:
         return 1, "No response"
 
-    text = assistant_msgs[0].get('content', '').lower()
+    features = text_features(assistant_msgs[0].get('content', ''))
     score = 3  # Start neutral
     issues = []
 
     # Check for Norwegian characters
-    norwegian_count = sum(1 for c in text if c in NORWEGIAN_CHARS)
-    alpha_count = sum(1 for c in text if c.isalpha())
-    if alpha_count > 0:
-        no_rate = norwegian_count / alpha_count
+    if features.alpha > 0:
+        no_rate = features.norwegian_rate
         if no_rate > 0.01:
             score += 1  # Good Norwegian char rate
-        elif no_rate < 0.001 and alpha_count > 50:
+        elif no_rate < 0.001 and features.alpha > 50:
             score -= 1
             issues.append("low Norwegian char rate")
 
     # Check for colloquial terms (bad)
-    colloquial_found = [term for term in COLLOQUIAL_TERMS if term in text]
+    colloquial_found = features.found('colloquial')
     if colloquial_found:
         score -= 1
         issues.append(f"colloquial: {', '.join(colloquial_found[:3])}")
 
     # Check for formal medical terms (good)
-    formal_found = sum(1 for term in FORMAL_TERMS if term in text)
+    formal_found = len(features.found('formal'))
     if formal_found >= 3:
         score += 1
     elif formal_found >= 1:
@@ -161,7 +120,7 @@ def score_norwegian(example):
     # Don't penalize for no formal terms — might be SMS/quick field
 
     # Check for English contamination
-    english_found = [term for term in ENGLISH_CONTAMINATION[:10] if term in text]
+    english_found = features.found('english')
     if len(english_found) >= 3:
         score -= 1
         issues.append(f"English contamination: {', '.join(english_found[:3])}")
@@ -224,12 +183,13 @@ def score_accuracy_heuristic(example):
     if not assistant_msgs:
         return 1, "No response"
 
-    text = assistant_msgs[0].get('content', '').lower()
+    content = assistant_msgs[0].get('content', '')
+    text = content.lower()
     score = 4  # Assume good unless red flags found
     issues = []
 
     # Check for non-clinical contamination (very bad)
-    non_clinical_found = [term for term in NON_CLINICAL if term in text]
+    non_clinical_found = text_features(content).found('non_clinical')
     if non_clinical_found:
         return 1, f"Non-clinical contamination: {', '.join(non_clinical_found[:3])}"
 
@@ -259,26 +219,10 @@ def score_accuracy_heuristic(example):
 
 def score_example(example, idx):
     """Score a single training example on all dimensions."""
-    fmt_score, fmt_note = score_format(example)
-    nor_score, nor_note = score_norwegian(example)
-    comp_score, comp_note = score_completeness(example)
-    acc_score, acc_note = score_accuracy_heuristic(example)
-
-    total = fmt_score + nor_score + comp_score + acc_score
-    avg = round(total / 4, 2)
-
-    return {
-        'index': idx,
-        'format': {'score': fmt_score, 'note': fmt_note},
-        'norwegian': {'score': nor_score, 'note': nor_note},
-        'completeness': {'score': comp_score, 'note': comp_note},
-        'accuracy': {'score': acc_score, 'note': acc_note},
-        'total': total,
-        'average': avg,
-    }
-
-
-def triage_results(scores):
+    return result_from_row(idx, _score_row(example))
+
+
+def triage_results(scores, keep_at=4.0, rewrite_at=3.0):
     """Triage scored examples into keep/rewrite/remove buckets."""
     keep = []
     rewrite = []
@@ -286,9 +230,9 @@ def triage_results(scores):
 
     for s in scores:
         avg = s['average']
-        if avg >= 4.0:
+        if avg >= keep_at:
             keep.append(s['index'])
-        elif avg >= 3.0:
+        elif avg >= rewrite_at:
             rewrite.append(s['index'])
         else:
             remove.append(s['index'])
@@ -296,6 +240,138 @@ def triage_results(scores):
     return keep, rewrite, remove
 
 
+# ============================================================
+# Score Sidecar (columnar, keyed by example fingerprint)
+# ============================================================
+
+DIMENSIONS = ['format', 'norwegian', 'completeness', 'accuracy']
+# Bump when a scoring heuristic changes so cached scores are discarded
+SCORER_VERSION = 1
+SIDECAR_COLUMNS = ['fingerprint'] + DIMENSIONS + [f'{d}_note' for d in DIMENSIONS]
+
+
+def score_fingerprint(example):
+    """Hash of everything the heuristics read (all messages, system prompt included)."""
+    payload = example.get('messages', example)
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def sidecar_path(input_path, arrow=True):
+    input_path = Path(input_path)
+    suffix = 'arrow' if arrow else 'json'
+    return input_path.parent / CACHE_DIRNAME / f'{input_path.stem}.scores.{suffix}'
+
+
+def load_sidecar(input_path):
+    """Cached {fingerprint: row tuple} for an input file (empty if missing/stale)."""
+    pa = get_pyarrow()
+    columns = None
+    arrow_path = sidecar_path(input_path, arrow=True)
+    json_path = sidecar_path(input_path, arrow=False)
+    try:
+        if pa is not None and arrow_path.exists():
+            with pa.memory_map(str(arrow_path), 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+            meta = table.schema.metadata or {}
+            if meta.get(b'scorer_version') == str(SCORER_VERSION).encode():
+                columns = {name: table.column(name).to_pylist() for name in SIDECAR_COLUMNS}
+        elif json_path.exists():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('scorer_version') == SCORER_VERSION:
+                columns = data['columns']
+    except (OSError, ValueError, KeyError):
+        columns = None
+    if not columns:
+        return {}
+    rows = zip(*(columns[name] for name in SIDECAR_COLUMNS[1:]))
+    return dict(zip(columns['fingerprint'], rows))
+
+
+def save_sidecar(input_path, cached):
+    """Write {fingerprint: row tuple} column-wise (Arrow IPC file, or JSON columns)."""
+    rows = list(cached.items())
+    columns = {name: [] for name in SIDECAR_COLUMNS}
+    for fp, row in rows:
+        columns['fingerprint'].append(fp)
+        for name, value in zip(SIDECAR_COLUMNS[1:], row):
+            columns[name].append(value)
+
+    pa = get_pyarrow()
+    path = sidecar_path(input_path, arrow=pa is not None)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    if pa is not None:
+        schema = pa.schema(
+            [('fingerprint', pa.string())]
+            + [(d, pa.int8()) for d in DIMENSIONS]
+            + [(f'{d}_note', pa.string()) for d in DIMENSIONS],
+            metadata={'scorer_version': str(SCORER_VERSION)})
+        table = pa.Table.from_pydict(columns, schema=schema)
+        with pa.OSFile(str(tmp), 'wb') as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+    else:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'scorer_version': SCORER_VERSION, 'columns': columns}, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def _score_row(example):
+    """(format, norwegian, completeness, accuracy, 4 notes) for one example."""
+    fmt = score_format(example)
+    nor = score_norwegian(example)
+    comp = score_completeness(example)
+    acc = score_accuracy_heuristic(example)
+    return (fmt[0], nor[0], comp[0], acc[0], fmt[1], nor[1], comp[1], acc[1])
+
+
+def _score_chunk(examples):
+    return [_score_row(ex) for ex in examples]
+
+
+def result_from_row(idx, row):
+    """Expand a sidecar row into the score_example() result layout."""
+    total = sum(row[:4])
+    result = {'index': idx}
+    for i, dim in enumerate(DIMENSIONS):
+        result[dim] = {'score': row[i], 'note': row[4 + i]}
+    result['total'] = total
+    result['average'] = round(total / 4, 2)
+    return result
+
+
+def score_rows(indexed_examples, cached=None, workers=1, chunk_size=2000):
+    """Score (index, example) pairs, reusing cached rows by fingerprint.
+
+    Uncached examples are scored in chunks across a process pool. Returns
+    (results in input order, updated {fingerprint: row}, number scored).
+    """
+    cached = dict(cached or {})
+    fingerprints = [score_fingerprint(ex) for _, ex in indexed_examples]
+
+    todo = {}
+    for (_, ex), fp in zip(indexed_examples, fingerprints):
+        if fp not in cached and fp not in todo:
+            todo[fp] = ex
+    todo_fps = list(todo)
+    todo_examples = list(todo.values())
+    chunks = [todo_examples[i:i + chunk_size] for i in range(0, len(todo_examples), chunk_size)]
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            scored = [row for chunk in pool.map(_score_chunk, chunks) for row in chunk]
+    else:
+        scored = [row for chunk in chunks for row in _score_chunk(chunk)]
+    cached.update(zip(todo_fps, scored))
+
+    results = [result_from_row(idx, cached[fp])
+               for (idx, _), fp in zip(indexed_examples, fingerprints)]
+    return results, cached, len(todo_fps)
+
+
 def main():
     parser = argparse.ArgumentParser(description='Score training data quality')
     parser.add_argument('--input', type=str, default=str(DEFAULT_INPUT),
@@ -308,6 +384,16 @@ def main():
                         help='Only score a random sample of N examples')
     parser.add_argument('--verbose', action='store_true',
                         help='Print details for low-scoring examples')
+    parser.add_argument('--keep-threshold', type=float, default=4.0,
+                        help='Minimum average to keep (default: 4.0)')
+    parser.add_argument('--rewrite-threshold', type=float, default=3.0,
+                        help='Minimum average to rewrite instead of remove (default: 3.0)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Scoring processes for uncached examples (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=2000,
+                        help='Examples per worker task (default: 2000)')
+    parser.add_argument('--rescore', action='store_true',
+                        help='Ignore cached scores and rescore everything')
     args = parser.parse_args()
 
     input_path = Path(args.input)
@@ -315,18 +401,11 @@ def main():
         print(f"Error: Input file not found: {input_path}")
         sys.exit(1)
 
-    # Load data
-    examples = []
-    with open(input_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                try:
-                    examples.append(json.loads(line))
-                except json.JSONDecodeError:
-                    pass
+    # Load data (columnar cache when it lines up 1:1 with the JSONL)
+    examples, from_cache = load_rows(input_path, strict=True)
 
-    print(f"Loaded {len(examples)} examples from {input_path}")
+    print(f"Loaded {len(examples)} examples from {input_path}"
+          f"{' (columnar cache)' if from_cache else ''}")
 
     # Sample if requested
     if args.sample > 0 and args.sample < len(examples):
@@ -337,14 +416,21 @@ def main():
     else:
         sampled = list(enumerate(examples))
 
-    # Score all
-    scores = []
-    dimension_totals = defaultdict(list)
+    # Score (cached rows by fingerprint; the rest in parallel chunks)
+    cached = {} if args.rescore else load_sidecar(input_path)
+    start = time.perf_counter()
+    scores, cached, scored_now = score_rows(sampled, cached, workers=args.workers,
+                                            chunk_size=args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored_now} new/changed unique examples, {len(scores) - scored_now} rows "
+          f"from cached scores or duplicates ({elapsed:.1f}s)")
+    if scored_now:
+        live = {score_fingerprint(ex) for ex in examples}
+        print(f"  Score cache: {save_sidecar(input_path, {fp: row for fp, row in cached.items() if fp in live})}")
 
-    for idx, example in sampled:
-        result = score_example(example, idx)
-        scores.append(result)
-        for dim in ['format', 'norwegian', 'completeness', 'accuracy']:
+    dimension_totals = defaultdict(list)
+    for result in scores:
+        for dim in DIMENSIONS:
             dimension_totals[dim].append(result[dim]['score'])
 
     # Print summary
@@ -370,11 +456,12 @@ def main():
     print(f"\n  Overall average: {overall_avg}/5")
 
     # Triage
-    keep, rewrite, remove = triage_results(scores)
+    keep_at, rewrite_at = args.keep_threshold, args.rewrite_threshold
+    keep, rewrite, remove = triage_results(scores, keep_at, rewrite_at)
     print(f"\n  Triage:")
-    print(f"    Keep (≥4.0):    {len(keep):5d} ({round(len(keep)/len(scores)*100, 1)}%)")
-    print(f"    Rewrite (3-4):  {len(rewrite):5d} ({round(len(rewrite)/len(scores)*100, 1)}%)")
-    print(f"    Remove (<3.0):  {len(remove):5d} ({round(len(remove)/len(scores)*100, 1)}%)")
+    print(f"    Keep (≥{keep_at:g}):    {len(keep):5d} ({round(len(keep)/len(scores)*100, 1)}%)")
+    print(f"    Rewrite ({rewrite_at:g}-{keep_at:g}):  {len(rewrite):5d} ({round(len(rewrite)/len(scores)*100, 1)}%)")
+    print(f"    Remove (<{rewrite_at:g}):  {len(remove):5d} ({round(len(remove)/len(scores)*100, 1)}%)")
 
     # Verbose: show worst examples
     if args.verbose:
@@ -430,10 +517,19 @@ def main():
             filtered_path = OUTPUT_DIR / 'train-filtered.jsonl'
             count = 0
             with open(filtered_path, 'w', encoding='utf-8') as out:
-                for i, ex in enumerate(examples):
-                    if i in keep_set:
-                        out.write(json.dumps(ex, ensure_ascii=False) + '\n')
-                        count += 1
+                if from_cache:
+                    # Cached rows drop extra metadata; copy the original lines
+                    with open(input_path, 'r', encoding='utf-8') as src:
+                        lines = (line for line in src if line.strip())
+                        for i, line in enumerate(lines):
+                            if i in keep_set:
+                                out.write(line.rstrip('\n') + '\n')
+                                count += 1
+                else:
+                    for i, ex in enumerate(examples):
+                        if i in keep_set:
+                            out.write(json.dumps(ex, ensure_ascii=False) + '\n')
+                            count += 1
             print(f"  Filtered dataset ({count} examples): {filtered_path}")
 
 
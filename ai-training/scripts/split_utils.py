@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Deterministic Split Assignment — ChiroClickCRM AI Training Pipeline
+
+Every prepare script assigns train/validation/test by hashing an example's
+content fingerprint into a bucket, instead of shuffling the whole list with
+a seed. An example's split depends only on its own content (and the salt),
+so adding new data never moves existing examples between splits.
+
+Rewriting a split file goes through append_order(): rows already in the
+previous file keep their position and new rows go at the end, so growing
+the data appends to each split instead of interleaving new rows. Removed
+or edited examples still shift everything after them. The dataset and
+token caches are keyed by the file's sha256 and rebuild on any change.
+
+Stratification: buckets are drawn per example, so every category converges
+to the requested ratios on its own. Categories too small to get a holdout
+example by hashing get their lowest-bucket example promoted, which is the
+one case where growth can move an example.
+
+Usage:
+    from split_utils import append_order, hash_split, primary_category, split_by_ratio
+
+    train, val, test = hash_split(examples, val_ratio=0.1, test_ratio=0.1,
+                                  category_fn=lambda ex: ex['category'])
+    train, val, test = split_by_ratio(examples, train_ratio=0.8, val_ratio=0.1, seed=42,
+                                      category_fn=lambda ex: primary_category(ex['tags']))
+    write(append_order(train, out_dir / 'train.jsonl'))
+"""
+
+import hashlib
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+
+_WS_RE = re.compile(r'\s+')
+
+# The historical default seed of every prepare script; as a salt it keeps
+# default runs stable while --seed still allows a deliberate reshuffle.
+DEFAULT_SALT = '42'
+
+
+def _normalize(text):
+    return _WS_RE.sub(' ', str(text).lower()).strip()
+
+
+def _side_text(value):
+    """Text of a prompt/chosen/rejected value (string or message list)."""
+    if isinstance(value, list):
+        return ' '.join(str(m.get('content', '')) for m in value if isinstance(m, dict))
+    return str(value)
+
+
+def example_fingerprint(example):
+    """Stable sha256 fingerprint of an example's training-relevant content.
+
+    ChatML: user + assistant turns (system prompts are shared boilerplate).
+    DPO: prompt + chosen + rejected. Instruction format: instruction + input
+    + output. Whitespace/case-normalized so reformatting does not move it.
+    """
+    if 'messages' in example:
+        parts = [f"{m.get('role')}:{_normalize(m.get('content', ''))}"
+                 for m in example['messages']
+                 if isinstance(m, dict) and m.get('role') in ('user', 'assistant')]
+        text = '||'.join(parts)
+    elif all(k in example for k in ('prompt', 'chosen', 'rejected')):
+        text = '||'.join(_normalize(_side_text(example[k]))
+                         for k in ('prompt', 'chosen', 'rejected'))
+    elif 'instruction' in example:
+        text = '||'.join(_normalize(example.get(k, ''))
+                         for k in ('instruction', 'input', 'output'))
+    else:
+        text = json.dumps(example, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def bucket(fingerprint, salt=DEFAULT_SALT, purpose='split'):
+    """Map a fingerprint to a uniform float in [0, 1)."""
+    h = hashlib.sha256(f'{salt}:{purpose}:{fingerprint}'.encode('utf-8')).digest()
+    return int.from_bytes(h[:8], 'big') / 2 ** 64
+
+
+def assign_split(fingerprint, val_ratio=0.1, test_ratio=0.1, salt=DEFAULT_SALT):
+    """Return 'train', 'validation' or 'test' for one fingerprint."""
+    b = bucket(fingerprint, salt)
+    if b < test_ratio:
+        return 'test'
+    if b < test_ratio + val_ratio:
+        return 'validation'
+    return 'train'
+
+
+def stable_order(examples, key_fn=example_fingerprint, salt=DEFAULT_SALT):
+    """Deterministic pseudo-shuffle: sort by a per-example hash.
+
+    Replaces random.shuffle for output ordering — the relative order of two
+    examples never changes when others are added.
+    """
+    return sorted(examples, key=lambda ex: bucket(key_fn(ex), salt, 'order'))
+
+
+def previous_order(path, key_fn=example_fingerprint):
+    """{fingerprint: line position} of a previously written JSONL file ({} if missing)."""
+    order = {}
+    path = Path(path)
+    if not path.exists():
+        return order
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                order.setdefault(key_fn(json.loads(line)), len(order))
+            except json.JSONDecodeError:
+                continue
+    return order
+
+
+def append_order(examples, previous_path, key_fn=example_fingerprint, salt=DEFAULT_SALT):
+    """Order examples so rewriting previous_path only appends to it.
+
+    Examples already in the file keep the file's order; new examples follow
+    in stable_order. Use on every split before writing it.
+    """
+    previous = previous_order(previous_path, key_fn)
+    kept, new = [], []
+    for ex in examples:
+        pos = previous.get(key_fn(ex))
+        if pos is None:
+            new.append(ex)
+        else:
+            kept.append((pos, ex))
+    kept.sort(key=lambda t: t[0])
+    return [ex for _, ex in kept] + stable_order(new, key_fn, salt)
+
+
+def hash_split(examples, val_ratio=0.1, test_ratio=0.1, category_fn=None,
+               key_fn=example_fingerprint, salt=DEFAULT_SALT, min_holdout=True):
+    """Split examples into (train, validation, test) by fingerprint hash.
+
+    Args:
+        examples: list of example dicts
+        val_ratio / test_ratio: target fractions
+        category_fn: optional callable(example) -> category for stratification
+        key_fn: fingerprint function (default: example_fingerprint)
+        salt: changes every assignment at once (prepare scripts pass --seed)
+        min_holdout: guarantee at least one validation/test example per
+            category when the ratio asks for one and the category has >= 3
+
+    Returns:
+        (train, validation, test), each in stable_order.
+    """
+    by_category = defaultdict(list)
+    for ex in examples:
+        cat = category_fn(ex) if category_fn else None
+        fp = key_fn(ex)
+        by_category[cat].append((bucket(fp, salt), fp, ex))
+
+    splits = {'train': [], 'validation': [], 'test': []}
+    for cat in sorted(by_category, key=lambda c: str(c)):
+        items = by_category[cat]
+        assigned = {'train': [], 'validation': [], 'test': []}
+        for b, fp, ex in items:
+            if b < test_ratio:
+                assigned['test'].append((b, fp, ex))
+            elif b < test_ratio + val_ratio:
+                assigned['validation'].append((b, fp, ex))
+            else:
+                assigned['train'].append((b, fp, ex))
+
+        if min_holdout and len(items) >= 3:
+            for name, ratio in (('test', test_ratio), ('validation', val_ratio)):
+                if ratio > 0 and not assigned[name] and len(assigned['train']) > 1:
+                    assigned['train'].sort(key=lambda t: t[0])
+                    assigned[name].append(assigned['train'].pop(0))
+
+        for name in splits:
+            splits[name].extend(assigned[name])
+
+    def ordered(items):
+        return [ex for _, _, ex in sorted(items, key=lambda t: bucket(t[1], salt, 'order'))]
+
+    return ordered(splits['train']), ordered(splits['validation']), ordered(splits['test'])
+
+
+def hash_split_two_way(examples, val_ratio=0.1, category_fn=None,
+                       key_fn=example_fingerprint, salt=DEFAULT_SALT):
+    """Train/validation only (for pipelines without a test split)."""
+    train, val, _ = hash_split(examples, val_ratio=val_ratio, test_ratio=0.0,
+                               category_fn=category_fn, key_fn=key_fn, salt=salt)
+    return train, val
+
+
+def split_by_ratio(examples, train_ratio=0.80, val_ratio=0.10, seed=42, category_fn=None):
+    """Train/validation/test split by train and validation ratios; test gets the rest.
+
+    The shared split of the prepare scripts (clean_and_prepare, prepare_v4):
+    hash_split salted with the seed, stratified by category_fn.
+    """
+    test_ratio = max(0.0, 1.0 - train_ratio - val_ratio)
+    return hash_split(examples, val_ratio=val_ratio, test_ratio=test_ratio,
+                      category_fn=category_fn, salt=str(seed))
+
+
+def primary_category(categories, fallback='general-clinical'):
+    """One stratification key from a set of category tags.
+
+    The catch-all fallback tag is ignored when a more specific one is present;
+    ties are broken alphabetically so the key is stable.
+    """
+    specific = sorted(c for c in categories if c != fallback)
+    return specific[0] if specific else fallback
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Text Features — ChiroClickCRM AI Training Pipeline
+
+One feature record per text, shared by the scorer, the auditor, the
+evaluator and the distillation validator instead of each re-scanning the
+same response:
+
+- alpha / Norwegian character counts (æøå rate)
+- Norwegian function/clinical word hits (language detection)
+- every watch-list term present: colloquial, formal, English contamination,
+  non-clinical and contamination keywords
+
+Features are computed lazily with C-level primitives (str.count,
+map(str.isalpha), substring search over precompiled term tuples; a regex
+alternation automaton measured ~4x slower than substring search on this
+corpus) and memoized per text, so a response read by several checks is
+scanned once per feature.
+
+Usage:
+    from text_features import text_features, detect_language
+
+    python scripts/text_features.py data/processed/all-clean/train.jsonl   # corpus summary + throughput
+"""
+
+import json
+import re
+import sys
+import time
+from functools import lru_cache
+from pathlib import Path
+
+NORWEGIAN_CHARS = set('æøåÆØÅ')
+
+# Colloquial terms that should be formal in medical context
+COLLOQUIAL_TERMS = {
+    'nakkevondt': 'cervikalgi',
+    'vondt i ryggen': 'dorsalgi/lumbalgi',
+    'vondt i skulderen': 'omalgi',
+    'nerve i klem': 'nerverotaffeksjon',
+    'slitasje': 'degenerativ forandring',
+    'stiv nakke': 'cervikal bevegelsesrestriksjon',
+    'sideveis bøying': 'lateralfleksjon',
+    'forover bøying': 'fleksjon',
+    'bakover bøying': 'ekstensjon',
+    'hevelse': 'ødem',
+    'nummen': 'hypoestesi/parestesi',
+    'vondt å gå': 'gangvansker/funksjonsnedsettelse',
+}
+
+# Formal medical terms (presence = good quality)
+FORMAL_TERMS = [
+    'cervikalgi', 'lumbalgi', 'dorsalgi', 'omalgi', 'cefalgi',
+    'radikulopati', 'myelopati', 'stenose', 'spondylose',
+    'lateralfleksjon', 'antefleksjon', 'retrofleksjon',
+    'hypoestesi', 'parestesi', 'pareser',
+    'palpasjonsømhet', 'hypertonisitet', 'segmental dysfunksjon',
+    'differensialdiagnostikk', 'klinisk resonnering',
+    'artikulær', 'periartrikulær', 'myofascial',
+    'propriosepsjon', 'nevrologisk status',
+]
+
+# English contamination markers
+ENGLISH_CONTAMINATION = [
+    'the patient', 'chief complaint', 'range of motion',
+    'subjective:', 'objective:', 'assessment:', 'plan:',
+    'however,', 'therefore,', 'additionally,',
+    'treatment plan', 'follow up', 'referred to',
+    'bilateral', 'unilateral',  # acceptable in medical context
+]
+
+# Non-clinical contamination (scorer: any hit in a response is fatal)
+NON_CLINICAL = [
+    'bubble.io', 'react', 'github', 'npm', 'component',
+    'api endpoint', 'webpack', 'javascript', 'docker',
+    'kubernetes', 'tailwind', 'prisma', 'deployment',
+    'frontend', 'backend', 'css', 'html',
+]
+
+# Contamination keywords (auditor: whole example, narrower phrases)
+CONTAMINATION_KEYWORDS = [
+    'bubble.io', 'react.js', 'github.com', 'npm install', 'react component',
+    'api endpoint', 'deployment pipeline', 'javascript', 'typescript',
+    'docker compose', 'kubernetes', 'redux', 'tailwind css', 'prisma',
+    'webpack config', 'next.js', 'node_modules',
+    # Note: 'vite' excluded — it means "to know" in Norwegian (å vite)
+    # Note: 'frontend'/'backend' excluded — too common in general usage
+]
+
+# Common Norwegian words (language detection fallback for æøå-poor text)
+NORWEGIAN_WORDS = ['og', 'er', 'det', 'som', 'på', 'med', 'den', 'til', 'av', 'for',
+                   'pasient', 'smerte', 'behandling', 'vurdering', 'tiltak']
+
+# Precompiled term groups; a record scans a group only when a check asks for it
+TERM_GROUPS = {
+    'colloquial': tuple(COLLOQUIAL_TERMS),
+    'formal': tuple(FORMAL_TERMS),
+    'english': tuple(ENGLISH_CONTAMINATION[:10]),  # the rest are acceptable in medical text
+    'non_clinical': tuple(NON_CLINICAL),
+    'contamination': tuple(CONTAMINATION_KEYWORDS),
+}
+
+# Whitespace-delimited Norwegian words, matching text.lower().split() membership
+_NORWEGIAN_WORD_RE = re.compile(
+    r'(?<!\S)(?:' + '|'.join(map(re.escape, NORWEGIAN_WORDS)) + r')(?!\S)')
+
+# Reuse is mostly within one example (several checks on the same response),
+# so a small cache suffices and keeps memory flat on large corpora
+FEATURE_CACHE_SIZE = 4096
+
+
+class TextFeatures:
+    """Feature record of one text, shared between checks.
+
+    Every feature is computed on first access and kept, so each check pays
+    only for what it reads and nothing is scanned twice.
+    """
+
+    __slots__ = ('text', '_lower', '_alpha', '_norwegian_chars', '_norwegian_words', '_found')
+
+    def __init__(self, text):
+        self.text = text
+        self._lower = None
+        self._alpha = None
+        self._norwegian_chars = None
+        self._norwegian_words = None
+        self._found = {}
+
+    @property
+    def lower(self):
+        if self._lower is None:
+            self._lower = self.text.lower()
+        return self._lower
+
+    @property
+    def alpha(self):
+        if self._alpha is None:
+            self._alpha = sum(map(str.isalpha, self.text))
+        return self._alpha
+
+    @property
+    def norwegian_chars(self):
+        if self._norwegian_chars is None:
+            self._norwegian_chars = sum(map(self.text.count, NORWEGIAN_CHARS))
+        return self._norwegian_chars
+
+    @property
+    def norwegian_rate(self):
+        """Share of alphabetic characters that are æøå (0.0 for no letters)."""
+        return self.norwegian_chars / self.alpha if self.alpha else 0.0
+
+    @property
+    def norwegian_words(self):
+        if self._norwegian_words is None:
+            self._norwegian_words = len(_NORWEGIAN_WORD_RE.findall(self.lower))
+        return self._norwegian_words
+
+    def found(self, group):
+        """Terms of a TERM_GROUPS group present in the text (case-insensitive), in list order."""
+        hits = self._found.get(group)
+        if hits is None:
+            lower = self.lower
+            hits = self._found[group] = [t for t in TERM_GROUPS[group] if t in lower]
+        return hits
+
+    def as_dict(self):
+        record = {'length': len(self.text), 'alpha': self.alpha,
+                  'norwegian_chars': self.norwegian_chars,
+                  'norwegian_rate': round(self.norwegian_rate, 4),
+                  'norwegian_words': self.norwegian_words,
+                  'language': detect_language(self)}
+        for group in TERM_GROUPS:
+            record[group] = self.found(group)
+        return record
+
+
+@lru_cache(maxsize=FEATURE_CACHE_SIZE)
+def text_features(text):
+    """The (memoized) feature record of a text."""
+    return TextFeatures(text)
+
+
+def norwegian_char_rate(text):
+    """Rate of Norwegian-specific characters among alphabetic characters."""
+    return text_features(text).norwegian_rate
+
+
+def detect_language(features):
+    """'norwegian', 'english_or_other' or 'unknown' from a feature record (or text)."""
+    if isinstance(features, str):
+        features = text_features(features)
+    if features.alpha == 0:
+        return 'unknown'
+    if features.norwegian_rate > 0.005:  # ~0.5% Norwegian chars → likely Norwegian
+        return 'norwegian'
+    if features.norwegian_words >= 3:
+        return 'norwegian'
+    return 'english_or_other'
+
+
+def assistant_text(example, last=False):
+    """Content of the first (or last) assistant message, '' if none."""
+    msgs = [m for m in example.get('messages', []) if m.get('role') == 'assistant']
+    if not msgs:
+        return ''
+    return msgs[-1 if last else 0].get('content', '')
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: python scripts/text_features.py <file.jsonl> [...]')
+        return 1
+    for path in sys.argv[1:]:
+        texts = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        texts.append(assistant_text(json.loads(line)))
+                    except json.JSONDecodeError:
+                        continue
+        start = time.perf_counter()
+        records = [text_features(t) for t in texts]
+        for r in records:
+            r.as_dict()
+        elapsed = time.perf_counter() - start
+        langs = {}
+        for r in records:
+            lang = detect_language(r)
+            langs[lang] = langs.get(lang, 0) + 1
+        print(f"\n  {Path(path).name}: {len(records)} responses in {elapsed:.2f}s "
+              f"({len(records) / max(elapsed, 1e-9):.0f}/s)")
+        print(f"    Languages: {langs}")
+        for group in TERM_GROUPS:
+            hits = sum(1 for r in records if r.found(group))
+            print(f"    With {group} terms: {hits}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
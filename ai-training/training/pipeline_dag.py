@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Resource-Aware Pipeline Scheduler — ChiroClickCRM AI Training Pipeline
+
+Runs the per-model training/deploy steps as a DAG instead of a strict
+sequence. Every step declares the resource slots it holds (GPU, CPU-RAM,
+disk I/O, Ollama); a step starts as soon as its dependencies are done and its
+slots are free. With one GPU slot, model N's merge, GGUF conversion, Ollama
+create and smoke test overlap with model N+1's training.
+
+Progress is persisted after every state change under the "steps" key of the
+existing training-progress.json, so an interrupted run resumes by skipping
+steps already marked done.
+
+Usage:
+    python training/pipeline_dag.py --dry-run
+    python training/pipeline_dag.py --dry-run --slots gpu=1,cpu_ram=2,disk_io=1
+
+    from pipeline_dag import Step, DagScheduler
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+
+DEFAULT_SLOTS = {'gpu': 1, 'cpu_ram': 2, 'disk_io': 1, 'ollama': 1}
+
+# Resources held by each kind of step
+STEP_RESOURCES = {
+    'prepare': {'cpu_ram': 1, 'disk_io': 1},
+    'train': {'gpu': 1, 'cpu_ram': 1},
+    'merge': {'cpu_ram': 1, 'disk_io': 1},
+    'convert': {'disk_io': 1},
+    'deploy': {'ollama': 1, 'disk_io': 1},
+    'test': {'ollama': 1},
+}
+
+DONE, FAILED, SKIPPED, RUNNING, PENDING = 'done', 'failed', 'skipped', 'running', 'pending'
+
+
+def parse_slots(spec):
+    """'gpu=1,cpu_ram=2' -> {'gpu': 1, 'cpu_ram': 2, ...} on top of DEFAULT_SLOTS."""
+    slots = dict(DEFAULT_SLOTS)
+    for part in filter(None, (spec or '').split(',')):
+        name, _, value = part.partition('=')
+        slots[name.strip()] = int(value)
+    return slots
+
+
+class Step:
+    """One node of the pipeline DAG.
+
+    fn() returns truthy on success; a falsy return or an exception fails the
+    step and skips everything that depends on it.
+    """
+
+    def __init__(self, name, fn, deps=(), kind=None, resources=None, model=None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.kind = kind or name.split(':')[0]
+        self.resources = resources if resources is not None else STEP_RESOURCES.get(self.kind, {})
+        self.model = model
+
+    def __repr__(self):
+        return f'Step({self.name!r}, deps={self.deps})'
+
+
+class DagScheduler:
+    """Runs Steps with bounded resource slots, persisting state to a progress dict."""
+
+    def __init__(self, steps, slots=None, progress=None, progress_path=None, log=print):
+        self.steps = {s.name: s for s in steps}
+        self.order = [s.name for s in steps]  # declaration order = priority
+        for step in steps:
+            unknown = [d for d in step.deps if d not in self.steps]
+            if unknown:
+                raise ValueError(f'{step.name}: unknown dependencies {unknown}')
+        self._check_acyclic()
+
+        self.slots = dict(slots or DEFAULT_SLOTS)
+        for step in steps:
+            for res, units in step.resources.items():
+                if units > self.slots.get(res, 0):
+                    raise ValueError(f'{step.name} needs {units} {res} slot(s), only {self.slots.get(res, 0)} configured')
+        self.free = dict(self.slots)
+        self.progress = progress if progress is not None else {}
+        self.progress_path = Path(progress_path) if progress_path else None
+        self.log = log
+        self._lock = threading.Lock()
+
+        state = self.progress.setdefault('steps', {})
+        self.status = {}
+        for name in self.order:
+            prev = state.get(name, {}).get('status')
+            self.status[name] = DONE if prev == DONE else PENDING
+
+    def _check_acyclic(self):
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f'Dependency cycle through {name}')
+            visiting.add(name)
+            for dep in self.steps[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.steps:
+            visit(name)
+
+    # ── State ──
+
+    def _record(self, name, status, **fields):
+        with self._lock:
+            self.status[name] = status
+            entry = self.progress['steps'].setdefault(name, {})
+            entry.update(status=status, **fields)
+            step = self.steps[name]
+            if step.model and step.kind in ('train', 'deploy'):
+                bucket = {('train', DONE): 'completed', ('train', FAILED): 'failed',
+                          ('deploy', DONE): 'deployed'}.get((step.kind, status))
+                if bucket and step.model not in self.progress.setdefault(bucket, []):
+                    self.progress[bucket].append(step.model)
+            self.save()
+
+    def save(self):
+        if self.progress_path is None:
+            return
+        self.progress_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.progress_path.with_suffix('.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.progress, f, indent=2)
+        tmp.replace(self.progress_path)
+
+    def _ready(self):
+        for name in self.order:
+            if self.status[name] != PENDING:
+                continue
+            step = self.steps[name]
+            dep_status = [self.status[d] for d in step.deps]
+            if any(s in (FAILED, SKIPPED) for s in dep_status):
+                self._record(name, SKIPPED, reason='dependency failed')
+                self.log(f"  SKIP  {name} (dependency failed)")
+                continue
+            if all(s == DONE for s in dep_status) and all(
+                    self.free.get(r, 0) >= u for r, u in step.resources.items()):
+                yield step
+
+    def _run_step(self, step):
+        started = time.time()
+        try:
+            ok = bool(step.fn())
+            error = None
+        except Exception as e:
+            ok, error = False, f'{type(e).__name__}: {e}'
+        return ok, time.time() - started, error
+
+    # ── Main loop ──
+
+    def run(self):
+        """Run until every step is done, failed or skipped. Returns status dict."""
+        resumed = [n for n in self.order if self.status[n] == DONE]
+        if resumed:
+            self.log(f"  Resuming: {len(resumed)} step(s) already done")
+
+        t0 = time.time()
+        running = {}
+        max_workers = max(1, sum(self.slots.values()))
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while True:
+                for step in self._ready():
+                    for res, units in step.resources.items():
+                        self.free[res] -= units
+                    self._record(step.name, RUNNING, started_at=datetime.now().isoformat())
+                    self.log(f"  START {step.name}  [{self._offset(t0)}]")
+                    running[pool.submit(self._run_step, step)] = step
+
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    for res, units in step.resources.items():
+                        self.free[res] += units
+                    ok, seconds, error = future.result()
+                    fields = {'finished_at': datetime.now().isoformat(), 'seconds': round(seconds, 1)}
+                    if error:
+                        fields['error'] = error
+                    self._record(step.name, DONE if ok else FAILED, **fields)
+                    label = 'DONE ' if ok else 'FAIL '
+                    self.log(f"  {label}{step.name} in {seconds / 60:.1f} min  [{self._offset(t0)}]"
+                             + (f"  {error}" if error else ''))
+
+        # Anything left pending has an unsatisfiable dependency chain
+        for name in self.order:
+            if self.status[name] == PENDING:
+                self._record(name, SKIPPED, reason='not runnable')
+        return dict(self.status)
+
+    @staticmethod
+    def _offset(t0):
+        return f"+{(time.time() - t0) / 60:.1f} min"
+
+    def summary(self):
+        """Makespan vs. the sequential sum of step durations (from progress)."""
+        state = self.progress.get('steps', {})
+        total = sum(state.get(n, {}).get('seconds', 0) for n in self.order)
+        starts = [state[n]['started_at'] for n in self.order if state.get(n, {}).get('started_at')]
+        ends = [state[n]['finished_at'] for n in self.order if state.get(n, {}).get('finished_at')]
+        makespan = 0.0
+        if starts and ends:
+            makespan = (datetime.fromisoformat(max(ends)) - datetime.fromisoformat(min(starts))).total_seconds()
+        return {'sequential_seconds': round(total, 1), 'makespan_seconds': round(makespan, 1)}
+
+
+def model_pipeline(model_key, train_fn, merge_fn, deploy_fn, test_fn=None, after=()):
+    """The train -> merge/convert -> deploy -> test chain for one model."""
+    steps = [
+        Step(f'train:{model_key}', train_fn, deps=after, model=model_key),
+        Step(f'merge:{model_key}', merge_fn, deps=[f'train:{model_key}'], model=model_key),
+        Step(f'deploy:{model_key}', deploy_fn, deps=[f'merge:{model_key}'], model=model_key),
+    ]
+    if test_fn is not None:
+        steps.append(Step(f'test:{model_key}', test_fn, deps=[f'deploy:{model_key}'], model=model_key))
+    return steps
+
+
+# ============================================================
+# Dry run (fake steps, CPU only)
+# ============================================================
+
+# Relative durations of the real pipeline (minutes): train, merge+convert, deploy, test
+DRY_RUN_MINUTES = {
+    'fast': (30, 3, 1, 0.5),
+    'medical': (90, 6, 2, 0.5),
+    'norwegian': (210, 15, 4, 1),
+    'default': (210, 15, 4, 1),
+}
+
+
+def fake_step(seconds, fail=False):
+    def fn():
+        time.sleep(seconds)
+        return not fail
+    return fn
+
+
+def dry_run_steps(models, scale=0.01, fail=()):
+    """Fake pipeline with realistic relative durations; `scale` = seconds per minute."""
+    steps = [Step('prepare:data', fake_step(5 * scale))]
+    for key in models:
+        train, merge, deploy, test = DRY_RUN_MINUTES.get(key, (60, 5, 2, 0.5))
+        steps += model_pipeline(
+            key,
+            fake_step(train * scale, fail=f'train:{key}' in fail),
+            fake_step(merge * scale, fail=f'merge:{key}' in fail),
+            fake_step(deploy * scale),
+            fake_step(test * scale),
+            after=['prepare:data'],
+        )
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resource-aware training/deploy DAG (dry run)')
+    parser.add_argument('--dry-run', action='store_true', help='Run fake steps (CPU only, seconds)')
+    parser.add_argument('--models', nargs='+', default=list(DRY_RUN_MINUTES))
+    parser.add_argument('--slots', default='', help='Resource slots, e.g. gpu=1,cpu_ram=2,disk_io=1')
+    parser.add_argument('--scale', type=float, default=0.01, help='Dry-run seconds per pipeline minute')
+    parser.add_argument('--fail', nargs='*', default=[], help='Dry-run steps to fail (e.g. merge:fast)')
+    parser.add_argument('--progress', help='Progress JSON to write/resume (default: none)')
+    args = parser.parse_args()
+
+    if not args.dry_run:
+        parser.error('Use train_all_sequential.py --parallel for real runs; this CLI only supports --dry-run')
+
+    progress = {}
+    if args.progress and Path(args.progress).exists():
+        with open(args.progress, 'r') as f:
+            progress = json.load(f)
+
+    scheduler = DagScheduler(dry_run_steps(args.models, args.scale, set(args.fail)),
+                             slots=parse_slots(args.slots), progress=progress,
+                             progress_path=args.progress)
+    status = scheduler.run()
+    summary = scheduler.summary()
+    print(f"\n  Sequential: {summary['sequential_seconds']:.1f}s  "
+          f"DAG makespan: {summary['makespan_seconds']:.1f}s")
+    return 0 if all(s == DONE for s in status.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
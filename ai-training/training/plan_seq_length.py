@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Sequence-Length & Batch Planner — ChiroClick LoRA Fine-Tuning
+
+Runs entirely on CPU before committing to a multi-hour GPU run:
+  1. Tokenizes each split with every requested model's tokenizer
+     (via the pre-tokenized cache in token_cache.py, so repeat runs are instant)
+  2. Reports exact token-length distributions per split and per category
+  3. For each candidate max_seq_length: truncation rate plus padding/packing
+     efficiency (naive, length-bucketed, best-fit-decreasing packed)
+  4. Recommends a max_seq_length + micro-batch + grad-accum that fits a VRAM
+     budget, using a QLoRA memory estimate (4-bit base, LoRA r=16, gradient
+     checkpointing). The estimate is deliberately conservative — treat it as
+     a starting point that replaces the blind 1024 fallback, not a guarantee.
+
+Usage:
+    python plan_seq_length.py --data-dir ../data/processed-v8/combined-sft --models fast medical
+    python plan_seq_length.py --data-dir ../data/curated --models default --vram-gb 12
+    python plan_seq_length.py --data-dir ../data/curated --tokenizer ./tiny-tokenizer --output plan.json
+"""
+
+import argparse
+import json
+import math
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from token_cache import TokenCache, build_token_cache, padding_report
+
+DEFAULT_CANDIDATES = [512, 1024, 1536, 2048, 3072, 4096]
+DEFAULT_TARGET_EFFECTIVE_BATCH = 16
+DEFAULT_MAX_TRUNCATION_PCT = 1.0
+VRAM_HEADROOM = 0.85  # Leave room for allocator fragmentation / CUDA context spikes
+
+# Architecture numbers for the memory estimate (from the HF configs)
+MODEL_DIMS = {
+    'Qwen/Qwen2.5-0.5B-Instruct': {'params_b': 0.49, 'layers': 24, 'hidden': 896,
+                                   'intermediate': 4864, 'vocab': 151936},
+    'Qwen/Qwen2.5-1.5B-Instruct': {'params_b': 1.54, 'layers': 28, 'hidden': 1536,
+                                   'intermediate': 8960, 'vocab': 151936},
+    'Qwen/Qwen2.5-3B-Instruct': {'params_b': 3.09, 'layers': 36, 'hidden': 2048,
+                                 'intermediate': 11008, 'vocab': 151936},
+    'Qwen/Qwen2.5-7B-Instruct': {'params_b': 7.61, 'layers': 28, 'hidden': 3584,
+                                 'intermediate': 18944, 'vocab': 152064},
+    'mistralai/Mistral-7B-Instruct-v0.2': {'params_b': 7.24, 'layers': 32, 'hidden': 4096,
+                                           'intermediate': 14336, 'vocab': 32000},
+}
+
+
+# ============================================================
+# Distribution stats
+# ============================================================
+
+def percentile(sorted_vals, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_vals:
+        return 0
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(pct / 100 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+def length_stats(lengths):
+    """Summary stats for a list of token lengths."""
+    vals = sorted(int(n) for n in lengths)
+    if not vals:
+        return {'count': 0}
+    return {
+        'count': len(vals),
+        'mean': round(sum(vals) / len(vals), 1),
+        'p50': percentile(vals, 50),
+        'p90': percentile(vals, 90),
+        'p95': percentile(vals, 95),
+        'p99': percentile(vals, 99),
+        'max': vals[-1],
+        'total_tokens': sum(vals),
+    }
+
+
+def truncation_stats(lengths, max_length):
+    """How many examples / tokens are lost at a given max_length."""
+    over = [n for n in lengths if n > max_length]
+    total = sum(lengths)
+    lost = sum(n - max_length for n in over)
+    return {
+        'truncated_examples': len(over),
+        'truncated_pct': round(len(over) / max(len(lengths), 1) * 100, 2),
+        'lost_tokens_pct': round(lost / max(total, 1) * 100, 2),
+    }
+
+
+# ============================================================
+# Memory model (QLoRA, gradient checkpointing)
+# ============================================================
+
+def lora_param_count(dims, r=16):
+    """LoRA params for q/k/v/o + gate/up/down (GQA ignored: upper bound)."""
+    h, inter = dims['hidden'], dims['intermediate']
+    per_layer = r * (4 * (h + h) + 2 * (h + inter) + (inter + h))
+    return dims['layers'] * per_layer
+
+
+def estimate_vram_gb(dims, seq_len, micro_batch, r=16):
+    """Rough peak VRAM (GB) for 4-bit QLoRA training with checkpointing.
+
+    weights:     ~0.6 bytes/param (nf4 + double-quant + fp16 embeddings share)
+    lora:        16 bytes/param (fp16 weight, fp32 grad, 2x fp32 Adam state)
+    activations: checkpointed layer inputs (2 bytes * hidden per layer/token)
+                 + one recomputed layer (~34 bytes * hidden per token, SDPA)
+    logits:      fp16 logits + fp32 upcast for the loss (~6 bytes * vocab/token)
+    fixed:       CUDA context + allocator slack
+    """
+    tokens = seq_len * micro_batch
+    weights = dims['params_b'] * 1e9 * 0.6
+    lora = lora_param_count(dims, r) * 16
+    activations = tokens * dims['hidden'] * (2 * dims['layers'] + 34)
+    logits = tokens * dims['vocab'] * 6
+    fixed = 0.8e9
+    return (weights + lora + activations + logits + fixed) / 1e9
+
+
+def recommend(lengths, dims, candidates, vram_gb, packing,
+              max_truncation_pct=DEFAULT_MAX_TRUNCATION_PCT,
+              target_effective_batch=DEFAULT_TARGET_EFFECTIVE_BATCH):
+    """Pick (seq_len, micro_batch, grad_accum) for a VRAM budget.
+
+    Prefers the shortest candidate whose truncation rate is acceptable (less
+    padding, more headroom), then the largest micro-batch that fits. Falls
+    back to shorter candidates only when nothing fits, and says so.
+    """
+    budget = vram_gb * VRAM_HEADROOM
+    ok_lengths = [c for c in sorted(candidates)
+                  if truncation_stats(lengths, c)['truncated_pct'] <= max_truncation_pct]
+    preferred = ok_lengths[0] if ok_lengths else max(candidates)
+    order = [preferred] + sorted((c for c in candidates if c < preferred), reverse=True)
+
+    for seq_len in order:
+        best_b = 0
+        for b in (1, 2, 4, 8, 16):
+            if estimate_vram_gb(dims, seq_len, b) <= budget:
+                best_b = b
+        if best_b:
+            report = padding_report(lengths, seq_len, best_b)
+            strategy = 'packed' if packing else 'bucketed'
+            return {
+                'max_seq_length': seq_len,
+                'micro_batch': best_b,
+                'grad_accum': max(1, math.ceil(target_effective_batch / best_b)),
+                'estimated_vram_gb': round(estimate_vram_gb(dims, seq_len, best_b), 2),
+                'budget_gb': round(budget, 2),
+                'truncation': truncation_stats(lengths, seq_len),
+                'padding_waste_pct': report[strategy]['waste_pct'],
+                'strategy': strategy,
+                'forced_shorter': seq_len != preferred,
+            }
+    return None
+
+
+# ============================================================
+# Planning
+# ============================================================
+
+def plan_for_tokenizer(data_dirs, tokenizer, dims, candidates, vram_gb, packing, batch_size):
+    """Build the full plan for one tokenizer across data dirs."""
+    splits = {}
+    train_lengths = []
+    by_category = defaultdict(list)
+
+    for data_dir in data_dirs:
+        cache_dir, manifests = build_token_cache(data_dir, tokenizer,
+                                                 splits=('train', 'validation', 'test'))
+        for split in manifests:
+            cache = TokenCache(cache_dir, split)
+            lengths = [int(n) for n in cache.lengths.tolist()]
+            key = f'{Path(data_dir).name}/{split}'
+            splits[key] = length_stats(lengths)
+            if split == 'train':
+                train_lengths.extend(lengths)
+                for n, cat in zip(lengths, cache.categories):
+                    by_category[cat].append(n)
+
+    plan = {
+        'splits': splits,
+        'categories': {cat: length_stats(v) for cat, v in sorted(by_category.items())},
+        'candidates': {},
+    }
+    for c in candidates:
+        report = padding_report(train_lengths, c, batch_size)
+        plan['candidates'][c] = {
+            **truncation_stats(train_lengths, c),
+            'naive_waste_pct': report['naive']['waste_pct'],
+            'bucketed_waste_pct': report['bucketed']['waste_pct'],
+            'packed_waste_pct': report['packed']['waste_pct'],
+            'packed_steps_per_epoch': report['packed']['steps'],
+            'estimated_vram_gb': (round(estimate_vram_gb(dims, c, batch_size), 2)
+                                  if dims else None),
+        }
+    if dims and train_lengths:
+        plan['recommendation'] = recommend(train_lengths, dims, candidates, vram_gb, packing)
+    return plan
+
+
+def print_plan(name, plan, batch_size):
+    print(f'\n{"=" * 78}')
+    print(f'  {name}')
+    print(f'{"=" * 78}')
+    print(f'  {"Split/category":<36s} {"n":>6s} {"mean":>7s} {"p50":>6s} '
+          f'{"p95":>6s} {"p99":>6s} {"max":>6s}')
+    for label, rows in (('', plan['splits']), ('  cat: ', plan['categories'])):
+        for key, st in rows.items():
+            if not st.get('count'):
+                continue
+            print(f'  {(label + key)[:36]:<36s} {st["count"]:>6d} {st["mean"]:>7.0f} '
+                  f'{st["p50"]:>6d} {st["p95"]:>6d} {st["p99"]:>6d} {st["max"]:>6d}')
+
+    print(f'\n  Candidates (train, batch={batch_size}):')
+    print(f'  {"seq_len":>7s} {"trunc%":>7s} {"lost%":>6s} {"naive%":>7s} '
+          f'{"bucket%":>8s} {"packed%":>8s} {"steps":>6s} {"VRAM GB":>8s}')
+    for c, r in plan['candidates'].items():
+        vram = f'{r["estimated_vram_gb"]:.1f}' if r['estimated_vram_gb'] is not None else '-'
+        print(f'  {c:>7d} {r["truncated_pct"]:>7.2f} {r["lost_tokens_pct"]:>6.2f} '
+              f'{r["naive_waste_pct"]:>7.1f} {r["bucketed_waste_pct"]:>8.1f} '
+              f'{r["packed_waste_pct"]:>8.1f} {r["packed_steps_per_epoch"]:>6d} {vram:>8s}')
+
+    rec = plan.get('recommendation')
+    if rec:
+        print(f'\n  RECOMMENDED: --max-seq-length {rec["max_seq_length"]} '
+              f'--batch-size {rec["micro_batch"]} '
+              f'--gradient-accumulation-steps {rec["grad_accum"]}')
+        print(f'    est. {rec["estimated_vram_gb"]} GB of {rec["budget_gb"]} GB budget, '
+              f'{rec["truncation"]["truncated_pct"]}% truncated, '
+              f'{rec["padding_waste_pct"]}% {rec["strategy"]} padding waste')
+        if rec['forced_shorter']:
+            print('    NOTE: shortened below the truncation target to fit the budget')
+    elif 'recommendation' in plan:
+        print('\n  No configuration fits the VRAM budget — use a smaller model')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Plan max_seq_length and batch shape on CPU')
+    parser.add_argument('--data-dir', type=Path, nargs='+', required=True,
+                        help='One or more dataset directories (train/validation/test.jsonl)')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--models', nargs='+', help='Model keys from train_unsloth.MODELS')
+    group.add_argument('--tokenizer', help='HF tokenizer name/path (no memory estimate)')
+    parser.add_argument('--candidates', type=int, nargs='+', default=DEFAULT_CANDIDATES)
+    parser.add_argument('--vram-gb', type=float, default=None,
+                        help='GPU memory budget (default: detected GPU, else 12)')
+    parser.add_argument('--batch-size', type=int, default=4,
+                        help='Micro-batch used for the padding table')
+    parser.add_argument('--no-packing', action='store_true',
+                        help='Plan for length-bucketed batches instead of packing')
+    parser.add_argument('--output', type=Path, default=None, help='Write plan JSON here')
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    vram_gb = args.vram_gb
+    if vram_gb is None:
+        try:
+            import torch
+            vram_gb = (torch.cuda.get_device_properties(0).total_memory / 1e9
+                       if torch.cuda.is_available() else 12.0)
+        except ImportError:
+            vram_gb = 12.0
+    print(f'  VRAM budget: {vram_gb:.1f} GB (x{VRAM_HEADROOM} headroom)')
+
+    targets = []
+    if args.models:
+        from train_unsloth import MODELS
+        for key in args.models:
+            if key not in MODELS:
+                print(f'  Unknown model: {key} (available: {", ".join(MODELS)})')
+                return 1
+            name = MODELS[key]['name']
+            targets.append((f'{key} ({name})', name, MODEL_DIMS.get(name)))
+    else:
+        targets.append((args.tokenizer, args.tokenizer, None))
+
+    output = {}
+    for label, tok_name, dims in targets:
+        tokenizer = AutoTokenizer.from_pretrained(tok_name, trust_remote_code=True)
+        plan = plan_for_tokenizer(args.data_dir, tokenizer, dims, args.candidates,
+                                  vram_gb, not args.no_packing, args.batch_size)
+        print_plan(label, plan, args.batch_size)
+        output[label] = plan
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+        print(f'\n  Plan saved to: {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Truncation-aware DPO Preprocessing — ChiroClickCRM
+
+DPOTrainer tokenizes prompt, chosen and rejected separately inside the
+trainer and silently truncates to max_prompt_length / max_length. This stage
+tokenizes every pair ONCE (cached per tokenizer + source hash), simulates the
+trainer's truncation, and:
+
+  - reports how many prompts / completions get truncated
+  - drops (or flags) pairs whose chosen and rejected only diverge AFTER the
+    truncation point — after truncation both sides are identical, so the
+    pair contributes zero preference signal and just burns compute
+  - writes length-sorted shards (shard order shuffled with a fixed seed) so
+    each batch pads to similar lengths; train_dpo.py keeps each shard
+    together and reshuffles the shard order every epoch
+
+Output (default: <data-dir>/prepared/):
+    train.jsonl, validation.jsonl      pairs in shard order
+    dpo-prep-manifest.json             truncation stats, shard boundaries
+
+Length cache: <data-dir>/.cache/dpo-tok-<tokenizer>/<split>.lengths.json
+
+Usage:
+    python prepare_dpo.py --model default --data-dir ../data/processed-v8/combined-dpo
+    python prepare_dpo.py --tokenizer ./tiny-tokenizer --data-dir ../data/dpo --on-diverge flag
+    python train_dpo.py --model default --data-dir ../data/processed-v8/combined-dpo/prepared
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent / 'scripts'))
+from dataset_cache import CACHE_DIRNAME, file_sha256
+from token_cache import tokenizer_fingerprint
+
+PREP_MANIFEST = 'dpo-prep-manifest.json'
+LENGTH_CACHE_VERSION = 1
+DEFAULT_SHARD_SIZE = 64
+
+
+# ============================================================
+# Rendering (mirrors TRL's maybe_apply_chat_template)
+# ============================================================
+
+def _is_conversational(value):
+    return isinstance(value, list) and value and isinstance(value[0], dict)
+
+
+def render_pair(item, tokenizer):
+    """Return (prompt_text, chosen_text, rejected_text) as the trainer sees them.
+
+    Conversational pairs go through the chat template: the prompt with a
+    generation prompt, each completion as the continuation of prompt+answer.
+    Plain-string pairs are used verbatim.
+    """
+    prompt, chosen, rejected = item['prompt'], item['chosen'], item['rejected']
+    if not _is_conversational(prompt):
+        return str(prompt), str(chosen), str(rejected)
+
+    prompt_text = tokenizer.apply_chat_template(
+        prompt, tokenize=False, add_generation_prompt=True,
+    )
+
+    def completion(value):
+        if not _is_conversational(value):
+            return str(value)
+        full = tokenizer.apply_chat_template(prompt + value, tokenize=False)
+        return full[len(prompt_text):] if full.startswith(prompt_text) else full
+
+    return prompt_text, completion(chosen), completion(rejected)
+
+
+def common_prefix_len(a, b):
+    """Length of the shared token prefix of two id lists."""
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+# ============================================================
+# Length cache
+# ============================================================
+
+def _read_pairs(jsonl_path):
+    pairs = []
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if all(k in item for k in ('prompt', 'chosen', 'rejected')):
+                pairs.append(item)
+    return pairs
+
+
+def tokenize_lengths(jsonl_path, tokenizer, pairs=None):
+    """Per-pair [prompt_len, chosen_len, rejected_len, common_prefix] (cached).
+
+    Each side is tokenized exactly once; the cache is keyed by tokenizer
+    fingerprint and the source file's sha256.
+    """
+    jsonl_path = Path(jsonl_path)
+    cache_dir = jsonl_path.parent / CACHE_DIRNAME / f'dpo-tok-{tokenizer_fingerprint(tokenizer)}'
+    cache_path = cache_dir / f'{jsonl_path.stem}.lengths.json'
+    source_hash = file_sha256(jsonl_path)
+
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if (cached.get('version') == LENGTH_CACHE_VERSION
+                    and cached.get('source_hash') == source_hash):
+                return cached['lengths'], True
+        except (OSError, json.JSONDecodeError):
+            pass
+
+    if pairs is None:
+        pairs = _read_pairs(jsonl_path)
+
+    lengths = []
+    for item in pairs:
+        prompt_text, chosen_text, rejected_text = render_pair(item, tokenizer)
+        enc = tokenizer([prompt_text, chosen_text, rejected_text],
+                        add_special_tokens=False)['input_ids']
+        p_ids, c_ids, r_ids = enc
+        lengths.append([len(p_ids), len(c_ids), len(r_ids), common_prefix_len(c_ids, r_ids)])
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_suffix('.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': LENGTH_CACHE_VERSION, 'source_hash': source_hash,
+                   'tokenizer': str(getattr(tokenizer, 'name_or_path', '')),
+                   'lengths': lengths}, f)
+    os.replace(tmp, cache_path)
+    return lengths, False
+
+
+# ============================================================
+# Truncation analysis
+# ============================================================
+
+def analyze_pair(lengths, max_length, max_prompt_length):
+    """Simulate DPOTrainer truncation for one pair.
+
+    The prompt keeps its last max_prompt_length tokens; each completion gets
+    the remaining max_length budget. Returns a dict of flags + effective
+    lengths.
+    """
+    p_len, c_len, r_len, prefix = lengths
+    eff_prompt = min(p_len, max_prompt_length)
+    budget = max(0, max_length - eff_prompt)
+    eff_c, eff_r = min(c_len, budget), min(r_len, budget)
+
+    flags = []
+    if p_len > max_prompt_length:
+        flags.append('prompt_truncated')
+    if c_len > budget:
+        flags.append('chosen_truncated')
+    if r_len > budget:
+        flags.append('rejected_truncated')
+    # After truncation the kept tokens are identical on both sides
+    if prefix >= min(eff_c, eff_r) and eff_c == eff_r:
+        flags.append('identical_after_truncation')
+
+    return {
+        'flags': flags,
+        'effective_length': eff_prompt + max(eff_c, eff_r),
+    }
+
+
+def length_sorted_shards(order_lengths, shard_size, seed):
+    """Sort indices by length, cut into shards, shuffle shard order.
+
+    Keeps batches length-homogeneous while still varying what the model sees
+    from one part of the epoch to the next.
+    """
+    order = sorted(range(len(order_lengths)), key=lambda i: order_lengths[i])
+    shards = [order[i:i + shard_size] for i in range(0, len(order), shard_size)]
+    random.Random(seed).shuffle(shards)
+    return shards
+
+
+def prepare_split(jsonl_path, tokenizer, out_path, max_length, max_prompt_length,
+                  on_diverge='drop', shard_size=DEFAULT_SHARD_SIZE, seed=42):
+    """Analyze, filter and shard one DPO split. Returns stats dict."""
+    pairs = _read_pairs(jsonl_path)
+    lengths, reused = tokenize_lengths(jsonl_path, tokenizer, pairs=pairs)
+    if len(lengths) != len(pairs):
+        raise ValueError(f'Length cache out of sync with {jsonl_path}')
+
+    stats = {
+        'pairs': len(pairs),
+        'length_cache_reused': reused,
+        'prompt_truncated': 0,
+        'chosen_truncated': 0,
+        'rejected_truncated': 0,
+        'identical_after_truncation': 0,
+        'dropped': 0,
+    }
+    kept, kept_lengths = [], []
+    for item, lens in zip(pairs, lengths):
+        result = analyze_pair(lens, max_length, max_prompt_length)
+        for flag in result['flags']:
+            stats[flag] += 1
+        if 'identical_after_truncation' in result['flags'] and on_diverge == 'drop':
+            stats['dropped'] += 1
+            continue
+        if result['flags']:
+            item = dict(item)
+            item['_dpo_flags'] = result['flags']
+        kept.append(item)
+        kept_lengths.append(result['effective_length'])
+
+    shards = length_sorted_shards(kept_lengths, shard_size, seed)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for shard in shards:
+            for i in shard:
+                f.write(json.dumps(kept[i], ensure_ascii=False) + '\n')
+
+    padded = sum(max(kept_lengths[i] for i in s) * len(s) for s in shards if s)
+    real = sum(kept_lengths)
+    stats.update({
+        'kept': len(kept),
+        'shards': len(shards),
+        'shard_sizes': [len(s) for s in shards],
+        'shard_bounds': [[min(kept_lengths[i] for i in s), max(kept_lengths[i] for i in s)]
+                         for s in shards if s],
+        'shard_padding_pct': round((padded - real) / padded * 100, 1) if padded else 0.0,
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Truncation-aware DPO preprocessing')
+    parser.add_argument('--data-dir', type=Path, required=True,
+                        help='DPO directory with train.jsonl (and validation.jsonl)')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--model', help='Model key from train_dpo.MODELS')
+    group.add_argument('--tokenizer', help='HF tokenizer name/path')
+    parser.add_argument('--output-dir', type=Path, default=None,
+                        help='Output directory (default: <data-dir>/prepared)')
+    parser.add_argument('--max-length', type=int, default=None,
+                        help='Default: model max_seq_length (2048)')
+    parser.add_argument('--max-prompt-length', type=int, default=None,
+                        help='Default: max_length // 2 (same as train_dpo.py)')
+    parser.add_argument('--on-diverge', choices=['drop', 'flag'], default='drop',
+                        help='Pairs identical after truncation: drop or keep with _dpo_flags')
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    max_length = args.max_length
+    if args.model:
+        from train_dpo import MODELS
+        tok_name = MODELS[args.model]['name']
+        max_length = max_length or MODELS[args.model]['max_seq_length']
+    else:
+        tok_name = args.tokenizer
+    max_length = max_length or 2048
+    max_prompt_length = args.max_prompt_length or max_length // 2
+
+    tokenizer = AutoTokenizer.from_pretrained(tok_name, trust_remote_code=True)
+    output_dir = args.output_dir or (args.data_dir / 'prepared')
+
+    start = time.time()
+    manifest = {
+        'tokenizer': tok_name,
+        'max_length': max_length,
+        'max_prompt_length': max_prompt_length,
+        'on_diverge': args.on_diverge,
+        'shard_size': args.shard_size,
+        'seed': args.seed,
+        'length_sorted': True,
+        'splits': {},
+    }
+    for split in ('train', 'validation'):
+        src = args.data_dir / f'{split}.jsonl'
+        if not src.exists():
+            continue
+        stats = prepare_split(src, tokenizer, output_dir / f'{split}.jsonl',
+                              max_length, max_prompt_length, args.on_diverge,
+                              args.shard_size, args.seed)
+        manifest['splits'][split] = stats
+        n = max(stats['pairs'], 1)
+        print(f"  {split}: {stats['pairs']} pairs -> {stats['kept']} kept "
+              f"({stats['dropped']} dropped), {stats['shards']} shards, "
+              f"{stats['shard_padding_pct']}% padding"
+              f"{' [cached lengths]' if stats['length_cache_reused'] else ''}")
+        print(f"    truncated: prompt {stats['prompt_truncated']} "
+              f"({stats['prompt_truncated'] / n * 100:.1f}%), "
+              f"chosen {stats['chosen_truncated']}, rejected {stats['rejected_truncated']}, "
+              f"identical after truncation {stats['identical_after_truncation']}")
+
+    if not manifest['splits']:
+        print(f'  No train.jsonl found in {args.data_dir}')
+        return 1
+
+    manifest['elapsed_seconds'] = round(time.time() - start, 2)
+    with open(output_dir / PREP_MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f'\n  Prepared DPO data: {output_dir}')
+    print(f'  Train: python training/train_dpo.py --model {args.model or "<model>"} '
+          f'--data-dir {output_dir}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Training Telemetry — ChiroClickCRM AI Training Pipeline
+
+Per-optimizer-step metrics for SFT runs, written as a compact time series:
+tokens/sec, samples/sec, padding ratio, loss, learning rate, grad norm, host
+RSS and device memory. One CSV per run next to the training log
+(logs/metrics-<model>-<timestamp>.csv, plus a .parquet copy when pyarrow is
+installed). monitor.py shows the latest row; the `report` command summarizes
+and compares runs (e.g. packing vs. no-packing, or a weekend run against a
+baseline).
+
+How it hooks in: a counting wrapper around the trainer's data collator sees
+every batch (real vs. padded tokens, samples), and a TrainerCallback turns
+those counts into one row per optimizer step. The recorder itself has no
+torch/transformers dependency, so `simulate` exercises it on CPU.
+
+Usage:
+    python training/telemetry.py report ../logs/metrics-fast-20260101-220000.csv
+    python training/telemetry.py report runA.csv runB.csv --baseline runA.csv
+    python training/telemetry.py simulate --out /tmp/sim.csv --steps 200 --packing
+
+    from telemetry import TelemetryRecorder, attach_telemetry
+"""
+
+import argparse
+import csv
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+FIELDS = [
+    'time', 'elapsed_s', 'attempt', 'step', 'epoch', 'step_seconds',
+    'samples', 'tokens', 'padded_tokens', 'tokens_per_sec', 'samples_per_sec',
+    'padding_ratio', 'loss', 'eval_loss', 'learning_rate', 'grad_norm',
+    'host_rss_mb', 'gpu_alloc_mb', 'gpu_reserved_mb', 'gpu_peak_mb',
+]
+
+FLUSH_EVERY = 10
+
+
+# ============================================================
+# Memory probes
+# ============================================================
+
+def host_rss_mb():
+    """Resident set size of this process in MB (None if unavailable)."""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 1024 ** 2
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def device_memory_mb():
+    """(allocated, reserved, peak) CUDA memory in MB, or (None, None, None)."""
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return (torch.cuda.memory_allocated(0) / 1024 ** 2,
+                    torch.cuda.memory_reserved(0) / 1024 ** 2,
+                    torch.cuda.max_memory_allocated(0) / 1024 ** 2)
+    except Exception:
+        pass
+    return None, None, None
+
+
+# ============================================================
+# Sink + recorder (no ML dependencies)
+# ============================================================
+
+class MetricsSink:
+    """Append-only CSV time series; optional Parquet copy on close."""
+
+    def __init__(self, path, fields=FIELDS):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fields = fields
+        new_file = not self.path.exists() or self.path.stat().st_size == 0
+        self._file = open(self.path, 'a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=fields, extrasaction='ignore')
+        if new_file:
+            self._writer.writeheader()
+        self._unflushed = 0
+
+    def write(self, row):
+        self._writer.writerow({k: _fmt(row.get(k)) for k in self.fields})
+        self._unflushed += 1
+        if self._unflushed >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._unflushed = 0
+
+    def close(self, parquet=True):
+        if self._file.closed:
+            return
+        self._file.close()
+        if parquet:
+            write_parquet_copy(self.path)
+
+
+def _fmt(value):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f'{value:.3f}' if abs(value) >= 1e6 else f'{value:.6g}'
+    return value
+
+
+def write_parquet_copy(csv_path):
+    """Write <run>.parquet next to the CSV if pyarrow is available."""
+    try:
+        import pyarrow.csv as pacsv
+        import pyarrow.parquet as pq
+    except ImportError:
+        return None
+    out = Path(csv_path).with_suffix('.parquet')
+    pq.write_table(pacsv.read_csv(str(csv_path)), str(out), compression='zstd')
+    return out
+
+
+class TelemetryRecorder:
+    """Accumulates batch counts and emits one row per optimizer step.
+
+    Call order per step: on_batch() for every micro-batch, step_end() once
+    per optimizer step, log() when the trainer logs loss/eval metrics for
+    that step. A step's row is written once the next step starts (so late
+    loss/eval values land in the right row) or on close().
+    """
+
+    def __init__(self, sink, clock=time.time, probe_memory=True):
+        self.sink = sink
+        self.clock = clock
+        self.probe_memory = probe_memory
+        self.attempt = 1
+        self.start = clock()
+        self.last_step_time = self.start
+        self._reset_counts()
+        self.pending = None
+        self.rows = 0
+
+    def _reset_counts(self):
+        self.samples = 0
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def on_batch(self, real_tokens, padded_tokens, samples):
+        self.tokens += int(real_tokens)
+        self.padded_tokens += int(padded_tokens)
+        self.samples += int(samples)
+
+    def step_end(self, step, epoch=None, learning_rate=None):
+        self._flush_pending()
+        now = self.clock()
+        seconds = max(now - self.last_step_time, 1e-9)
+        row = {
+            'time': round(now, 3),
+            'elapsed_s': round(now - self.start, 3),
+            'attempt': self.attempt,
+            'step': step,
+            'epoch': epoch,
+            'step_seconds': seconds,
+            'samples': self.samples,
+            'tokens': self.tokens,
+            'padded_tokens': self.padded_tokens,
+            'tokens_per_sec': self.tokens / seconds,
+            'samples_per_sec': self.samples / seconds,
+            'padding_ratio': 1 - self.tokens / self.padded_tokens if self.padded_tokens else None,
+            'learning_rate': learning_rate,
+        }
+        if self.probe_memory:
+            row['host_rss_mb'] = host_rss_mb()
+            row['gpu_alloc_mb'], row['gpu_reserved_mb'], row['gpu_peak_mb'] = device_memory_mb()
+        self.pending = row
+        self.last_step_time = now
+        self._reset_counts()
+
+    def log(self, step, logs):
+        """Merge trainer log values (loss, eval_loss, grad_norm, ...) into the step's row."""
+        if self.pending is None or self.pending['step'] != step:
+            return
+        for key in ('loss', 'eval_loss', 'grad_norm', 'learning_rate'):
+            if logs.get(key) is not None:
+                self.pending[key] = logs[key]
+
+    def skip_interval(self):
+        """Discard counts/time since the last step (evaluation, checkpoint save)."""
+        self._reset_counts()
+        self.last_step_time = self.clock()
+
+    def new_attempt(self):
+        """The trainer was recreated (OOM retry); keep writing to the same series."""
+        self._flush_pending()
+        self.attempt += 1
+        self.skip_interval()
+
+    def _flush_pending(self):
+        if self.pending is not None:
+            self.sink.write(self.pending)
+            self.rows += 1
+            self.pending = None
+
+    def close(self):
+        self._flush_pending()
+        self.sink.close()
+
+
+# ============================================================
+# Hugging Face Trainer integration
+# ============================================================
+
+class CountingCollator:
+    """Wraps a data collator and reports real/padded tokens per batch."""
+
+    def __init__(self, collator, recorder, pad_token_id=None):
+        self.collator = collator
+        self.recorder = recorder
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        input_ids = batch.get('input_ids')
+        if input_ids is None:
+            return batch
+        padded = input_ids.numel()
+        mask = batch.get('attention_mask')
+        if mask is not None:
+            real = int(mask.sum())
+        elif self.pad_token_id is not None:
+            real = int((input_ids != self.pad_token_id).sum())
+        else:
+            real = padded
+        samples = input_ids.shape[0]
+        position_ids = batch.get('position_ids')
+        if position_ids is not None and mask is None:
+            samples = int((position_ids == 0).sum())  # packed / padding-free batches
+        self.recorder.on_batch(real, padded, samples)
+        return batch
+
+    def __getattr__(self, name):
+        return getattr(self.collator, name)
+
+
+def make_callback(recorder):
+    """TrainerCallback feeding the recorder (imports transformers lazily)."""
+    from transformers import TrainerCallback
+
+    class TelemetryCallback(TrainerCallback):
+        def on_step_end(self, args, state, control, **kwargs):
+            lr = None
+            scheduler = kwargs.get('lr_scheduler')
+            if scheduler is not None:
+                try:
+                    lr = scheduler.get_last_lr()[0]
+                except Exception:
+                    pass
+            recorder.step_end(state.global_step, epoch=state.epoch, learning_rate=lr)
+
+        def on_log(self, args, state, control, logs=None, **kwargs):
+            recorder.log(state.global_step, logs or {})
+
+        def on_evaluate(self, args, state, control, **kwargs):
+            recorder.skip_interval()
+
+        def on_save(self, args, state, control, **kwargs):
+            recorder.skip_interval()
+
+        def on_train_end(self, args, state, control, **kwargs):
+            recorder._flush_pending()
+            recorder.sink.flush()
+
+    return TelemetryCallback()
+
+
+def attach_telemetry(trainer, recorder, pad_token_id=None):
+    """Install the counting collator and callback on a (new) trainer."""
+    trainer.data_collator = CountingCollator(trainer.data_collator, recorder, pad_token_id)
+    trainer.add_callback(make_callback(recorder))
+    return trainer
+
+
+def metrics_path_for(log_file):
+    """logs/train-<model>-<ts>.log -> logs/metrics-<model>-<ts>.csv"""
+    log_file = Path(log_file)
+    return log_file.with_name(log_file.stem.replace('train-', 'metrics-', 1) + '.csv')
+
+
+# ============================================================
+# Reading + report
+# ============================================================
+
+def read_metrics(path):
+    """Rows of a metrics CSV (or .parquet) as dicts with floats where possible."""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        import pyarrow.parquet as pq
+        raw = pq.read_table(str(path)).to_pylist()
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            raw = list(csv.DictReader(f))
+    rows = []
+    for r in raw:
+        rows.append({k: _num(v) for k, v in r.items()})
+    return rows
+
+
+def _num(value):
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+
+def summarize(rows, warmup_steps=5):
+    """Throughput/memory summary of one run (skips the first warmup steps)."""
+    steady = [r for r in rows if (r.get('step') or 0) > warmup_steps] or rows
+    tps = [r['tokens_per_sec'] for r in steady if r.get('tokens_per_sec') is not None]
+    sps = [r['samples_per_sec'] for r in steady if r.get('samples_per_sec') is not None]
+    pad = [r['padding_ratio'] for r in steady if r.get('padding_ratio') is not None]
+    losses = [r['loss'] for r in rows if r.get('loss') is not None]
+    evals = [r['eval_loss'] for r in rows if r.get('eval_loss') is not None]
+    peak_gpu = [r['gpu_peak_mb'] for r in rows if r.get('gpu_peak_mb') is not None]
+    rss = [r['host_rss_mb'] for r in rows if r.get('host_rss_mb') is not None]
+    total_tokens = sum(r.get('tokens') or 0 for r in rows)
+    return {
+        'steps': len(rows),
+        'wall_minutes': (rows[-1]['elapsed_s'] / 60) if rows and rows[-1].get('elapsed_s') else 0,
+        'total_tokens': int(total_tokens),
+        'tokens_per_sec_median': statistics.median(tps) if tps else None,
+        'tokens_per_sec_p10': _percentile(tps, 10),
+        'samples_per_sec_median': statistics.median(sps) if sps else None,
+        'padding_ratio_mean': statistics.fmean(pad) if pad else None,
+        'final_loss': losses[-1] if losses else None,
+        'best_eval_loss': min(evals) if evals else None,
+        'peak_gpu_mb': max(peak_gpu) if peak_gpu else None,
+        'peak_host_rss_mb': max(rss) if rss else None,
+    }
+
+
+def format_report(summaries, baseline=None, threshold=0.10):
+    """Side-by-side table of run summaries; flags throughput regressions vs. baseline."""
+    def fmt(v, spec):
+        if isinstance(v, (int, float)):
+            return format(v, spec)
+        return '-'.rjust(int(spec.split('.')[0]))
+
+    lines = [f"  {'Run':<38} {'steps':>6} {'tok/s':>9} {'p10':>9} {'pad%':>6} "
+             f"{'loss':>7} {'eval':>7} {'GPU MB':>8} {'RSS MB':>8}"]
+    base_tps = summaries[baseline]['tokens_per_sec_median'] if baseline in summaries else None
+    for name, s in summaries.items():
+        pad = s['padding_ratio_mean'] * 100 if s['padding_ratio_mean'] is not None else None
+        line = (f"  {name[:38]:<38} {s['steps']:>6} {fmt(s['tokens_per_sec_median'], '9.0f')} "
+                f"{fmt(s['tokens_per_sec_p10'], '9.0f')} {fmt(pad, '6.1f')} "
+                f"{fmt(s['final_loss'], '7.4f')} {fmt(s['best_eval_loss'], '7.4f')} "
+                f"{fmt(s['peak_gpu_mb'], '8.0f')} {fmt(s['peak_host_rss_mb'], '8.0f')}")
+        tps = s['tokens_per_sec_median']
+        if base_tps and tps is not None and name != baseline:
+            change = tps / base_tps - 1
+            flag = '  REGRESSION' if change < -threshold else ''
+            line += f"  ({change:+.1%} vs baseline){flag}"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+# ============================================================
+# Simulation (CPU only)
+# ============================================================
+
+def simulate(out_path, steps=100, batch_size=4, grad_accum=4, seq_len=2048,
+             packing=False, seed=42):
+    """Drive the recorder with synthetic batches and a fake clock."""
+    rng = random.Random(seed)
+    clock_now = [1_700_000_000.0]
+    recorder = TelemetryRecorder(MetricsSink(out_path), clock=lambda: clock_now[0], probe_memory=False)
+    loss = 2.5
+    for step in range(1, steps + 1):
+        for _ in range(grad_accum):
+            lengths = [min(seq_len, int(rng.lognormvariate(6.3, 0.6))) for _ in range(batch_size)]
+            if packing:
+                real, padded, samples = int(sum(lengths) * 0.97), seq_len * max(1, sum(lengths) // seq_len), batch_size
+                padded = max(padded, real)
+            else:
+                real, padded, samples = sum(lengths), max(lengths) * batch_size, batch_size
+            recorder.on_batch(real, padded, samples)
+            clock_now[0] += padded / 6000.0  # compute scales with padded positions
+        recorder.step_end(step, epoch=step / steps, learning_rate=1.5e-4 * (1 - step / steps))
+        loss = max(0.3, loss * 0.985 + rng.uniform(-0.02, 0.02))
+        if step % 10 == 0:
+            recorder.log(step, {'loss': round(loss, 4)})
+    recorder.close()
+    return out_path
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Training telemetry report / simulation')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    rep = sub.add_parser('report', help='Summarize and compare metrics files')
+    rep.add_argument('files', nargs='+', type=Path)
+    rep.add_argument('--baseline', type=Path, help='Run to compare throughput against')
+    rep.add_argument('--threshold', type=float, default=0.10,
+                     help='Flag median tokens/sec drops larger than this fraction (default: 0.10)')
+
+    sim = sub.add_parser('simulate', help='Write a simulated metrics file (CPU only)')
+    sim.add_argument('--out', type=Path, required=True)
+    sim.add_argument('--steps', type=int, default=100)
+    sim.add_argument('--batch-size', type=int, default=4)
+    sim.add_argument('--grad-accum', type=int, default=4)
+    sim.add_argument('--seq-len', type=int, default=2048)
+    sim.add_argument('--packing', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.command == 'simulate':
+        simulate(args.out, steps=args.steps, batch_size=args.batch_size,
+                 grad_accum=args.grad_accum, seq_len=args.seq_len, packing=args.packing)
+        print(f'  Wrote {args.out}')
+        print(format_report({args.out.name: summarize(read_metrics(args.out))}))
+        return 0
+
+    files = list(args.files)
+    if args.baseline and args.baseline not in files:
+        files.insert(0, args.baseline)
+    summaries = {f.name: summarize(read_metrics(f)) for f in files}
+    print(format_report(summaries, baseline=args.baseline.name if args.baseline else None,
+                        threshold=args.threshold))
+    regressions = args.baseline and any(
+        s['tokens_per_sec_median'] is not None
+        and summaries[args.baseline.name]['tokens_per_sec_median']
+        and s['tokens_per_sec_median'] < summaries[args.baseline.name]['tokens_per_sec_median'] * (1 - args.threshold)
+        for name, s in summaries.items() if name != args.baseline.name
+    )
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
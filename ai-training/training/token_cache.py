@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized Training Cache — ChiroClick LoRA Fine-Tuning
+
+Applies the tokenizer's chat template to every ChatML example ONCE per
+(tokenizer, template, source data) and stores the token ids memory-mappable:
+
+    <data-dir>/.cache/tok-<key>/<split>.ids.npy       flat uint32 token ids
+    <data-dir>/.cache/tok-<key>/<split>.offsets.npy   int64, len = rows + 1
+    <data-dir>/.cache/tok-<key>/<split>.categories.json  category per row
+    <data-dir>/.cache/tok-<key>/<split>.manifest.json source sha256, stats
+
+Relaunching after an OOM retry (or with different batch settings) reuses the
+cache instead of re-templating and re-tokenizing. The packing planners below
+turn the cached lengths into length-bucketed batches or best-fit-decreasing
+packs, with a padding-waste report for each.
+
+Runs on CPU; any HF tokenizer works (a tiny one is enough for a smoke test).
+
+Usage:
+    python token_cache.py --tokenizer Qwen/Qwen2.5-1.5B-Instruct --data-dir ../data/processed-v8/combined-sft
+    python token_cache.py --model fast --data-dir ../data/curated --max-seq-length 2048 --batch-size 4
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR.parent / 'scripts'))
+from dataset_cache import CACHE_DIRNAME, default_category, file_sha256
+
+TOKEN_CACHE_VERSION = 2
+TOKENIZE_BATCH = 256
+
+
+# ============================================================
+# Cache keys
+# ============================================================
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash everything about a tokenizer that changes the token ids.
+
+    Name/path, vocabulary size, special tokens and the chat template text.
+    """
+    parts = [
+        str(getattr(tokenizer, 'name_or_path', '')),
+        str(len(tokenizer)),
+        str(getattr(tokenizer, 'eos_token', '')),
+        str(getattr(tokenizer, 'bos_token', '')),
+        str(getattr(tokenizer, 'chat_template', '') or ''),
+        type(tokenizer).__name__,
+    ]
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def cache_dir_for(data_dir, tokenizer):
+    """Directory holding the token cache for this data dir + tokenizer."""
+    return Path(data_dir) / CACHE_DIRNAME / f'tok-{tokenizer_fingerprint(tokenizer)}'
+
+
+# ============================================================
+# Templating
+# ============================================================
+
+def render_chat(messages, tokenizer):
+    """Render messages to text with the tokenizer's chat template.
+
+    Mirrors train_unsloth.format_chat_template, including its manual ChatML
+    fallback, so cached ids match what SFTTrainer would have produced.
+    """
+    try:
+        return tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=False,
+        )
+    except Exception:
+        text = ''
+        for msg in messages:
+            role = msg.get('role', 'user')
+            if role in ('system', 'user', 'assistant'):
+                text += f"<|im_start|>{role}\n{msg.get('content', '')}<|im_end|>\n"
+        return text
+
+
+def _iter_messages(jsonl_path, fallback_category=None):
+    """Yield (messages, category) for every ChatML record in a JSONL file."""
+    with open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            messages = item.get('messages') or []
+            if messages:
+                yield messages, default_category(item, fallback_category)
+
+
+# ============================================================
+# Build / load
+# ============================================================
+
+def _split_paths(cache_dir, split):
+    return (cache_dir / f'{split}.ids.npy',
+            cache_dir / f'{split}.offsets.npy',
+            cache_dir / f'{split}.manifest.json')
+
+
+def _categories_path(cache_dir, split):
+    return cache_dir / f'{split}.categories.json'
+
+
+def _manifest_matches(manifest_path, source_hash):
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get('version') != TOKEN_CACHE_VERSION:
+        return None
+    if manifest.get('source_hash') != source_hash:
+        return None
+    return manifest
+
+
+def build_split(jsonl_path, tokenizer, cache_dir, min_chars=10, force=False):
+    """Tokenize one JSONL split into the cache. Returns the manifest dict.
+
+    Skips work entirely when a manifest for the same source hash exists.
+    Examples whose rendered text is <= min_chars are dropped, matching the
+    empty-example filter in train_unsloth.train(). Rows without
+    metadata.category are tagged with the data directory name.
+    """
+    import numpy as np
+
+    jsonl_path = Path(jsonl_path)
+    split = jsonl_path.stem
+    ids_path, offsets_path, manifest_path = _split_paths(cache_dir, split)
+    source_hash = file_sha256(jsonl_path)
+
+    if not force:
+        manifest = _manifest_matches(manifest_path, source_hash)
+        if (manifest and ids_path.exists() and offsets_path.exists()
+                and _categories_path(cache_dir, split).exists()):
+            manifest['reused'] = True
+            return manifest
+
+    start = time.time()
+    chunks = []
+    lengths = []
+    categories = []
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        encoded = tokenizer(batch, add_special_tokens=False)['input_ids']
+        for ids in encoded:
+            chunks.append(np.asarray(ids, dtype=np.uint32))
+            lengths.append(len(ids))
+        batch.clear()
+
+    dropped = 0
+    for messages, category in _iter_messages(jsonl_path, jsonl_path.parent.name):
+        text = render_chat(messages, tokenizer)
+        if len(text) <= min_chars:
+            dropped += 1
+            continue
+        categories.append(category)
+        batch.append(text)
+        if len(batch) >= TOKENIZE_BATCH:
+            flush()
+    flush()
+
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    if lengths:
+        np.cumsum(np.asarray(lengths, dtype=np.int64), out=offsets[1:])
+    ids = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.uint32)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    for path, arr in ((ids_path, ids), (offsets_path, offsets)):
+        tmp = path.with_suffix('.tmp.npy')
+        np.save(tmp, arr)
+        os.replace(tmp, path)
+    with open(_categories_path(cache_dir, split), 'w', encoding='utf-8') as f:
+        json.dump(categories, f, ensure_ascii=False)
+
+    manifest = {
+        'version': TOKEN_CACHE_VERSION,
+        'split': split,
+        'source': str(jsonl_path),
+        'source_hash': source_hash,
+        'tokenizer': str(getattr(tokenizer, 'name_or_path', '')),
+        'tokenizer_fingerprint': tokenizer_fingerprint(tokenizer),
+        'rows': len(lengths),
+        'dropped_short': dropped,
+        'total_tokens': int(offsets[-1]),
+        'max_length': int(max(lengths)) if lengths else 0,
+        'build_seconds': round(time.time() - start, 2),
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'reused': False,
+    }
+    tmp = manifest_path.with_suffix('.json.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+class TokenCache:
+    """Memory-mapped view of one cached split.
+
+    ids/offsets are np.memmap-backed; sequence(i) is a zero-copy slice.
+    """
+
+    def __init__(self, cache_dir, split):
+        import numpy as np
+        ids_path, offsets_path, manifest_path = _split_paths(Path(cache_dir), split)
+        self.ids = np.load(ids_path, mmap_mode='r')
+        self.offsets = np.load(offsets_path, mmap_mode='r')
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        with open(_categories_path(Path(cache_dir), split), 'r', encoding='utf-8') as f:
+            self.categories = json.load(f)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def lengths(self):
+        import numpy as np
+        return np.diff(self.offsets)
+
+    def sequence(self, i):
+        return self.ids[self.offsets[i]:self.offsets[i + 1]]
+
+    def to_hf_dataset(self, max_length=None):
+        """Build a `datasets.Dataset` with input_ids + length columns.
+
+        The Arrow list column wraps the cached ids buffer directly (no
+        per-row Python lists); only the offsets are converted. With
+        max_length, rows are clipped in one vectorized gather, and that gather
+        copies the ids only when some row is actually longer.
+
+        SFTTrainer skips its own tokenization when `input_ids` is present;
+        the `length` column feeds TrainingArguments.group_by_length.
+        """
+        import numpy as np
+        import pyarrow as pa
+        from datasets import Dataset
+
+        ids, offsets = self.ids, np.asarray(self.offsets)
+        lengths = np.diff(offsets)
+        if max_length and len(lengths) and lengths.max() > max_length:
+            row = np.repeat(np.arange(len(lengths)), lengths)
+            keep = np.arange(len(ids)) - offsets[row] < max_length
+            ids = ids[keep]
+            lengths = np.minimum(lengths, max_length)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+
+        values = pa.array(np.asarray(ids))
+        if offsets[-1] <= np.iinfo(np.int32).max:
+            input_ids = pa.ListArray.from_arrays(pa.array(offsets.astype(np.int32)), values)
+        else:
+            input_ids = pa.LargeListArray.from_arrays(pa.array(offsets), values)
+        table = pa.table({'input_ids': input_ids, 'length': pa.array(lengths.astype(np.int64))})
+        return Dataset(table)
+
+
+def build_token_cache(data_dir, tokenizer, splits=('train', 'validation'), force=False):
+    """Tokenize every available split of a data dir. Returns {split: manifest}."""
+    data_dir = Path(data_dir)
+    cache_dir = cache_dir_for(data_dir, tokenizer)
+    manifests = {}
+    for split in splits:
+        path = data_dir / f'{split}.jsonl'
+        if path.exists():
+            manifests[split] = build_split(path, tokenizer, cache_dir, force=force)
+    return cache_dir, manifests
+
+
+# ============================================================
+# Packing plans
+# ============================================================
+
+def plan_length_buckets(lengths, max_length, batch_size):
+    """Group examples into batches of similar length (no cross-example packing).
+
+    Lengths are clipped to max_length first, since longer examples are
+    truncated to it. Returns a list of batches, each a list of example
+    indices, sorted by clipped length so each batch pads only to its own
+    longest member.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: min(int(lengths[i]), max_length))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def plan_best_fit_decreasing(lengths, max_length):
+    """Pack examples into max_length bins using best-fit decreasing.
+
+    Each example goes into the fullest bin that still has room; examples
+    longer than max_length get a bin of their own (they will be truncated).
+    Returns a list of bins, each a list of example indices.
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    bins = []
+    # Sorted (remaining_capacity, bin_id) so bisect finds the tightest fit
+    free = []
+    for idx in order:
+        n = min(int(lengths[idx]), max_length)
+        pos = bisect.bisect_left(free, (n, -1))
+        if pos < len(free):
+            remaining, bin_id = free.pop(pos)
+            bins[bin_id].append(idx)
+            remaining -= n
+        else:
+            bin_id = len(bins)
+            bins.append([idx])
+            remaining = max_length - n
+        if remaining > 0:
+            bisect.insort(free, (remaining, bin_id))
+    return bins
+
+
+def padding_report(lengths, max_length, batch_size):
+    """Compare padded-token waste across batching strategies.
+
+    naive:    dataset order, each batch padded to its longest member
+    bucketed: length-sorted batches (plan_length_buckets)
+    packed:   best-fit-decreasing bins of max_length, batch_size bins per step
+    """
+    truncated = sum(1 for n in lengths if int(n) > max_length)
+    lengths = [min(int(n), max_length) for n in lengths]
+    real = sum(lengths)
+
+    def batched_cost(batches):
+        return sum(max(lengths[i] for i in b) * len(b) for b in batches if b)
+
+    naive = [list(range(i, min(i + batch_size, len(lengths))))
+             for i in range(0, len(lengths), batch_size)]
+    buckets = plan_length_buckets(lengths, max_length, batch_size)
+    bins = plan_best_fit_decreasing(lengths, max_length)
+
+    report = {
+        'examples': len(lengths),
+        'real_tokens': real,
+        'max_length': max_length,
+        'batch_size': batch_size,
+        'truncated_examples': truncated,
+    }
+    for name, slots, steps in (
+        ('naive', batched_cost(naive), len(naive)),
+        ('bucketed', batched_cost(buckets), len(buckets)),
+        ('packed', len(bins) * max_length, -(-len(bins) // max(batch_size, 1))),
+    ):
+        report[name] = {
+            'slot_tokens': slots,
+            'padding_tokens': slots - real,
+            'waste_pct': round((slots - real) / slots * 100, 1) if slots else 0.0,
+            'steps': steps,
+        }
+    return report
+
+
+def format_padding_report(report):
+    """Render padding_report() as printable lines."""
+    lines = [
+        f"{report['examples']} examples, {report['real_tokens']:,} real tokens, "
+        f"max_length={report['max_length']}, batch={report['batch_size']}, "
+        f"truncated={report['truncated_examples']}",
+    ]
+    for name in ('naive', 'bucketed', 'packed'):
+        r = report[name]
+        lines.append(f"  {name:<9s} {r['slot_tokens']:>12,} slots  "
+                     f"{r['padding_tokens']:>12,} pad  {r['waste_pct']:>5.1f}% waste  "
+                     f"{r['steps']:>6d} steps")
+    return lines
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description='Pre-tokenize ChatML splits and report packing waste')
+    parser.add_argument('--data-dir', type=Path, required=True,
+                        help='Directory with train.jsonl / validation.jsonl')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--tokenizer', help='HF tokenizer name or local path')
+    group.add_argument('--model', help='Model key from train_unsloth.MODELS')
+    parser.add_argument('--max-seq-length', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--force', action='store_true', help='Rebuild even if cached')
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+
+    max_len = args.max_seq_length
+    if args.model:
+        from train_unsloth import MODELS
+        name = MODELS[args.model]['name']
+        max_len = max_len or MODELS[args.model]['max_seq_length']
+    else:
+        name = args.tokenizer
+    max_len = max_len or 2048
+
+    tokenizer = AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+    cache_dir, manifests = build_token_cache(args.data_dir, tokenizer, force=args.force)
+    if not manifests:
+        print(f'  No train/validation JSONL in {args.data_dir}')
+        return 1
+
+    print(f'  Token cache: {cache_dir}')
+    for split, m in manifests.items():
+        state = 'reused' if m.get('reused') else f"built in {m['build_seconds']}s"
+        print(f"  {split}: {m['rows']} rows, {m['total_tokens']:,} tokens, "
+              f"max {m['max_length']} ({state})")
+
+    train = TokenCache(cache_dir, 'train') if 'train' in manifests else None
+    if train is not None:
+        print('\n  Padding waste (train):')
+        report = padding_report(train.lengths.tolist(), max_len, args.batch_size)
+        for line in format_padding_report(report):
+            print(f'  {line}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
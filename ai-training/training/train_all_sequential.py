@@ -4,10 +4,16 @@ ChiroClick Sequential Training Pipeline
 Trains all 4 models one after another, deploys each to Ollama after completion.
 Designed to run unattended for 8-11 hours.
 
+With --parallel the same steps run as a resource-aware DAG (pipeline_dag.py):
+model N's merge/GGUF conversion, Ollama deploy and smoke test overlap with
+model N+1's training on the GPU.
+
 Usage:
     python train_all_sequential.py
     python train_all_sequential.py --skip fast  # Skip already-trained models
     python train_all_sequential.py --only fast medical  # Train specific models only
+    python train_all_sequential.py --parallel --resume
+    python train_all_sequential.py --parallel --dry-run  # Fake steps, CPU only
 """
 
 import argparse
@@ -56,12 +62,14 @@ MODELS_DIR = AI_TRAINING_DIR / 'models'
 LOGS_DIR = AI_TRAINING_DIR / 'logs'
 DATA_DIR = AI_TRAINING_DIR / 'data' / 'processed'
 PROGRESS_FILE = LOGS_DIR / 'training-progress.json'
+DRY_RUN_PROGRESS_FILE = LOGS_DIR / 'training-progress-dryrun.json'
+SCRIPTS_DIR = AI_TRAINING_DIR / 'scripts'
 
 
-def load_progress():
+def load_progress(path=PROGRESS_FILE):
     """Load training progress from file."""
-    if PROGRESS_FILE.exists():
-        with open(PROGRESS_FILE, 'r') as f:
+    if path.exists():
+        with open(path, 'r') as f:
             return json.load(f)
     return {'completed': [], 'failed': [], 'deployed': [], 'started_at': None}
 
@@ -236,15 +244,79 @@ def test_model(model_key, test_prompt):
         return False
 
 
+def merge_model(model_key):
+    """Merge the LoRA adapter into a GGUF (direct stream, else merged dir + convert)."""
+    if str(SCRIPTS_DIR) not in sys.path:
+        sys.path.insert(0, str(SCRIPTS_DIR))
+    from merge_and_deploy import direct_gguf, merge_lora_model, convert_to_gguf
+
+    if direct_gguf(model_key) is not None:
+        return True
+    merged_dir = merge_lora_model(model_key, low_memory=True)
+    return merged_dir is not None and convert_to_gguf(model_key, merged_dir) is not None
+
+
+def deploy_gguf(model_key):
+    """ollama create from the GGUF written by merge_model."""
+    from merge_and_deploy import deploy_to_ollama
+    from train_unsloth import MODELS
+    merged_dir = MODELS_DIR / f"{MODELS[model_key]['output_name']}-merged"
+    return deploy_to_ollama(model_key, merged_dir)
+
+
+def run_parallel(models_to_train, progress, args):
+    """Run train -> merge -> deploy -> test for every model as a resource-aware DAG."""
+    from pipeline_dag import DagScheduler, model_pipeline, parse_slots, dry_run_steps, Step
+
+    if args.dry_run:
+        steps = dry_run_steps([m['key'] for m in models_to_train])
+        progress_path = DRY_RUN_PROGRESS_FILE
+    else:
+        steps = []
+        for model_info in models_to_train:
+            key = model_info['key']
+            train = lambda m=model_info: train_model(m)
+            if args.no_deploy:
+                steps.append(Step(f'train:{key}', train, model=key))
+                continue
+            steps += model_pipeline(
+                key, train,
+                lambda k=key: merge_model(k),
+                lambda k=key: deploy_gguf(k),
+                lambda k=key, p=model_info['test_prompt']: test_model(k, p),
+            )
+        progress_path = PROGRESS_FILE
+
+    # Progress files from sequential runs only know completed models
+    step_state = progress.setdefault('steps', {})
+    for key in progress.get('completed', []):
+        step_state.setdefault(f'train:{key}', {'status': 'done'})
+
+    scheduler = DagScheduler(steps, slots=parse_slots(args.slots),
+                             progress=progress, progress_path=progress_path)
+    status = scheduler.run()
+    summary = scheduler.summary()
+    print(f"\n  Step time (sequential sum): {summary['sequential_seconds'] / 60:.1f} min")
+    print(f"  Wall time (DAG makespan):   {summary['makespan_seconds'] / 60:.1f} min")
+    return status
+
+
 def main():
     parser = argparse.ArgumentParser(description='Train all ChiroClick models sequentially')
     parser.add_argument('--skip', nargs='+', default=[], help='Models to skip (e.g., fast medical)')
     parser.add_argument('--only', nargs='+', default=[], help='Train only these models')
     parser.add_argument('--no-deploy', action='store_true', help='Skip Ollama deployment')
     parser.add_argument('--resume', action='store_true', help='Resume from last progress checkpoint')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Overlap merge/deploy of model N with training of model N+1')
+    parser.add_argument('--slots', default='',
+                        help='Resource slots for --parallel, e.g. gpu=1,cpu_ram=2,disk_io=1,ollama=1')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='With --parallel: run fake steps to check scheduling (CPU only)')
     args = parser.parse_args()
 
-    progress = load_progress() if args.resume else {
+    progress_file = DRY_RUN_PROGRESS_FILE if args.dry_run else PROGRESS_FILE
+    progress = load_progress(progress_file) if args.resume else {
         'completed': [], 'failed': [], 'deployed': [],
         'started_at': datetime.now().isoformat(),
     }
@@ -255,9 +327,12 @@ def main():
         models_to_train = [m for m in models_to_train if m['key'] in args.only]
     if args.skip:
         models_to_train = [m for m in models_to_train if m['key'] not in args.skip]
-    if args.resume:
+    if args.resume and not args.parallel:
         models_to_train = [m for m in models_to_train if m['key'] not in progress['completed']]
 
+    if args.dry_run and not args.parallel:
+        parser.error('--dry-run requires --parallel')
+
     print(f"\n{'#'*70}")
     print(f"  ChiroClick Sequential Training Pipeline")
     print(f"  Models to train: {[m['key'] for m in models_to_train]}")
@@ -266,6 +341,17 @@ def main():
 
     overall_start = time.time()
 
+    if args.parallel:
+        status = run_parallel(models_to_train, progress, args)
+        failed_steps = [name for name, st in status.items() if st != 'done']
+        print(f"\n{'#'*70}")
+        print(f"  PARALLEL PIPELINE COMPLETE in {(time.time() - overall_start) / 60:.0f} minutes")
+        print(f"  Completed: {progress.get('completed', [])}")
+        print(f"  Deployed: {progress.get('deployed', [])}")
+        print(f"  Not done: {failed_steps or 'none'}")
+        print(f"{'#'*70}\n")
+        return 0 if not failed_steps else 1
+
     for i, model_info in enumerate(models_to_train, 1):
         key = model_info['key']
         print(f"\n[{i}/{len(models_to_train)}] Starting {key}...")
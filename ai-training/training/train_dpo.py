@@ -27,6 +27,9 @@ import time
 from datetime import datetime
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from dataset_cache import load_hf_dataset
+
 # ============================================================
 # Model Configurations (same as SFT)
 # ============================================================
@@ -131,6 +134,17 @@ def load_dpo_dataset(data_dir, logger):
         logger.error('Generate DPO pairs first: python scripts/export_dpo_pairs.py')
         sys.exit(1)
 
+    # Prefer the memory-mapped columnar cache (scripts/dataset_cache.py)
+    if os.path.exists(val_path):
+        cached_train = load_hf_dataset(train_path)
+        cached_val = load_hf_dataset(val_path) if cached_train is not None else None
+        if cached_train is not None and cached_val is not None:
+            cached_train = cached_train.remove_columns(['category', 'source'])
+            cached_val = cached_val.remove_columns(['category', 'source'])
+            logger.info(f'Loaded {len(cached_train)} training / {len(cached_val)} validation '
+                        f'pairs from columnar cache')
+            return cached_train, cached_val
+
     # Load training data
     train_data = []
     with open(train_path, 'r', encoding='utf-8') as f:
@@ -168,9 +182,61 @@ def load_dpo_dataset(data_dir, logger):
     train_dataset = Dataset.from_list(train_data)
     val_dataset = Dataset.from_list(val_data)
 
+    # Flags written by prepare_dpo.py --on-diverge flag are not trainer input
+    if '_dpo_flags' in train_dataset.column_names:
+        train_dataset = train_dataset.remove_columns(['_dpo_flags'])
+    if '_dpo_flags' in val_dataset.column_names:
+        val_dataset = val_dataset.remove_columns(['_dpo_flags'])
+
     return train_dataset, val_dataset
 
 
+def load_prep_manifest(data_dir, max_length, logger):
+    """Load prepare_dpo.py's manifest if data_dir was preprocessed.
+
+    Logs the truncation report and warns when the prep was done for a
+    different max_length than this run will use.
+    """
+    manifest_path = os.path.join(data_dir, 'dpo-prep-manifest.json')
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    logger.info(f'Prepared DPO data (tokenizer {manifest.get("tokenizer")}, '
+                f'max_length {manifest.get("max_length")})')
+    for split, st in manifest.get('splits', {}).items():
+        logger.info(f'  {split}: {st["kept"]}/{st["pairs"]} pairs kept, '
+                    f'{st["dropped"]} identical after truncation dropped, '
+                    f'{st["shard_padding_pct"]}% shard padding')
+    if manifest.get('max_length') != max_length:
+        logger.warning(f'Prep used max_length={manifest.get("max_length")} but training '
+                       f'uses {max_length} — re-run training/prepare_dpo.py')
+    return manifest
+
+
+def shard_ranges(manifest, n):
+    """[start, end) row ranges of the prepared train shards, clipped to n rows.
+
+    Uses the per-shard sizes prepare_dpo.py records; older manifests only have
+    shard_size, so the file is cut into runs of that size.
+    """
+    stats = manifest.get('splits', {}).get('train', {})
+    sizes = stats.get('shard_sizes')
+    if not sizes:
+        size = max(int(manifest.get('shard_size') or 1), 1)
+        sizes = [size] * -(-n // size)
+    ranges, start = [], 0
+    for size in sizes:
+        if start >= n:
+            break
+        ranges.append((start, min(start + size, n)))
+        start += size
+    if start < n:
+        ranges.append((start, n))
+    return ranges
+
+
 def train_dpo(model_key, data_dir, args, logger):
     """Run DPO training on a model."""
     import torch
@@ -206,6 +272,7 @@ def train_dpo(model_key, data_dir, args, logger):
 
     # Load dataset
     train_dataset, val_dataset = load_dpo_dataset(data_dir, logger)
+    prep_manifest = load_prep_manifest(data_dir, config['max_seq_length'], logger)
 
     # Quantization config (4-bit NF4)
     bnb_config = BitsAndBytesConfig(
@@ -298,8 +365,44 @@ def train_dpo(model_key, data_dir, args, logger):
         seed=42,
     )
 
-    # Create DPO trainer
-    trainer = DPOTrainer(
+    # Create DPO trainer (length-sorted shards from prepare_dpo.py stay together;
+    # the shard order is reshuffled every epoch)
+    trainer_cls = DPOTrainer
+    if prep_manifest and prep_manifest.get('length_sorted'):
+        from torch.utils.data import Sampler
+
+        ranges = shard_ranges(prep_manifest, len(train_dataset))
+
+        class ShardShuffleSampler(Sampler):
+            """Yields whole shards in an order drawn from seed + epoch."""
+
+            def __init__(self, seed):
+                self.seed = seed
+                self.epoch = 0
+
+            def set_epoch(self, epoch):
+                self.epoch = epoch
+
+            def __len__(self):
+                return ranges[-1][1] if ranges else 0
+
+            def __iter__(self):
+                generator = torch.Generator()
+                generator.manual_seed(self.seed + self.epoch)
+                # Trainer calls set_epoch() before each epoch; counting here
+                # keeps later epochs distinct if it does not
+                self.epoch += 1
+                for shard in torch.randperm(len(ranges), generator=generator).tolist():
+                    yield from range(*ranges[shard])
+
+        class ShardOrderDPOTrainer(DPOTrainer):
+            def _get_train_sampler(self, *args, **kwargs):
+                return ShardShuffleSampler(self.args.seed)
+
+        trainer_cls = ShardOrderDPOTrainer
+        logger.info(f'Using prepared shards ({len(ranges)}), shard order shuffled per epoch')
+
+    trainer = trainer_cls(
         model=model,
         args=dpo_config,
         train_dataset=train_dataset,
@@ -25,6 +25,10 @@ import time
 from datetime import datetime
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+from dataset_cache import load_hf_dataset
+from telemetry import metrics_path_for
+
 # ============================================================
 # Model Configurations
 # ============================================================
@@ -298,7 +302,7 @@ def load_model_with_lora(model_key, max_seq_length, logger):
 
 def load_dataset_from_dir(data_dir, logger):
     """Load training and validation datasets from a directory."""
-    from datasets import load_dataset
+    from datasets import DatasetDict, load_dataset
 
     data_dir = Path(data_dir)
     train_file = data_dir / 'train.jsonl'
@@ -309,13 +313,17 @@ def load_dataset_from_dir(data_dir, logger):
 
     logger.info(f"Loading datasets from: {data_dir}")
 
-    data_files = {'train': str(train_file)}
-    if val_file.exists():
-        data_files['validation'] = str(val_file)
-    else:
-        data_files['validation'] = str(train_file)
+    # Prefer the memory-mapped columnar cache (scripts/dataset_cache.py)
+    if not val_file.exists():
         logger.warning("No validation file found, using train for validation")
-
+        val_file = train_file
+    cached_train = load_hf_dataset(train_file)
+    cached_val = load_hf_dataset(val_file) if cached_train is not None else None
+    if cached_train is not None and cached_val is not None:
+        logger.info("Using columnar cache (.cache/*.arrow)")
+        return DatasetDict({'train': cached_train, 'validation': cached_val})
+
+    data_files = {'train': str(train_file), 'validation': str(val_file)}
     dataset = load_dataset('json', data_files=data_files)
 
     logger.info(f"Train examples: {len(dataset['train'])}")
@@ -352,6 +360,39 @@ def format_chat_template(example, tokenizer):
         return {"text": text}
 
 
+def load_tokenized_dataset(data_dir, tokenizer, seq_len, batch_size, logger):
+    """Load train/validation from the pre-tokenized cache (training/token_cache.py).
+
+    Tokenizes once per tokenizer/template/data hash; later launches and OOM
+    retries reuse the memory-mapped ids. Logs the padding-waste report for
+    the chosen sequence length and batch size.
+    """
+    from token_cache import (
+        TokenCache, build_token_cache, format_padding_report, padding_report,
+    )
+
+    data_dir = Path(data_dir)
+    if not (data_dir / 'train.jsonl').exists():
+        raise FileNotFoundError(f"Training file not found: {data_dir / 'train.jsonl'}")
+
+    splits = ('train', 'validation') if (data_dir / 'validation.jsonl').exists() else ('train',)
+    cache_dir, manifests = build_token_cache(data_dir, tokenizer, splits=splits)
+    for split, m in manifests.items():
+        state = 'reused' if m.get('reused') else f"built in {m['build_seconds']}s"
+        logger.info(f"Token cache {split}: {m['rows']} rows, {m['total_tokens']:,} tokens ({state})")
+
+    train_cache = TokenCache(cache_dir, 'train')
+    val_cache = TokenCache(cache_dir, 'validation') if 'validation' in manifests else train_cache
+    if 'validation' not in manifests:
+        logger.warning("No validation file found, using train for validation")
+
+    report = padding_report(train_cache.lengths.tolist(), seq_len, batch_size)
+    for line in format_padding_report(report):
+        logger.info(f"Padding: {line}")
+
+    return train_cache.to_hf_dataset(), val_cache.to_hf_dataset()
+
+
 # ============================================================
 # Training
 # ============================================================
@@ -370,6 +411,8 @@ def train(
     max_seq_length=None,
     resume_from_checkpoint=False,
     packing=True,
+    use_token_cache=False,
+    metrics_path=None,
 ):
     """Run the training pipeline. Returns (model, tokenizer, lora_path) or (None, None, None) on failure."""
     import torch
@@ -385,6 +428,7 @@ def train(
     logger.info(f"Output: {output_name}")
     logger.info(f"Low VRAM mode: {low_vram}")
     logger.info(f"Packing: {packing}")
+    logger.info(f"Token cache: {use_token_cache}")
     logger.info(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("=" * 60)
 
@@ -430,23 +474,28 @@ def train(
     logger.info(f"Trainable parameters: {trainable:,} / {total:,} ({100*trainable/total:.2f}%)")
     logger.info(f"Model load time: {load_time:.1f}s")
 
-    # Load dataset
-    dataset = load_dataset_from_dir(data_dir, logger)
-
-    # Format dataset
-    logger.info("Formatting dataset with chat template...")
-    formatted_train = dataset['train'].map(
-        lambda x: format_chat_template(x, tokenizer),
-        remove_columns=dataset['train'].column_names
-    )
-    formatted_val = dataset['validation'].map(
-        lambda x: format_chat_template(x, tokenizer),
-        remove_columns=dataset['validation'].column_names
-    )
+    if use_token_cache:
+        formatted_train, formatted_val = load_tokenized_dataset(
+            data_dir, tokenizer, seq_len, t_config['per_device_train_batch_size'], logger,
+        )
+    else:
+        # Load dataset
+        dataset = load_dataset_from_dir(data_dir, logger)
+
+        # Format dataset
+        logger.info("Formatting dataset with chat template...")
+        formatted_train = dataset['train'].map(
+            lambda x: format_chat_template(x, tokenizer),
+            remove_columns=dataset['train'].column_names
+        )
+        formatted_val = dataset['validation'].map(
+            lambda x: format_chat_template(x, tokenizer),
+            remove_columns=dataset['validation'].column_names
+        )
 
-    # Filter empty examples
-    formatted_train = formatted_train.filter(lambda x: len(x.get('text', '')) > 10)
-    formatted_val = formatted_val.filter(lambda x: len(x.get('text', '')) > 10)
+        # Filter empty examples
+        formatted_train = formatted_train.filter(lambda x: len(x.get('text', '')) > 10)
+        formatted_val = formatted_val.filter(lambda x: len(x.get('text', '')) > 10)
     logger.info(f"Formatted: {len(formatted_train)} train, {len(formatted_val)} val")
 
     # Detect bf16 support
@@ -489,6 +538,8 @@ def train(
         dataset_text_field="text",
         max_length=seq_len,
         packing=packing,
+        # Pre-tokenized cache carries a length column: batch similar lengths
+        group_by_length=use_token_cache and not packing,
     )
 
     # Create SFTTrainer
@@ -501,6 +552,14 @@ def train(
         args=sft_config,
     )
 
+    # Per-step throughput/memory time series (training/telemetry.py)
+    recorder = None
+    if metrics_path:
+        from telemetry import MetricsSink, TelemetryRecorder, attach_telemetry
+        recorder = TelemetryRecorder(MetricsSink(metrics_path))
+        attach_telemetry(trainer, recorder, pad_token_id=tokenizer.pad_token_id)
+        logger.info(f"Metrics: {metrics_path}")
+
     # Train with OOM recovery and signal handling
     logger.info("=" * 60)
     logger.info("STARTING TRAINING")
@@ -547,6 +606,10 @@ def train(
 
             retry_seq_len = ULTRA_LOW_VRAM_CONFIG['max_seq_length_override']
             logger.info(f"Retrying with seq_len={retry_seq_len}, batch=1, grad_accum=8")
+            logger.info("Tip: plan a fitting seq_len/batch on CPU first with "
+                        f"training/plan_seq_length.py --models {model_key} --data-dir {data_dir}")
+            if use_token_cache:
+                logger.info("Reusing pre-tokenized cache (no re-tokenization)")
 
             sft_config.per_device_train_batch_size = 1
             sft_config.gradient_accumulation_steps = 8
@@ -560,6 +623,9 @@ def train(
                 eval_dataset=formatted_val,
                 args=sft_config,
             )
+            if recorder is not None:
+                recorder.new_attempt()
+                attach_telemetry(trainer, recorder, pad_token_id=tokenizer.pad_token_id)
 
             try:
                 trainer.train()
@@ -580,6 +646,8 @@ def train(
                 logger.info(f"Peak GPU memory during training: {peak:.2f} GB")
         except Exception:
             pass
+        if recorder is not None:
+            recorder.close()
         # Restore previous signal handler
         signal.signal(signal.SIGTERM, prev_sigterm)
 
@@ -683,6 +751,10 @@ Examples:
                         help='Resume training from latest checkpoint in output dir')
     parser.add_argument('--no-packing', action='store_true',
                         help='Disable sequence packing (recommended for 7B models on <=12GB VRAM)')
+    parser.add_argument('--token-cache', action='store_true',
+                        help='Use pre-tokenized cache (tokenize once per tokenizer/data hash)')
+    parser.add_argument('--no-metrics', action='store_true',
+                        help='Do not write the per-step metrics CSV (logs/metrics-*.csv)')
     parser.add_argument('--gradient-accumulation-steps', type=int, default=None,
                         help='Override gradient accumulation steps (default: 4, or from config)')
     parser.add_argument('--save-steps', type=int, default=None,
@@ -719,6 +791,8 @@ Examples:
         max_seq_length=args.max_seq_length,
         resume_from_checkpoint=args.resume,
         packing=not args.no_packing,
+        use_token_cache=args.token_cache,
+        metrics_path=None if args.no_metrics else metrics_path_for(log_file),
     )
 
     if model is None: